@@ -23,12 +23,14 @@ from .pattern_detection_service import (
 logger = logging.getLogger(__name__)
 
 
-def check_aml_risk(transaction) -> Dict[str, Any]:
+def check_aml_risk(transaction, include_patterns: bool = True, budget=None) -> Dict[str, Any]:
     """
     Check a transaction for AML risks.
     
     Args:
         transaction: The transaction object
+        include_patterns: Whether to run the advanced AML pattern scans
+        budget: Optional LatencyBudget, checked before the pattern scans
         
     Returns:
         Dictionary with the AML risk check result
@@ -184,8 +186,10 @@ def check_aml_risk(transaction) -> Dict[str, Any]:
         result['risk_score'] = max(result['risk_score'], 75.0)
         result['is_suspicious'] = True
     
-    # Check for advanced AML patterns
-    aml_patterns_result = check_aml_patterns(transaction)
+    # Check for advanced AML patterns, unless the latency budget is nearly spent
+    if include_patterns and budget is not None and not budget.allows('aml_engine.pattern_scan'):
+        include_patterns = False
+    aml_patterns_result = check_aml_patterns(transaction) if include_patterns else {}
     
     # Add detected patterns to the result
     for pattern in aml_patterns_result.get('patterns_detected', []):
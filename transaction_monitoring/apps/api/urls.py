@@ -27,5 +27,8 @@ urlpatterns = [
     path('auth/', include('rest_framework.urls')),
     path('token/', obtain_auth_token, name='token_obtain'),
     path('process-transaction/', views.process_transaction, name='process_transaction'),
+    path('process-transactions/bulk/', views.bulk_process_transactions, name='bulk_process_transactions'),
+    path('shadow-results/', views.shadow_results, name='shadow_results'),
+    path('queue-metrics/', views.queue_metrics, name='queue_metrics'),
     path('health/', views.health_check, name='health_check'),
 ]
\ No newline at end of file
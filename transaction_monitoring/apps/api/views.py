@@ -11,10 +11,21 @@ from django.db import connection
 from django.conf import settings
 import redis
 import json
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from apps.core.utils import generate_transaction_id
+from apps.fraud_engine.services.budget_service import get_latency_budget
+from apps.fraud_engine.services.scoring_service import (
+    SCORING_MODES,
+    SCORING_MODE_ASYNC,
+    enqueue_scoring_on_commit,
+    post_save_scoring_suppressed,
+    score_transaction
+)
+from apps.fraud_engine.services.routing_service import get_queue_metrics
+from apps.fraud_engine.services.shadow_service import summarize_shadow_results
 from apps.transactions.models import (
     Transaction,
     POSTransaction,
@@ -26,6 +37,18 @@ from apps.transactions.serializers import (
     EcommerceTransactionSerializer,
     WalletTransactionSerializer
 )
+from apps.transactions.services.dedup_service import (
+    find_duplicate,
+    load_stored_decisions,
+    remember_transactions
+)
+from apps.transactions.services.ingestion_service import (
+    ROW_STATUS_CREATED,
+    ingest_transactions,
+    parse_ndjson
+)
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonlines')
 
 
 @api_view(['POST'])
@@ -36,7 +59,15 @@ def process_transaction(request):
     
     This endpoint accepts transaction data, validates it, creates the appropriate
     transaction record, and initiates the fraud detection process.
+    
+    The transaction is scored in the ``scoring_mode`` given in the request
+    (``inline``, ``async`` or ``inline_fast``), or the configured default.
+    Inline scoring can be bounded by a latency budget, given per request as
+    ``latency_budget_ms`` or configured per merchant. Work skipped to stay
+    within the budget is reported in ``degraded_stages``.
     """
+    # The latency budget covers validation and the insert too
+    request_start_time = time.time()
     data = request.data
     
     # Validate required fields
@@ -48,6 +79,11 @@ def process_transaction(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    # Answer resubmissions with the stored decision instead of scoring again
+    stored_decision = find_duplicate(data.get('transaction_id'))
+    if stored_decision is not None:
+        return duplicate_response(data['transaction_id'], stored_decision)
+    
     # Generate transaction ID if not provided
     if 'transaction_id' not in data:
         data['transaction_id'] = generate_transaction_id()
@@ -71,33 +107,50 @@ def process_transaction(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Optional per-request scoring mode and latency budget
+    scoring_mode = data.get('scoring_mode', settings.FRAUD_ENGINE_API_SCORING_MODE)
+    if scoring_mode not in SCORING_MODES:
+        return Response(
+            {'error': f'Invalid scoring_mode: {scoring_mode}. Must be one of: {", ".join(SCORING_MODES)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    requested_budget_ms = data.get('latency_budget_ms')
+    if requested_budget_ms is not None:
+        try:
+            requested_budget_ms = float(requested_budget_ms)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'latency_budget_ms must be a number of milliseconds'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
     if serializer.is_valid():
-        # Save the transaction
-        transaction = serializer.save()
+        # Save the transaction, it is scored below rather than by the post_save signal
+        with post_save_scoring_suppressed():
+            transaction = serializer.save()
+        remember_transactions([transaction.transaction_id])
         
-        # Process the transaction synchronously
+        # Process the transaction in the requested mode
         try:
-            # Import the necessary modules
-            from apps.rule_engine.services import apply_rules
-            from apps.ml_engine.services.prediction_service import get_fraud_prediction
-            
-            # Apply rules
-            rule_results = apply_rules(transaction)
+            budget = get_latency_budget(transaction.merchant_id, requested_budget_ms, request_start_time)
+            scoring = score_transaction(transaction, scoring_mode, budget=budget)
             
-            # Get ML prediction
-            ml_results = get_fraud_prediction(transaction)
+            if scoring_mode == SCORING_MODE_ASYNC:
+                return Response(
+                    {
+                        'status': 'success',
+                        'message': 'Transaction queued for processing',
+                        'transaction_id': transaction.transaction_id,
+                        'transaction_status': transaction.status,
+                        'scoring_mode': scoring_mode,
+                    },
+                    status=status.HTTP_201_CREATED
+                )
             
-            # Update transaction with results
-            transaction.risk_score = ml_results.get('risk_score', 0)
-            transaction.is_flagged = rule_results.get('is_flagged', False) or ml_results.get('is_fraudulent', False)
-            
-            if transaction.is_flagged:
-                transaction.flag_reason = rule_results.get('flag_reason') or 'ML model flagged as high risk'
-                transaction.status = 'flagged'
-            else:
-                transaction.status = 'approved'
-            
-            transaction.save()
+            results = scoring['results']
+            decision_result = scoring['decision_result']
+            ml_results = results['ml_engine']
             
             # Return the transaction data with processing results
             return Response(
@@ -106,9 +159,13 @@ def process_transaction(request):
                     'message': 'Transaction processed successfully',
                     'transaction_id': transaction.transaction_id,
                     'transaction_status': transaction.status,
+                    'scoring_mode': scoring_mode,
+                    'decision': decision_result.get('decision'),
                     'risk_score': float(transaction.risk_score),
                     'is_flagged': transaction.is_flagged,
                     'flag_reason': transaction.flag_reason,
+                    'latency_budget_ms': budget.budget_ms if budget else None,
+                    'degraded_stages': results.get('degraded_stages', []),
                     'ml_results': {
                         'model_name': ml_results.get('model_name'),
                         'model_version': ml_results.get('model_version'),
@@ -124,6 +181,9 @@ def process_transaction(request):
             logger = logging.getLogger(__name__)
             logger.error(f"Error processing transaction {transaction.transaction_id}: {str(e)}", exc_info=True)
             
+            # The post_save signal was suppressed, so queue the transaction for async scoring instead
+            enqueue_scoring_on_commit([transaction])
+            
             return Response(
                 {
                     'status': 'partial_success',
@@ -134,9 +194,122 @@ def process_transaction(request):
                 status=status.HTTP_201_CREATED
             )
     
+    # Resubmissions the duplicate filter no longer knows fail the unique check
+    if 'transaction_id' in serializer.errors:
+        transaction_id = str(data['transaction_id'])
+        stored_decision = load_stored_decisions({transaction_id}).get(transaction_id)
+        if stored_decision is not None:
+            return duplicate_response(transaction_id, stored_decision)
+    
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def duplicate_response(transaction_id, stored_decision):
+    """
+    Build the response for a resubmitted transaction.
+    
+    Args:
+        transaction_id: The resubmitted transaction ID
+        stored_decision: The decision stored for the earlier submission
+    
+    Returns:
+        Response with the stored decision
+    """
+    return Response(
+        {
+            'status': 'duplicate',
+            'message': 'Transaction already received, returning the stored decision',
+            'transaction_id': transaction_id,
+            'transaction_status': stored_decision.get('status'),
+            'decision': stored_decision.get('decision'),
+            'risk_score': stored_decision.get('risk_score'),
+            'is_flagged': stored_decision.get('is_flagged'),
+            'flag_reason': stored_decision.get('flag_reason'),
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_process_transactions(request):
+    """
+    Process a batch of new transactions.
+    
+    This endpoint accepts a JSON array of transactions, or newline-delimited
+    JSON with the ``application/x-ndjson`` content type. Rows are validated
+    and inserted in bulk, queued for batched fraud detection, and reported
+    with one status per row.
+    """
+    if request.content_type.split(';')[0].strip() in NDJSON_CONTENT_TYPES:
+        rows = list(parse_ndjson(request.body.splitlines()))
+    else:
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {'error': 'Request body must be a JSON array of transactions'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    if not rows:
+        return Response({'error': 'No transactions given'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(rows) > settings.TRANSACTION_BULK_MAX_ROWS:
+        return Response(
+            {'error': f'Too many transactions: {len(rows)}. At most {settings.TRANSACTION_BULK_MAX_ROWS} per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = ingest_transactions(rows)
+    created = sum(1 for result in results if result['status'] == ROW_STATUS_CREATED)
+    
+    return Response(
+        {
+            'status': 'success' if created == len(results) else 'partial_success',
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        },
+        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def shadow_results(request):
+    """
+    Compare the shadow rules and ML models with production.
+    
+    The optional ``days`` query parameter limits the comparison to recent
+    shadow results (default: 7).
+    """
+    try:
+        days = int(request.query_params.get('days', 7))
+    except ValueError:
+        return Response(
+            {'days': ['Must be a whole number of days']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    since = timezone.now() - timedelta(days=days)
+    return Response({'days': days, **summarize_shadow_results(since)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def queue_metrics(request):
+    """
+    Report the depth and lag of each fraud engine Celery queue.
+    
+    Lag is the time tasks waited in the queue before a worker started them,
+    over the last FRAUD_ENGINE_QUEUE_LAG_WINDOW seconds.
+    """
+    return Response({
+        'window_seconds': settings.FRAUD_ENGINE_QUEUE_LAG_WINDOW,
+        'queues': get_queue_metrics(),
+    })
+
+
 @api_view(['GET'])
 def health_check(request):
     """
@@ -0,0 +1,342 @@
+"""
+Aggregated hit counters for rules.
+
+Rule and velocity rule hits are counted in memory by the process that sees
+them, which costs one dictionary update under a lock. A background thread
+adds each process's counts to shared totals in the Django cache every
+HIT_COUNT_PUSH_INTERVAL_MS milliseconds, and the periodic
+flush_rule_hit_counts Celery task moves the shared totals into the
+``hit_count`` and ``last_triggered`` columns with one ``F()`` increment per
+rule every HIT_COUNT_FLUSH_INTERVAL seconds. Concurrent workers therefore never update the same rule row for
+every hit, and no hits are lost.
+
+Dashboards add the shared totals not yet written to the rule rows, so they
+show counts that are at most one push interval old.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Models whose hits are counted, by label
+HIT_COUNTED_MODELS = ('rule_engine.Rule', 'velocity_engine.VelocityRule')
+
+
+def hit_count_key(label: str, pk) -> str:
+    """
+    Get the cache key holding the shared hit count of a rule.
+    
+    Args:
+        label: The model label, e.g. 'rule_engine.Rule'
+        pk: The rule ID
+    
+    Returns:
+        The cache key
+    """
+    return f"hit_counts:{label}:{pk}"
+
+
+def last_triggered_key(label: str, pk) -> str:
+    """
+    Get the cache key holding the last time a rule triggered, as a Unix timestamp.
+    
+    Args:
+        label: The model label
+        pk: The rule ID
+    
+    Returns:
+        The cache key
+    """
+    return f"hit_counts:{label}:{pk}:last"
+
+
+class HitCountBuffer:
+    """
+    Per-process buffer of rule hit counts.
+    
+    Counts are pushed to the shared cache by a background thread every
+    ``push_interval_ms`` milliseconds. With ``synchronous`` set, they are
+    pushed as soon as they are counted, which keeps tests deterministic.
+    """
+    
+    def __init__(self, push_interval_ms: int, synchronous: bool = False):
+        self.push_interval_ms = push_interval_ms
+        self.synchronous = synchronous
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._push_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+    
+    def add(self, label: str, pk, hits: int = 1, triggered_at: Optional[float] = None):
+        """
+        Count hits of a rule.
+        
+        Args:
+            label: The model label
+            pk: The rule ID
+            hits: Number of hits
+            triggered_at: Unix timestamp of the last hit, defaults to now
+        """
+        triggered_at = triggered_at or time.time()
+        with self._lock:
+            count, last = self._hits.get((label, pk), (0, 0.0))
+            self._hits[(label, pk)] = (count + hits, max(last, triggered_at))
+            if not self.synchronous:
+                self._ensure_pusher()
+        
+        if self.synchronous:
+            self.push()
+    
+    def push(self):
+        """
+        Add the buffered counts to the shared totals now, in the calling thread.
+        """
+        with self._push_lock:
+            with self._lock:
+                hits, self._hits = self._hits, {}
+            
+            if not hits:
+                return
+            
+            pushed = set()
+            failed_times = {}
+            try:
+                for (label, pk), (count, last) in hits.items():
+                    key = hit_count_key(label, pk)
+                    try:
+                        cache.incr(key, count)
+                    except ValueError:
+                        # First hit since the last flush, or the total was evicted
+                        cache.add(key, 0, None)
+                        cache.incr(key, count)
+                    # The count is in the total, it must not be pushed again
+                    pushed.add((label, pk))
+                    
+                    # Concurrent pushes may keep a slightly older time, which is fine for display
+                    try:
+                        if last > (cache.get(last_triggered_key(label, pk)) or 0):
+                            cache.set(last_triggered_key(label, pk), last, None)
+                    except Exception:
+                        failed_times[(label, pk)] = last
+            except Exception as e:
+                # Keep what was not pushed for the next push
+                with self._lock:
+                    for series, (count, last) in hits.items():
+                        if series not in pushed:
+                            self._requeue(series, count, last)
+                logger.warning(f"Error pushing rule hit counts, retrying on next push: {str(e)}")
+            
+            if failed_times:
+                # Only the last-triggered times are retried, their counts were added
+                with self._lock:
+                    for series, last in failed_times.items():
+                        self._requeue(series, 0, last)
+                logger.warning(f"Error pushing last-triggered times of {len(failed_times)} rules, retrying on next push")
+    
+    def _requeue(self, series, count: int, last: float):
+        # Must be called with the lock held
+        current_count, current_last = self._hits.get(series, (0, 0.0))
+        self._hits[series] = (current_count + count, max(current_last, last))
+    
+    def close(self):
+        """
+        Stop the background pusher and push any remaining counts.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        self.push()
+    
+    def _ensure_pusher(self):
+        # Must be called with the lock held
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='hit-count-pusher', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.push_interval_ms / 1000.0)
+            self._wakeup.clear()
+            self.push()
+
+
+_hit_count_buffer = None
+_hit_count_buffer_lock = threading.Lock()
+
+
+def get_hit_count_buffer() -> HitCountBuffer:
+    """
+    Get the process-wide hit count buffer.
+    
+    Returns:
+        The HitCountBuffer instance
+    """
+    global _hit_count_buffer
+    
+    if _hit_count_buffer is None:
+        with _hit_count_buffer_lock:
+            if _hit_count_buffer is None:
+                _hit_count_buffer = HitCountBuffer(
+                    push_interval_ms=settings.HIT_COUNT_PUSH_INTERVAL_MS,
+                    synchronous=settings.HIT_COUNT_SYNC_PUSH,
+                )
+                # Don't lose counted hits when the process exits
+                atexit.register(_hit_count_buffer.close)
+    
+    return _hit_count_buffer
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def push_hit_counts_on_shutdown(**kwargs):
+    """Push counted hits before a Celery worker process exits."""
+    if _hit_count_buffer is not None:
+        _hit_count_buffer.close()
+
+
+def count_hit(rule, hits: int = 1):
+    """
+    Count hits of a Rule or VelocityRule.
+    
+    Args:
+        rule: The rule object
+        hits: Number of hits
+    """
+    get_hit_count_buffer().add(rule._meta.label, rule.pk, hits)
+
+
+def count_hits(model, hits: Dict):
+    """
+    Count hits of several rules of a model.
+    
+    Args:
+        model: The Rule or VelocityRule model
+        hits: Dictionary of rule ID to number of hits
+    """
+    buffer = get_hit_count_buffer()
+    for pk, count in hits.items():
+        buffer.add(model._meta.label, pk, count)
+
+
+def get_pending_hits(model, pks: Iterable) -> Dict:
+    """
+    Get the shared hit counts not yet written to the rule rows.
+    
+    Args:
+        model: The Rule or VelocityRule model
+        pks: The rule IDs
+    
+    Returns:
+        Dictionary of rule ID to (hits, last triggered datetime or None),
+        for the rules with pending hits
+    """
+    label = model._meta.label
+    pks = list(pks)
+    keys = {}
+    for pk in pks:
+        keys[hit_count_key(label, pk)] = pk
+        keys[last_triggered_key(label, pk)] = pk
+    
+    try:
+        values = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Error reading pending rule hit counts: {str(e)}")
+        return {}
+    
+    pending = {}
+    for pk in pks:
+        hits = values.get(hit_count_key(label, pk)) or 0
+        if hits > 0:
+            last = values.get(last_triggered_key(label, pk))
+            pending[pk] = (hits, datetime.fromtimestamp(last, tz=dt_timezone.utc) if last else None)
+    return pending
+
+
+def apply_pending_hits(rules: Iterable) -> List:
+    """
+    Add the pending shared hit counts to rule objects, for display.
+    
+    Args:
+        rules: Rule or VelocityRule objects of one model
+    
+    Returns:
+        The rules, as a list
+    """
+    rules = list(rules)
+    if not rules:
+        return rules
+    
+    pending = get_pending_hits(type(rules[0]), [rule.pk for rule in rules])
+    for rule in rules:
+        if rule.pk in pending:
+            hits, last = pending[rule.pk]
+            rule.hit_count += hits
+            if last is not None and (rule.last_triggered is None or last > rule.last_triggered):
+                rule.last_triggered = last
+    return rules
+
+
+def flush_model_hit_counts(label: str) -> Tuple[int, int]:
+    """
+    Move the shared hit counts of a model's rules into the rule rows.
+    
+    Each total is decremented by the amount written, so hits pushed while
+    flushing are kept for the next flush.
+    
+    Args:
+        label: The model label
+    
+    Returns:
+        Tuple of (rules updated, hits written)
+    """
+    model = apps.get_model(label)
+    pending = get_pending_hits(model, model.objects.order_by().values_list('pk', flat=True))
+    
+    rules_updated = 0
+    hits_written = 0
+    for pk, (hits, last) in pending.items():
+        key = hit_count_key(label, pk)
+        cache.decr(key, hits)
+        updates = {'hit_count': F('hit_count') + hits}
+        if last is not None:
+            updates['last_triggered'] = last
+        try:
+            model.objects.filter(pk=pk).update(**updates)
+        except Exception:
+            # Put the hits back for the next flush
+            cache.incr(key, hits)
+            raise
+        rules_updated += 1
+        hits_written += hits
+    return rules_updated, hits_written
+
+
+def flush_hit_counts() -> int:
+    """
+    Move the shared hit counts of every counted model into the rule rows.
+    
+    Returns:
+        Number of hits written
+    """
+    total = 0
+    for label in HIT_COUNTED_MODELS:
+        try:
+            rules_updated, hits_written = flush_model_hit_counts(label)
+        except Exception as e:
+            logger.error(f"Error flushing hit counts of {label}: {str(e)}", exc_info=True)
+            continue
+        total += hits_written
+        if rules_updated:
+            logger.info(f"Flushed {hits_written} hits of {rules_updated} {label} rules")
+    return total
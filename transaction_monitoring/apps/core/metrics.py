@@ -0,0 +1,355 @@
+"""
+Process-aggregated metrics for the Transaction Monitoring System.
+
+Counters and histograms are updated in memory by the process that observes
+them, which costs one dictionary update under a lock. A background thread
+adds each process's increments to shared totals in the Django cache every
+METRICS_FLUSH_INTERVAL_MS milliseconds, so gunicorn and Celery processes are
+aggregated without a round trip per observation. The ``/metrics`` endpoint
+renders the shared totals in the Prometheus text format.
+
+The cache has to be shared between processes, as the Redis cache used in
+production is, for the endpoint to include every process.
+"""
+
+import atexit
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Cache key of the index describing every stored sample
+METRICS_INDEX_KEY = 'metrics:index'
+
+# Histogram sums are stored as integers with this many units per second
+SUM_SCALE = 1000000
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Metrics defined in this process, by name
+REGISTRY = {}
+
+
+class Metric:
+    """
+    Base class of the metric types.
+    
+    Args:
+        name: The metric name
+        documentation: Help text shown on the metrics endpoint
+        labelnames: Names of the labels every observation must set
+    """
+    
+    kind = None
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+    
+    def _labels(self, labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        return tuple((labelname, str(labels[labelname])) for labelname in self.labelnames)
+    
+    def describe(self) -> Dict[str, Any]:
+        """
+        Describe the metric for the shared index.
+        
+        Returns:
+            Dictionary with the metric name, type and help text
+        """
+        return {'metric': self.name, 'type': self.kind, 'help': self.documentation}
+
+
+class Counter(Metric):
+    """A monotonically increasing count."""
+    
+    kind = 'counter'
+    
+    def inc(self, amount: int = 1, **labels):
+        """
+        Increase the counter.
+        
+        Args:
+            amount: Whole number to add
+            **labels: Label values
+        """
+        get_metrics_buffer().add([((self.name, self.name, self._labels(labels), None), amount)])
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values in cumulative buckets.
+    
+    Args:
+        name: The metric name
+        documentation: Help text shown on the metrics endpoint
+        labelnames: Names of the labels every observation must set
+        buckets: Upper bounds of the buckets, in increasing order
+    """
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+    
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), 'buckets': [format_bound(bound) for bound in self.buckets]}
+    
+    def observe(self, value: float, **labels):
+        """
+        Record an observation.
+        
+        Args:
+            value: The observed value, in seconds for latency histograms
+            **labels: Label values
+        """
+        label_values = self._labels(labels)
+        bound = format_bound(self.buckets[bisect.bisect_left(self.buckets, value)])
+        get_metrics_buffer().add([
+            ((self.name, f'{self.name}_bucket', label_values, bound), 1),
+            ((self.name, f'{self.name}_count', label_values, None), 1),
+            ((self.name, f'{self.name}_sum', label_values, None), int(value * SUM_SCALE)),
+        ])
+    
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the time spent in the block, in seconds.
+        
+        Args:
+            **labels: Label values
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+
+def format_bound(bound: float) -> str:
+    """Format a bucket bound as a Prometheus ``le`` label value."""
+    return '+Inf' if bound == float('inf') else format(bound, 'g')
+
+
+def sample_key(series: Tuple) -> str:
+    """
+    Get the cache key holding the shared total of a sample.
+    
+    Args:
+        series: Tuple of (metric name, sample name, labels, bucket bound)
+    
+    Returns:
+        The cache key
+    """
+    digest = hashlib.md5(json.dumps(series).encode('utf-8')).hexdigest()
+    return f"metrics:{series[1]}:{digest}"
+
+
+class MetricsBuffer:
+    """
+    Per-process buffer of metric increments.
+    
+    Increments are pushed to the shared cache by a background thread every
+    ``flush_interval_ms`` milliseconds. With ``synchronous`` set, they are
+    pushed as soon as they are added, which keeps tests deterministic.
+    """
+    
+    def __init__(self, flush_interval_ms: int, synchronous: bool = False):
+        self.flush_interval_ms = flush_interval_ms
+        self.synchronous = synchronous
+        self._deltas = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+    
+    def add(self, increments: List[Tuple[Tuple, int]]):
+        """
+        Add increments to the buffer.
+        
+        Args:
+            increments: List of (series, amount) pairs, where a series is a
+                tuple of (metric name, sample name, labels, bucket bound)
+        """
+        with self._lock:
+            for series, amount in increments:
+                self._deltas[series] = self._deltas.get(series, 0) + amount
+            if not self.synchronous:
+                self._ensure_flusher()
+        
+        if self.synchronous:
+            self.flush()
+    
+    def flush(self):
+        """
+        Add the buffered increments to the shared totals now, in the calling thread.
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            
+            if not deltas:
+                return
+            
+            pushed = set()
+            try:
+                self._update_index(deltas)
+                for series, amount in deltas.items():
+                    key = self._keys[series]
+                    try:
+                        cache.incr(key, amount)
+                    except ValueError:
+                        # First increment of the sample, or the total was evicted
+                        cache.add(key, 0, None)
+                        cache.incr(key, amount)
+                    pushed.add(series)
+            except Exception as e:
+                # Keep what was not pushed for the next flush
+                with self._lock:
+                    for series, amount in deltas.items():
+                        if series not in pushed:
+                            self._deltas[series] = self._deltas.get(series, 0) + amount
+                logger.warning(f"Error pushing metrics, retrying on next flush: {str(e)}")
+    
+    def close(self):
+        """
+        Stop the background flusher and push any remaining increments.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+    
+    def _update_index(self, deltas: Dict[Tuple, int]):
+        # Describe new samples so the endpoint can render them. The whole
+        # index is re-checked on every flush, so an entry lost to a
+        # concurrent update by another process is written again.
+        for series in deltas:
+            if series not in self._keys:
+                self._keys[series] = sample_key(series)
+        
+        index = cache.get(METRICS_INDEX_KEY) or {}
+        missing = {
+            key: {
+                **REGISTRY[series[0]].describe(),
+                'sample': series[1],
+                'labels': [list(label) for label in series[2]],
+                'le': series[3],
+            }
+            for series, key in self._keys.items()
+            if key not in index and series[0] in REGISTRY
+        }
+        if missing:
+            index.update(missing)
+            cache.set(METRICS_INDEX_KEY, index, None)
+    
+    def _ensure_flusher(self):
+        # Must be called with the lock held
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval_ms / 1000.0)
+            self._wakeup.clear()
+            self.flush()
+
+
+_metrics_buffer = None
+_metrics_buffer_lock = threading.Lock()
+
+
+def get_metrics_buffer() -> MetricsBuffer:
+    """
+    Get the process-wide metrics buffer.
+    
+    Returns:
+        The MetricsBuffer instance
+    """
+    global _metrics_buffer
+    
+    if _metrics_buffer is None:
+        with _metrics_buffer_lock:
+            if _metrics_buffer is None:
+                _metrics_buffer = MetricsBuffer(
+                    flush_interval_ms=settings.METRICS_FLUSH_INTERVAL_MS,
+                    synchronous=settings.METRICS_SYNC_FLUSH,
+                )
+                # Don't lose buffered increments when the process exits
+                atexit.register(_metrics_buffer.close)
+    
+    return _metrics_buffer
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def flush_metrics_on_shutdown(**kwargs):
+    """Push buffered metric increments before a Celery worker process exits."""
+    if _metrics_buffer is not None:
+        _metrics_buffer.close()
+
+
+def _format_labels(labels: List[List[str]], le: Optional[str] = None) -> str:
+    pairs = list(labels) + ([['le', le]] if le is not None else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+def render_metrics() -> str:
+    """
+    Render the shared metric totals in the Prometheus text format.
+    
+    Returns:
+        The metrics as text
+    """
+    index = cache.get(METRICS_INDEX_KEY) or {}
+    values = cache.get_many(list(index))
+    
+    # Group the samples by metric, then by label set
+    metrics = {}
+    for key, entry in index.items():
+        metric = metrics.setdefault(entry['metric'], {'entry': entry, 'series': {}})
+        label_key = json.dumps(entry['labels'])
+        samples = metric['series'].setdefault(label_key, {})
+        samples[(entry['sample'], entry['le'])] = values.get(key, 0)
+    
+    lines = []
+    for name in sorted(metrics):
+        entry = metrics[name]['entry']
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        
+        for label_key in sorted(metrics[name]['series']):
+            labels = json.loads(label_key)
+            samples = metrics[name]['series'][label_key]
+            
+            if entry['type'] == 'histogram':
+                cumulative = 0
+                for bound in entry['buckets']:
+                    cumulative += samples.get((f'{name}_bucket', bound), 0)
+                    lines.append(f"{name}_bucket{_format_labels(labels, bound)} {cumulative}")
+                lines.append(f"{name}_count{_format_labels(labels)} {samples.get((f'{name}_count', None), 0)}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {samples.get((f'{name}_sum', None), 0) / SUM_SCALE}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {samples.get((name, None), 0)}")
+    
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,161 @@
+"""
+Scoring context for Transaction Monitoring and Fraud Detection System.
+
+A ScoringContext is built once per transaction and passed to every detection
+engine, so normalisation, JSON parsing and hashing of entity keys happen once
+per transaction instead of once per rule or engine.
+"""
+
+import threading
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Callable, Optional
+from .constants import PAYMENT_METHOD_CREDIT_CARD, PAYMENT_METHOD_DEBIT_CARD
+from .utils import hash_sensitive_data
+
+CARD_PAYMENT_METHODS = (PAYMENT_METHOD_CREDIT_CARD, PAYMENT_METHOD_DEBIT_CARD)
+
+EMPTY_MAPPING = MappingProxyType({})
+
+
+class ScoringContext:
+    """
+    Immutable per-transaction view shared by the detection engines.
+    
+    Normalised fields are set when the context is built. Derived fields are
+    computed on first access and cached. Attributes cannot be reassigned, and
+    mappings are exposed read-only so engines cannot affect each other.
+    """
+    
+    def __init__(self, transaction):
+        set_field = super().__setattr__
+        set_field('transaction', transaction)
+        set_field('_derived', {})
+        set_field('_derived_lock', threading.Lock())
+        
+        # Normalised fields
+        set_field('transaction_id', transaction.transaction_id)
+        set_field('transaction_type', transaction.transaction_type)
+        set_field('channel', transaction.channel)
+        set_field('amount', float(transaction.amount))
+        set_field('currency', transaction.currency)
+        set_field('user_id', transaction.user_id)
+        set_field('timestamp', transaction.timestamp)
+        set_field('merchant_id', getattr(transaction, 'merchant_id', None))
+        set_field('device_id', getattr(transaction, 'device_id', None))
+        
+        # Parsed JSON fields
+        set_field('location_data', self._read_only(transaction, 'location_data'))
+        set_field('payment_method_data', self._read_only(transaction, 'payment_method_data'))
+        set_field('metadata', self._read_only(transaction, 'metadata'))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+    
+    def __repr__(self):
+        return f"<ScoringContext {self.transaction_id}>"
+    
+    @staticmethod
+    def _read_only(transaction, field_name: str):
+        value = getattr(transaction, field_name, None)
+        return MappingProxyType(value) if isinstance(value, dict) and value else EMPTY_MAPPING
+    
+    @cached_property
+    def payment_method_type(self) -> Optional[str]:
+        """The payment method type, if any."""
+        return self.payment_method_data.get('type')
+    
+    @cached_property
+    def card_details(self):
+        """The card details of a card payment, read-only."""
+        if self.payment_method_type not in CARD_PAYMENT_METHODS:
+            return EMPTY_MAPPING
+        card_details = self.payment_method_data.get('card_details') or {}
+        return MappingProxyType(card_details) if isinstance(card_details, dict) else EMPTY_MAPPING
+    
+    @cached_property
+    def card_hash(self) -> Optional[str]:
+        """The hashed card number, used for blocklist and velocity lookups."""
+        if 'card_number' not in self.card_details:
+            return None
+        return hash_sensitive_data(self.card_details['card_number'])
+    
+    @cached_property
+    def ip_address(self) -> Optional[str]:
+        """The IP address from the location data."""
+        return self.location_data.get('ip_address')
+    
+    @cached_property
+    def email(self) -> Optional[str]:
+        """The customer email from the metadata."""
+        return self.metadata.get('customer_email')
+    
+    @cached_property
+    def entity_keys(self):
+        """Lookup keys by entity type, as used by blocklist and velocity rules."""
+        return MappingProxyType({
+            'user_id': self.user_id,
+            'card_number': self.card_hash,
+            'device_id': self.device_id,
+            'ip_address': self.ip_address,
+            'merchant_id': self.merchant_id,
+            'email': self.email,
+        })
+    
+    @cached_property
+    def hour_of_day(self) -> int:
+        """The hour of the transaction timestamp."""
+        return self.timestamp.hour
+    
+    @cached_property
+    def day_of_week(self) -> int:
+        """The weekday of the transaction timestamp (Monday is 0)."""
+        return self.timestamp.weekday()
+    
+    @cached_property
+    def is_weekend(self) -> bool:
+        """Whether the transaction happened on a weekend."""
+        return self.day_of_week >= 5
+    
+    @cached_property
+    def is_night(self) -> bool:
+        """Whether the transaction happened between 22:00 and 06:00."""
+        return self.hour_of_day < 6 or self.hour_of_day >= 22
+    
+    def derived(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Get an engine-specific derived value, computing it once.
+        
+        Args:
+            name: Name of the derived value
+            factory: Callable computing the value on first access
+        
+        Returns:
+            The cached value
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        
+        with self._derived_lock:
+            if name not in self._derived:
+                self._derived[name] = factory()
+            return self._derived[name]
+
+
+def get_scoring_context(transaction, context: Optional[ScoringContext] = None) -> ScoringContext:
+    """
+    Get the scoring context for a transaction, building it if needed.
+    
+    Args:
+        transaction: The transaction object
+        context: An existing context for the transaction, if any
+    
+    Returns:
+        The ScoringContext
+    """
+    return context if context is not None else ScoringContext(transaction)
@@ -0,0 +1,22 @@
+"""
+Celery tasks for the Core app.
+"""
+
+import logging
+from transaction_monitoring.celery_app import app
+from .hit_counts import flush_hit_counts
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(ignore_result=True)
+def flush_rule_hit_counts():
+    """
+    Write the shared rule hit counts to the rule rows.
+    
+    Scheduled every HIT_COUNT_FLUSH_INTERVAL seconds by Celery beat.
+    
+    Returns:
+        Number of hits written
+    """
+    return flush_hit_counts()
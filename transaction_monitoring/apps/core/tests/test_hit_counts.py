@@ -0,0 +1,114 @@
+"""
+Tests for the core hit counts module.
+"""
+
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from apps.core.hit_counts import (
+    HitCountBuffer,
+    apply_pending_hits,
+    count_hit,
+    flush_hit_counts,
+    get_pending_hits
+)
+from apps.core.tasks import flush_rule_hit_counts
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.transactions.models import POSTransaction
+
+
+class HitCountTests(TestCase):
+    """Tests for the aggregated rule hit counters."""
+    
+    def setUp(self):
+        """Set up an empty cache and a rule."""
+        cache.clear()
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+    
+    def test_buffers_aggregate_in_the_cache(self):
+        """Test that hits from separate process buffers add up and are only pushed on push."""
+        buffers = [HitCountBuffer(push_interval_ms=60000), HitCountBuffer(push_interval_ms=60000)]
+        
+        for buffer in buffers:
+            with patch('apps.core.hit_counts.get_hit_count_buffer', return_value=buffer):
+                count_hit(self.rule)
+                count_hit(self.rule)
+        self.assertEqual(get_pending_hits(Rule, [self.rule.pk]), {})
+        
+        for buffer in buffers:
+            buffer.close()
+        self.assertEqual(get_pending_hits(Rule, [self.rule.pk])[self.rule.pk][0], 4)
+    
+    def test_flush_writes_hits_with_one_increment(self):
+        """Test that the flush task moves the shared counts into the rule row."""
+        count_hit(self.rule, 3)
+        
+        # One query listing each model's rules, one increment per rule with hits
+        with self.assertNumQueries(3):
+            self.assertEqual(flush_rule_hit_counts(), 3)
+        
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.hit_count, 3)
+        self.assertIsNotNone(self.rule.last_triggered)
+        self.assertEqual(get_pending_hits(Rule, [self.rule.pk]), {})
+        
+        count_hit(self.rule)
+        flush_hit_counts()
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.hit_count, 4)
+    
+    def test_dashboard_counts_include_pending_hits(self):
+        """Test that displayed counts add the hits not yet written to the rule row."""
+        Rule.objects.filter(pk=self.rule.pk).update(hit_count=5)
+        count_hit(self.rule, 2)
+        
+        rule = apply_pending_hits([Rule.objects.get(pk=self.rule.pk)])[0]
+        
+        self.assertEqual(rule.hit_count, 7)
+        self.assertLessEqual(rule.last_triggered, timezone.now())
+    
+    def test_rule_hits_do_not_update_the_rule_row(self):
+        """Test that evaluating a rule counts its hit without writing the rule row."""
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_hits_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        
+        evaluate_rules(transaction, rules=[self.rule])
+        
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.hit_count, 0)
+        self.assertEqual(get_pending_hits(Rule, [self.rule.pk])[self.rule.pk][0], 1)
+    
+    def test_failed_last_triggered_update_does_not_recount_hits(self):
+        """Test that a push failing after the increment retries only the last-triggered time."""
+        buffer = HitCountBuffer(push_interval_ms=60000)
+        buffer.add(Rule._meta.label, self.rule.pk, 2)
+        
+        with patch('apps.core.hit_counts.cache.set', side_effect=ConnectionError('cache down')):
+            buffer.push()
+        hits, last_triggered = get_pending_hits(Rule, [self.rule.pk])[self.rule.pk]
+        self.assertEqual(hits, 2)
+        self.assertIsNone(last_triggered)
+        
+        buffer.push()
+        hits, last_triggered = get_pending_hits(Rule, [self.rule.pk])[self.rule.pk]
+        self.assertEqual(hits, 2)
+        self.assertIsNotNone(last_triggered)
@@ -0,0 +1,81 @@
+"""
+Tests for the core metrics module.
+"""
+
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from apps.core.metrics import Counter, Histogram, MetricsBuffer, render_metrics
+from apps.core.views import metrics
+from apps.fraud_engine.services.scoring_service import (
+    SCORING_MODE_INLINE,
+    post_save_scoring_suppressed,
+    score_transaction
+)
+from apps.transactions.models import POSTransaction
+
+REQUESTS = Counter('test_requests_total', 'Requests handled', ['outcome'])
+LATENCY = Histogram('test_latency_seconds', 'Request latency', ['path'], buckets=(0.1, 1.0))
+
+
+class MetricsTests(TestCase):
+    """Tests for the process-aggregated metrics."""
+    
+    def setUp(self):
+        """Set up an empty metrics cache."""
+        cache.clear()
+    
+    def test_renders_counters_and_histograms(self):
+        """Test that observations are rendered in the Prometheus text format."""
+        REQUESTS.inc(outcome='ok')
+        REQUESTS.inc(2, outcome='ok')
+        LATENCY.observe(0.05, path='/a')
+        LATENCY.observe(0.5, path='/a')
+        LATENCY.observe(3, path='/a')
+        
+        output = render_metrics()
+        
+        self.assertIn('# TYPE test_requests_total counter', output)
+        self.assertIn('test_requests_total{outcome="ok"} 3', output)
+        self.assertIn('# TYPE test_latency_seconds histogram', output)
+        self.assertIn('test_latency_seconds_bucket{path="/a",le="0.1"} 1', output)
+        self.assertIn('test_latency_seconds_bucket{path="/a",le="1"} 2', output)
+        self.assertIn('test_latency_seconds_bucket{path="/a",le="+Inf"} 3', output)
+        self.assertIn('test_latency_seconds_count{path="/a"} 3', output)
+        self.assertIn('test_latency_seconds_sum{path="/a"} 3.55', output)
+    
+    def test_buffers_aggregate_in_the_cache(self):
+        """Test that increments from separate process buffers add up and are only pushed on flush."""
+        buffers = [MetricsBuffer(flush_interval_ms=60000), MetricsBuffer(flush_interval_ms=60000)]
+        
+        for buffer in buffers:
+            with patch('apps.core.metrics.get_metrics_buffer', return_value=buffer):
+                REQUESTS.inc(outcome='error')
+        self.assertNotIn('test_requests_total', render_metrics())
+        
+        for buffer in buffers:
+            buffer.close()
+        self.assertIn('test_requests_total{outcome="error"} 2', render_metrics())
+    
+    def test_pipeline_is_instrumented(self):
+        """Test that scoring records stage latency and the decision."""
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_metrics_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount='123.45',
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        
+        score_transaction(transaction, SCORING_MODE_INLINE)
+        
+        output = metrics(RequestFactory().get('/metrics')).content.decode()
+        for stage in ('blocklist', 'rule_engine', 'velocity_engine', 'ml_engine', 'aml_engine',
+                      'decision', 'persistence', 'audit_write'):
+            self.assertIn(f'fraud_engine_stage_seconds_count{{stage="{stage}"}} 1', output)
+        self.assertIn('fraud_engine_decisions_total{decision="approve"} 1', output)
@@ -0,0 +1,95 @@
+"""
+Tests for the per-transaction scoring context.
+"""
+
+from datetime import datetime
+from django.test import TestCase
+from unittest.mock import MagicMock, patch
+from apps.core.scoring_context import ScoringContext, get_scoring_context
+from apps.core.utils import hash_sensitive_data
+
+
+class ScoringContextTests(TestCase):
+    """Tests for ScoringContext class."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.transaction = MagicMock()
+        self.transaction.transaction_id = 'tx_context_1'
+        self.transaction.transaction_type = 'acquiring'
+        self.transaction.channel = 'ecommerce'
+        self.transaction.amount = '125.50'
+        self.transaction.currency = 'USD'
+        self.transaction.user_id = 'user_1'
+        self.transaction.merchant_id = 'merchant_1'
+        self.transaction.device_id = 'device_1'
+        self.transaction.timestamp = datetime(2026, 10, 17, 23, 15)
+        self.transaction.location_data = {'ip_address': '10.0.0.1', 'country': 'US'}
+        self.transaction.payment_method_data = {
+            'type': 'credit_card',
+            'card_details': {'card_number': '4111111111111111'},
+        }
+        self.transaction.metadata = {'customer_email': 'user@example.com'}
+    
+    def test_normalised_fields(self):
+        """Test that fields are normalised when the context is built."""
+        context = ScoringContext(self.transaction)
+        
+        self.assertEqual(context.amount, 125.5)
+        self.assertEqual(context.ip_address, '10.0.0.1')
+        self.assertEqual(context.email, 'user@example.com')
+        self.assertTrue(context.is_weekend)
+        self.assertTrue(context.is_night)
+    
+    def test_context_is_immutable(self):
+        """Test that attributes and mappings cannot be modified."""
+        context = ScoringContext(self.transaction)
+        
+        with self.assertRaises(AttributeError):
+            context.amount = 1.0
+        with self.assertRaises(AttributeError):
+            del context.user_id
+        with self.assertRaises(TypeError):
+            context.location_data['country'] = 'GB'
+    
+    def test_card_number_is_hashed_once(self):
+        """Test that the card hash is computed once and shared by entity keys."""
+        with patch(
+            'apps.core.scoring_context.hash_sensitive_data',
+            side_effect=hash_sensitive_data
+        ) as mock_hash:
+            context = ScoringContext(self.transaction)
+            card_hash = context.card_hash
+            entity_keys = context.entity_keys
+            context.card_hash
+        
+        mock_hash.assert_called_once_with('4111111111111111')
+        self.assertEqual(entity_keys['card_number'], card_hash)
+        self.assertEqual(entity_keys['ip_address'], '10.0.0.1')
+        self.assertEqual(entity_keys['merchant_id'], 'merchant_1')
+    
+    def test_missing_card_details(self):
+        """Test that non-card payments have no card hash."""
+        self.transaction.payment_method_data = {'type': 'wallet'}
+        context = ScoringContext(self.transaction)
+        
+        self.assertIsNone(context.card_hash)
+        self.assertEqual(dict(context.card_details), {})
+    
+    def test_derived_values_are_memoised(self):
+        """Test that derived values are computed once."""
+        context = ScoringContext(self.transaction)
+        factory = MagicMock(return_value={'amount': 125.5})
+        
+        first = context.derived('test.value', factory)
+        second = context.derived('test.value', factory)
+        
+        factory.assert_called_once()
+        self.assertIs(first, second)
+    
+    def test_get_scoring_context_reuses_context(self):
+        """Test that an existing context is reused."""
+        context = ScoringContext(self.transaction)
+        
+        self.assertIs(get_scoring_context(self.transaction, context), context)
+        self.assertIsNot(get_scoring_context(self.transaction), context)
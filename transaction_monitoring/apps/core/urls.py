@@ -10,4 +10,5 @@ app_name = 'core'
 urlpatterns = [
     path('', views.home, name='home'),
     path('health/', views.health_check, name='health_check'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
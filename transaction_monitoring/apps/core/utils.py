@@ -5,6 +5,7 @@ Utility functions for Transaction Monitoring and Fraud Detection System.
 import hashlib
 import json
 import uuid
+import zlib
 from datetime import datetime
 from typing import Any, Dict, Optional
 from django.core.serializers.json import DjangoJSONEncoder
@@ -126,4 +127,22 @@ class CustomJSONEncoder(DjangoJSONEncoder):
     def default(self, obj):
         if isinstance(obj, bool):
             return str(obj).lower()  # Convert boolean to string
-        return super().default(obj)
\ No newline at end of file
+        return super().default(obj)
+
+
+def is_sampled(transaction_id: str, sample_rate: float) -> bool:
+    """
+    Check whether a transaction falls in a sample.
+    
+    The sample is taken by hashing the transaction ID, so a transaction
+    scored twice is either sampled both times or neither, and samples with
+    the same rate hold the same transactions.
+    
+    Args:
+        transaction_id: The transaction ID
+        sample_rate: Fraction of transactions to sample, between 0 and 1
+    
+    Returns:
+        True if the transaction is in the sample
+    """
+    return zlib.crc32(transaction_id.encode('utf-8')) % 10000 < sample_rate * 10000
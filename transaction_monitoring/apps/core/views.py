@@ -3,11 +3,12 @@ Views for the core app.
 """
 
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.db import connection
 from django.conf import settings
 import redis
 import json
+from .metrics import render_metrics
 
 
 def home(request):
@@ -48,4 +49,11 @@ def health_check(request):
         "version": getattr(settings, "VERSION", "1.0.0"),
     }
     
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
+
+
+def metrics(request):
+    """
+    Metrics endpoint in the Prometheus text format.
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
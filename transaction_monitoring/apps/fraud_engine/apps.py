@@ -10,4 +10,11 @@ class FraudEngineConfig(AppConfig):
     
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.fraud_engine'
-    verbose_name = 'Fraud Engine'
\ No newline at end of file
+    verbose_name = 'Fraud Engine'
+    
+    def ready(self):
+        """
+        Initialize app when Django starts.
+        """
+        # Import signals
+        import apps.fraud_engine.signals  # noqa
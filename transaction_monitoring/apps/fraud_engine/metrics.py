@@ -0,0 +1,24 @@
+"""
+Metrics for the Fraud Engine app.
+"""
+
+from apps.core.metrics import Counter, Histogram
+
+STAGE_SECONDS = Histogram(
+    'fraud_engine_stage_seconds',
+    'Time spent in each stage of the fraud detection pipeline',
+    ['stage']
+)
+
+DECISIONS = Counter(
+    'fraud_engine_decisions_total',
+    'Fraud decisions applied to transactions, by outcome',
+    ['decision']
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    'fraud_engine_queue_wait_seconds',
+    'Time tasks waited in their Celery queue before a worker started them',
+    ['queue'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
@@ -0,0 +1,22 @@
+"""
+Middleware for the Fraud Engine app.
+"""
+
+from .services.scoring_service import coalesced_scoring_enqueue
+
+
+class ScoringEnqueueMiddleware:
+    """
+    Middleware to queue the transactions created by a request together.
+    
+    Transactions committed while the request is handled are queued for
+    scoring once the response is ready, with one broker connection and one
+    message per scoring queue.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with coalesced_scoring_enqueue():
+            return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fraud_engine', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frauddetectionresult',
+            name='timed_out_stages',
+            field=models.JSONField(blank=True, default=list, verbose_name='Timed Out Stages'),
+        ),
+    ]
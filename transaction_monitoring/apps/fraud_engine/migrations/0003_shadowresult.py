@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-17 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fraud_engine', '0002_frauddetectionresult_timed_out_stages'),
+        ('ml_engine', '0003_mlmodel_is_shadow'),
+        ('rule_engine', '0003_rule_is_shadow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShadowResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(max_length=100, verbose_name='Transaction ID')),
+                ('triggered', models.BooleanField(default=False, verbose_name='Triggered')),
+                ('risk_score', models.FloatField(default=0.0, verbose_name='Risk Score')),
+                ('execution_time', models.FloatField(verbose_name='Execution Time (ms)')),
+                ('production_decision', models.CharField(blank=True, max_length=20, verbose_name='Production Decision')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('ml_model', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shadow_results', to='ml_engine.mlmodel')),
+                ('rule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shadow_results', to='rule_engine.rule')),
+            ],
+            options={
+                'verbose_name': 'Shadow Result',
+                'verbose_name_plural': 'Shadow Results',
+                'indexes': [models.Index(fields=['rule', 'created_at'], name='fraud_engin_rule_id_023e01_idx'), models.Index(fields=['ml_model', 'created_at'], name='fraud_engin_ml_mode_f66de4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fraud_engine', '0003_shadowresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(max_length=100, verbose_name='Transaction ID')),
+                ('total_time', models.FloatField(verbose_name='Total Time (ms)')),
+                ('query_count', models.IntegerField(default=0, verbose_name='Query Count')),
+                ('is_slow', models.BooleanField(default=False, verbose_name='Slow')),
+                ('spans', models.JSONField(default=list, verbose_name='Spans')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Transaction Trace',
+                'verbose_name_plural': 'Transaction Traces',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['transaction_id'], name='fraud_engin_transac_f10329_idx'), models.Index(fields=['is_slow', 'created_at'], name='fraud_engin_is_slow_f16992_idx')],
+            },
+        ),
+    ]
@@ -56,6 +56,9 @@ class FraudDetectionResult(TimeStampedModel):
     # Triggered rules
     triggered_rules = models.JSONField(_('Triggered Rules'), default=list)
     
+    # Engine stages that missed their time budget
+    timed_out_stages = models.JSONField(_('Timed Out Stages'), default=list, blank=True)
+    
     class Meta:
         verbose_name = _('Fraud Detection Result')
         verbose_name_plural = _('Fraud Detection Results')
@@ -78,6 +81,64 @@ class FraudDetectionResult(TimeStampedModel):
             return f"{self.id} - {self.get_detection_type_display()} - {self.get_risk_level_display()}"
 
 
+class ShadowResult(models.Model):
+    """
+    Outcome of a shadow rule or ML model on a sampled live transaction.
+    
+    One row is written per shadow rule or model and sampled transaction, so
+    the row is kept small. Shadow results never affect the decision.
+    """
+    transaction_id = models.CharField(_('Transaction ID'), max_length=100)
+    rule = models.ForeignKey('rule_engine.Rule', on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='shadow_results')
+    ml_model = models.ForeignKey('ml_engine.MLModel', on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='shadow_results')
+    triggered = models.BooleanField(_('Triggered'), default=False)
+    risk_score = models.FloatField(_('Risk Score'), default=0.0)
+    execution_time = models.FloatField(_('Execution Time (ms)'))
+    production_decision = models.CharField(_('Production Decision'), max_length=20, blank=True)
+    created_at = models.DateTimeField(_('Created at'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Shadow Result')
+        verbose_name_plural = _('Shadow Results')
+        indexes = [
+            models.Index(fields=['rule', 'created_at']),
+            models.Index(fields=['ml_model', 'created_at']),
+        ]
+    
+    def __str__(self):
+        scored_by = self.rule or self.ml_model
+        return f"{self.transaction_id} - {scored_by} - {'triggered' if self.triggered else 'not triggered'}"
+
+
+class TransactionTrace(models.Model):
+    """
+    Timeline of the spans recorded while scoring a transaction.
+    
+    Only sampled and slow transactions are traced, and the spans are kept in
+    one compact JSON list per transaction.
+    """
+    transaction_id = models.CharField(_('Transaction ID'), max_length=100)
+    total_time = models.FloatField(_('Total Time (ms)'))
+    query_count = models.IntegerField(_('Query Count'), default=0)
+    is_slow = models.BooleanField(_('Slow'), default=False)
+    spans = models.JSONField(_('Spans'), default=list)
+    created_at = models.DateTimeField(_('Created at'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Transaction Trace')
+        verbose_name_plural = _('Transaction Traces')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['transaction_id']),
+            models.Index(fields=['is_slow', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.transaction_id} - {self.total_time:.2f}ms"
+
+
 class BlockList(TimeStampedModel):
     """
     Model for storing blocked entities (users, cards, devices, etc.).
@@ -0,0 +1,212 @@
+"""
+Audit service for the Fraud Engine.
+
+This service owns the write-behind buffer for audit rows produced while
+scoring (RuleExecution, VelocityAlert, MLPrediction, FraudDetectionResult and
+TransactionTrace). Scoring only appends rows to the buffer; a background
+thread writes them with bulk inserts once enough rows are buffered or the
+flush interval has passed, so scoring latency does not depend on audit-log
+write throughput.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+from typing import List
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+from apps.core.hit_counts import count_hits
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.rule_engine.services.execution_store import store_rule_executions
+from apps.velocity_engine.models import VelocityRule, VelocityAlert
+from apps.ml_engine.models import MLPrediction
+from ..metrics import STAGE_SECONDS
+from ..models import FraudDetectionResult, TransactionTrace
+
+logger = logging.getLogger(__name__)
+
+
+# Audit models written with plain bulk inserts, in insertion order; rule
+# executions go through the execution store first
+AUDIT_MODELS = (VelocityAlert, MLPrediction, FraudDetectionResult, TransactionTrace)
+
+
+def persist_audit_records(audit_records: List):
+    """
+    Write audit rows with bulk inserts and count rule hits.
+    
+    Rule executions are added to the execution rollups and written as
+    configured by RULE_ENGINE_EXECUTION_STORAGE.
+    
+    Args:
+        audit_records: Unsaved RuleExecution, VelocityAlert, MLPrediction and
+            FraudDetectionResult objects
+    """
+    with STAGE_SECONDS.time(stage='audit_write'), db_transaction.atomic():
+        store_rule_executions([record for record in audit_records if isinstance(record, RuleExecution)])
+        for model in AUDIT_MODELS:
+            model.objects.bulk_create([record for record in audit_records if isinstance(record, model)])
+        
+    # Count rule hits once the rows are written
+    count_hits(Rule, Counter(
+        record.rule_id for record in audit_records
+        if isinstance(record, RuleExecution) and record.triggered
+    ))
+    count_hits(VelocityRule, Counter(
+        record.rule_id for record in audit_records if isinstance(record, VelocityAlert)
+    ))
+
+
+class AuditBuffer:
+    """
+    Write-behind buffer for audit rows.
+    
+    Rows are flushed by a background thread when ``max_size`` rows are
+    buffered or every ``flush_interval_ms`` milliseconds, whichever comes
+    first. With ``synchronous`` set, rows are written as soon as they are
+    added, which keeps tests deterministic.
+    
+    If a flush fails, its rows are put back and retried on the next flush,
+    as long as no more than ``max_pending`` rows are waiting.
+    """
+    
+    def __init__(self, max_size: int, flush_interval_ms: int, max_pending: int, synchronous: bool = False):
+        self.max_size = max_size
+        self.flush_interval_ms = flush_interval_ms
+        self.max_pending = max_pending
+        self.synchronous = synchronous
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+    
+    def add(self, records: List):
+        """
+        Add audit rows to the buffer.
+        
+        Args:
+            records: Unsaved audit model instances
+        """
+        if not records:
+            return
+        
+        if self.synchronous:
+            persist_audit_records(records)
+            return
+        
+        with self._lock:
+            self._buffer.extend(records)
+            is_full = len(self._buffer) >= self.max_size
+            self._ensure_flusher()
+        
+        if is_full:
+            self._wakeup.set()
+    
+    def flush(self):
+        """
+        Write all buffered rows now, in the calling thread.
+        """
+        # Only one flush at a time so rows are written in order
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            
+            if not records:
+                return
+            
+            try:
+                persist_audit_records(records)
+            except Exception as e:
+                with self._lock:
+                    if len(self._buffer) + len(records) <= self.max_pending:
+                        self._buffer[:0] = records
+                        logger.error(f"Error writing {len(records)} audit rows, retrying on next flush: {str(e)}", exc_info=True)
+                    else:
+                        logger.error(f"Error writing {len(records)} audit rows, dropping them: {str(e)}", exc_info=True)
+    
+    def close(self):
+        """
+        Stop the background flusher and write any remaining rows.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+    
+    def pending(self) -> int:
+        """
+        Get the number of buffered rows.
+        
+        Returns:
+            Number of rows waiting to be written
+        """
+        with self._lock:
+            return len(self._buffer)
+    
+    def _ensure_flusher(self):
+        # Must be called with the lock held
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='fraud-engine-audit-flusher', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval_ms / 1000.0)
+            self._wakeup.clear()
+            
+            # The flusher thread has its own database connection
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+_audit_buffer = None
+_audit_buffer_lock = threading.Lock()
+
+
+def get_audit_buffer() -> AuditBuffer:
+    """
+    Get the process-wide audit buffer.
+    
+    Returns:
+        The AuditBuffer instance
+    """
+    global _audit_buffer
+    
+    if _audit_buffer is None:
+        with _audit_buffer_lock:
+            if _audit_buffer is None:
+                _audit_buffer = AuditBuffer(
+                    max_size=settings.FRAUD_ENGINE_AUDIT_BUFFER_SIZE,
+                    flush_interval_ms=settings.FRAUD_ENGINE_AUDIT_FLUSH_INTERVAL_MS,
+                    max_pending=settings.FRAUD_ENGINE_AUDIT_MAX_PENDING,
+                    synchronous=settings.FRAUD_ENGINE_AUDIT_SYNC_FLUSH,
+                )
+                # Don't lose buffered rows when the process exits
+                atexit.register(_audit_buffer.close)
+    
+    return _audit_buffer
+
+
+def buffer_audit_records(records: List):
+    """
+    Queue audit rows for a write-behind bulk insert.
+    
+    Args:
+        records: Unsaved RuleExecution, VelocityAlert, MLPrediction and
+            FraudDetectionResult objects
+    """
+    get_audit_buffer().add(records)
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def flush_audit_buffer_on_shutdown(**kwargs):
+    """Write buffered audit rows before a Celery worker process exits."""
+    if _audit_buffer is not None:
+        _audit_buffer.close()
@@ -0,0 +1,663 @@
+"""
+Backtest service for the Fraud Engine.
+
+This service replays a historical window of transactions against a candidate
+configuration (rules, velocity rules, ML models and engine weights) and
+compares the resulting decisions with the stored FraudDetectionResult rows.
+
+Nothing is written to the database. Rule conditions are evaluated over each
+batch as column expressions with their execution records discarded, velocity
+counts are rebuilt in memory from the replayed transactions instead of the
+live counters, and ML models score each batch with one call per model. The blocklist and AML results cannot be replayed
+without side effects, so the stored results of those stages are reused.
+
+The window is split into shards, by time range or by user ID range, which
+are scored in a process pool. Each shard returns aggregate counts only, so
+the size of the report does not depend on the number of transactions.
+"""
+
+import time
+import logging
+import multiprocessing
+from bisect import bisect_right
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
+
+from apps.core.scoring_context import ScoringContext
+from apps.ml_engine.models import MLModel, MLPrediction
+from apps.ml_engine.services.feature_service import extract_features, transform_features
+from apps.ml_engine.services.prediction_service import combine_model_scores, load_model_file, predict_risk_scores
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.rule_index import RuleIndex
+from apps.rule_engine.services.vectorizer import evaluate_batch_conditions
+from apps.transactions.models import Transaction
+from apps.velocity_engine.models import VelocityRule
+from apps.velocity_engine.services import get_applicable_velocity_rules
+from ..models import FraudDetectionResult
+from .decision_service import make_fraud_decision
+
+logger = logging.getLogger(__name__)
+
+
+# Ways of splitting the backtest window between workers
+SHARD_BY_TIME = 'time'
+SHARD_BY_USER = 'user'
+SHARD_MODES = (SHARD_BY_TIME, SHARD_BY_USER)
+
+# Decisions counted as flagged
+FLAGGED_DECISIONS = ('review', 'reject')
+
+# Risk score histogram bin edges
+SCORE_BINS = np.linspace(0, 100, 11)
+
+# Reverse one-to-one accessors of the channel transaction models
+CHANNEL_ACCESSORS = ('postransaction', 'ecommercetransaction', 'wallettransaction')
+
+
+def run_backtest(
+    start,
+    end,
+    config: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+    shard_by: str = SHARD_BY_TIME,
+    batch_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Re-score the transactions of a time window with a candidate configuration.
+    
+    Args:
+        start: Start of the window (inclusive)
+        end: End of the window (exclusive)
+        config: Candidate configuration with optional keys ``rule_ids``,
+            ``velocity_rule_ids`` and ``ml_model_ids`` (lists of IDs, which
+            may include inactive ones) and ``weights`` (engine weights for
+            the decision). Omitted keys use the active production objects.
+        workers: Number of worker processes. With one worker the shards
+            are scored in this process.
+        shard_by: Split the window by SHARD_BY_TIME or SHARD_BY_USER
+        batch_size: Number of transactions loaded and scored per batch
+    
+    Returns:
+        Dictionary with the comparison report
+    """
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"Invalid shard mode: {shard_by}. Must be one of: {', '.join(SHARD_MODES)}")
+    
+    config = dict(config or {})
+    workers = workers or settings.FRAUD_ENGINE_BACKTEST_WORKERS
+    batch_size = batch_size or settings.FRAUD_ENGINE_BACKTEST_BATCH_SIZE
+    start_time = time.time()
+    
+    # More shards than workers so a busy shard doesn't hold up the whole run
+    shards = plan_shards(start, end, shard_by, workers * 4 if workers > 1 else 1)
+    jobs = [(shard, config, batch_size) for shard in shards]
+    
+    report = BacktestReport()
+    if workers <= 1:
+        for job in jobs:
+            report.merge(backtest_shard(*job))
+    else:
+        # Workers open their own connections, none may be inherited
+        connections.close_all()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        with executor:
+            for partial in executor.map(_backtest_shard_job, jobs):
+                report.merge(partial)
+    
+    result = report.as_dict()
+    elapsed = time.time() - start_time
+    result.update({
+        'window': {'start': start.isoformat(), 'end': end.isoformat()},
+        'config': config,
+        'shard_by': shard_by,
+        'shards': len(shards),
+        'workers': workers,
+        'elapsed_seconds': round(elapsed, 2),
+        'transactions_per_second': round(result['transactions'] / max(elapsed, 0.001), 1),
+    })
+    
+    logger.info(
+        f"Backtest of {result['transactions']} transactions from {start} to {end} "
+        f"finished in {elapsed:.2f}s, {result['changed']} decisions changed"
+    )
+    
+    return result
+
+
+def plan_shards(start, end, shard_by: str, shard_count: int) -> List[Dict[str, Any]]:
+    """
+    Split a backtest window into shards.
+    
+    Args:
+        start: Start of the window (inclusive)
+        end: End of the window (exclusive)
+        shard_by: SHARD_BY_TIME or SHARD_BY_USER
+        shard_count: Number of shards to aim for
+    
+    Returns:
+        List of shard dicts with ``start``, ``end``, ``user_min`` and
+        ``user_max`` (the user bounds are None when not sharding by user)
+    """
+    if shard_by == SHARD_BY_USER:
+        bounds = user_id_boundaries(start, end, shard_count)
+        return [
+            {'start': start, 'end': end, 'user_min': user_min, 'user_max': user_max}
+            for user_min, user_max in zip([None] + bounds, bounds + [None])
+        ]
+    
+    step = (end - start) / max(shard_count, 1)
+    return [
+        {
+            'start': start + step * index,
+            'end': end if index == shard_count - 1 else start + step * (index + 1),
+            'user_min': None,
+            'user_max': None,
+        }
+        for index in range(max(shard_count, 1))
+    ]
+
+
+def user_id_boundaries(start, end, shard_count: int) -> List[str]:
+    """
+    Get user IDs splitting the users of a window into equal shards.
+    
+    Args:
+        start: Start of the window (inclusive)
+        end: End of the window (exclusive)
+        shard_count: Number of shards
+    
+    Returns:
+        Sorted list of up to shard_count - 1 boundary user IDs
+    """
+    user_ids = (
+        Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by('user_id').values_list('user_id', flat=True).distinct()
+    )
+    user_count = user_ids.count()
+    if shard_count <= 1 or user_count <= shard_count:
+        return []
+    
+    step = user_count / shard_count
+    positions = {int(step * index) for index in range(1, shard_count)}
+    return [user_id for index, user_id in enumerate(user_ids.iterator()) if index in positions]
+
+
+def load_candidate(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Load the rules, velocity rules and ML models of a candidate configuration.
+    
+    Candidate objects are marked active in memory only, so inactive rules
+    and models can be backtested before they are switched on.
+    
+    Args:
+        config: The candidate configuration
+    
+    Returns:
+        Dictionary with ``rules`` (a RuleIndex), ``velocity_rules``, ``ml_models`` (list of
+        (MLModel, estimator) pairs) and ``weights``
+    """
+    def select(production, ids):
+        objects = list(production if ids is None else production.model.objects.filter(id__in=ids))
+        for obj in objects:
+            obj.is_active = True
+        return objects
+    
+    ml_models = []
+    for model in select(MLModel.objects.filter(is_active=True, is_shadow=False), config.get('ml_model_ids')):
+        estimator = load_model_file(model)
+        if estimator is not None:
+            ml_models.append((model, estimator))
+    
+    return {
+        'rules': RuleIndex(select(Rule.objects.filter(is_active=True, is_shadow=False), config.get('rule_ids'))),
+        'velocity_rules': select(VelocityRule.objects.filter(is_active=True), config.get('velocity_rule_ids')),
+        'ml_models': ml_models,
+        'weights': config.get('weights'),
+    }
+
+
+def backtest_shard(shard: Dict[str, Any], config: Dict[str, Any], batch_size: int) -> Dict[str, Any]:
+    """
+    Re-score the transactions of one shard.
+    
+    Args:
+        shard: The shard dict from plan_shards
+        config: The candidate configuration
+        batch_size: Number of transactions loaded and scored per batch
+    
+    Returns:
+        The shard's partial report, to be merged with BacktestReport.merge
+    """
+    candidate = load_candidate(config)
+    velocity = VelocityReplay(candidate['velocity_rules'])
+    report = BacktestReport()
+    
+    # Transactions before the shard only feed the velocity counts
+    warmup_start = shard['start'] - timedelta(seconds=velocity.max_window)
+    rows = iter_shard_transactions(shard, warmup_start, batch_size)
+    
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        score_batch(batch, shard['start'], candidate, velocity, report)
+    
+    return report.as_partial()
+
+
+def iter_shard_transactions(shard: Dict[str, Any], warmup_start, batch_size: int):
+    """
+    Stream the transactions of a shard in timestamp order.
+    
+    Channel transactions are loaded with their channel fields in the same
+    query, and the rows are read from a cursor in chunks of batch_size.
+    
+    Yields:
+        The channel transaction objects
+    """
+    queryset = Transaction.objects.filter(timestamp__gte=warmup_start, timestamp__lt=shard['end'])
+    if shard['user_min'] is not None:
+        queryset = queryset.filter(user_id__gte=shard['user_min'])
+    if shard['user_max'] is not None:
+        queryset = queryset.filter(user_id__lt=shard['user_max'])
+    
+    queryset = queryset.select_related(*CHANNEL_ACCESSORS).order_by('timestamp', 'id')
+    for transaction in queryset.iterator(chunk_size=batch_size):
+        yield as_channel_transaction(transaction)
+
+
+def as_channel_transaction(transaction):
+    """
+    Get the channel subclass object of a transaction loaded with select_related.
+    
+    Args:
+        transaction: The Transaction object
+    
+    Returns:
+        The POSTransaction, EcommerceTransaction or WalletTransaction, or the
+        transaction itself if it has no channel row
+    """
+    for accessor in CHANNEL_ACCESSORS:
+        try:
+            return getattr(transaction, accessor)
+        except ObjectDoesNotExist:
+            continue
+    return transaction
+
+
+def load_baseline(transaction_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the stored detection results of a batch of transactions.
+    
+    Args:
+        transaction_ids: The transaction IDs
+    
+    Returns:
+        Dictionary of transaction ID to its latest stored result
+    """
+    rows = (
+        FraudDetectionResult.objects.filter(transaction_id__in=transaction_ids)
+        .order_by('created_at')
+        .values_list('transaction_id', 'decision', 'risk_score', 'block_check_result', 'aml_engine_result')
+    )
+    return {
+        transaction_id: {
+            'decision': decision,
+            'risk_score': float(risk_score),
+            'block_check': block_check_result or {},
+            'aml_engine': aml_engine_result or {},
+        }
+        for transaction_id, decision, risk_score, block_check_result, aml_engine_result in rows
+    }
+
+
+def load_stored_features(transaction_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the raw ML features stored with the predictions of a batch.
+    
+    Replaying the stored features avoids the history queries of live
+    feature extraction and scores the features as they were at the time.
+    
+    Args:
+        transaction_ids: The transaction IDs
+    
+    Returns:
+        Dictionary of transaction ID to its latest stored raw features
+    """
+    rows = (
+        MLPrediction.objects.filter(transaction_id__in=transaction_ids)
+        .order_by('created_at')
+        .values_list('transaction_id', 'features')
+    )
+    return {transaction_id: features for transaction_id, features in rows if features}
+
+
+def score_batch(batch: List, window_start, candidate: Dict[str, Any], velocity, report):
+    """
+    Re-score a batch of transactions and add the outcome to a report.
+    
+    Args:
+        batch: Channel transaction objects in timestamp order
+        window_start: Start of the shard; earlier transactions only feed
+            the velocity counts
+        candidate: The loaded candidate configuration
+        velocity: The shard's VelocityReplay
+        report: The BacktestReport to add to
+    """
+    scored = []
+    for transaction in batch:
+        context = ScoringContext(transaction)
+        velocity_result = velocity.observe(transaction, context)
+        if transaction.timestamp >= window_start:
+            scored.append((transaction, context, velocity_result))
+    
+    if not scored:
+        return
+    
+    transaction_ids = [transaction.transaction_id for transaction, context, velocity_result in scored]
+    baseline = load_baseline(transaction_ids)
+    ml_scores = score_ml_batch(scored, candidate['ml_models'])
+    batch_conditions = evaluate_batch_conditions(
+        candidate['rules'].rules,
+        [transaction for transaction, context, velocity_result in scored],
+        [context for transaction, context, velocity_result in scored]
+    )
+    
+    for (transaction, context, velocity_result), ml_score in zip(scored, ml_scores):
+        stored = baseline.get(transaction.transaction_id)
+        results = {
+            'block_check': stored['block_check'] if stored else {},
+            'rule_engine': evaluate_rules(
+                transaction, rules=candidate['rules'], execution_records=[], context=context,
+                batch_conditions=batch_conditions
+            ),
+            'velocity_engine': velocity_result,
+            'ml_engine': {'risk_score': ml_score},
+            'aml_engine': stored['aml_engine'] if stored else {},
+            'triggered_rules': [],
+        }
+        for stage in ('rule_engine', 'velocity_engine', 'aml_engine'):
+            results['triggered_rules'].extend(results[stage].get('triggered_rules', []))
+        
+        decision_result = make_fraud_decision(transaction, results, weights=candidate['weights'])
+        report.add(transaction.transaction_id, stored, decision_result)
+    
+    report.fold_scores()
+
+
+def score_ml_batch(scored: List[Tuple], ml_models: List[Tuple]) -> List[float]:
+    """
+    Score a batch of transactions with the candidate ML models.
+    
+    Each model scores the whole batch with one call.
+    
+    Args:
+        scored: List of (transaction, context, velocity result) tuples
+        ml_models: List of (MLModel, estimator) pairs
+    
+    Returns:
+        List of ensemble risk scores, one per transaction
+    """
+    if not ml_models:
+        return [0.0] * len(scored)
+    
+    stored_features = load_stored_features(
+        [transaction.transaction_id for transaction, context, velocity_result in scored]
+    )
+    feature_rows = [
+        transform_features(
+            stored_features.get(transaction.transaction_id) or extract_features(transaction, context)
+        )
+        for transaction, context, velocity_result in scored
+    ]
+    
+    model_scores = []
+    for model, estimator in ml_models:
+        try:
+            model_scores.append((model.model_type, predict_risk_scores(model, estimator, feature_rows)))
+        except Exception as e:
+            logger.error(f"Error using model {model.name} in backtest: {str(e)}", exc_info=True)
+    
+    return [
+        float(combine_model_scores((model_type, scores[index]) for model_type, scores in model_scores))
+        for index in range(len(scored))
+    ]
+
+
+class VelocityReplay:
+    """
+    Rebuilds velocity counts in memory from transactions in timestamp order.
+    
+    Each entity keeps the timestamps of its transactions within the longest
+    rule window, so the count for any window is a binary search away. A
+    transaction is counted once per entity, whichever rules apply to it.
+    """
+    
+    def __init__(self, rules: List[VelocityRule]):
+        self.rules = rules
+        self.max_window = max((rule.time_window for rule in rules), default=0)
+        self._events = defaultdict(deque)
+    
+    def observe(self, transaction, context: ScoringContext) -> Dict[str, Any]:
+        """
+        Count a transaction and check it against the velocity rules.
+        
+        Args:
+            transaction: The transaction object
+            context: The transaction's ScoringContext
+        
+        Returns:
+            Dictionary with the velocity check result
+        """
+        result = {
+            'triggered_rules': [],
+            'risk_score': 0.0,
+            'rules_evaluated': 0,
+            'rules_triggered': 0,
+        }
+        rules = get_applicable_velocity_rules(transaction, self.rules)
+        if not rules:
+            return result
+        
+        timestamp = transaction.timestamp.timestamp()
+        for entity_type in {rule.entity_type for rule in rules}:
+            entity_value = context.entity_keys.get(entity_type)
+            if entity_value:
+                events = self._events[(entity_type, entity_value)]
+                events.append(timestamp)
+                while events[0] <= timestamp - self.max_window:
+                    events.popleft()
+        
+        max_risk_score = 0.0
+        for rule in rules:
+            entity_value = context.entity_keys.get(rule.entity_type)
+            if entity_value:
+                events = self._events[(rule.entity_type, entity_value)]
+                count = len(events) - bisect_right(events, timestamp - rule.time_window)
+                if count > rule.threshold:
+                    result['triggered_rules'].append({
+                        'id': rule.id,
+                        'name': rule.name,
+                        'description': rule.description,
+                        'rule_type': 'velocity',
+                        'action': rule.action,
+                        'risk_score': float(rule.risk_score),
+                        'entity_type': rule.entity_type,
+                        'time_window': rule.time_window,
+                        'threshold': rule.threshold,
+                        'count': count
+                    })
+                    max_risk_score = max(max_risk_score, float(rule.risk_score))
+                    result['rules_triggered'] += 1
+            result['rules_evaluated'] += 1
+        
+        result['risk_score'] = max_risk_score
+        return result
+
+
+class BacktestReport:
+    """
+    Accumulates the comparison between stored and candidate decisions.
+    
+    Only counts, sums and histograms are kept, plus a bounded sample of
+    transactions whose decision changed.
+    """
+    
+    def __init__(self):
+        self.transactions = 0
+        self.without_baseline = 0
+        self.decisions = {'baseline': Counter(), 'candidate': Counter()}
+        self.changes = Counter()
+        self.score_sums = {'baseline': 0.0, 'candidate': 0.0}
+        self.histograms = {
+            'baseline': np.zeros(len(SCORE_BINS) - 1, dtype=np.int64),
+            'candidate': np.zeros(len(SCORE_BINS) - 1, dtype=np.int64),
+        }
+        self.changed_sample = []
+        self._scores = {'baseline': [], 'candidate': []}
+    
+    def add(self, transaction_id: str, stored: Optional[Dict[str, Any]], decision_result: Dict[str, Any]):
+        """
+        Add one re-scored transaction.
+        
+        Args:
+            transaction_id: The transaction ID
+            stored: The stored result from load_baseline, or None
+            decision_result: The candidate decision result
+        """
+        self.transactions += 1
+        decision = decision_result['decision']
+        self.decisions['candidate'][decision] += 1
+        self.score_sums['candidate'] += decision_result['risk_score']
+        self._scores['candidate'].append(decision_result['risk_score'])
+        
+        if stored is None:
+            self.without_baseline += 1
+            return
+        
+        self.decisions['baseline'][stored['decision']] += 1
+        self.score_sums['baseline'] += stored['risk_score']
+        self._scores['baseline'].append(stored['risk_score'])
+        
+        if stored['decision'] != decision:
+            self.changes[(stored['decision'], decision)] += 1
+            if len(self.changed_sample) < settings.FRAUD_ENGINE_BACKTEST_SAMPLE_SIZE:
+                self.changed_sample.append({
+                    'transaction_id': transaction_id,
+                    'baseline_decision': stored['decision'],
+                    'baseline_risk_score': stored['risk_score'],
+                    'candidate_decision': decision,
+                    'candidate_risk_score': decision_result['risk_score'],
+                    'flag_reason': decision_result.get('flag_reason', ''),
+                })
+    
+    def fold_scores(self):
+        """Bin the risk scores added since the last fold, in one call per side."""
+        for side, scores in self._scores.items():
+            if scores:
+                self.histograms[side] += np.histogram(np.clip(scores, 0, 100), bins=SCORE_BINS)[0]
+                self._scores[side] = []
+    
+    def as_partial(self) -> Dict[str, Any]:
+        """
+        Get the accumulated state for merging into another report.
+        
+        Returns:
+            Dictionary of picklable counts
+        """
+        self.fold_scores()
+        return {
+            'transactions': self.transactions,
+            'without_baseline': self.without_baseline,
+            'decisions': {side: dict(counts) for side, counts in self.decisions.items()},
+            'changes': dict(self.changes),
+            'score_sums': dict(self.score_sums),
+            'histograms': {side: histogram.tolist() for side, histogram in self.histograms.items()},
+            'changed_sample': self.changed_sample,
+        }
+    
+    def merge(self, partial: Dict[str, Any]):
+        """
+        Merge the partial report of a shard.
+        
+        Args:
+            partial: Dictionary from as_partial
+        """
+        self.transactions += partial['transactions']
+        self.without_baseline += partial['without_baseline']
+        for side in ('baseline', 'candidate'):
+            self.decisions[side].update(partial['decisions'][side])
+            self.score_sums[side] += partial['score_sums'][side]
+            self.histograms[side] += np.asarray(partial['histograms'][side], dtype=np.int64)
+        self.changes.update(partial['changes'])
+        
+        room = settings.FRAUD_ENGINE_BACKTEST_SAMPLE_SIZE - len(self.changed_sample)
+        self.changed_sample.extend(partial['changed_sample'][:max(room, 0)])
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Get the comparison report.
+        
+        Returns:
+            Dictionary with decision counts and changes, flag rates, mean
+            risk scores and risk score histograms for the stored and the
+            candidate decisions
+        """
+        self.fold_scores()
+        compared = self.transactions - self.without_baseline
+        counts = {'baseline': compared, 'candidate': self.transactions}
+        
+        def rate(side):
+            flagged = sum(self.decisions[side][decision] for decision in FLAGGED_DECISIONS)
+            return round(flagged / counts[side], 4) if counts[side] else None
+        
+        return {
+            'transactions': self.transactions,
+            'without_baseline': self.without_baseline,
+            'changed': sum(self.changes.values()),
+            'decisions': {side: dict(counts) for side, counts in self.decisions.items()},
+            'decision_changes': {
+                f"{baseline} -> {candidate}": count
+                for (baseline, candidate), count in self.changes.most_common()
+            },
+            'flag_rate': {side: rate(side) for side in counts},
+            'mean_risk_score': {
+                side: round(self.score_sums[side] / counts[side], 2) if counts[side] else None
+                for side in counts
+            },
+            'score_distribution': {
+                'bins': SCORE_BINS.tolist(),
+                'baseline': self.histograms['baseline'].tolist(),
+                'candidate': self.histograms['candidate'].tolist(),
+            },
+            'changed_sample': self.changed_sample,
+        }
+
+
+def _init_worker():
+    """Set up Django in a spawned backtest worker."""
+    import django
+    
+    django.setup()
+
+
+def _backtest_shard_job(job: Tuple[Dict[str, Any], Dict[str, Any], int]) -> Dict[str, Any]:
+    """Run backtest_shard for a (shard, config, batch size) job in a worker."""
+    shard, config, batch_size = job
+    try:
+        return backtest_shard(shard, config, batch_size)
+    finally:
+        connections.close_all()
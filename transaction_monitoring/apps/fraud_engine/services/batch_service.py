@@ -0,0 +1,140 @@
+"""
+Batch service for the Fraud Engine.
+
+This service collects transactions queued for fraud detection and hands them
+to the micro-batched scoring task, either once enough transactions have been
+collected or once the oldest one has waited long enough.
+"""
+
+import atexit
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionBatcher:
+    """
+    Collects transactions and dispatches them to the batch scoring task.
+    
+    A batch is sent when ``batch_size`` transactions are buffered or when
+    ``max_wait_ms`` milliseconds have passed since the first transaction
+    of the batch was added, whichever happens first. Batches are sent to
+    ``queue``, or to the default Celery queue when it is None.
+    """
+    
+    def __init__(self, batch_size: int, max_wait_ms: int, queue: Optional[str] = None):
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queue = queue
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def add(self, transaction_id: str, transaction_type: str, channel: str):
+        """
+        Add a transaction to the current batch.
+        
+        Args:
+            transaction_id: The ID of the transaction to score
+            transaction_type: The type of transaction
+            channel: The channel of the transaction
+        """
+        with self._lock:
+            self._buffer.append({
+                'transaction_id': transaction_id,
+                'transaction_type': transaction_type,
+                'channel': channel,
+            })
+            
+            if len(self._buffer) >= self.batch_size:
+                batch = self._take_batch()
+            else:
+                batch = None
+                if self._timer is None:
+                    # Start the wait timer when the first transaction arrives
+                    self._timer = threading.Timer(self.max_wait_ms / 1000.0, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        
+        if batch:
+            self._dispatch(batch)
+    
+    def flush(self):
+        """
+        Dispatch any buffered transactions immediately.
+        """
+        with self._lock:
+            batch = self._take_batch()
+        
+        if batch:
+            self._dispatch(batch)
+    
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        # Must be called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._buffer = self._buffer, []
+        return batch
+    
+    def _dispatch(self, batch: List[Dict[str, Any]]):
+        # Import here to avoid circular imports
+        from ..tasks import process_transaction_batch
+        
+        try:
+            process_transaction_batch.apply_async(args=[batch], queue=self.queue)
+        except Exception as e:
+            logger.error(
+                f"Error queuing batch of {len(batch)} transactions for processing on {self.queue}: {str(e)}",
+                exc_info=True
+            )
+
+
+_batchers = {}
+_batcher_lock = threading.Lock()
+
+
+def get_batcher(queue: Optional[str] = None) -> TransactionBatcher:
+    """
+    Get the process-wide transaction batcher of a queue.
+    
+    Args:
+        queue: The scoring queue the batcher sends its batches to
+    
+    Returns:
+        The TransactionBatcher instance
+    """
+    batcher = _batchers.get(queue)
+    
+    if batcher is None:
+        with _batcher_lock:
+            batcher = _batchers.get(queue)
+            if batcher is None:
+                batcher = TransactionBatcher(
+                    batch_size=settings.FRAUD_ENGINE_BATCH_SIZE,
+                    max_wait_ms=settings.FRAUD_ENGINE_BATCH_MAX_WAIT_MS,
+                    queue=queue,
+                )
+                # Don't lose buffered transactions when the process exits
+                atexit.register(batcher.flush)
+                _batchers[queue] = batcher
+    
+    return batcher
+
+
+def queue_transaction_for_batch(transaction_id: str, transaction_type: str, channel: str,
+                                queue: Optional[str] = None):
+    """
+    Queue a transaction for micro-batched fraud detection.
+    
+    Args:
+        transaction_id: The ID of the transaction to score
+        transaction_type: The type of transaction
+        channel: The channel of the transaction
+        queue: The scoring queue the transaction is routed to
+    """
+    get_batcher(queue).add(transaction_id, transaction_type, channel)
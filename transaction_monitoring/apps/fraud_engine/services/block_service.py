@@ -10,17 +10,19 @@ from typing import Dict, Any
 from django.utils import timezone
 from django.db import models
 from apps.core.utils import hash_sensitive_data
+from apps.core.scoring_context import get_scoring_context
 from ..models import BlockList
 
 logger = logging.getLogger(__name__)
 
 
-def check_blocklist(transaction) -> Dict[str, Any]:
+def check_blocklist(transaction, context=None) -> Dict[str, Any]:
     """
     Check if any entity in the transaction is on the blocklist.
     
     Args:
         transaction: The transaction object
+        context: Optional ScoringContext holding the hashed entity keys
         
     Returns:
         Dictionary with the blocklist check result
@@ -31,6 +33,8 @@ def check_blocklist(transaction) -> Dict[str, Any]:
         'blocked_entities': []
     }
     
+    context = get_scoring_context(transaction, context)
+    
     # Get active blocklist entries
     blocklist_entries = BlockList.objects.filter(
         is_active=True
@@ -42,7 +46,7 @@ def check_blocklist(transaction) -> Dict[str, Any]:
     # Check user_id
     user_blocklist = blocklist_entries.filter(
         entity_type='user_id',
-        entity_value=transaction.user_id
+        entity_value=context.user_id
     ).first()
     
     if user_blocklist:
@@ -50,16 +54,16 @@ def check_blocklist(transaction) -> Dict[str, Any]:
         result['reason'] = user_blocklist.reason
         result['blocked_entities'].append({
             'type': 'user_id',
-            'value': transaction.user_id
+            'value': context.user_id
         })
-        logger.info(f"Transaction {transaction.transaction_id} blocked: User {transaction.user_id} is on blocklist")
+        logger.info(f"Transaction {context.transaction_id} blocked: User {context.user_id} is on blocklist")
         return result
     
     # Check device_id
-    if hasattr(transaction, 'device_id') and transaction.device_id:
+    if context.device_id:
         device_blocklist = blocklist_entries.filter(
             entity_type='device_id',
-            entity_value=transaction.device_id
+            entity_value=context.device_id
         ).first()
         
         if device_blocklist:
@@ -67,35 +71,34 @@ def check_blocklist(transaction) -> Dict[str, Any]:
             result['reason'] = device_blocklist.reason
             result['blocked_entities'].append({
                 'type': 'device_id',
-                'value': transaction.device_id
+                'value': context.device_id
             })
-            logger.info(f"Transaction {transaction.transaction_id} blocked: Device {transaction.device_id} is on blocklist")
+            logger.info(f"Transaction {context.transaction_id} blocked: Device {context.device_id} is on blocklist")
             return result
     
     # Check IP address
-    if hasattr(transaction, 'location_data') and transaction.location_data:
-        ip_address = transaction.location_data.get('ip_address')
-        if ip_address:
-            ip_blocklist = blocklist_entries.filter(
-                entity_type='ip_address',
-                entity_value=ip_address
-            ).first()
-            
-            if ip_blocklist:
-                result['is_blocked'] = True
-                result['reason'] = ip_blocklist.reason
-                result['blocked_entities'].append({
-                    'type': 'ip_address',
-                    'value': ip_address
-                })
-                logger.info(f"Transaction {transaction.transaction_id} blocked: IP {ip_address} is on blocklist")
-                return result
+    ip_address = context.ip_address
+    if ip_address:
+        ip_blocklist = blocklist_entries.filter(
+            entity_type='ip_address',
+            entity_value=ip_address
+        ).first()
+        
+        if ip_blocklist:
+            result['is_blocked'] = True
+            result['reason'] = ip_blocklist.reason
+            result['blocked_entities'].append({
+                'type': 'ip_address',
+                'value': ip_address
+            })
+            logger.info(f"Transaction {context.transaction_id} blocked: IP {ip_address} is on blocklist")
+            return result
     
     # Check merchant_id
-    if hasattr(transaction, 'merchant_id') and transaction.merchant_id:
+    if context.merchant_id:
         merchant_blocklist = blocklist_entries.filter(
             entity_type='merchant_id',
-            entity_value=transaction.merchant_id
+            entity_value=context.merchant_id
         ).first()
         
         if merchant_blocklist:
@@ -103,54 +106,46 @@ def check_blocklist(transaction) -> Dict[str, Any]:
             result['reason'] = merchant_blocklist.reason
             result['blocked_entities'].append({
                 'type': 'merchant_id',
-                'value': transaction.merchant_id
+                'value': context.merchant_id
             })
-            logger.info(f"Transaction {transaction.transaction_id} blocked: Merchant {transaction.merchant_id} is on blocklist")
+            logger.info(f"Transaction {context.transaction_id} blocked: Merchant {context.merchant_id} is on blocklist")
             return result
     
-    # Check card number (if present)
-    if hasattr(transaction, 'payment_method_data') and transaction.payment_method_data:
-        payment_method = transaction.payment_method_data.get('type')
+    # Check card number (if present), using the hash computed once per transaction
+    card_hash = context.card_hash
+    if card_hash is not None:
+        card_blocklist = blocklist_entries.filter(
+            entity_type='card_number',
+            entity_value=card_hash
+        ).first()
         
-        if payment_method in ['credit_card', 'debit_card']:
-            card_details = transaction.payment_method_data.get('card_details', {})
-            if card_details and 'card_number' in card_details:
-                # Hash the card number for comparison with blocklist
-                card_hash = hash_sensitive_data(card_details['card_number'])
-                
-                card_blocklist = blocklist_entries.filter(
-                    entity_type='card_number',
-                    entity_value=card_hash
-                ).first()
-                
-                if card_blocklist:
-                    result['is_blocked'] = True
-                    result['reason'] = card_blocklist.reason
-                    result['blocked_entities'].append({
-                        'type': 'card_number',
-                        'value': 'MASKED'  # Don't include actual card number in result
-                    })
-                    logger.info(f"Transaction {transaction.transaction_id} blocked: Card is on blocklist")
-                    return result
+        if card_blocklist:
+            result['is_blocked'] = True
+            result['reason'] = card_blocklist.reason
+            result['blocked_entities'].append({
+                'type': 'card_number',
+                'value': 'MASKED'  # Don't include actual card number in result
+            })
+            logger.info(f"Transaction {context.transaction_id} blocked: Card is on blocklist")
+            return result
     
     # Check email (if present in metadata)
-    if hasattr(transaction, 'metadata') and transaction.metadata:
-        email = transaction.metadata.get('customer_email')
-        if email:
-            email_blocklist = blocklist_entries.filter(
-                entity_type='email',
-                entity_value=email
-            ).first()
-            
-            if email_blocklist:
-                result['is_blocked'] = True
-                result['reason'] = email_blocklist.reason
-                result['blocked_entities'].append({
-                    'type': 'email',
-                    'value': email
-                })
-                logger.info(f"Transaction {transaction.transaction_id} blocked: Email {email} is on blocklist")
-                return result
+    email = context.email
+    if email:
+        email_blocklist = blocklist_entries.filter(
+            entity_type='email',
+            entity_value=email
+        ).first()
+        
+        if email_blocklist:
+            result['is_blocked'] = True
+            result['reason'] = email_blocklist.reason
+            result['blocked_entities'].append({
+                'type': 'email',
+                'value': email
+            })
+            logger.info(f"Transaction {context.transaction_id} blocked: Email {email} is on blocklist")
+            return result
     
     return result
 
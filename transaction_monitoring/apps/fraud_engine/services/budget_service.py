@@ -0,0 +1,120 @@
+"""
+Latency budget service for the Fraud Engine.
+
+This service tracks the time left for synchronous scoring so the pipeline can
+skip or defer optional work once a request's latency budget is spent.
+"""
+
+import time
+import logging
+from typing import Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyBudget:
+    """
+    Deadline for scoring a single transaction.
+    
+    The pipeline checks the budget between stages, and the engines right
+    before their optional work; every piece of work skipped or deferred is
+    recorded in ``degraded_stages``.
+    
+    Args:
+        budget_ms: The budget in milliseconds
+        start_time: Unix time the budget starts at, defaults to now
+    """
+    
+    def __init__(self, budget_ms: float, start_time: Optional[float] = None):
+        self.budget_ms = budget_ms
+        self.start_time = start_time if start_time is not None else time.time()
+        self.degraded_stages = []
+    
+    def elapsed_ms(self) -> float:
+        """
+        Get the time spent since the budget started.
+        
+        Returns:
+            Elapsed time in milliseconds
+        """
+        return (time.time() - self.start_time) * 1000
+    
+    def remaining_ms(self) -> float:
+        """
+        Get the time left in the budget.
+        
+        Returns:
+            Remaining time in milliseconds, never negative
+        """
+        return max(self.budget_ms - self.elapsed_ms(), 0.0)
+    
+    def is_exhausted(self) -> bool:
+        """
+        Check whether the budget has been spent.
+        
+        Returns:
+            True if no time is left
+        """
+        return self.remaining_ms() <= 0
+    
+    def allows(self, stage: str) -> bool:
+        """
+        Check whether optional work may start within the budget.
+        
+        Optional work is skipped once less than
+        FRAUD_ENGINE_OPTIONAL_WORK_RESERVE_MS is left, so the stage running it
+        can still finish within the budget.
+        
+        Args:
+            stage: Name of the optional work, recorded if it is skipped
+        
+        Returns:
+            True if the work should run
+        """
+        if self.remaining_ms() <= settings.FRAUD_ENGINE_OPTIONAL_WORK_RESERVE_MS:
+            self.degrade(stage)
+            return False
+        return True
+    
+    def degrade(self, stage: str):
+        """
+        Record that work was skipped or deferred to stay within the budget.
+        
+        Args:
+            stage: Name of the degraded stage, e.g. 'ml_engine.explanation'
+        """
+        if stage not in self.degraded_stages:
+            logger.info(
+                f"Latency budget of {self.budget_ms}ms spent after "
+                f"{self.elapsed_ms():.2f}ms, degrading {stage}"
+            )
+            self.degraded_stages.append(stage)
+
+
+def get_latency_budget(merchant_id: Optional[str] = None, requested_ms: Optional[float] = None,
+                       start_time: Optional[float] = None) -> Optional[LatencyBudget]:
+    """
+    Get the latency budget for a synchronous scoring request.
+    
+    A budget requested by the caller takes precedence over a per-merchant
+    budget, which takes precedence over the default budget.
+    
+    Args:
+        merchant_id: The merchant of the transaction, if any
+        requested_ms: The budget requested by the caller, if any
+        start_time: Unix time the request arrived at, defaults to now
+    
+    Returns:
+        A LatencyBudget, or None if scoring is not time-bounded
+    """
+    budget_ms = requested_ms
+    if budget_ms is None and merchant_id:
+        budget_ms = settings.FRAUD_ENGINE_MERCHANT_LATENCY_BUDGETS_MS.get(merchant_id)
+    if budget_ms is None:
+        budget_ms = settings.FRAUD_ENGINE_LATENCY_BUDGET_MS
+    
+    if budget_ms is None:
+        return None
+    
+    return LatencyBudget(float(budget_ms), start_time)
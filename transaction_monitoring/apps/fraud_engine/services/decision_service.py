@@ -6,18 +6,30 @@ the results from all detection engines.
 """
 
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
 
-def make_fraud_decision(transaction, results: Dict[str, Any]) -> Dict[str, Any]:
+# Weight of each engine in the combined risk score (should sum to 1.0)
+ENGINE_WEIGHTS = {
+    'rule_engine': 0.3,
+    'velocity_engine': 0.2,
+    'ml_engine': 0.3,
+    'aml_engine': 0.2,
+}
+
+
+def make_fraud_decision(transaction, results: Dict[str, Any],
+                        weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
     """
     Make a fraud decision based on the results from all detection engines.
     
     Args:
         transaction: The transaction object
         results: Dictionary containing results from all detection engines
+        weights: Optional engine weights overriding ENGINE_WEIGHTS, e.g. for
+            backtesting a candidate configuration
         
     Returns:
         Dictionary with the decision result
@@ -57,11 +69,12 @@ def make_fraud_decision(transaction, results: Dict[str, Any]) -> Dict[str, Any]:
     ml_score = ml_result.get('risk_score', 0.0)
     aml_score = aml_result.get('risk_score', 0.0)
     
-    # Weights for each engine (should sum to 1.0)
-    rule_weight = 0.3
-    velocity_weight = 0.2
-    ml_weight = 0.3
-    aml_weight = 0.2
+    # Weights for each engine
+    weights = {**ENGINE_WEIGHTS, **(weights or {})}
+    rule_weight = weights['rule_engine']
+    velocity_weight = weights['velocity_engine']
+    ml_weight = weights['ml_engine']
+    aml_weight = weights['aml_engine']
     
     # Calculate weighted average
     combined_score = (
@@ -0,0 +1,303 @@
+"""
+Pipeline service for the Fraud Engine.
+
+This service runs a transaction through the detection engines and produces
+the combined results and final decision. It is shared by the
+single-transaction and micro-batched scoring tasks so both paths reach the
+same decision for the same transaction.
+
+Once the blocklist check passes, the rule, velocity, ML and AML engines do
+not depend on each other, so they can run concurrently in a bounded thread
+pool, each with its own time budget.
+"""
+
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, List, Tuple
+from django.conf import settings
+from django.db import close_old_connections
+from apps.core.utils import CustomJSONEncoder
+from apps.core.scoring_context import ScoringContext
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.optimizer import get_rule_optimizer
+from apps.rule_engine.services.profiler import get_rule_profiler
+from apps.velocity_engine.services import check_velocity
+from apps.ml_engine.services.prediction_service import get_fraud_prediction
+from apps.aml.services.monitoring_service import check_aml_risk
+from ..models import FraudDetectionResult
+from .audit_service import buffer_audit_records
+from .block_service import check_blocklist
+from .decision_service import make_fraud_decision
+from .shadow_service import is_sampled
+from .trace_service import activate, current_span, get_current_tracer, stage as trace_stage
+
+logger = logging.getLogger(__name__)
+
+
+# Order in which engine results are combined
+ENGINE_STAGES = ('rule_engine', 'velocity_engine', 'ml_engine', 'aml_engine')
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+
+def get_stage_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide thread pool used to run engine stages.
+    
+    Returns:
+        The ThreadPoolExecutor instance
+    """
+    global _stage_executor
+    
+    if _stage_executor is None:
+        with _stage_executor_lock:
+            if _stage_executor is None:
+                _stage_executor = ThreadPoolExecutor(
+                    max_workers=settings.FRAUD_ENGINE_STAGE_WORKERS,
+                    thread_name_prefix='fraud-engine-stage'
+                )
+    
+    return _stage_executor
+
+
+def _run_stage(func):
+    """
+    Run an engine stage in a pool thread.
+    
+    Each pool thread has its own database connection, so stale connections
+    are cleaned up around the stage the same way Django does per request.
+    """
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+def _timed_stage(stage: str, runner):
+    """
+    Wrap an engine stage so its run time is recorded in the stage histogram
+    and, for a traced transaction, as a span of the trace.
+    
+    The time is recorded when the stage finishes, even if it missed its
+    deadline, so the histogram shows how long the engines really take.
+    """
+    # Capture the trace here, the stage may run in a pool thread
+    tracer = get_current_tracer()
+    parent = current_span()
+    
+    def run():
+        with activate(tracer, parent), trace_stage(stage):
+            return runner()
+    return run
+
+
+def run_detection_pipeline(
+    transaction,
+    rules=None,
+    velocity_rules=None,
+    ml_models=None,
+    audit_records: Optional[List] = None,
+    budget=None,
+    stages: Optional[Tuple[str, ...]] = None,
+    batch_conditions=None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run a transaction through all detection engines and make a decision.
+    
+    Args:
+        transaction: The transaction object
+        rules: Optional list of preloaded active rules
+        velocity_rules: Optional list of preloaded active velocity rules
+        ml_models: Optional list of preloaded active ML models
+        audit_records: Optional list to collect unsaved audit rows
+            (RuleExecution, VelocityAlert, MLPrediction) in. When omitted,
+            the rows are handed to the write-behind audit buffer. Rows of
+            stages that missed their deadline are left out.
+        budget: Optional LatencyBudget. Stages left once it is spent are
+            skipped, and the ML and AML engines check it right before SHAP
+            explanations and advanced AML pattern scans, and skip them once
+            it is nearly spent.
+        stages: Optional subset of ENGINE_STAGES to run. Engines left out
+            contribute nothing to the decision.
+        batch_conditions: Optional BatchRuleConditions of the transaction's
+            batch, passed to the rule engine
+    
+    Returns:
+        Tuple of (results, decision_result)
+    """
+    # Initialize results dictionary
+    results = {
+        'block_check': {},
+        'rule_engine': {},
+        'velocity_engine': {},
+        'ml_engine': {},
+        'aml_engine': {},
+        'triggered_rules': [],
+        'timed_out_stages': [],
+    }
+    if budget is not None:
+        results['degraded_stages'] = budget.degraded_stages
+    
+    # Build the scoring context shared by all engines
+    context = ScoringContext(transaction)
+    
+    # Step 1: Check blocklist
+    with trace_stage('blocklist'):
+        block_result = check_blocklist(transaction, context=context)
+    results['block_check'] = block_result
+    
+    # If blocked, skip the remaining engines
+    if block_result.get('is_blocked', False):
+        with trace_stage('decision'):
+            return results, make_fraud_decision(transaction, results)
+    
+    # Audit rows are collected and handed to the write-behind buffer at the end
+    records = audit_records if audit_records is not None else []
+    
+    # Each stage collects its audit rows apart, a stage that misses its deadline keeps running
+    stage_records = {stage: [] for stage in ENGINE_STAGES}
+    
+    # The rule optimizer may stop early, except for audit-sampled transactions
+    rule_optimizer = get_rule_optimizer() if settings.RULE_ENGINE_OPTIMIZER else None
+    full_evaluation = rule_optimizer is not None and is_sampled(
+        transaction.transaction_id, settings.RULE_ENGINE_FULL_EVALUATION_SAMPLE_RATE
+    )
+    rule_profiler = get_rule_profiler() if settings.RULE_ENGINE_PROFILER else None
+    
+    # Steps 2-5: Rules, velocity, ML and AML
+    stage_runners = {
+        'rule_engine': lambda: evaluate_rules(
+            transaction, rules=rules, execution_records=stage_records['rule_engine'], context=context,
+            batch_conditions=batch_conditions, optimizer=rule_optimizer, full_evaluation=full_evaluation,
+            profiler=rule_profiler
+        ),
+        'velocity_engine': lambda: check_velocity(
+            transaction, rules=velocity_rules, alert_records=stage_records['velocity_engine'], context=context
+        ),
+        'ml_engine': lambda: get_fraud_prediction(
+            transaction, active_models=ml_models, prediction_records=stage_records['ml_engine'],
+            context=context, budget=budget
+        ),
+        'aml_engine': lambda: check_aml_risk(transaction, budget=budget),
+    }
+    stage_runners = {
+        stage: _timed_stage(stage, runner) for stage, runner in stage_runners.items()
+        if stages is None or stage in stages
+    }
+    
+    if settings.FRAUD_ENGINE_PARALLEL_STAGES:
+        results.update(_run_stages_concurrently(transaction, stage_runners, results['timed_out_stages'], budget))
+    else:
+        for stage, runner in stage_runners.items():
+            # Stages left once the budget is spent are skipped, as late stages are when running concurrently
+            if budget is not None and budget.is_exhausted():
+                results['timed_out_stages'].append(stage)
+                results[stage] = {'timed_out': True}
+                budget.degrade(stage)
+                continue
+            results[stage] = runner()
+    
+    # Keep the audit rows of the stages whose results are used
+    for stage in stage_runners:
+        if stage not in results['timed_out_stages']:
+            records.extend(stage_records[stage])
+    
+    # Combine triggered rules in engine order
+    for stage in ('rule_engine', 'velocity_engine', 'aml_engine'):
+        results['triggered_rules'].extend(results[stage].get('triggered_rules', []))
+    
+    # Step 6: Make final decision from the stages that finished
+    with trace_stage('decision'):
+        decision_result = make_fraud_decision(transaction, results)
+    
+    if records is not audit_records:
+        buffer_audit_records(records)
+    
+    return results, decision_result
+
+
+def _run_stages_concurrently(transaction, stages, timed_out_stages: List[str], budget=None) -> Dict[str, Any]:
+    """
+    Run the engine stages concurrently, each within its own time budget.
+    
+    Args:
+        transaction: The transaction object
+        stages: Dictionary of stage name to a callable running the stage
+        timed_out_stages: List to append the names of late stages to
+        budget: Optional LatencyBudget capping every stage deadline
+    
+    Returns:
+        Dictionary of stage name to stage result
+    """
+    executor = get_stage_executor()
+    timeouts = settings.FRAUD_ENGINE_STAGE_TIMEOUTS_MS
+    start_time = time.time()
+    
+    futures = {
+        stage: executor.submit(_run_stage, runner)
+        for stage, runner in stages.items()
+    }
+    
+    stage_results = {}
+    for stage in stages:
+        # Deadlines are measured from submission since the stages run together
+        deadline = start_time + timeouts.get(stage, 1000) / 1000.0
+        if budget is not None:
+            deadline = min(deadline, budget.start_time + budget.budget_ms / 1000.0)
+        try:
+            stage_results[stage] = futures[stage].result(timeout=max(deadline - time.time(), 0))
+        except FutureTimeoutError:
+            # Leave the stage running, its result is simply not used
+            logger.warning(
+                f"Stage {stage} for transaction {transaction.transaction_id} "
+                f"missed its deadline after {(time.time() - start_time) * 1000:.2f}ms"
+            )
+            timed_out_stages.append(stage)
+            stage_results[stage] = {'timed_out': True}
+            if budget is not None:
+                budget.degrade(stage)
+    
+    return stage_results
+
+
+def build_detection_result(
+    transaction_id: str,
+    results: Dict[str, Any],
+    decision_result: Dict[str, Any],
+    processing_time: float
+) -> FraudDetectionResult:
+    """
+    Build an unsaved FraudDetectionResult for a pipeline run.
+    
+    Args:
+        transaction_id: The ID of the transaction
+        results: Dictionary containing results from all detection engines
+        decision_result: The decision result from the decision service
+        processing_time: The processing time in milliseconds
+    
+    Returns:
+        An unsaved FraudDetectionResult object
+    """
+    def to_json(value):
+        # Serialize JSON fields using our custom encoder
+        return json.loads(json.dumps(value, cls=CustomJSONEncoder))
+    
+    return FraudDetectionResult(
+        transaction_id=transaction_id,
+        risk_score=decision_result.get('risk_score', 0.0),
+        is_fraudulent=decision_result.get('is_fraudulent', False),
+        decision=decision_result.get('decision', 'approve'),
+        processing_time=processing_time,
+        block_check_result=to_json(results['block_check']),
+        rule_engine_result=to_json(results['rule_engine']),
+        velocity_engine_result=to_json(results['velocity_engine']),
+        ml_engine_result=to_json(results['ml_engine']),
+        aml_engine_result=to_json(results['aml_engine']),
+        triggered_rules=to_json(results['triggered_rules']),
+        timed_out_stages=list(results.get('timed_out_stages', []))
+    )
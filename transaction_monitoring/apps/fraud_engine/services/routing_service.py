@@ -0,0 +1,259 @@
+"""
+Routing service for the Fraud Engine.
+
+This service picks the Celery queue each transaction is scored on, so that
+card-present authorisations and large or high-tier payments are not stuck
+behind bursts of low-value traffic. Each queue is served by its own worker
+pool. It also measures how long tasks wait in each queue before a worker
+starts them.
+"""
+
+import time
+import logging
+from typing import Dict, Any, List, Optional
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from ..metrics import QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LAG_CACHE_PREFIX = 'fraud_engine:queue_lag'
+
+# Seconds covered by each bucket of lag samples
+LAG_BUCKET_SECONDS = 60
+
+# Message header holding the time a task was published
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+
+def get_merchant_tier(merchant_id: Optional[str]) -> str:
+    """
+    Get the tier of a merchant.
+    
+    Args:
+        merchant_id: The merchant ID, if any
+    
+    Returns:
+        The merchant tier from FRAUD_ENGINE_MERCHANT_TIERS, or the default tier
+    """
+    return settings.FRAUD_ENGINE_MERCHANT_TIERS.get(merchant_id, settings.FRAUD_ENGINE_DEFAULT_MERCHANT_TIER)
+
+
+def route_matches(route: Dict[str, Any], channel: str, amount, merchant_tier: str) -> bool:
+    """
+    Check whether a transaction matches a scoring route.
+    
+    Every criterion the route sets must match; criteria it leaves out match
+    any transaction.
+    
+    Args:
+        route: The route from FRAUD_ENGINE_SCORING_ROUTES
+        channel: The channel of the transaction
+        amount: The amount of the transaction
+        merchant_tier: The tier of the transaction's merchant
+    
+    Returns:
+        True if the route applies to the transaction
+    """
+    if 'channels' in route and channel not in route['channels']:
+        return False
+    if 'merchant_tiers' in route and merchant_tier not in route['merchant_tiers']:
+        return False
+    if route.get('min_amount') is not None and amount < route['min_amount']:
+        return False
+    if route.get('max_amount') is not None and amount >= route['max_amount']:
+        return False
+    return True
+
+
+def get_scoring_queue(channel: str, amount, merchant_id: Optional[str] = None) -> str:
+    """
+    Get the Celery queue a transaction is scored on.
+    
+    Routes are tried in the order of FRAUD_ENGINE_SCORING_ROUTES and the
+    first one that matches wins.
+    
+    Args:
+        channel: The channel of the transaction
+        amount: The amount of the transaction
+        merchant_id: The merchant ID, if any
+    
+    Returns:
+        The queue name
+    """
+    merchant_tier = get_merchant_tier(merchant_id)
+    for route in settings.FRAUD_ENGINE_SCORING_ROUTES:
+        if route_matches(route, channel, amount, merchant_tier):
+            return route['queue']
+    return settings.FRAUD_ENGINE_DEFAULT_SCORING_QUEUE
+
+
+def get_transaction_queue(transaction) -> str:
+    """
+    Get the Celery queue a transaction object is scored on.
+    
+    Args:
+        transaction: The transaction object
+    
+    Returns:
+        The queue name
+    """
+    return get_scoring_queue(transaction.channel, transaction.amount, transaction.merchant_id)
+
+
+def get_scoring_queues() -> List[str]:
+    """
+    Get the names of the queues transactions are routed to for scoring.
+    
+    Returns:
+        The default scoring queue and the queues of the scoring routes,
+        without duplicates
+    """
+    queues = [settings.FRAUD_ENGINE_DEFAULT_SCORING_QUEUE]
+    queues.extend(route['queue'] for route in settings.FRAUD_ENGINE_SCORING_ROUTES)
+    return list(dict.fromkeys(queues))
+
+
+def get_monitored_queues() -> List[str]:
+    """
+    Get the names of the queues used by the fraud engine.
+    
+    Returns:
+        The scoring, bulk and shadow queue names, without duplicates
+    """
+    queues = get_scoring_queues()
+    queues.extend(
+        route['queue'] for route in getattr(settings, 'CELERY_TASK_ROUTES', {}).values()
+        if 'queue' in route
+    )
+    queues.append(settings.FRAUD_ENGINE_SHADOW_QUEUE)
+    return list(dict.fromkeys(queues))
+
+
+def stamp_enqueue_time(headers=None, **kwargs):
+    """
+    Record the publish time in the message headers.
+    
+    Connected to Celery's before_task_publish signal.
+    """
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+def record_task_lag(task=None, **kwargs):
+    """
+    Record how long a task waited in its queue.
+    
+    Connected to Celery's task_prerun signal. Tasks published without a
+    publish time, such as eagerly executed ones, are ignored.
+    """
+    if task is None:
+        return
+    
+    enqueued_at = task.request.get(ENQUEUED_AT_HEADER)
+    queue = (task.request.delivery_info or {}).get('routing_key')
+    if enqueued_at is None or not queue:
+        return
+    
+    lag = max(0.0, time.time() - float(enqueued_at))
+    QUEUE_WAIT_SECONDS.observe(lag, queue=queue)
+    record_queue_lag(queue, lag * 1000)
+
+
+def record_queue_lag(queue: str, lag_ms: float):
+    """
+    Add a lag sample to the current bucket of a queue.
+    
+    Counts and totals use atomic cache increments. The maximum is updated
+    with a read and a write, so concurrent workers may occasionally lose a
+    sample of it, which is acceptable for monitoring.
+    
+    Args:
+        queue: The queue name
+        lag_ms: Time (ms) the task waited in the queue
+    """
+    bucket = int(time.time() // LAG_BUCKET_SECONDS)
+    key = f"{LAG_CACHE_PREFIX}:{queue}:{bucket}"
+    timeout = settings.FRAUD_ENGINE_QUEUE_LAG_WINDOW + LAG_BUCKET_SECONDS
+    
+    try:
+        for suffix, delta in (('count', 1), ('total_ms', int(lag_ms))):
+            cache.add(f"{key}:{suffix}", 0, timeout)
+            cache.incr(f"{key}:{suffix}", delta)
+        
+        if lag_ms > cache.get(f"{key}:max_ms", 0):
+            cache.set(f"{key}:max_ms", lag_ms, timeout)
+        cache.set(f"{LAG_CACHE_PREFIX}:{queue}:last_ms", lag_ms, timeout)
+    except Exception as e:
+        logger.warning(f"Error recording lag of queue {queue}: {str(e)}")
+
+
+def get_queue_lag(queue: str) -> Dict[str, Any]:
+    """
+    Summarize the lag samples of a queue over FRAUD_ENGINE_QUEUE_LAG_WINDOW.
+    
+    Args:
+        queue: The queue name
+    
+    Returns:
+        Dictionary with the number of tasks started and their mean, maximum
+        and most recent lag in milliseconds
+    """
+    current = int(time.time() // LAG_BUCKET_SECONDS)
+    buckets = range(current - settings.FRAUD_ENGINE_QUEUE_LAG_WINDOW // LAG_BUCKET_SECONDS, current + 1)
+    keys = [
+        f"{LAG_CACHE_PREFIX}:{queue}:{bucket}:{suffix}"
+        for bucket in buckets
+        for suffix in ('count', 'total_ms', 'max_ms')
+    ]
+    last_key = f"{LAG_CACHE_PREFIX}:{queue}:last_ms"
+    values = cache.get_many(keys + [last_key])
+    
+    count = sum(values.get(key, 0) for key in keys if key.endswith(':count'))
+    total_ms = sum(values.get(key, 0) for key in keys if key.endswith(':total_ms'))
+    max_ms = max((values.get(key, 0) for key in keys if key.endswith(':max_ms')), default=0)
+    
+    return {
+        'tasks_started': count,
+        'mean_lag_ms': round(total_ms / count, 1) if count else None,
+        'max_lag_ms': round(max_ms, 1) if count else None,
+        'last_lag_ms': round(values[last_key], 1) if last_key in values else None,
+    }
+
+
+def get_queue_depths(queues: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Get the number of messages waiting in each queue of the Redis broker.
+    
+    Args:
+        queues: The queue names
+    
+    Returns:
+        Dictionary of queue name to depth, None where it could not be read
+    """
+    try:
+        broker = redis.from_url(settings.CELERY_BROKER_URL, socket_connect_timeout=1)
+        return {queue: broker.llen(queue) for queue in queues}
+    except redis.RedisError as e:
+        logger.warning(f"Error reading queue depths: {str(e)}")
+        return {queue: None for queue in queues}
+
+
+def get_queue_metrics(include_depth: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the lag and depth of every fraud engine queue.
+    
+    Args:
+        include_depth: Whether to read the queue depths from the broker
+    
+    Returns:
+        Dictionary of queue name to its metrics
+    """
+    queues = get_monitored_queues()
+    depths = get_queue_depths(queues) if include_depth else {}
+    
+    return {
+        queue: {'depth': depths.get(queue), **get_queue_lag(queue)}
+        for queue in queues
+    }
@@ -0,0 +1,338 @@
+"""
+Scoring service for the Fraud Engine.
+
+This service is the single entry point for scoring a transaction. Callers
+choose how the transaction is scored:
+
+- ``inline``: run the full detection pipeline now and apply the decision.
+- ``async``: queue the transaction for the Celery scoring task.
+- ``inline_fast``: run the fast engines now for a provisional decision and
+  queue the full pipeline, whose decision replaces the provisional one.
+
+Transactions scored inline are not queued again by the transaction
+``post_save`` signal. Transactions are queued only once the database
+transaction that wrote them commits, so workers never load a row that is
+not visible yet, and everything queued in one request or database
+transaction is published together.
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, Optional, List
+from django.conf import settings
+from django.db import transaction as db_transaction
+from apps.transactions.services.dedup_service import remember_decisions
+from ..metrics import DECISIONS
+from .audit_service import buffer_audit_records
+from .pipeline_service import run_detection_pipeline, build_detection_result
+from .routing_service import get_transaction_queue
+from .shadow_service import enqueue_shadow_scoring
+from .trace_service import stage as trace_stage, trace_transaction
+
+logger = logging.getLogger(__name__)
+
+
+SCORING_MODE_INLINE = 'inline'
+SCORING_MODE_ASYNC = 'async'
+SCORING_MODE_INLINE_FAST = 'inline_fast'
+
+SCORING_MODES = (SCORING_MODE_INLINE, SCORING_MODE_ASYNC, SCORING_MODE_INLINE_FAST)
+
+# Transaction fields set from the fraud decision
+DECISION_FIELDS = ['status', 'is_flagged', 'flag_reason', 'risk_score', 'updated_at']
+
+_signal_state = threading.local()
+
+_enqueue_state = threading.local()
+
+
+@contextmanager
+def post_save_scoring_suppressed():
+    """
+    Stop the transaction post_save signal from queueing scoring.
+    
+    Used around saves of transactions that the caller scores itself.
+    """
+    previous = getattr(_signal_state, 'suppressed', False)
+    _signal_state.suppressed = True
+    try:
+        yield
+    finally:
+        _signal_state.suppressed = previous
+
+
+def is_post_save_scoring_suppressed() -> bool:
+    """
+    Check whether the post_save signal should skip queueing scoring.
+    
+    Returns:
+        True inside post_save_scoring_suppressed()
+    """
+    return getattr(_signal_state, 'suppressed', False)
+
+
+def score_transaction(transaction, mode: Optional[str] = None, budget=None) -> Dict[str, Any]:
+    """
+    Score a transaction in the given mode.
+    
+    Args:
+        transaction: The saved transaction object
+        mode: One of SCORING_MODES, defaults to FRAUD_ENGINE_API_SCORING_MODE
+        budget: Optional LatencyBudget for the inline part of the scoring
+    
+    Returns:
+        Dictionary with the scoring mode and, unless the transaction was only
+        queued, the engine results, decision result and processing time
+    """
+    mode = mode or settings.FRAUD_ENGINE_API_SCORING_MODE
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Invalid scoring mode: {mode}. Must be one of: {', '.join(SCORING_MODES)}")
+    
+    if mode == SCORING_MODE_ASYNC:
+        enqueue_scoring_on_commit([transaction])
+        return {'mode': mode}
+    
+    start_time = time.time()
+    
+    with trace_transaction(transaction.transaction_id, 'score_transaction'):
+        if mode == SCORING_MODE_INLINE_FAST:
+            # Provisional decision from the fast engines. Its audit rows are not
+            # kept since the deep scoring records the full run.
+            results, decision_result = run_detection_pipeline(
+                transaction,
+                audit_records=[],
+                budget=budget,
+                stages=settings.FRAUD_ENGINE_FAST_STAGES
+            )
+            apply_decision(transaction, decision_result)
+            enqueue_scoring_on_commit([transaction])
+        else:
+            audit_records = []
+            results, decision_result = run_detection_pipeline(transaction, audit_records=audit_records, budget=budget)
+            apply_decision(transaction, decision_result)
+            DECISIONS.inc(decision=decision_result.get('decision', 'approve'))
+            
+            processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+            audit_records.append(
+                build_detection_result(transaction.transaction_id, results, decision_result, processing_time)
+            )
+            buffer_audit_records(audit_records)
+            enqueue_shadow_scoring([(transaction, decision_result.get('decision'))])
+            
+            if decision_result.get('is_flagged', False) and not results['block_check'].get('is_blocked', False):
+                # Import here to avoid circular imports
+                from ..tasks import create_fraud_case
+                
+                # Use Celery to create the fraud case asynchronously
+                create_fraud_case.delay(transaction.transaction_id, decision_result, results)
+    
+    return {
+        'mode': mode,
+        'results': results,
+        'decision_result': decision_result,
+        'processing_time': (time.time() - start_time) * 1000,
+    }
+
+
+def apply_decision(transaction, decision_result: Dict[str, Any]):
+    """
+    Update a transaction with a fraud decision.
+    
+    Args:
+        transaction: The transaction object
+        decision_result: The decision result from the decision service
+    """
+    transaction.status = decision_result.get('status', 'pending')
+    transaction.is_flagged = decision_result.get('is_flagged', False)
+    transaction.flag_reason = decision_result.get('flag_reason', '')
+    transaction.risk_score = decision_result.get('risk_score', 0.0)
+    with trace_stage('persistence'):
+        transaction.save(update_fields=DECISION_FIELDS)
+    
+    # Answer resubmissions of the transaction with this decision
+    remember_decisions([(transaction, decision_result.get('decision'))])
+
+
+def enqueue_transaction_scoring(transaction, producer=None):
+    """
+    Queue a transaction for scoring by the Celery workers now.
+    
+    The transaction goes to the scoring queue picked by its channel, amount
+    and merchant tier. Callers inside a database transaction should use
+    enqueue_scoring_on_commit instead.
+    
+    Args:
+        transaction: The saved transaction object
+        producer: Optional Celery producer to publish with
+    """
+    # Import here to avoid circular imports
+    from ..tasks import process_transaction
+    from .batch_service import queue_transaction_for_batch
+    
+    queue = get_transaction_queue(transaction)
+    if settings.FRAUD_ENGINE_BATCH_SCORING:
+        queue_transaction_for_batch(
+            transaction_id=transaction.transaction_id,
+            transaction_type=transaction.transaction_type,
+            channel=transaction.channel,
+            queue=queue
+        )
+    else:
+        process_transaction.apply_async(
+            kwargs={
+                'transaction_id': transaction.transaction_id,
+                'transaction_type': transaction.transaction_type,
+                'channel': transaction.channel,
+            },
+            queue=queue,
+            **({'producer': producer} if producer is not None else {})
+        )
+
+
+def enqueue_batch_scoring(transactions: List, producer=None):
+    """
+    Queue transactions for scoring in batches of FRAUD_ENGINE_BATCH_SIZE.
+    
+    Used for transactions created in bulk, which don't send post_save. Each
+    batch goes to the scoring queue its transactions are routed to.
+    
+    Args:
+        transactions: The saved transaction objects
+        producer: Optional Celery producer to publish with
+    """
+    # Import here to avoid circular imports
+    from ..tasks import process_transaction_batch
+    
+    # Batches never mix transactions routed to different queues
+    items_by_queue = {}
+    for transaction in transactions:
+        items_by_queue.setdefault(get_transaction_queue(transaction), []).append({
+            'transaction_id': transaction.transaction_id,
+            'transaction_type': transaction.transaction_type,
+            'channel': transaction.channel,
+        })
+    
+    batch_size = settings.FRAUD_ENGINE_BATCH_SIZE
+    for queue, items in items_by_queue.items():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                process_transaction_batch.apply_async(
+                    args=[batch],
+                    queue=queue,
+                    **({'producer': producer} if producer is not None else {})
+                )
+            except Exception as e:
+                logger.error(
+                    f"Error queuing batch of {len(batch)} transactions for processing on {queue}: {str(e)}",
+                    exc_info=True
+                )
+
+
+class _ScoringCommitHook:
+    """
+    On-commit hook queueing the transactions written in one atomic block.
+    
+    Transactions are keyed by ID, so a transaction saved several times in
+    the block is queued once, after its final write.
+    """
+    
+    def __init__(self, savepoint_ids: List[str]):
+        self.savepoint_ids = savepoint_ids
+        self.transactions = {}
+    
+    def __call__(self):
+        if getattr(_enqueue_state, 'hook', None) is self:
+            _enqueue_state.hook = None
+        
+        if getattr(_enqueue_state, 'depth', 0):
+            # Held until the coalescing scope ends
+            _enqueue_state.committed.update(self.transactions)
+        else:
+            dispatch_scoring(list(self.transactions.values()))
+
+
+def enqueue_scoring_on_commit(transactions: List):
+    """
+    Queue transactions for scoring once the current database transaction commits.
+    
+    Transactions written in the same atomic block share one on-commit hook.
+    If the block is rolled back, Django drops the hook and nothing is
+    queued. Outside an atomic block the transactions are queued right away,
+    or at the end of the enclosing coalesced_scoring_enqueue() scope.
+    
+    Args:
+        transactions: The saved transaction objects
+    """
+    connection = db_transaction.get_connection()
+    hook = getattr(_enqueue_state, 'hook', None)
+    
+    # Reuse the hook only while Django still holds it for this savepoint, so
+    # transactions of a rolled back savepoint never join a committed batch
+    reuse = (
+        hook is not None
+        and connection.in_atomic_block
+        and hook.savepoint_ids == connection.savepoint_ids
+        and any(entry[1] is hook for entry in connection.run_on_commit)
+    )
+    if not reuse:
+        hook = _ScoringCommitHook(list(connection.savepoint_ids))
+    
+    for transaction in transactions:
+        hook.transactions[transaction.transaction_id] = transaction
+    
+    if not reuse:
+        _enqueue_state.hook = hook
+        db_transaction.on_commit(hook)
+
+
+@contextmanager
+def coalesced_scoring_enqueue():
+    """
+    Hold back committed transactions until the block exits, then queue them together.
+    
+    Used around whole requests, so a request that creates many transactions
+    publishes them with one broker connection and one message per scoring
+    queue. Scopes can be nested; the outermost one queues.
+    """
+    depth = getattr(_enqueue_state, 'depth', 0)
+    if depth == 0:
+        _enqueue_state.committed = {}
+    _enqueue_state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _enqueue_state.depth = depth
+        if depth == 0:
+            committed, _enqueue_state.committed = _enqueue_state.committed, {}
+            dispatch_scoring(list(committed.values()))
+
+
+def dispatch_scoring(transactions: List):
+    """
+    Queue committed transactions for scoring in as few messages as possible.
+    
+    A single transaction goes to the scoring task, several go to the batch
+    scoring task. All messages are published with one producer.
+    
+    Args:
+        transactions: The committed transaction objects
+    """
+    if not transactions:
+        return
+    
+    # Import here to avoid circular imports
+    from transaction_monitoring.celery_app import app
+    
+    try:
+        # Eager tasks never reach a broker, so there is nothing to connect to
+        with nullcontext() if app.conf.task_always_eager else app.producer_or_acquire() as producer:
+            if len(transactions) == 1:
+                enqueue_transaction_scoring(transactions[0], producer=producer)
+            else:
+                enqueue_batch_scoring(transactions, producer=producer)
+    except Exception as e:
+        # Log the error but don't raise it, the transactions are already committed
+        logger.error(f"Error queuing {len(transactions)} transactions for processing: {str(e)}", exc_info=True)
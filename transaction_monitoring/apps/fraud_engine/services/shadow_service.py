@@ -0,0 +1,275 @@
+"""
+Shadow scoring service for the Fraud Engine.
+
+Rules and ML models with ``is_shadow`` set are scored on a sampled fraction
+of live transactions before they are activated. Shadow scoring runs in a
+Celery task on a low-priority queue after the production decision is made,
+so it adds no latency to the decision and never changes it. Each shadow
+rule or model writes one compact ShadowResult row per sampled transaction,
+which is used to compare hit rates and latency with production.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from apps.core.scoring_context import ScoringContext
+from apps.core.utils import is_sampled
+from apps.ml_engine.models import MLModel
+from apps.ml_engine.services.feature_service import extract_features, transform_features
+from apps.ml_engine.services.prediction_service import load_model_file, predict_risk_scores
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.rule_index import RuleIndex
+from apps.transactions.models import Transaction, POSTransaction, EcommerceTransaction, WalletTransaction
+from ..models import ShadowResult
+
+logger = logging.getLogger(__name__)
+
+
+CHANNEL_MODELS = {
+    'pos': POSTransaction,
+    'ecommerce': EcommerceTransaction,
+    'wallet': WalletTransaction,
+}
+
+# Shadow ML scores at or above this count as a hit, as in the prediction service
+ML_HIT_THRESHOLD = 80
+
+# Production decisions counted as flagged
+FLAGGED_DECISIONS = ('review', 'reject')
+
+_shadow_config = None
+_shadow_config_loaded_at = 0.0
+_shadow_config_lock = threading.Lock()
+
+
+def get_shadow_config() -> Dict[str, List[int]]:
+    """
+    Get the IDs of the shadow rules and models.
+    
+    The IDs are cached per process for FRAUD_ENGINE_SHADOW_CONFIG_TTL
+    seconds, so deciding whether to enqueue shadow work does not query the
+    database for every transaction.
+    
+    Returns:
+        Dictionary with ``rule_ids`` and ``ml_model_ids`` lists
+    """
+    global _shadow_config, _shadow_config_loaded_at
+    
+    with _shadow_config_lock:
+        if _shadow_config is None or time.time() - _shadow_config_loaded_at >= settings.FRAUD_ENGINE_SHADOW_CONFIG_TTL:
+            _shadow_config = {
+                'rule_ids': list(Rule.objects.filter(is_shadow=True).values_list('id', flat=True)),
+                'ml_model_ids': list(MLModel.objects.filter(is_shadow=True).values_list('id', flat=True)),
+            }
+            _shadow_config_loaded_at = time.time()
+        return _shadow_config
+
+
+def enqueue_shadow_scoring(scored: Iterable[Tuple[Any, Optional[str]]]):
+    """
+    Queue sampled transactions for shadow scoring on the shadow queue.
+    
+    Failures are logged and never affect the production decision.
+    
+    Args:
+        scored: Iterable of (transaction, production decision) pairs
+    """
+    sample_rate = settings.FRAUD_ENGINE_SHADOW_SAMPLE_RATE
+    if sample_rate <= 0:
+        return
+    
+    try:
+        config = get_shadow_config()
+        if not config['rule_ids'] and not config['ml_model_ids']:
+            return
+        
+        items = [
+            {
+                'transaction_id': transaction.transaction_id,
+                'channel': transaction.channel,
+                'decision': decision or '',
+            }
+            for transaction, decision in scored
+            if is_sampled(transaction.transaction_id, sample_rate)
+        ]
+        if not items:
+            return
+        
+        # Import here to avoid circular imports
+        from ..tasks import score_shadow_transactions
+        
+        score_shadow_transactions.apply_async(args=[items], queue=settings.FRAUD_ENGINE_SHADOW_QUEUE)
+    except Exception as e:
+        logger.warning(f"Error queueing shadow scoring: {str(e)}")
+
+
+def run_shadow_scoring(items: List[Dict[str, str]]) -> int:
+    """
+    Score transactions with the shadow rules and models and record the results.
+    
+    Args:
+        items: List of dicts with transaction_id, channel and the production
+            decision, as queued by enqueue_shadow_scoring
+    
+    Returns:
+        Number of ShadowResult rows written
+    """
+    # Shadow rules are scored as if they were active
+    rules = list(Rule.objects.filter(is_shadow=True))
+    for rule in rules:
+        rule.is_active = True
+    
+    ml_models = []
+    for model in MLModel.objects.filter(is_shadow=True):
+        estimator = load_model_file(model)
+        if estimator is not None:
+            ml_models.append((model, estimator))
+    
+    if not rules and not ml_models:
+        return 0
+    rule_index = RuleIndex(rules)
+    
+    # Load the transactions, one query per channel
+    decisions = {item['transaction_id']: item['decision'] for item in items}
+    transaction_ids_by_channel = {}
+    for item in items:
+        transaction_ids_by_channel.setdefault(item['channel'], []).append(item['transaction_id'])
+    
+    transactions = []
+    for channel, transaction_ids in transaction_ids_by_channel.items():
+        model = CHANNEL_MODELS.get(channel, Transaction)
+        transactions.extend(model.objects.filter(transaction_id__in=transaction_ids))
+    
+    shadow_results = []
+    contexts = []
+    for transaction in transactions:
+        context = ScoringContext(transaction)
+        contexts.append(context)
+        
+        if rules:
+            executions = []
+            evaluate_rules(transaction, rules=rule_index, execution_records=executions, context=context)
+            for execution in executions:
+                shadow_results.append(ShadowResult(
+                    transaction_id=transaction.transaction_id,
+                    rule=execution.rule,
+                    triggered=execution.triggered,
+                    risk_score=float(execution.rule.risk_score) if execution.triggered else 0.0,
+                    execution_time=execution.execution_time,
+                    production_decision=decisions[transaction.transaction_id]
+                ))
+    
+    if ml_models and transactions:
+        shadow_results.extend(score_shadow_models(transactions, contexts, ml_models, decisions))
+    
+    ShadowResult.objects.bulk_create(shadow_results)
+    
+    logger.info(
+        f"Shadow scored {len(transactions)} transactions with {len(rules)} rules "
+        f"and {len(ml_models)} models"
+    )
+    
+    return len(shadow_results)
+
+
+def score_shadow_models(transactions: List, contexts: List[ScoringContext], ml_models: List[Tuple],
+                        decisions: Dict[str, str]) -> List[ShadowResult]:
+    """
+    Score transactions with the shadow ML models, one call per model.
+    
+    Args:
+        transactions: The transaction objects
+        contexts: The ScoringContext of each transaction
+        ml_models: List of (MLModel, estimator) pairs
+        decisions: Dictionary of transaction ID to production decision
+    
+    Returns:
+        List of unsaved ShadowResult objects
+    """
+    feature_start = time.time()
+    feature_rows = [
+        transform_features(extract_features(transaction, context))
+        for transaction, context in zip(transactions, contexts)
+    ]
+    feature_time = (time.time() - feature_start) * 1000 / len(transactions)
+    
+    shadow_results = []
+    for model, estimator in ml_models:
+        prediction_start = time.time()
+        try:
+            risk_scores = predict_risk_scores(model, estimator, feature_rows)
+        except Exception as e:
+            logger.error(f"Error using shadow model {model.name}: {str(e)}", exc_info=True)
+            continue
+        
+        # Latency per transaction, including its share of feature extraction
+        execution_time = feature_time + (time.time() - prediction_start) * 1000 / len(transactions)
+        for transaction, risk_score in zip(transactions, risk_scores):
+            shadow_results.append(ShadowResult(
+                transaction_id=transaction.transaction_id,
+                ml_model=model,
+                triggered=bool(risk_score >= ML_HIT_THRESHOLD),
+                risk_score=float(risk_score),
+                execution_time=execution_time,
+                production_decision=decisions[transaction.transaction_id]
+            ))
+    
+    return shadow_results
+
+
+def summarize_shadow_results(since=None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Compare the shadow rules and models with the production decisions.
+    
+    Args:
+        since: Optional datetime, only results created after it are counted
+    
+    Returns:
+        Dictionary with ``rules`` and ``ml_models`` lists. Each entry holds
+        the number of transactions scored, the shadow hit rate, the
+        production flag rate on the same transactions, how many hits
+        production also flagged and the mean execution time.
+    """
+    results = ShadowResult.objects.all()
+    if since is not None:
+        results = results.filter(created_at__gte=since)
+    
+    flagged = Q(production_decision__in=FLAGGED_DECISIONS)
+    aggregates = {
+        'scored': Count('id'),
+        'hits': Count('id', filter=Q(triggered=True)),
+        'production_flagged': Count('id', filter=flagged),
+        'hits_flagged_by_production': Count('id', filter=Q(triggered=True) & flagged),
+        'mean_execution_time': Avg('execution_time'),
+    }
+    
+    def summarize(key, name_field, version_field):
+        rows = (
+            results.filter(**{f'{key}__isnull': False})
+            .values(key, name_field, version_field)
+            .annotate(**aggregates)
+            .order_by(name_field)
+        )
+        return [
+            {
+                'id': row[key],
+                'name': row[name_field],
+                'version': row[version_field],
+                'scored': row['scored'],
+                'hits': row['hits'],
+                'hit_rate': round(row['hits'] / row['scored'], 4),
+                'production_flag_rate': round(row['production_flagged'] / row['scored'], 4),
+                'hits_flagged_by_production': row['hits_flagged_by_production'],
+                'mean_execution_time': round(row['mean_execution_time'] or 0.0, 3),
+            }
+            for row in rows
+        ]
+    
+    return {
+        'rules': summarize('rule', 'rule__name', 'rule__version'),
+        'ml_models': summarize('ml_model', 'ml_model__name', 'ml_model__version'),
+    }
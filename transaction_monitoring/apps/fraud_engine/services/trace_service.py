@@ -0,0 +1,339 @@
+"""
+Trace service for the Fraud Engine.
+
+This service records a timeline of spans for a transaction as it is
+scored: one span per engine stage and one per group of consecutive
+database queries, with the number of queries in the group. Recording only
+appends to a list, so every transaction can be traced. The trace is stored
+only for transactions in the FRAUD_ENGINE_TRACE_SAMPLE_RATE sample or
+slower than FRAUD_ENGINE_TRACE_SLOW_MS, through the write-behind audit
+buffer. The transaction detail page renders it as a waterfall.
+"""
+
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+from django.db import connection
+from ..metrics import STAGE_SECONDS
+from ..models import TransactionTrace
+from .audit_service import buffer_audit_records
+from .shadow_service import is_sampled
+
+logger = logging.getLogger(__name__)
+
+# Table name of a query, for naming query groups
+QUERY_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+["`]?(\w+)', re.IGNORECASE)
+
+# Consecutive queries further apart than this (ms) start a new query group
+QUERY_GROUP_GAP_MS = 1.0
+
+_state = threading.local()
+
+
+class TransactionTracer:
+    """
+    Records the spans of one transaction.
+    
+    Spans can be opened from several threads; each thread keeps its own
+    stack of open spans, so spans nest under the span that was open in the
+    thread that started them.
+    """
+    
+    def __init__(self, transaction_id: str):
+        self.transaction_id = transaction_id
+        self.start_time = time.perf_counter()
+        self.spans = []
+        self.query_count = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self.start_time) * 1000
+    
+    def _stack(self) -> List[int]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+    
+    def start_span(self, name: str) -> int:
+        """
+        Open a span under the current span of this thread.
+        
+        Args:
+            name: The span name
+        
+        Returns:
+            The index of the span
+        """
+        stack = self._stack()
+        span = {
+            'name': name,
+            'start': round(self._now_ms(), 3),
+            'duration': None,
+            'parent': stack[-1] if stack else None,
+            'queries': 0,
+        }
+        with self._lock:
+            index = len(self.spans)
+            self.spans.append(span)
+        stack.append(index)
+        self._local.last_group = None
+        return index
+    
+    def end_span(self, index: int):
+        """
+        Close a span opened by this thread.
+        
+        Args:
+            index: The index returned by start_span
+        """
+        span = self.spans[index]
+        span['duration'] = round(self._now_ms() - span['start'], 3)
+        stack = self._stack()
+        if stack and stack[-1] == index:
+            stack.pop()
+        self._local.last_group = None
+    
+    @contextmanager
+    def span(self, name: str):
+        """
+        Record the block as a span.
+        
+        Args:
+            name: The span name
+        """
+        index = self.start_span(name)
+        try:
+            yield
+        finally:
+            self.end_span(index)
+    
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Time a database query into the current query group.
+        
+        Installed as a database execute wrapper while the trace is active.
+        """
+        start = self._now_ms()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._add_query(sql, start, self._now_ms())
+    
+    def _add_query(self, sql: str, start: float, end: float):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        group_index = getattr(self._local, 'last_group', None)
+        
+        with self._lock:
+            self.query_count += 1
+            group = self.spans[group_index] if group_index is not None else None
+            if group is not None and start - (group['start'] + group['duration']) <= QUERY_GROUP_GAP_MS:
+                group['duration'] = round(end - group['start'], 3)
+                group['queries'] += 1
+                return
+            
+            match = QUERY_TABLE_PATTERN.search(sql)
+            self.spans.append({
+                'name': f"{sql.split(None, 1)[0].upper()} {match.group(1) if match else ''}".strip(),
+                'start': round(start, 3),
+                'duration': round(end - start, 3),
+                'parent': parent,
+                'queries': 1,
+                'is_query': True,
+            })
+            self._local.last_group = len(self.spans) - 1
+    
+    def total_time(self) -> float:
+        """
+        Get the duration of the root span, or the time elapsed so far.
+        
+        Returns:
+            The duration in milliseconds
+        """
+        if self.spans and self.spans[0]['duration'] is not None:
+            return self.spans[0]['duration']
+        return self._now_ms()
+    
+    def build_record(self) -> TransactionTrace:
+        """
+        Build an unsaved TransactionTrace for the recorded spans.
+        
+        Returns:
+            An unsaved TransactionTrace object
+        """
+        total_time = self.total_time()
+        return TransactionTrace(
+            transaction_id=self.transaction_id,
+            total_time=round(total_time, 3),
+            query_count=self.query_count,
+            is_slow=total_time >= settings.FRAUD_ENGINE_TRACE_SLOW_MS,
+            spans=list(self.spans)
+        )
+
+
+def get_current_tracer() -> Optional[TransactionTracer]:
+    """
+    Get the tracer active in this thread.
+    
+    Returns:
+        The TransactionTracer, or None when the thread is not tracing
+    """
+    return getattr(_state, 'tracer', None)
+
+
+@contextmanager
+def activate(tracer: Optional[TransactionTracer], parent: Optional[int] = None):
+    """
+    Make a tracer current in this thread and time its database queries.
+    
+    Used by pool threads running engine stages for a traced transaction.
+    Does nothing if the tracer is already current in this thread.
+    
+    Args:
+        tracer: The tracer, or None to do nothing
+        parent: Index of the span new spans in this thread are nested under
+    """
+    if tracer is None or tracer is get_current_tracer():
+        yield
+        return
+    
+    previous = get_current_tracer()
+    _state.tracer = tracer
+    stack = tracer._stack()
+    base = len(stack)
+    if parent is not None:
+        stack.append(parent)
+    try:
+        with connection.execute_wrapper(tracer.record_query):
+            yield
+    finally:
+        del stack[base:]
+        _state.tracer = previous
+
+
+@contextmanager
+def trace_transaction(transaction_id: str, name: str = 'process_transaction'):
+    """
+    Trace the scoring of a transaction.
+    
+    Inside an active trace this only records a nested span. Otherwise it
+    starts a trace, and when the block exits stores it if the transaction
+    is sampled or slow.
+    
+    Args:
+        transaction_id: The ID of the transaction
+        name: Name of the root span
+    
+    Yields:
+        The TransactionTracer, or None when tracing is disabled
+    """
+    tracer = get_current_tracer()
+    if tracer is not None:
+        with tracer.span(name):
+            yield tracer
+        return
+    
+    if not settings.FRAUD_ENGINE_TRACING:
+        yield None
+        return
+    
+    tracer = TransactionTracer(transaction_id)
+    with activate(tracer):
+        with tracer.span(name):
+            yield tracer
+    
+    store_trace(tracer)
+
+
+def store_trace(tracer: TransactionTracer) -> bool:
+    """
+    Store a finished trace if its transaction is sampled or slow.
+    
+    Args:
+        tracer: The finished tracer
+    
+    Returns:
+        True if the trace was handed to the audit buffer
+    """
+    slow = tracer.total_time() >= settings.FRAUD_ENGINE_TRACE_SLOW_MS
+    if not slow and not is_sampled(tracer.transaction_id, settings.FRAUD_ENGINE_TRACE_SAMPLE_RATE):
+        return False
+    
+    try:
+        buffer_audit_records([tracer.build_record()])
+    except Exception as e:
+        logger.warning(f"Error storing trace of transaction {tracer.transaction_id}: {str(e)}")
+        return False
+    return True
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage into the stage histogram and the active trace.
+    
+    Args:
+        name: The stage name
+    """
+    with ExitStack() as stack:
+        stack.enter_context(STAGE_SECONDS.time(stage=name))
+        tracer = get_current_tracer()
+        if tracer is not None:
+            stack.enter_context(tracer.span(name))
+        yield
+
+
+def current_span() -> Optional[int]:
+    """
+    Get the index of the span open in this thread.
+    
+    Returns:
+        The span index, or None when the thread is not tracing
+    """
+    tracer = get_current_tracer()
+    if tracer is None:
+        return None
+    stack = tracer._stack()
+    return stack[-1] if stack else None
+
+
+def build_waterfall(trace: TransactionTrace) -> List[Dict[str, Any]]:
+    """
+    Lay out the spans of a stored trace as waterfall rows.
+    
+    Args:
+        trace: The stored TransactionTrace
+    
+    Returns:
+        List of span dicts in start order, each with its nesting depth and
+        its offset and width as percentages of the trace duration
+    """
+    spans = trace.spans
+    total = max(trace.total_time, 0.001)
+    
+    def depth(span):
+        level = 0
+        while span['parent'] is not None:
+            span = spans[span['parent']]
+            level += 1
+        return level
+    
+    rows = []
+    for span in sorted(spans, key=lambda item: item['start']):
+        duration = span['duration'] or 0.0
+        level = depth(span)
+        rows.append({
+            **span,
+            'duration': duration,
+            'end': round(span['start'] + duration, 3),
+            'depth': level,
+            'indent': level * 12,
+            'offset_pct': round(min(span['start'] / total * 100, 100), 2),
+            'width_pct': round(max(min(duration / total * 100, 100), 0.5), 2),
+        })
+    return rows
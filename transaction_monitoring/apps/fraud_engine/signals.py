@@ -0,0 +1,10 @@
+"""
+Signal handlers for the fraud engine app.
+"""
+
+from celery.signals import before_task_publish, task_prerun
+from .services.routing_service import stamp_enqueue_time, record_task_lag
+
+# Measure the time tasks wait in their queue
+before_task_publish.connect(stamp_enqueue_time, dispatch_uid='fraud_engine_stamp_enqueue_time')
+task_prerun.connect(record_task_lag, dispatch_uid='fraud_engine_record_task_lag')
@@ -4,22 +4,30 @@ Celery tasks for the Fraud Engine app.
 
 import time
 import logging
-import json
 from transaction_monitoring.celery_app import app
 from django.utils import timezone
 from django.db import transaction as db_transaction
 from apps.transactions.models import Transaction, POSTransaction, EcommerceTransaction, WalletTransaction
-from .models import FraudDetectionResult
-from apps.core.utils import CustomJSONEncoder
-from .services.decision_service import make_fraud_decision
-from .services.block_service import check_blocklist
-from apps.rule_engine.services.evaluator import evaluate_rules
-from apps.velocity_engine.services import check_velocity
-from apps.ml_engine.services.prediction_service import get_fraud_prediction
-from apps.aml.services.monitoring_service import check_aml_risk
+from apps.rule_engine.services.rule_index import get_rule_index
+from apps.rule_engine.services.vectorizer import evaluate_batch_conditions
+from apps.velocity_engine.models import VelocityRule
+from apps.ml_engine.models import MLModel
+from apps.transactions.services.dedup_service import remember_decisions
+from .metrics import DECISIONS, STAGE_SECONDS
+from .services.pipeline_service import run_detection_pipeline, build_detection_result
+from .services.audit_service import buffer_audit_records
+from .services.scoring_service import score_transaction, SCORING_MODE_INLINE
+from .services.shadow_service import enqueue_shadow_scoring, run_shadow_scoring
+from .services.trace_service import trace_transaction
 
 logger = logging.getLogger(__name__)
 
+CHANNEL_MODELS = {
+    'pos': POSTransaction,
+    'ecommerce': EcommerceTransaction,
+    'wallet': WalletTransaction,
+}
+
 
 @app.task
 def process_transaction(transaction_id, transaction_type, channel):
@@ -32,129 +40,25 @@ def process_transaction(transaction_id, transaction_type, channel):
         channel: The channel of the transaction (pos, ecommerce, wallet)
     """
     logger.info(f"Processing transaction {transaction_id} for fraud detection")
-    start_time = time.time()
     
     try:
-        # Get the transaction object based on channel
-        if channel == 'pos':
-            transaction = POSTransaction.objects.get(transaction_id=transaction_id)
-        elif channel == 'ecommerce':
-            transaction = EcommerceTransaction.objects.get(transaction_id=transaction_id)
-        elif channel == 'wallet':
-            transaction = WalletTransaction.objects.get(transaction_id=transaction_id)
-        else:
-            transaction = Transaction.objects.get(transaction_id=transaction_id)
-        
-        # Initialize results dictionary
-        results = {
-            'block_check': {},
-            'rule_engine': {},
-            'velocity_engine': {},
-            'ml_engine': {},
-            'aml_engine': {},
-            'triggered_rules': [],
-        }
-        
-        # Step 1: Check blocklist
-        block_result = check_blocklist(transaction)
-        results['block_check'] = block_result
-        
-        # If blocked, update transaction and return early
-        if block_result.get('is_blocked', False):
-            with db_transaction.atomic():
-                transaction.status = 'rejected'
-                transaction.is_flagged = True
-                transaction.flag_reason = block_result.get('reason', 'Blocked entity')
-                transaction.risk_score = 100.0  # Maximum risk score
-                transaction.save()
-            
-            # Create fraud detection result
-            processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-            FraudDetectionResult.objects.create(
-                transaction_id=transaction_id,
-                risk_score=100.0,
-                is_fraudulent=True,
-                decision='reject',
-                processing_time=processing_time,
-                block_check_result=block_result,
-                rule_engine_result={},
-                velocity_engine_result={},
-                ml_engine_result={},
-                aml_engine_result={},
-                triggered_rules=[]
-            )
+        with trace_transaction(transaction_id):
+            # Get the transaction object based on channel
+            model = CHANNEL_MODELS.get(channel, Transaction)
+            transaction = model.objects.get(transaction_id=transaction_id)
             
-            logger.info(f"Transaction {transaction_id} blocked: {block_result.get('reason')}")
-            return
-        
-        # Step 2: Evaluate rules
-        rule_result = evaluate_rules(transaction)
-        results['rule_engine'] = rule_result
-        results['triggered_rules'] = rule_result.get('triggered_rules', [])
-        
-        # Step 3: Check velocity
-        velocity_result = check_velocity(transaction)
-        results['velocity_engine'] = velocity_result
-        
-        # Add velocity triggered rules to the list
-        if velocity_result.get('triggered_rules'):
-            results['triggered_rules'].extend(velocity_result.get('triggered_rules', []))
-        
-        # Step 4: Get ML prediction
-        ml_result = get_fraud_prediction(transaction)
-        results['ml_engine'] = ml_result
-        
-        # Step 5: Check AML risk
-        aml_result = check_aml_risk(transaction)
-        results['aml_engine'] = aml_result
-        
-        # Add AML triggered rules to the list
-        if aml_result.get('triggered_rules'):
-            results['triggered_rules'].extend(aml_result.get('triggered_rules', []))
-        
-        # Step 6: Make final decision
-        decision_result = make_fraud_decision(transaction, results)
+            # Run the detection engines, apply the decision and record the result
+            scoring = score_transaction(transaction, SCORING_MODE_INLINE)
+        results = scoring['results']
         
-        # Step 7: Update transaction with decision
-        with db_transaction.atomic():
-            transaction.status = decision_result.get('status', 'pending')
-            transaction.is_flagged = decision_result.get('is_flagged', False)
-            transaction.flag_reason = decision_result.get('flag_reason', '')
-            transaction.risk_score = decision_result.get('risk_score', 0.0)
-            transaction.save()
-        
-        # Step 8: Create fraud detection result
-        processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-        
-        # Serialize JSON fields using our custom encoder
-        block_check_json = json.dumps(results['block_check'], cls=CustomJSONEncoder)
-        rule_engine_json = json.dumps(results['rule_engine'], cls=CustomJSONEncoder)
-        velocity_engine_json = json.dumps(results['velocity_engine'], cls=CustomJSONEncoder)
-        ml_engine_json = json.dumps(results['ml_engine'], cls=CustomJSONEncoder)
-        aml_engine_json = json.dumps(results['aml_engine'], cls=CustomJSONEncoder)
-        triggered_rules_json = json.dumps(results['triggered_rules'], cls=CustomJSONEncoder)
+        if results['block_check'].get('is_blocked', False):
+            logger.info(f"Transaction {transaction_id} blocked: {results['block_check'].get('reason')}")
+            return
         
-        # Create the fraud detection result with pre-serialized JSON data
-        FraudDetectionResult.objects.create(
-            transaction_id=transaction_id,
-            risk_score=decision_result.get('risk_score', 0.0),
-            is_fraudulent=decision_result.get('is_fraudulent', False),
-            decision=decision_result.get('decision', 'approve'),
-            processing_time=processing_time,
-            block_check_result=json.loads(block_check_json),
-            rule_engine_result=json.loads(rule_engine_json),
-            velocity_engine_result=json.loads(velocity_engine_json),
-            ml_engine_result=json.loads(ml_engine_json),
-            aml_engine_result=json.loads(aml_engine_json),
-            triggered_rules=json.loads(triggered_rules_json)
+        logger.info(
+            f"Transaction {transaction_id} processed: {scoring['decision_result'].get('decision')} "
+            f"in {scoring['processing_time']:.2f}ms"
         )
-        
-        logger.info(f"Transaction {transaction_id} processed: {decision_result.get('decision')} in {processing_time:.2f}ms")
-        
-        # Step 9: If flagged for review, create a case
-        if decision_result.get('is_flagged', False):
-            # Use Celery to create the fraud case asynchronously
-            create_fraud_case.delay(transaction_id, decision_result, results)
     
     except Exception as e:
         logger.error(f"Error processing transaction {transaction_id}: {str(e)}", exc_info=True)
@@ -168,6 +72,129 @@ def process_transaction(transaction_id, transaction_type, channel):
             pass
 
 
+@app.task
+def process_transaction_batch(transactions):
+    """
+    Process a batch of transactions through the fraud detection pipeline.
+    
+    Transactions, rules, velocity rules and ML models are loaded once for the
+    whole batch, the transactions are updated with one bulk query, and the
+    audit rows and detection results go to the write-behind audit buffer.
+    Each transaction goes through the same pipeline as process_transaction,
+    so decisions are identical to the single path.
+    
+    Args:
+        transactions: List of dicts with transaction_id, transaction_type and
+            channel keys, as produced by the TransactionBatcher
+    """
+    batch_start_time = time.time()
+    logger.info(f"Processing batch of {len(transactions)} transactions for fraud detection")
+    
+    # Load the transactions, one query per channel
+    transaction_ids_by_channel = {}
+    for item in transactions:
+        transaction_ids_by_channel.setdefault(item['channel'], []).append(item['transaction_id'])
+    
+    loaded = {}
+    for channel, transaction_ids in transaction_ids_by_channel.items():
+        model = CHANNEL_MODELS.get(channel, Transaction)
+        for transaction in model.objects.filter(transaction_id__in=transaction_ids):
+            loaded[transaction.transaction_id] = transaction
+    
+    # Load velocity rules and models once for the whole batch; rules come from the rule index
+    rules = get_rule_index()
+    velocity_rules = list(VelocityRule.objects.filter(is_active=True))
+    ml_models = list(MLModel.objects.filter(is_active=True, is_shadow=False))
+    
+    # Evaluate the rule conditions over the whole batch at once
+    batch_conditions = evaluate_batch_conditions(rules.rules, list(loaded.values()))
+    
+    audit_records = []
+    detection_results = []
+    scored_transactions = []
+    flagged = []
+    failed_ids = []
+    
+    for item in transactions:
+        transaction_id = item['transaction_id']
+        transaction = loaded.get(transaction_id)
+        if transaction is None:
+            logger.error(f"Error processing transaction {transaction_id}: transaction not found")
+            continue
+        
+        start_time = time.time()
+        try:
+            results, decision_result = run_detection_pipeline(
+                transaction,
+                rules=rules,
+                velocity_rules=velocity_rules,
+                ml_models=ml_models,
+                audit_records=audit_records,
+                batch_conditions=batch_conditions
+            )
+        except Exception as e:
+            logger.error(f"Error processing transaction {transaction_id}: {str(e)}", exc_info=True)
+            failed_ids.append(transaction_id)
+            continue
+        
+        transaction.status = decision_result.get('status', 'pending')
+        transaction.is_flagged = decision_result.get('is_flagged', False)
+        transaction.flag_reason = decision_result.get('flag_reason', '')
+        transaction.risk_score = decision_result.get('risk_score', 0.0)
+        transaction.updated_at = timezone.now()
+        scored_transactions.append((transaction, decision_result.get('decision')))
+        DECISIONS.inc(decision=decision_result.get('decision', 'approve'))
+        
+        processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+        detection_results.append(
+            build_detection_result(transaction_id, results, decision_result, processing_time)
+        )
+        
+        if decision_result.get('is_flagged', False) and not results['block_check'].get('is_blocked', False):
+            flagged.append((transaction_id, decision_result, results))
+    
+    # Update the batch's transactions with bulk queries
+    with STAGE_SECONDS.time(stage='persistence'), db_transaction.atomic():
+        Transaction.objects.bulk_update(
+            [transaction for transaction, decision in scored_transactions],
+            ['status', 'is_flagged', 'flag_reason', 'risk_score', 'updated_at']
+        )
+        
+        if failed_ids:
+            Transaction.objects.filter(transaction_id__in=failed_ids).update(status='error')
+    
+    # Answer resubmissions of the transactions with these decisions
+    remember_decisions(scored_transactions)
+    buffer_audit_records(audit_records + detection_results)
+    enqueue_shadow_scoring(scored_transactions)
+    
+    for transaction_id, decision_result, results in flagged:
+        # Use Celery to create the fraud case asynchronously
+        create_fraud_case.delay(transaction_id, decision_result, results)
+    
+    logger.info(
+        f"Processed batch of {len(scored_transactions)} transactions "
+        f"in {(time.time() - batch_start_time) * 1000:.2f}ms"
+    )
+
+
+@app.task
+def score_shadow_transactions(items):
+    """
+    Score sampled transactions with the shadow rules and models.
+    
+    Queued on the shadow queue after the production decision is made.
+    
+    Args:
+        items: List of dicts with transaction_id, channel and the production
+            decision
+    """
+    try:
+        run_shadow_scoring(items)
+    except Exception as e:
+        logger.error(f"Error shadow scoring {len(items)} transactions: {str(e)}", exc_info=True)
+
+
 @app.task
 def create_fraud_case(transaction_id, decision_result, detection_results):
     """
@@ -0,0 +1,3 @@
+"""
+Tests for the Fraud Engine app.
+"""
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Tests for the fraud engine audit service.
+"""
+
+import threading
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from apps.core.hit_counts import flush_hit_counts
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.fraud_engine.models import FraudDetectionResult
+from apps.fraud_engine.services.audit_service import AuditBuffer, persist_audit_records
+
+
+class PersistAuditRecordsTests(TestCase):
+    """Tests for persist_audit_records function."""
+    
+    def test_writes_rows_and_hit_counts(self):
+        """Test that audit rows are bulk inserted and hit counts applied once flushed."""
+        cache.clear()
+        rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+        
+        persist_audit_records([
+            RuleExecution(transaction_id='tx_1', rule=rule, triggered=True, execution_time=0.1),
+            RuleExecution(transaction_id='tx_2', rule=rule, triggered=False, execution_time=0.1),
+            FraudDetectionResult(transaction_id='tx_1', risk_score=60.0, decision='review', processing_time=1.0),
+        ])
+        
+        self.assertEqual(RuleExecution.objects.count(), 2)
+        self.assertEqual(FraudDetectionResult.objects.count(), 1)
+        self.assertEqual(flush_hit_counts(), 1)
+        rule.refresh_from_db()
+        self.assertEqual(rule.hit_count, 1)
+        self.assertLessEqual(rule.last_triggered, timezone.now())
+
+
+@patch('apps.fraud_engine.services.audit_service.persist_audit_records')
+class AuditBufferTests(TestCase):
+    """Tests for the AuditBuffer write-behind buffer."""
+    
+    def make_buffer(self, **kwargs):
+        options = {'max_size': 100, 'flush_interval_ms': 60000, 'max_pending': 1000}
+        options.update(kwargs)
+        buffer = AuditBuffer(**options)
+        self.addCleanup(buffer.close)
+        return buffer
+    
+    def wait_for_flush(self, mock_persist):
+        flushed = threading.Event()
+        mock_persist.side_effect = lambda records: flushed.set()
+        return flushed
+    
+    def test_synchronous_mode_writes_immediately(self, mock_persist):
+        """Test that a synchronous buffer writes rows as they are added."""
+        buffer = self.make_buffer(synchronous=True)
+        
+        buffer.add(['row_1', 'row_2'])
+        
+        mock_persist.assert_called_once_with(['row_1', 'row_2'])
+        self.assertEqual(buffer.pending(), 0)
+    
+    def test_full_buffer_is_flushed_in_background(self, mock_persist):
+        """Test that reaching max_size wakes the background flusher."""
+        flushed = self.wait_for_flush(mock_persist)
+        buffer = self.make_buffer(max_size=3)
+        
+        buffer.add(['row_1', 'row_2'])
+        mock_persist.assert_not_called()
+        
+        buffer.add(['row_3'])
+        self.assertTrue(flushed.wait(2))
+        mock_persist.assert_called_once_with(['row_1', 'row_2', 'row_3'])
+    
+    def test_partial_buffer_is_flushed_after_interval(self, mock_persist):
+        """Test that buffered rows are written once the flush interval passes."""
+        flushed = self.wait_for_flush(mock_persist)
+        buffer = self.make_buffer(flush_interval_ms=10)
+        
+        buffer.add(['row_1'])
+        
+        self.assertTrue(flushed.wait(2))
+        mock_persist.assert_called_once_with(['row_1'])
+    
+    def test_close_writes_remaining_rows(self, mock_persist):
+        """Test that closing the buffer writes whatever is buffered."""
+        buffer = self.make_buffer()
+        
+        buffer.add(['row_1'])
+        buffer.close()
+        
+        mock_persist.assert_called_once_with(['row_1'])
+        self.assertEqual(buffer.pending(), 0)
+    
+    def test_failed_flush_is_retried(self, mock_persist):
+        """Test that rows from a failed flush are kept for the next flush."""
+        buffer = self.make_buffer()
+        mock_persist.side_effect = [Exception('database unavailable'), None]
+        
+        buffer.add(['row_1'])
+        buffer.flush()
+        self.assertEqual(buffer.pending(), 1)
+        
+        buffer.add(['row_2'])
+        buffer.flush()
+        self.assertEqual(mock_persist.call_args[0][0], ['row_1', 'row_2'])
+        self.assertEqual(buffer.pending(), 0)
+    
+    def test_failed_flush_drops_rows_over_limit(self, mock_persist):
+        """Test that rows are dropped when too many are waiting for retry."""
+        buffer = self.make_buffer(max_pending=1)
+        mock_persist.side_effect = Exception('database unavailable')
+        
+        buffer.add(['row_1', 'row_2'])
+        buffer.flush()
+        
+        self.assertEqual(buffer.pending(), 0)
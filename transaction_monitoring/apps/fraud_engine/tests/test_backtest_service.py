@@ -0,0 +1,125 @@
+"""
+Tests for the fraud engine backtest service.
+"""
+
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.models import FraudDetectionResult
+from apps.fraud_engine.services.backtest_service import SHARD_BY_USER, plan_shards, run_backtest
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.transactions.models import POSTransaction
+from apps.velocity_engine.models import VelocityCounter, VelocityRule
+
+
+class RunBacktestTests(TestCase):
+    """Tests for run_backtest function."""
+    
+    def setUp(self):
+        """Set up stored transactions and decisions."""
+        self.start = timezone.now() - timedelta(days=1)
+        self.end = timezone.now()
+        
+        # Inactive candidate rule, not yet used in production
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='reject',
+            risk_score=90,
+            is_active=False,
+        )
+        
+        with post_save_scoring_suppressed():
+            for index, (amount, user_id) in enumerate([(100, 'user_1'), (1000, 'user_2'), (200, 'user_3')]):
+                POSTransaction.objects.create(
+                    transaction_id=f'tx_backtest_{index}',
+                    transaction_type='acquiring',
+                    channel='pos',
+                    amount=amount,
+                    currency='USD',
+                    user_id=user_id,
+                    timestamp=self.start + timedelta(minutes=index),
+                    terminal_id='term_1',
+                )
+                FraudDetectionResult.objects.create(
+                    transaction_id=f'tx_backtest_{index}',
+                    risk_score=10,
+                    decision='approve',
+                    processing_time=1.0,
+                )
+    
+    def test_reports_decision_changes(self):
+        """Test that candidate decisions are compared with the stored ones."""
+        report = run_backtest(self.start, self.end, config={'rule_ids': [self.rule.id]}, workers=1)
+        
+        self.assertEqual(report['transactions'], 3)
+        self.assertEqual(report['changed'], 1)
+        self.assertEqual(report['decision_changes'], {'approve -> reject': 1})
+        self.assertEqual(report['flag_rate'], {'baseline': 0.0, 'candidate': round(1 / 3, 4)})
+        self.assertEqual(report['changed_sample'][0]['transaction_id'], 'tx_backtest_1')
+        self.assertEqual(sum(report['score_distribution']['candidate']), 3)
+    
+    def test_does_not_write_production_tables(self):
+        """Test that a backtest leaves audit rows, counters and rules untouched."""
+        VelocityRule.objects.create(
+            name='Busy terminal user',
+            description='More than one transaction per hour',
+            entity_type='user_id',
+            time_window=3600,
+            threshold=0,
+            action='review',
+            risk_score=50,
+        )
+        
+        run_backtest(self.start, self.end, config={'rule_ids': [self.rule.id]}, workers=1)
+        
+        self.assertEqual(RuleExecution.objects.count(), 0)
+        self.assertEqual(VelocityCounter.objects.count(), 0)
+        self.assertEqual(FraudDetectionResult.objects.count(), 3)
+        self.rule.refresh_from_db()
+        self.assertFalse(self.rule.is_active)
+        self.assertEqual(self.rule.hit_count, 0)
+    
+    def test_replays_velocity_in_memory(self):
+        """Test that velocity counts are rebuilt from the replayed transactions."""
+        velocity_rule = VelocityRule.objects.create(
+            name='Repeat user',
+            description='More than one transaction per hour',
+            entity_type='user_id',
+            time_window=3600,
+            threshold=1,
+            action='review',
+            risk_score=50,
+        )
+        with post_save_scoring_suppressed():
+            POSTransaction.objects.create(
+                transaction_id='tx_backtest_repeat',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=100,
+                currency='USD',
+                user_id='user_1',
+                timestamp=self.start + timedelta(minutes=10),
+                terminal_id='term_1',
+            )
+        
+        report = run_backtest(
+            self.start, self.end,
+            config={'rule_ids': [], 'velocity_rule_ids': [velocity_rule.id]},
+            workers=1
+        )
+        
+        self.assertEqual(report['decisions']['candidate'], {'approve': 3, 'review': 1})
+        self.assertEqual(report['without_baseline'], 1)
+    
+    def test_plans_user_shards(self):
+        """Test that user shards split the window's users by ID range."""
+        shards = plan_shards(self.start, self.end, SHARD_BY_USER, 2)
+        
+        self.assertEqual(len(shards), 2)
+        self.assertIsNone(shards[0]['user_min'])
+        self.assertEqual(shards[0]['user_max'], shards[1]['user_min'])
+        self.assertIsNone(shards[1]['user_max'])
@@ -0,0 +1,259 @@
+"""
+Tests for the fraud engine pipeline service.
+"""
+
+import time
+from django.test import TestCase, override_settings
+from unittest.mock import patch, MagicMock
+from apps.fraud_engine.services.budget_service import LatencyBudget, get_latency_budget
+from apps.fraud_engine.services.pipeline_service import run_detection_pipeline, build_detection_result
+from apps.ml_engine.models import MLModel
+
+
+def slow_prediction(transaction, **kwargs):
+    """Simulate an ML stage that misses its deadline."""
+    time.sleep(0.3)
+    return {'risk_score': 100.0}
+
+
+def budgeted_prediction(transaction, budget=None, **kwargs):
+    """Simulate an ML stage that checks the latency budget before its explanation."""
+    return {'risk_score': 20.0, 'explained': budget is None or budget.allows('ml_engine.explanation')}
+
+
+def budgeted_aml_check(transaction, budget=None, **kwargs):
+    """Simulate an AML stage that checks the latency budget before its pattern scans."""
+    scanned = budget is None or budget.allows('aml_engine.pattern_scan')
+    return {'risk_score': 50.0, 'triggered_rules': [{'name': 'AML A', 'action': 'notify'}], 'scanned': scanned}
+
+
+class RunDetectionPipelineTests(TestCase):
+    """Tests for run_detection_pipeline function."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.transaction = MagicMock()
+        self.transaction.transaction_id = 'tx_test_123'
+        
+        patchers = {
+            'check_blocklist': {'is_blocked': False},
+            'evaluate_rules': {
+                'risk_score': 60.0,
+                'triggered_rules': [{'name': 'Rule A', 'action': 'review'}],
+            },
+            'check_velocity': {'risk_score': 0.0, 'triggered_rules': []},
+            'get_fraud_prediction': {'risk_score': 20.0},
+            'check_aml_risk': {
+                'risk_score': 50.0,
+                'triggered_rules': [{'name': 'AML A', 'action': 'notify'}],
+            },
+        }
+        self.mocks = {}
+        self.patchers = {}
+        for name, return_value in patchers.items():
+            patcher = self.patchers[name] = patch(
+                f'apps.fraud_engine.services.pipeline_service.{name}',
+                return_value=return_value
+            )
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_sequential_pipeline(self):
+        """Test that all stages contribute to the decision."""
+        results, decision = run_detection_pipeline(self.transaction)
+        
+        self.assertEqual(results['timed_out_stages'], [])
+        self.assertEqual([rule['name'] for rule in results['triggered_rules']], ['Rule A', 'AML A'])
+        self.assertEqual(decision['decision'], 'review')
+        self.assertEqual(decision['risk_score'], 34.0)
+    
+    def test_concurrent_pipeline_matches_sequential(self):
+        """Test that concurrent stages produce the same decision."""
+        sequential_results, sequential_decision = run_detection_pipeline(self.transaction)
+        with override_settings(FRAUD_ENGINE_PARALLEL_STAGES=True):
+            results, decision = run_detection_pipeline(self.transaction)
+        
+        self.assertEqual(decision, sequential_decision)
+        self.assertEqual(results['triggered_rules'], sequential_results['triggered_rules'])
+    
+    @override_settings(
+        FRAUD_ENGINE_PARALLEL_STAGES=True,
+        FRAUD_ENGINE_STAGE_TIMEOUTS_MS={
+            'rule_engine': 1000,
+            'velocity_engine': 1000,
+            'ml_engine': 50,
+            'aml_engine': 1000,
+        }
+    )
+    def test_timed_out_stage_is_skipped(self):
+        """Test that a late stage is recorded and left out of the decision."""
+        self.mocks['get_fraud_prediction'].side_effect = slow_prediction
+        
+        results, decision = run_detection_pipeline(self.transaction)
+        
+        self.assertEqual(results['timed_out_stages'], ['ml_engine'])
+        self.assertEqual(results['ml_engine'], {'timed_out': True})
+        self.assertEqual(decision['risk_score'], 28.0)
+        
+        detection_result = build_detection_result('tx_test_123', results, decision, 10.0)
+        self.assertEqual(detection_result.timed_out_stages, ['ml_engine'])
+    
+    @override_settings(
+        FRAUD_ENGINE_PARALLEL_STAGES=True,
+        FRAUD_ENGINE_STAGE_TIMEOUTS_MS={
+            'rule_engine': 1000,
+            'velocity_engine': 1000,
+            'ml_engine': 50,
+            'aml_engine': 1000,
+        }
+    )
+    def test_timed_out_stage_audit_rows_are_dropped(self):
+        """Test that the audit rows of a late stage are left out of the collected rows."""
+        execution, prediction = MagicMock(), MagicMock()
+        
+        def evaluate_rules(transaction, execution_records=None, **kwargs):
+            execution_records.append(execution)
+            return {'risk_score': 0.0, 'triggered_rules': []}
+        
+        def late_prediction(transaction, prediction_records=None, **kwargs):
+            prediction_records.append(prediction)
+            return slow_prediction(transaction)
+        
+        self.mocks['evaluate_rules'].side_effect = evaluate_rules
+        self.mocks['get_fraud_prediction'].side_effect = late_prediction
+        
+        audit_records = []
+        results, decision = run_detection_pipeline(self.transaction, audit_records=audit_records)
+        
+        self.assertEqual(results['timed_out_stages'], ['ml_engine'])
+        self.assertEqual(audit_records, [execution])
+    
+    def test_blocked_transaction_skips_engines(self):
+        """Test that a blocked transaction is rejected without running the engines."""
+        self.mocks['check_blocklist'].return_value = {'is_blocked': True, 'reason': 'Blocked user'}
+        
+        results, decision = run_detection_pipeline(self.transaction)
+        
+        self.mocks['evaluate_rules'].assert_not_called()
+        self.assertEqual(decision['decision'], 'reject')
+        self.assertEqual(decision['flag_reason'], 'Blocked user')
+        self.assertEqual(decision['risk_score'], 100.0)
+
+    @override_settings(FRAUD_ENGINE_OPTIONAL_WORK_RESERVE_MS=60000)
+    def test_spent_budget_skips_optional_work(self):
+        """Test that the engines skip their optional work once the latency budget is nearly spent."""
+        self.mocks['get_fraud_prediction'].side_effect = budgeted_prediction
+        self.mocks['check_aml_risk'].side_effect = budgeted_aml_check
+        budget = LatencyBudget(30000)
+        
+        results, decision = run_detection_pipeline(self.transaction, budget=budget)
+        
+        self.assertIs(self.mocks['get_fraud_prediction'].call_args.kwargs['budget'], budget)
+        self.assertFalse(results['ml_engine']['explained'])
+        self.assertFalse(results['aml_engine']['scanned'])
+        self.assertEqual(results['degraded_stages'], ['ml_engine.explanation', 'aml_engine.pattern_scan'])
+    
+    def test_sequential_stages_stop_once_budget_is_spent(self):
+        """Test that sequential stages left once the budget is spent are skipped and degraded."""
+        def slow_rules(transaction, **kwargs):
+            time.sleep(0.1)
+            return {'risk_score': 60.0, 'triggered_rules': [{'name': 'Rule A', 'action': 'review'}]}
+        
+        self.mocks['evaluate_rules'].side_effect = slow_rules
+        budget = LatencyBudget(50)
+        
+        results, decision = run_detection_pipeline(self.transaction, budget=budget)
+        
+        self.mocks['check_velocity'].assert_not_called()
+        self.mocks['get_fraud_prediction'].assert_not_called()
+        self.assertEqual(results['timed_out_stages'], ['velocity_engine', 'ml_engine', 'aml_engine'])
+        self.assertEqual(results['degraded_stages'], ['velocity_engine', 'ml_engine', 'aml_engine'])
+        self.assertEqual(results['ml_engine'], {'timed_out': True})
+        self.assertEqual([rule['name'] for rule in results['triggered_rules']], ['Rule A'])
+    
+    @override_settings(FRAUD_ENGINE_PARALLEL_STAGES=True, FRAUD_ENGINE_OPTIONAL_WORK_RESERVE_MS=300)
+    def test_concurrent_stage_skips_explanation_within_budget(self):
+        """Test that a concurrent ML stage skips SHAP when the budget runs low during the stage and keeps its score."""
+        self.mocks['check_aml_risk'].side_effect = budgeted_aml_check
+        self.patchers['get_fraud_prediction'].stop()
+        
+        def slow_scores(model, ml_model, features):
+            time.sleep(0.15)
+            return [40.0]
+        
+        prediction_service = 'apps.ml_engine.services.prediction_service'
+        model = MLModel(name='Classifier', version='1', model_type='classification', file_path='model.pkl')
+        budget = LatencyBudget(400)
+        with patch(f'{prediction_service}.extract_features', return_value={}), \
+                patch(f'{prediction_service}.transform_features', return_value=[0.0]), \
+                patch(f'{prediction_service}.load_model_file', return_value=object()), \
+                patch(f'{prediction_service}.predict_risk_scores', side_effect=slow_scores), \
+                patch(f'{prediction_service}.generate_shap_explanation') as mock_shap:
+            results, decision = run_detection_pipeline(
+                self.transaction, ml_models=[model], audit_records=[], budget=budget
+            )
+        
+        mock_shap.assert_not_called()
+        self.assertEqual(results['timed_out_stages'], [])
+        self.assertEqual(results['ml_engine']['risk_score'], 40.0)
+        self.assertTrue(results['aml_engine']['scanned'])
+        self.assertEqual(results['degraded_stages'], ['ml_engine.explanation'])
+    
+    def test_audit_rows_go_to_write_behind_buffer(self):
+        """Test that audit rows are buffered unless the caller collects them."""
+        execution = MagicMock()
+        
+        def evaluate_rules(transaction, rules=None, execution_records=None, context=None,
+                           batch_conditions=None, optimizer=None, full_evaluation=False, profiler=None):
+            execution_records.append(execution)
+            return {'risk_score': 0.0, 'triggered_rules': []}
+        
+        self.mocks['evaluate_rules'].side_effect = evaluate_rules
+        
+        with patch('apps.fraud_engine.services.pipeline_service.buffer_audit_records') as mock_buffer:
+            run_detection_pipeline(self.transaction)
+            mock_buffer.assert_called_once_with([execution])
+            
+            audit_records = []
+            run_detection_pipeline(self.transaction, audit_records=audit_records)
+            mock_buffer.assert_called_once()
+            self.assertEqual(audit_records, [execution])
+    
+    def test_budget_with_time_left_runs_everything(self):
+        """Test that nothing is degraded while the budget has time left."""
+        self.mocks['get_fraud_prediction'].side_effect = budgeted_prediction
+        self.mocks['check_aml_risk'].side_effect = budgeted_aml_check
+        budget = LatencyBudget(60000)
+        
+        results, decision = run_detection_pipeline(self.transaction, budget=budget)
+        
+        self.assertTrue(results['ml_engine']['explained'])
+        self.assertTrue(results['aml_engine']['scanned'])
+        self.assertEqual(results['degraded_stages'], [])
+
+
+class GetLatencyBudgetTests(TestCase):
+    """Tests for get_latency_budget function."""
+    
+    @override_settings(FRAUD_ENGINE_LATENCY_BUDGET_MS=None, FRAUD_ENGINE_MERCHANT_LATENCY_BUDGETS_MS={})
+    def test_no_budget_configured(self):
+        """Test that scoring is unbounded by default."""
+        self.assertIsNone(get_latency_budget('merchant_1'))
+    
+    @override_settings(
+        FRAUD_ENGINE_LATENCY_BUDGET_MS=500,
+        FRAUD_ENGINE_MERCHANT_LATENCY_BUDGETS_MS={'merchant_1': 150}
+    )
+    def test_budget_precedence(self):
+        """Test that request budgets override merchant budgets, which override the default."""
+        self.assertEqual(get_latency_budget('merchant_1', 80).budget_ms, 80)
+        self.assertEqual(get_latency_budget('merchant_1').budget_ms, 150)
+        self.assertEqual(get_latency_budget('merchant_2').budget_ms, 500)
+    
+    @override_settings(FRAUD_ENGINE_LATENCY_BUDGET_MS=500)
+    def test_budget_starts_when_the_request_arrives(self):
+        """Test that a budget started at the request arrival counts the time spent before scoring."""
+        budget = get_latency_budget(start_time=time.time() - 0.2)
+        
+        self.assertGreaterEqual(budget.elapsed_ms(), 200)
+        self.assertLessEqual(budget.remaining_ms(), 300)
@@ -0,0 +1,90 @@
+"""
+Tests for the fraud engine routing service.
+"""
+
+from types import SimpleNamespace
+from celery.app.task import Context
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from apps.fraud_engine.services.routing_service import (
+    get_queue_lag,
+    get_queue_metrics,
+    get_scoring_queue,
+    record_queue_lag,
+    record_task_lag,
+    stamp_enqueue_time
+)
+
+
+class GetScoringQueueTests(TestCase):
+    """Tests for get_scoring_queue function."""
+    
+    def test_routes_by_channel_and_amount(self):
+        """Test that POS goes to the priority queue and small wallet top-ups to the low queue."""
+        self.assertEqual(get_scoring_queue('pos', 10), 'scoring_priority')
+        self.assertEqual(get_scoring_queue('wallet', 20), 'scoring_low')
+        self.assertEqual(get_scoring_queue('wallet', 500), 'scoring')
+        self.assertEqual(get_scoring_queue('wallet', 10000), 'scoring_priority')
+        self.assertEqual(get_scoring_queue('ecommerce', 250), 'scoring')
+    
+    @override_settings(FRAUD_ENGINE_MERCHANT_TIERS={'merchant_gold': 'premium'})
+    def test_routes_by_merchant_tier(self):
+        """Test that premium merchants go to the priority queue."""
+        self.assertEqual(get_scoring_queue('ecommerce', 250, 'merchant_gold'), 'scoring_priority')
+        self.assertEqual(get_scoring_queue('ecommerce', 250, 'merchant_other'), 'scoring')
+    
+    @override_settings(FRAUD_ENGINE_SCORING_ROUTES=[], FRAUD_ENGINE_DEFAULT_SCORING_QUEUE='celery')
+    def test_default_queue(self):
+        """Test that transactions matching no route go to the default queue."""
+        self.assertEqual(get_scoring_queue('pos', 10), 'celery')
+
+
+class QueueLagTests(TestCase):
+    """Tests for the queue lag metrics."""
+    
+    def setUp(self):
+        """Set up an empty metrics cache."""
+        cache.clear()
+    
+    def test_summarizes_lag_samples(self):
+        """Test that lag samples are summarized per queue."""
+        record_queue_lag('scoring', 100)
+        record_queue_lag('scoring', 300)
+        
+        lag = get_queue_lag('scoring')
+        
+        self.assertEqual(lag['tasks_started'], 2)
+        self.assertEqual(lag['mean_lag_ms'], 200.0)
+        self.assertEqual(lag['max_lag_ms'], 300.0)
+        self.assertEqual(lag['last_lag_ms'], 300.0)
+        self.assertEqual(get_queue_lag('bulk')['tasks_started'], 0)
+    
+    def test_records_lag_from_message_headers(self):
+        """Test that the publish time stamped in the headers gives the task's lag."""
+        headers = {}
+        stamp_enqueue_time(headers=headers)
+        headers['enqueued_at'] -= 2
+        task = SimpleNamespace(request=Context(headers, delivery_info={'routing_key': 'scoring_low'}))
+        
+        record_task_lag(task=task)
+        
+        self.assertGreaterEqual(get_queue_lag('scoring_low')['last_lag_ms'], 2000)
+    
+    def test_ignores_tasks_without_publish_time(self):
+        """Test that eagerly executed tasks are not counted."""
+        record_task_lag(task=SimpleNamespace(request=Context(delivery_info={'routing_key': 'scoring'})))
+        
+        self.assertEqual(get_queue_lag('scoring')['tasks_started'], 0)
+    
+    def test_metrics_cover_every_queue(self):
+        """Test that the metrics list the scoring, bulk and shadow queues."""
+        record_queue_lag('bulk', 50)
+        
+        metrics = get_queue_metrics(include_depth=False)
+        
+        self.assertEqual(
+            set(metrics),
+            {'scoring', 'scoring_priority', 'scoring_low', 'bulk', 'shadow'}
+        )
+        self.assertEqual(metrics['bulk']['tasks_started'], 1)
+        self.assertIsNone(metrics['bulk']['depth'])
@@ -0,0 +1,186 @@
+"""
+Tests for the fraud engine scoring service.
+"""
+
+from django.db import transaction as db_transaction
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from apps.transactions.models import POSTransaction
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.fraud_engine.models import FraudDetectionResult
+from apps.fraud_engine.services.scoring_service import (
+    SCORING_MODE_ASYNC,
+    SCORING_MODE_INLINE,
+    SCORING_MODE_INLINE_FAST,
+    coalesced_scoring_enqueue,
+    post_save_scoring_suppressed,
+    score_transaction
+)
+
+
+@patch('apps.fraud_engine.tasks.create_fraud_case.delay')
+@patch('apps.fraud_engine.tasks.process_transaction.apply_async')
+class ScoreTransactionTests(TestCase):
+    """Tests for score_transaction function."""
+    
+    def setUp(self):
+        """Set up test data."""
+        # Keep the AML engine out of these tests
+        aml_patcher = patch(
+            'apps.fraud_engine.services.pipeline_service.check_aml_risk',
+            return_value={'risk_score': 0.0, 'triggered_rules': []}
+        )
+        self.mock_aml = aml_patcher.start()
+        self.addCleanup(aml_patcher.stop)
+        
+        Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+    
+    def create_transaction(self):
+        with post_save_scoring_suppressed():
+            return POSTransaction.objects.create(
+                transaction_id='tx_scoring_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+    
+    def test_suppressed_signal_does_not_queue(self, mock_process, mock_create_case):
+        """Test that transactions scored by their creator are not queued again."""
+        self.create_transaction()
+        
+        mock_process.assert_not_called()
+    
+    def test_inline_scores_once(self, mock_process, mock_create_case):
+        """Test that inline scoring applies the decision and records the result."""
+        transaction = self.create_transaction()
+        
+        scoring = score_transaction(transaction, SCORING_MODE_INLINE)
+        
+        self.assertEqual(scoring['decision_result']['decision'], 'review')
+        mock_process.assert_not_called()
+        mock_create_case.assert_called_once()
+        
+        transaction.refresh_from_db()
+        self.assertTrue(transaction.is_flagged)
+        self.assertEqual(FraudDetectionResult.objects.filter(transaction_id='tx_scoring_1').count(), 1)
+        self.assertEqual(RuleExecution.objects.filter(transaction_id='tx_scoring_1').count(), 1)
+    
+    def test_async_only_queues(self, mock_process, mock_create_case):
+        """Test that async scoring queues the transaction without scoring it."""
+        transaction = self.create_transaction()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            scoring = score_transaction(transaction, SCORING_MODE_ASYNC)
+        
+        self.assertEqual(scoring, {'mode': SCORING_MODE_ASYNC})
+        mock_process.assert_called_once_with(
+            kwargs={
+                'transaction_id': 'tx_scoring_1',
+                'transaction_type': 'acquiring',
+                'channel': 'pos',
+            },
+            queue='scoring_priority'
+        )
+        self.assertFalse(FraudDetectionResult.objects.exists())
+    
+    def test_inline_fast_queues_deep_scoring(self, mock_process, mock_create_case):
+        """Test that fast scoring gives a provisional decision and queues the full pipeline."""
+        transaction = self.create_transaction()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            scoring = score_transaction(transaction, SCORING_MODE_INLINE_FAST)
+        
+        self.assertEqual(scoring['decision_result']['decision'], 'review')
+        self.mock_aml.assert_not_called()
+        mock_process.assert_called_once()
+        mock_create_case.assert_not_called()
+        
+        # The deep scoring records the result
+        self.assertFalse(FraudDetectionResult.objects.exists())
+        self.assertFalse(RuleExecution.objects.exists())
+        transaction.refresh_from_db()
+        self.assertTrue(transaction.is_flagged)
+    
+    def test_invalid_mode(self, mock_process, mock_create_case):
+        """Test that an unknown scoring mode is rejected."""
+        transaction = self.create_transaction()
+        
+        with self.assertRaises(ValueError):
+            score_transaction(transaction, 'eventually')
+
+
+@patch('apps.fraud_engine.tasks.process_transaction_batch.apply_async')
+@patch('apps.fraud_engine.tasks.process_transaction.apply_async')
+class EnqueueOnCommitTests(TestCase):
+    """Tests for queueing transactions once they are committed."""
+    
+    def create_transaction(self, transaction_id):
+        return POSTransaction.objects.create(
+            transaction_id=transaction_id,
+            transaction_type='acquiring',
+            channel='pos',
+            amount=10,
+            currency='USD',
+            user_id='user_1',
+            timestamp=timezone.now(),
+            terminal_id='term_1',
+        )
+    
+    def queued_ids(self, mock_process, mock_batch):
+        queued = [call.kwargs['kwargs']['transaction_id'] for call in mock_process.call_args_list]
+        for call in mock_batch.call_args_list:
+            queued.extend(item['transaction_id'] for item in call.kwargs['args'][0])
+        return queued
+    
+    def test_queues_after_commit(self, mock_process, mock_batch):
+        """Test that transactions are queued together once their atomic block commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            with db_transaction.atomic():
+                for index in range(3):
+                    transaction = self.create_transaction(f'tx_commit_{index}')
+                    transaction.save()
+                
+                mock_process.assert_not_called()
+                mock_batch.assert_not_called()
+        
+        mock_process.assert_not_called()
+        mock_batch.assert_called_once()
+        self.assertEqual(self.queued_ids(mock_process, mock_batch), ['tx_commit_0', 'tx_commit_1', 'tx_commit_2'])
+    
+    def test_rolled_back_transactions_are_not_queued(self, mock_process, mock_batch):
+        """Test that transactions of a rolled back savepoint are never queued."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction('tx_commit_kept')
+            try:
+                with db_transaction.atomic():
+                    self.create_transaction('tx_commit_lost')
+                    raise ValueError('rollback')
+            except ValueError:
+                pass
+        
+        self.assertEqual(self.queued_ids(mock_process, mock_batch), ['tx_commit_kept'])
+    
+    def test_coalesces_committed_transactions(self, mock_process, mock_batch):
+        """Test that transactions committed in one scope are queued when it ends."""
+        with coalesced_scoring_enqueue():
+            for index in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.create_transaction(f'tx_coalesced_{index}')
+            
+            mock_process.assert_not_called()
+            mock_batch.assert_not_called()
+        
+        mock_batch.assert_called_once()
+        self.assertEqual(self.queued_ids(mock_process, mock_batch), ['tx_coalesced_0', 'tx_coalesced_1'])
@@ -0,0 +1,103 @@
+"""
+Tests for the fraud engine shadow scoring service.
+"""
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.fraud_engine.models import ShadowResult
+from apps.fraud_engine.services import shadow_service
+from apps.fraud_engine.services.scoring_service import (
+    SCORING_MODE_INLINE,
+    post_save_scoring_suppressed,
+    score_transaction
+)
+from apps.fraud_engine.services.shadow_service import is_sampled, summarize_shadow_results
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.transactions.models import POSTransaction
+
+
+@override_settings(FRAUD_ENGINE_SHADOW_SAMPLE_RATE=1.0)
+class ShadowScoringTests(TestCase):
+    """Tests for shadow scoring of live transactions."""
+    
+    def setUp(self):
+        """Set up a shadow rule."""
+        shadow_service._shadow_config = None
+        self.addCleanup(setattr, shadow_service, '_shadow_config', None)
+        
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='reject',
+            risk_score=90,
+            is_active=True,
+            is_shadow=True,
+        )
+    
+    def create_transaction(self, transaction_id, amount):
+        with post_save_scoring_suppressed():
+            return POSTransaction.objects.create(
+                transaction_id=transaction_id,
+                transaction_type='acquiring',
+                channel='pos',
+                amount=amount,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+    
+    def test_shadow_rule_does_not_affect_decision(self):
+        """Test that a shadow rule is recorded separately and leaves the decision alone."""
+        transaction = self.create_transaction('tx_shadow_1', '1234.56')
+        
+        scoring = score_transaction(transaction, SCORING_MODE_INLINE)
+        
+        self.assertEqual(scoring['decision_result']['decision'], 'approve')
+        self.assertFalse(RuleExecution.objects.filter(rule=self.rule).exists())
+        
+        shadow_result = ShadowResult.objects.get(transaction_id='tx_shadow_1')
+        self.assertEqual(shadow_result.rule, self.rule)
+        self.assertTrue(shadow_result.triggered)
+        self.assertEqual(shadow_result.production_decision, 'approve')
+    
+    def test_production_skips_shadow_rules(self):
+        """Test that production rule evaluation ignores active shadow rules."""
+        transaction = self.create_transaction('tx_shadow_2', '1234.56')
+        
+        result = evaluate_rules(transaction, execution_records=[])
+        
+        self.assertEqual(result['rules_evaluated'], 0)
+    
+    @override_settings(FRAUD_ENGINE_SHADOW_SAMPLE_RATE=0.0)
+    def test_unsampled_transactions_are_not_shadow_scored(self):
+        """Test that nothing is shadow scored with a zero sample rate."""
+        transaction = self.create_transaction('tx_shadow_3', '1234.56')
+        
+        score_transaction(transaction, SCORING_MODE_INLINE)
+        
+        self.assertFalse(ShadowResult.objects.exists())
+    
+    def test_summarizes_hit_rates(self):
+        """Test that shadow hit rates are compared with production flag rates."""
+        for index, amount in enumerate(['1234.56', '123.45', '123.45', '123.45']):
+            score_transaction(self.create_transaction(f'tx_shadow_sum_{index}', amount), SCORING_MODE_INLINE)
+        
+        summary = summarize_shadow_results()
+        
+        self.assertEqual(len(summary['rules']), 1)
+        self.assertEqual(summary['rules'][0]['scored'], 4)
+        self.assertEqual(summary['rules'][0]['hit_rate'], 0.25)
+        self.assertEqual(summary['rules'][0]['production_flag_rate'], 0.0)
+        self.assertEqual(summary['ml_models'], [])
+    
+    def test_sampling_is_deterministic(self):
+        """Test that sampling depends only on the transaction ID."""
+        sampled = [is_sampled(f'tx_{index}', 0.5) for index in range(1000)]
+        
+        self.assertEqual(sampled, [is_sampled(f'tx_{index}', 0.5) for index in range(1000)])
+        self.assertTrue(400 < sum(sampled) < 600)
+        self.assertFalse(any(is_sampled(f'tx_{index}', 0.0) for index in range(100)))
@@ -0,0 +1,172 @@
+"""
+Tests for fraud engine tasks.
+"""
+
+import time
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest.mock import patch
+from apps.core.hit_counts import flush_hit_counts
+from apps.transactions.models import POSTransaction
+from apps.rule_engine.models import Rule, RuleExecution
+from apps.fraud_engine.models import FraudDetectionResult
+from apps.fraud_engine.services.batch_service import TransactionBatcher
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.fraud_engine.tasks import process_transaction, process_transaction_batch
+
+
+class TransactionBatcherTests(TestCase):
+    """Tests for the TransactionBatcher producer."""
+    
+    @patch('apps.fraud_engine.tasks.process_transaction_batch.apply_async')
+    def test_dispatches_when_batch_is_full(self, mock_delay):
+        """Test that a full batch is dispatched immediately."""
+        batcher = TransactionBatcher(batch_size=2, max_wait_ms=60000)
+        
+        batcher.add('tx_1', 'acquiring', 'pos')
+        mock_delay.assert_not_called()
+        
+        batcher.add('tx_2', 'acquiring', 'pos')
+        mock_delay.assert_called_once()
+        batch = mock_delay.call_args.kwargs['args'][0]
+        self.assertEqual([item['transaction_id'] for item in batch], ['tx_1', 'tx_2'])
+    
+    @patch('apps.fraud_engine.tasks.process_transaction_batch.apply_async')
+    def test_dispatches_after_max_wait(self, mock_delay):
+        """Test that a partial batch is dispatched once the wait time expires."""
+        batcher = TransactionBatcher(batch_size=100, max_wait_ms=10)
+        
+        batcher.add('tx_1', 'acquiring', 'pos')
+        time.sleep(0.2)
+        
+        mock_delay.assert_called_once()
+        self.assertEqual(mock_delay.call_args.kwargs['args'][0][0]['transaction_id'], 'tx_1')
+    
+    @patch('apps.fraud_engine.tasks.process_transaction_batch.apply_async')
+    def test_flush_dispatches_buffered_transactions(self, mock_delay):
+        """Test that flush dispatches whatever is buffered."""
+        batcher = TransactionBatcher(batch_size=100, max_wait_ms=60000)
+        
+        batcher.flush()
+        mock_delay.assert_not_called()
+        
+        batcher.add('tx_1', 'acquiring', 'pos')
+        batcher.flush()
+        mock_delay.assert_called_once()
+
+
+class ProcessTransactionBatchTests(TestCase):
+    """Tests for the process_transaction_batch task."""
+    
+    def setUp(self):
+        """Set up test data."""
+        # Keep the AML engine out of these tests
+        aml_patcher = patch(
+            'apps.fraud_engine.services.pipeline_service.check_aml_risk',
+            return_value={'risk_score': 0.0, 'triggered_rules': []}
+        )
+        aml_patcher.start()
+        self.addCleanup(aml_patcher.stop)
+        
+        Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+            priority=10,
+        )
+        Rule.objects.create(
+            name='Very large amount',
+            description='Amount above 5000',
+            rule_type='amount',
+            condition='transaction["amount"] > 5000',
+            action='reject',
+            risk_score=90,
+            priority=20,
+        )
+        
+        # Create the transactions without triggering the post_save scoring
+        with post_save_scoring_suppressed():
+            for index, amount in enumerate([100, 1000, 10000, 100, 1000, 10000]):
+                POSTransaction.objects.create(
+                    transaction_id=f'tx_batch_{index}',
+                    transaction_type='acquiring',
+                    channel='pos',
+                    amount=amount,
+                    currency='USD',
+                    user_id=f'user_{index}',
+                    merchant_id='merchant_1',
+                    timestamp=timezone.now(),
+                    terminal_id='term_1',
+                    entry_mode='chip',
+                    terminal_type='traditional',
+                    attendance='attended',
+                    condition='card_present',
+                )
+    
+    @patch('apps.fraud_engine.tasks.create_fraud_case.delay')
+    def test_batch_matches_single_path(self, mock_create_case):
+        """Test that batched scoring makes the same decisions as single scoring."""
+        for index in range(3):
+            process_transaction(f'tx_batch_{index}', 'acquiring', 'pos')
+        
+        process_transaction_batch([
+            {'transaction_id': f'tx_batch_{index}', 'transaction_type': 'acquiring', 'channel': 'pos'}
+            for index in range(3, 6)
+        ])
+        
+        for single_index, batch_index in zip(range(3), range(3, 6)):
+            single = FraudDetectionResult.objects.get(transaction_id=f'tx_batch_{single_index}')
+            batched = FraudDetectionResult.objects.get(transaction_id=f'tx_batch_{batch_index}')
+            self.assertEqual(single.decision, batched.decision)
+            self.assertEqual(single.risk_score, batched.risk_score)
+            self.assertEqual(
+                [rule['name'] for rule in single.triggered_rules],
+                [rule['name'] for rule in batched.triggered_rules]
+            )
+            
+            single_tx = POSTransaction.objects.get(transaction_id=f'tx_batch_{single_index}')
+            batched_tx = POSTransaction.objects.get(transaction_id=f'tx_batch_{batch_index}')
+            self.assertEqual(single_tx.status, batched_tx.status)
+            self.assertEqual(single_tx.flag_reason, batched_tx.flag_reason)
+    
+    @patch('apps.fraud_engine.tasks.create_fraud_case.delay')
+    def test_batch_writes_audit_rows_and_hit_counts(self, mock_create_case):
+        """Test that batched scoring persists executions and rule hit counts."""
+        cache.clear()
+        process_transaction_batch([
+            {'transaction_id': f'tx_batch_{index}', 'transaction_type': 'acquiring', 'channel': 'pos'}
+            for index in range(3)
+        ])
+        flush_hit_counts()
+        
+        self.assertEqual(RuleExecution.objects.count(), 6)
+        self.assertEqual(Rule.objects.get(name='Large amount').hit_count, 2)
+        self.assertEqual(Rule.objects.get(name='Very large amount').hit_count, 1)
+        self.assertEqual(mock_create_case.call_count, 2)
+    
+    @override_settings(FRAUD_ENGINE_BATCH_SCORING=True)
+    @patch('apps.fraud_engine.services.batch_service.queue_transaction_for_batch')
+    def test_signal_uses_batcher_when_enabled(self, mock_queue):
+        """Test that new transactions are batched when batch scoring is enabled."""
+        with self.captureOnCommitCallbacks(execute=True):
+            POSTransaction.objects.create(
+                transaction_id='tx_batch_signal',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=10,
+                currency='USD',
+                user_id='user_signal',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        
+        mock_queue.assert_called_once_with(
+            transaction_id='tx_batch_signal',
+            transaction_type='acquiring',
+            channel='pos',
+            queue='scoring_priority'
+        )
@@ -0,0 +1,85 @@
+"""
+Tests for the fraud engine trace service.
+"""
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.fraud_engine.models import TransactionTrace
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.fraud_engine.services.trace_service import build_waterfall
+from apps.fraud_engine.tasks import process_transaction
+from apps.transactions.models import POSTransaction
+
+
+class TransactionTraceTests(TestCase):
+    """Tests for tracing transaction scoring."""
+    
+    def setUp(self):
+        """Set up a transaction to score."""
+        with post_save_scoring_suppressed():
+            POSTransaction.objects.create(
+                transaction_id='tx_trace_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount='123.45',
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+    
+    @override_settings(FRAUD_ENGINE_TRACE_SLOW_MS=0, FRAUD_ENGINE_TRACE_SAMPLE_RATE=0.0)
+    def test_stores_slow_transaction_trace(self):
+        """Test that a slow transaction's trace has a span per stage and grouped queries."""
+        process_transaction('tx_trace_1', 'acquiring', 'pos')
+        
+        trace = TransactionTrace.objects.get(transaction_id='tx_trace_1')
+        self.assertTrue(trace.is_slow)
+        self.assertGreater(trace.query_count, 0)
+        
+        spans = {span['name']: span for span in trace.spans if not span.get('is_query')}
+        self.assertIsNone(spans['process_transaction']['parent'])
+        self.assertEqual(trace.spans[spans['score_transaction']['parent']]['name'], 'process_transaction')
+        for stage in ('blocklist', 'rule_engine', 'velocity_engine', 'ml_engine', 'aml_engine',
+                      'decision', 'persistence'):
+            self.assertIn(stage, spans)
+            self.assertIsNotNone(spans[stage]['duration'])
+        
+        query_groups = [span for span in trace.spans if span.get('is_query')]
+        self.assertEqual(sum(span['queries'] for span in query_groups), trace.query_count)
+        self.assertIn('SELECT fraud_engine_blocklist', [span['name'] for span in query_groups])
+    
+    @override_settings(FRAUD_ENGINE_TRACE_SLOW_MS=60000, FRAUD_ENGINE_TRACE_SAMPLE_RATE=0.0)
+    def test_skips_fast_unsampled_transactions(self):
+        """Test that traces of fast transactions outside the sample are not stored."""
+        process_transaction('tx_trace_1', 'acquiring', 'pos')
+        
+        self.assertFalse(TransactionTrace.objects.exists())
+    
+    @override_settings(FRAUD_ENGINE_TRACING=False, FRAUD_ENGINE_TRACE_SLOW_MS=0)
+    def test_tracing_can_be_disabled(self):
+        """Test that nothing is recorded with tracing disabled."""
+        process_transaction('tx_trace_1', 'acquiring', 'pos')
+        
+        self.assertFalse(TransactionTrace.objects.exists())
+    
+    def test_builds_waterfall(self):
+        """Test that spans are laid out by start time with their depth and position."""
+        trace = TransactionTrace(
+            transaction_id='tx_trace_1',
+            total_time=100.0,
+            spans=[
+                {'name': 'process_transaction', 'start': 0.0, 'duration': 100.0, 'parent': None, 'queries': 0},
+                {'name': 'ml_engine', 'start': 50.0, 'duration': 25.0, 'parent': 0, 'queries': 0},
+                {'name': 'SELECT ml_engine_mlmodel', 'start': 55.0, 'duration': 0.1, 'parent': 1,
+                 'queries': 2, 'is_query': True},
+            ]
+        )
+        
+        rows = build_waterfall(trace)
+        
+        self.assertEqual([row['depth'] for row in rows], [0, 1, 2])
+        self.assertEqual(rows[1]['offset_pct'], 50.0)
+        self.assertEqual(rows[1]['width_pct'], 25.0)
+        self.assertEqual(rows[1]['end'], 75.0)
+        self.assertEqual(rows[2]['width_pct'], 0.5)
@@ -25,6 +25,9 @@ class MLModel(TimeStampedModel):
     version = models.CharField(_('Version'), max_length=20)
     file_path = models.CharField(_('File Path'), max_length=255)
     is_active = models.BooleanField(_('Is Active'), default=False)
+    is_shadow = models.BooleanField(_('Shadow Mode'), default=False,
+                                    help_text=_('If enabled, this model is scored on sampled live transactions '
+                                                'without affecting decisions'))
     
     # Performance metrics
     accuracy = models.FloatField(_('Accuracy'), null=True, blank=True)
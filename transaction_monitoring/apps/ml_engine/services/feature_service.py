@@ -8,42 +8,45 @@ for use in ML models.
 import logging
 from typing import Dict, Any, List
 from django.utils import timezone
+from apps.core.scoring_context import get_scoring_context
 from ..models import FeatureDefinition
 from .advanced_features import extract_advanced_features
 
 logger = logging.getLogger(__name__)
 
 
-def extract_features(transaction) -> Dict[str, Any]:
+def extract_features(transaction, context=None) -> Dict[str, Any]:
     """
     Extract features from a transaction for ML models.
     
     Args:
         transaction: The transaction object
+        context: Optional ScoringContext shared with the other engines
         
     Returns:
         Dictionary of features
     """
+    context = get_scoring_context(transaction, context)
+    
     # Initialize features dictionary
     features = {}
     
     # Basic transaction features
-    features['amount'] = float(transaction.amount)
-    features['transaction_type'] = transaction.transaction_type
-    features['channel'] = transaction.channel
+    features['amount'] = context.amount
+    features['transaction_type'] = context.transaction_type
+    features['channel'] = context.channel
     
     # Time-based features
-    transaction_time = transaction.timestamp
-    features['hour_of_day'] = transaction_time.hour
-    features['day_of_week'] = transaction_time.weekday()
-    features['is_weekend'] = 1 if transaction_time.weekday() >= 5 else 0
-    features['is_night'] = 1 if transaction_time.hour < 6 or transaction_time.hour >= 22 else 0
+    features['hour_of_day'] = context.hour_of_day
+    features['day_of_week'] = context.day_of_week
+    features['is_weekend'] = 1 if context.is_weekend else 0
+    features['is_night'] = 1 if context.is_night else 0
     
     # Location features
-    if hasattr(transaction, 'location_data') and transaction.location_data:
-        location = transaction.location_data
+    if context.location_data:
+        location = context.location_data
         features['country'] = location.get('country', 'unknown')
-        features['has_ip'] = 1 if location.get('ip_address') else 0
+        features['has_ip'] = 1 if context.ip_address else 0
         
         # Check if coordinates are available
         if location.get('latitude') and location.get('longitude'):
@@ -56,13 +59,12 @@ def extract_features(transaction) -> Dict[str, Any]:
         features['has_coordinates'] = 0
     
     # Payment method features
-    if hasattr(transaction, 'payment_method_data') and transaction.payment_method_data:
-        payment_method = transaction.payment_method_data
-        features['payment_method_type'] = payment_method.get('type', 'unknown')
+    if context.payment_method_data:
+        features['payment_method_type'] = context.payment_method_data.get('type', 'unknown')
         
         # Card-specific features
-        if payment_method.get('type') in ['credit_card', 'debit_card']:
-            card_details = payment_method.get('card_details', {})
+        if context.payment_method_type in ['credit_card', 'debit_card']:
+            card_details = context.card_details
             features['is_new_card'] = 1 if card_details.get('is_new', False) else 0
             
             # Extract card BIN (first 6 digits) if available
@@ -9,7 +9,7 @@ import logging
 import pickle
 import os
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Tuple
 from django.conf import settings
 from django.utils import timezone
 from ..models import MLModel, MLPrediction
@@ -18,13 +18,68 @@ from .explainability_service import generate_shap_explanation, explain_response_
 
 logger = logging.getLogger(__name__)
 
+# Per-process cache of unpickled models, keyed by file path
+_loaded_models = {}
 
-def get_fraud_prediction(transaction) -> Dict[str, Any]:
+# Ensemble weight of each model type
+MODEL_TYPE_WEIGHTS = {
+    'classification': 0.5,  # Base fraud classification
+    'behavioral': 0.3,      # Behavioral analysis
+    'network': 0.2,         # Network analysis
+    'anomaly': 0.3,         # Anomaly detection
+    'adaptive': 0.2         # Adaptive thresholds
+}
+# Weight of model types missing from MODEL_TYPE_WEIGHTS
+DEFAULT_MODEL_WEIGHT = 0.2
+
+
+def load_model_file(model: MLModel):
+    """
+    Load the estimator for an MLModel from disk, reusing a cached copy.
+    
+    The cached estimator is reused until the model file is modified, so a
+    worker does not unpickle the same file for every transaction.
+    
+    Args:
+        model: The MLModel instance
+    
+    Returns:
+        The loaded estimator, or None if the model file does not exist
+    """
+    model_path = os.path.join(settings.BASE_DIR, model.file_path)
+    
+    # Check if model file exists
+    if not os.path.exists(model_path):
+        logger.error(f"Model file not found: {model_path}")
+        return None
+    
+    modified_time = os.path.getmtime(model_path)
+    cached = _loaded_models.get(model_path)
+    if cached and cached[0] == modified_time:
+        return cached[1]
+    
+    # Load the model from file
+    with open(model_path, 'rb') as f:
+        ml_model = pickle.load(f)
+    
+    _loaded_models[model_path] = (modified_time, ml_model)
+    return ml_model
+
+
+def get_fraud_prediction(transaction, active_models=None, prediction_records=None, explain: bool = True,
+                         context=None, budget=None) -> Dict[str, Any]:
     """
     Get fraud prediction for a transaction.
     
     Args:
         transaction: The transaction object
+        active_models: Optional list of preloaded active MLModel objects.
+            When omitted, the active models are queried from the database.
+        prediction_records: Optional list to collect unsaved MLPrediction
+            objects in instead of writing them one by one
+        explain: Whether to generate SHAP explanations for the predictions
+        context: Optional ScoringContext shared with the other engines
+        budget: Optional LatencyBudget, checked before each SHAP explanation
         
     Returns:
         Dictionary with the prediction result
@@ -45,76 +100,49 @@ def get_fraud_prediction(transaction) -> Dict[str, Any]:
     
     try:
         # Extract features
-        raw_features = extract_features(transaction)
+        raw_features = extract_features(transaction, context)
         
         # Transform features
         transformed_features = transform_features(raw_features)
         
         # Get active models
-        active_models = MLModel.objects.filter(is_active=True)
+        if active_models is None:
+            active_models = list(MLModel.objects.filter(is_active=True, is_shadow=False))
         
-        if not active_models.exists():
+        if not active_models:
             logger.warning(f"No active ML models found for transaction {transaction.transaction_id}")
             result['execution_time'] = (time.time() - start_time) * 1000
             return result
         
         # Initialize variables for ensemble prediction
-        total_risk_score = 0.0
-        model_weights = {
-            'classification': 0.5,  # Base fraud classification
-            'behavioral': 0.3,      # Behavioral analysis
-            'network': 0.2,         # Network analysis
-            'anomaly': 0.3,         # Anomaly detection
-            'adaptive': 0.2         # Adaptive thresholds
-        }
-        used_model_types = set()
+        model_weights = MODEL_TYPE_WEIGHTS
+        scored_models = []
         model_scores = {}
+        explanations = {}
         
         # Process each active model
         for model in active_models:
             try:
                 # Load the model
-                model_path = os.path.join(settings.BASE_DIR, model.file_path)
-                
-                # Check if model file exists
-                if not os.path.exists(model_path):
-                    logger.error(f"Model file not found: {model_path}")
+                ml_model = load_model_file(model)
+                if ml_model is None:
                     continue
                 
-                # Load the model from file
-                with open(model_path, 'rb') as f:
-                    ml_model = pickle.load(f)
-                
-                # Prepare features for prediction
-                feature_vector = []
-                for feature in ml_model.feature_names_in_:
-                    feature_vector.append(transformed_features.get(feature, 0))
-                
                 # Make prediction
                 prediction_start = time.time()
-                
-                # Different handling based on model type
-                if model.model_type == 'anomaly' or model.model_type == 'behavioral':
-                    # For anomaly detection models (like Isolation Forest)
-                    # -1 for anomalies, 1 for normal observations
-                    anomaly_score = ml_model.decision_function([feature_vector])[0]
-                    # Convert to a 0-1 scale where 1 is anomalous
-                    normalized_score = 1 - (anomaly_score + 1) / 2
-                    risk_score = normalized_score * 100
-                else:
-                    # For classification models
-                    prediction = ml_model.predict_proba([feature_vector])[0]
-                    # Get fraud probability (assuming binary classification with fraud as class 1)
-                    fraud_probability = prediction[1]
-                    risk_score = fraud_probability * 100
+                risk_score = float(predict_risk_scores(model, ml_model, [transformed_features])[0])
                 
                 prediction_time = (time.time() - prediction_start) * 1000
                 
-                # Generate explanation using SHAP
-                explanation = generate_shap_explanation(ml_model, transformed_features)
+                # Generate explanation using SHAP, unless the latency budget is nearly spent
+                if explain and budget is not None and not budget.allows('ml_engine.explanation'):
+                    explain = False
+                explanation = generate_shap_explanation(ml_model, transformed_features) if explain else {}
+                
+                explanations[model.name] = explanation
                 
                 # Save prediction to database
-                MLPrediction.objects.create(
+                prediction_record = MLPrediction(
                     transaction_id=transaction.transaction_id,
                     model=model,
                     prediction=risk_score,
@@ -123,11 +151,14 @@ def get_fraud_prediction(transaction) -> Dict[str, Any]:
                     explanation=explanation,
                     execution_time=prediction_time
                 )
+                if prediction_records is not None:
+                    prediction_records.append(prediction_record)
+                else:
+                    prediction_record.save()
                 
                 # Add to ensemble prediction
-                model_weight = model_weights.get(model.model_type, 0.2)  # Default weight if type not specified
-                total_risk_score += risk_score * model_weight
-                used_model_types.add(model.model_type)
+                model_weight = model_weights.get(model.model_type, DEFAULT_MODEL_WEIGHT)
+                scored_models.append((model.model_type, risk_score))
                 
                 # Store individual model scores
                 model_scores[model.name] = {
@@ -149,12 +180,7 @@ def get_fraud_prediction(transaction) -> Dict[str, Any]:
                              exc_info=True)
         
         # Calculate final risk score (weighted average)
-        if used_model_types:
-            # Normalize by the sum of weights of used model types
-            total_weight = sum(model_weights.get(model_type, 0.2) for model_type in used_model_types)
-            final_risk_score = total_risk_score / total_weight if total_weight > 0 else 0
-        else:
-            final_risk_score = 0
+        final_risk_score = combine_model_scores(scored_models)
         
         # Determine if fraudulent based on threshold
         is_fraudulent = final_risk_score >= 80  # Threshold can be adjusted
@@ -174,15 +200,8 @@ def get_fraud_prediction(transaction) -> Dict[str, Any]:
             result['model_name'] = primary_model['name']
             result['model_version'] = primary_model['version']
             
-            # Get the explanation from the database
-            try:
-                primary_prediction = MLPrediction.objects.filter(
-                    transaction_id=transaction.transaction_id,
-                    model__name=primary_model['name']
-                ).latest('created_at')
-                result['explanation'] = primary_prediction.explanation
-            except MLPrediction.DoesNotExist:
-                pass
+            # Use the explanation generated for the primary model
+            result['explanation'] = explanations.get(primary_model['name'], {})
     
     except Exception as e:
         logger.error(f"Error making fraud prediction for transaction {transaction.transaction_id}: {str(e)}", exc_info=True)
@@ -201,6 +220,58 @@ def get_fraud_prediction(transaction) -> Dict[str, Any]:
     return result
 
 
+def predict_risk_scores(model: MLModel, ml_model, feature_rows: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Score transformed feature rows with a loaded model in one call.
+    
+    Args:
+        model: The MLModel the estimator belongs to
+        ml_model: The loaded estimator
+        feature_rows: List of transformed feature dictionaries
+    
+    Returns:
+        Array of risk scores between 0 and 100, one per row
+    """
+    # Prepare features for prediction in the estimator's column order
+    feature_names = list(ml_model.feature_names_in_)
+    matrix = [[row.get(feature, 0) for feature in feature_names] for row in feature_rows]
+    
+    # Different handling based on model type
+    if model.model_type == 'anomaly' or model.model_type == 'behavioral':
+        # For anomaly detection models (like Isolation Forest)
+        # -1 for anomalies, 1 for normal observations
+        anomaly_scores = np.asarray(ml_model.decision_function(matrix), dtype=float)
+        # Convert to a 0-1 scale where 1 is anomalous
+        return (1 - (anomaly_scores + 1) / 2) * 100
+    
+    # For classification models, the fraud probability is class 1
+    return np.asarray(ml_model.predict_proba(matrix), dtype=float)[:, 1] * 100
+
+
+def combine_model_scores(scored_models: Iterable[Tuple[str, float]]) -> float:
+    """
+    Combine the risk scores of several models into the ensemble score.
+    
+    Args:
+        scored_models: Iterable of (model type, risk score) pairs
+    
+    Returns:
+        The weighted average risk score, or 0 if no model was scored
+    """
+    total_risk_score = 0.0
+    used_model_types = set()
+    for model_type, risk_score in scored_models:
+        total_risk_score += risk_score * MODEL_TYPE_WEIGHTS.get(model_type, DEFAULT_MODEL_WEIGHT)
+        used_model_types.add(model_type)
+    
+    if not used_model_types:
+        return 0
+    
+    # Normalize by the sum of weights of used model types
+    total_weight = sum(MODEL_TYPE_WEIGHTS.get(model_type, DEFAULT_MODEL_WEIGHT) for model_type in used_model_types)
+    return total_risk_score / total_weight if total_weight > 0 else 0
+
+
 def generate_explanation(model, features: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate an explanation for a model prediction.
@@ -3,10 +3,12 @@ Management command to test merchant-specific rules.
 """
 
 import uuid
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from apps.transactions.models import Transaction
+from apps.rule_engine.models import Rule
 from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.simulator import simulate_condition
 
 
 class Command(BaseCommand):
@@ -36,12 +38,28 @@ class Command(BaseCommand):
             default=1000.0,
             help='Transaction amount to use for testing'
         )
+        
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Simulate the rule or condition over the transactions of the last N days instead'
+        )
+        
+        parser.add_argument(
+            '--condition',
+            type=str,
+            help='Candidate rule condition to simulate (defaults to the condition of --rule_id)'
+        )
     
     def handle(self, *args, **options):
         rule_id = options.get('rule_id')
         merchant_id = options.get('merchant_id')
         amount = options.get('amount')
         
+        if options.get('days'):
+            self.simulate(rule_id, options.get('condition'), options['days'])
+            return
+        
         self.stdout.write(self.style.NOTICE(f"Testing merchant-specific rules for merchant {merchant_id}"))
         
         # Create a test transaction
@@ -85,4 +103,58 @@ class Command(BaseCommand):
             if rule_id in triggered_rule_ids:
                 self.stdout.write(self.style.SUCCESS(f"Rule {rule_id} was triggered for merchant {merchant_id}"))
             else:
-                self.stdout.write(self.style.WARNING(f"Rule {rule_id} was NOT triggered for merchant {merchant_id}"))
\ No newline at end of file
+                self.stdout.write(self.style.WARNING(f"Rule {rule_id} was NOT triggered for merchant {merchant_id}"))
+    
+    def simulate(self, rule_id, condition, days):
+        """
+        Simulate a rule or condition over historical transactions and print the report.
+        """
+        if not condition:
+            if not rule_id:
+                raise CommandError("Either --rule_id or --condition is required with --days")
+            try:
+                condition = Rule.objects.get(id=rule_id).condition
+            except Rule.DoesNotExist:
+                raise CommandError(f"Rule with ID {rule_id} does not exist")
+        
+        self.stdout.write(self.style.NOTICE(f"Simulating condition over the last {days} days: {condition}"))
+        
+        try:
+            report = simulate_condition(condition, days=days, exclude_rule_id=rule_id)
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(
+            f"Evaluated {report['transactions']} transactions in {report['execution_time']:.2f}ms "
+            f"({report['rows_evaluated_per_row']} per row)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['hits']} hits ({report['hit_rate']:.2f}%), "
+            f"{report['new_hits']} not caught by the active rules"
+        ))
+        
+        self.stdout.write("Hit rate by channel:")
+        for row in report['by_channel']:
+            self.stdout.write(f"  - {row['channel']}: {row['hits']}/{row['transactions']} ({row['hit_rate']:.2f}%)")
+        
+        self.stdout.write("Top merchants:")
+        for row in report['by_merchant']:
+            self.stdout.write(
+                f"  - {row['merchant_id'] or '-'}: {row['hits']}/{row['transactions']} ({row['hit_rate']:.2f}%)"
+            )
+        
+        if report['overlap']:
+            self.stdout.write("Overlap with active rules:")
+            for row in report['overlap']:
+                self.stdout.write(
+                    f"  - {row['name']} (ID: {row['rule_id']}): {row['overlap']} shared hits "
+                    f"({row['overlap_rate']:.1f}% of the hits)"
+                )
+        
+        if report['samples']:
+            self.stdout.write("Sample matches:")
+            for sample in report['samples']:
+                self.stdout.write(
+                    f"  - {sample['transaction_id']} ({sample['channel']}, {sample['merchant_id'] or '-'}, "
+                    f"{sample['amount']})"
+                )
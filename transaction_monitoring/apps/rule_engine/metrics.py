@@ -0,0 +1,11 @@
+"""
+Metrics for the Rule Engine app.
+"""
+
+from apps.core.metrics import Counter
+
+RULE_GUARD_EVENTS = Counter(
+    'rule_engine_guard_events_total',
+    'Rules flagged as slow, failing or quarantined by the rule profiler, by event',
+    ['event']
+)
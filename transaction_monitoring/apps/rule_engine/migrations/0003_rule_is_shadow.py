@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rule_engine', '0002_rule_excluded_merchants_rule_included_merchants_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rule',
+            name='is_shadow',
+            field=models.BooleanField(default=False, help_text='If enabled, this rule is scored on sampled live transactions without affecting decisions', verbose_name='Shadow Mode'),
+        ),
+    ]
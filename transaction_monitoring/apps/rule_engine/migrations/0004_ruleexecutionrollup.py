@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rule_engine', '0003_rule_is_shadow'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='RuleExecutionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(verbose_name='Minute')),
+                ('evaluations', models.IntegerField(default=0, verbose_name='Evaluations')),
+                ('hits', models.IntegerField(default=0, verbose_name='Hits')),
+                ('total_time', models.FloatField(default=0.0, verbose_name='Total Execution Time (ms)')),
+                ('min_time', models.FloatField(blank=True, null=True, verbose_name='Min Execution Time (ms)')),
+                ('max_time', models.FloatField(blank=True, null=True, verbose_name='Max Execution Time (ms)')),
+                ('latency_histogram', models.JSONField(default=list, verbose_name='Latency Histogram')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='execution_rollups', to='rule_engine.rule')),
+            ],
+            options={
+                'verbose_name': 'Rule Execution Rollup',
+                'verbose_name_plural': 'Rule Execution Rollups',
+                'ordering': ['-minute'],
+                'indexes': [models.Index(fields=['minute'], name='rule_engine_minute_d4127a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('rule', 'minute'), name='rule_engine_rollup_rule_minute')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rule_engine', '0004_ruleexecutionrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rule',
+            name='threshold_field',
+            field=models.CharField(blank=True, choices=[('amount', 'Amount'), ('hour', 'Hour of Day')], help_text='If set, this rule triggers when the field is within the threshold interval', max_length=20, null=True, verbose_name='Threshold Field'),
+        ),
+        migrations.AddField(
+            model_name='rule',
+            name='threshold_max',
+            field=models.FloatField(blank=True, help_text='Upper bound of the matching values, exclusive. A maximum below the minimum matches values outside the interval', null=True, verbose_name='Threshold Maximum'),
+        ),
+        migrations.AddField(
+            model_name='rule',
+            name='threshold_min',
+            field=models.FloatField(blank=True, help_text='Lowest matching value, inclusive', null=True, verbose_name='Threshold Minimum'),
+        ),
+    ]
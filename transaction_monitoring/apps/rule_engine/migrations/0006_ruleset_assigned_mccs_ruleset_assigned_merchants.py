@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rule_engine', '0005_rule_threshold_field_rule_threshold_max_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruleset',
+            name='assigned_mccs',
+            field=models.JSONField(blank=True, default=list, help_text='List of merchant category codes whose transactions are evaluated with this rule set only, unless their merchant has a rule set', verbose_name='Assigned MCCs'),
+        ),
+        migrations.AddField(
+            model_name='ruleset',
+            name='assigned_merchants',
+            field=models.JSONField(blank=True, default=list, help_text='List of merchant IDs whose transactions are evaluated with this rule set only', verbose_name='Assigned Merchants'),
+        ),
+    ]
@@ -29,6 +29,11 @@ class Rule(TimeStampedModel):
         ('notify', _('Notify Only')),
     )
     
+    THRESHOLD_FIELD_CHOICES = (
+        ('amount', _('Amount')),
+        ('hour', _('Hour of Day')),
+    )
+    
     name = models.CharField(_('Rule Name'), max_length=100)
     description = models.TextField(_('Description'))
     rule_type = models.CharField(_('Rule Type'), max_length=20, choices=RULE_TYPE_CHOICES)
@@ -36,6 +41,9 @@ class Rule(TimeStampedModel):
     action = models.CharField(_('Action'), max_length=20, choices=ACTION_CHOICES)
     risk_score = models.DecimalField(_('Risk Score'), max_digits=5, decimal_places=2)
     is_active = models.BooleanField(_('Is Active'), default=True)
+    is_shadow = models.BooleanField(_('Shadow Mode'), default=False,
+                                    help_text=_('If enabled, this rule is scored on sampled live transactions '
+                                                'without affecting decisions'))
     priority = models.IntegerField(_('Priority'), default=0)
     version = models.IntegerField(_('Version'), default=1)
     created_by = models.CharField(_('Created By'), max_length=100)
@@ -54,6 +62,17 @@ class Rule(TimeStampedModel):
     excluded_merchants = models.JSONField(_('Excluded Merchants'), default=list, blank=True,
                                          help_text=_('List of merchant IDs this rule does NOT apply to'))
     
+    # Threshold rules match a transaction field against an interval; their condition is generated from it
+    threshold_field = models.CharField(_('Threshold Field'), max_length=20, choices=THRESHOLD_FIELD_CHOICES,
+                                       null=True, blank=True,
+                                       help_text=_('If set, this rule triggers when the field is within the '
+                                                   'threshold interval'))
+    threshold_min = models.FloatField(_('Threshold Minimum'), null=True, blank=True,
+                                      help_text=_('Lowest matching value, inclusive'))
+    threshold_max = models.FloatField(_('Threshold Maximum'), null=True, blank=True,
+                                      help_text=_('Upper bound of the matching values, exclusive. A maximum '
+                                                  'below the minimum matches values outside the interval'))
+    
     # Performance metrics
     hit_count = models.IntegerField(_('Hit Count'), default=0)
     false_positive_count = models.IntegerField(_('False Positive Count'), default=0)
@@ -75,11 +94,23 @@ class Rule(TimeStampedModel):
 class RuleSet(TimeStampedModel):
     """
     Model for grouping rules into sets.
+    
+    An active rule set assigned to merchants or merchant category codes is
+    the only set of rules evaluated for their transactions.
     """
     name = models.CharField(_('Rule Set Name'), max_length=100)
     description = models.TextField(_('Description'))
     rules = models.ManyToManyField(Rule, related_name='rule_sets')
     is_active = models.BooleanField(_('Is Active'), default=True)
+    
+    # Merchants and segments evaluated with this rule set instead of the global rules
+    assigned_merchants = models.JSONField(_('Assigned Merchants'), default=list, blank=True,
+                                          help_text=_('List of merchant IDs whose transactions are evaluated '
+                                                      'with this rule set only'))
+    assigned_mccs = models.JSONField(_('Assigned MCCs'), default=list, blank=True,
+                                     help_text=_('List of merchant category codes whose transactions are '
+                                                 'evaluated with this rule set only, unless their merchant '
+                                                 'has a rule set'))
     created_by = models.CharField(_('Created By'), max_length=100)
     last_modified_by = models.CharField(_('Last Modified By'), max_length=100, null=True, blank=True)
     
@@ -113,4 +144,36 @@ class RuleExecution(TimeStampedModel):
         ]
     
     def __str__(self):
-        return f"{self.rule.name} - {self.transaction_id} - {'Triggered' if self.triggered else 'Not Triggered'}"
\ No newline at end of file
+        return f"{self.rule.name} - {self.transaction_id} - {'Triggered' if self.triggered else 'Not Triggered'}"
+
+
+class RuleExecutionRollup(models.Model):
+    """
+    Aggregated executions of a rule over one minute.
+    
+    Rollups are updated incrementally as executions are stored, including
+    the executions whose rows are not kept, so rule statistics are read from
+    one row per rule and minute instead of from RuleExecution.
+    """
+    rule = models.ForeignKey(Rule, on_delete=models.CASCADE, related_name='execution_rollups')
+    minute = models.DateTimeField(_('Minute'))
+    evaluations = models.IntegerField(_('Evaluations'), default=0)
+    hits = models.IntegerField(_('Hits'), default=0)
+    total_time = models.FloatField(_('Total Execution Time (ms)'), default=0.0)
+    min_time = models.FloatField(_('Min Execution Time (ms)'), null=True, blank=True)
+    max_time = models.FloatField(_('Max Execution Time (ms)'), null=True, blank=True)
+    latency_histogram = models.JSONField(_('Latency Histogram'), default=list)
+    
+    class Meta:
+        verbose_name = _('Rule Execution Rollup')
+        verbose_name_plural = _('Rule Execution Rollups')
+        ordering = ['-minute']
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'minute'], name='rule_engine_rollup_rule_minute'),
+        ]
+        indexes = [
+            models.Index(fields=['minute']),
+        ]
+    
+    def __str__(self):
+        return f"{self.rule_id} - {self.minute:%Y-%m-%d %H:%M} - {self.hits}/{self.evaluations}"
@@ -12,6 +12,9 @@ AML_RULES = [
         'description': 'Flag potential structuring activity (multiple transactions just below reporting thresholds)',
         'rule_type': 'aml',
         'condition': 'transaction["amount"] >= 9000 and transaction["amount"] < 10000',
+        'threshold_field': 'amount',
+        'threshold_min': 9000,
+        'threshold_max': 10000,
         'action': 'review',
         'risk_score': 80.0,
         'priority': 90,
@@ -118,6 +121,9 @@ def create_aml_rules(created_by='system'):
                 'action': rule_data['action'],
                 'risk_score': rule_data['risk_score'],
                 'priority': rule_data['priority'],
+                'threshold_field': rule_data.get('threshold_field'),
+                'threshold_min': rule_data.get('threshold_min'),
+                'threshold_max': rule_data.get('threshold_max'),
                 'created_by': created_by,
             }
         )
\ No newline at end of file
@@ -2,14 +2,43 @@
 Rule compiler service for the Rule Engine.
 
 This service is responsible for compiling rule conditions into executable code.
+
+Conditions are validated and compiled to code objects once, then kept in a
+per-process cache keyed by rule ID and version. Saving a rule bumps a
+version stamp in the shared cache, which every process checks at most every
+RULE_ENGINE_VERSION_CHECK_INTERVAL seconds to drop its compiled rules and
+its rule index.
 """
 
 import logging
 import ast
-from typing import Dict, Any, List, Tuple
+import threading
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+from django.conf import settings
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+# Cache key of the stamp bumped whenever a rule is saved or deleted
+RULES_VERSION_KEY = 'rule_engine:rules_version'
+
+# Read-only methods conditions may call on values read from the transaction
+READ_ONLY_METHODS = {
+    # Dictionaries
+    'get', 'keys', 'values', 'items',
+    # Strings
+    'lower', 'upper', 'title', 'casefold', 'strip', 'lstrip', 'rstrip', 'split', 'replace',
+    'startswith', 'endswith', 'find', 'count', 'index', 'isdigit', 'isalpha', 'isalnum',
+    # Dates and times
+    'date', 'time', 'weekday', 'isoweekday', 'isoformat', 'timestamp', 'total_seconds',
+}
+
+# Transaction fields reported in the condition values when a condition uses them
+CONDITION_VALUE_FIELDS = (
+    'amount', 'currency', 'user_id', 'merchant_id', 'location_data', 'payment_method_data'
+)
+
 
 def compile_rule_condition(condition: str) -> Tuple[bool, str]:
     """
@@ -42,6 +71,192 @@ def compile_rule_condition(condition: str) -> Tuple[bool, str]:
     return True, ""
 
 
+class CompiledCondition:
+    """
+    A validated rule condition compiled to a code object.
+    
+    Conditions that fail validation are kept too, with their error, so they
+    are not re-parsed on every transaction.
+    """
+    
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.code = None
+        self.error = None
+        self.value_fields = tuple(field for field in CONDITION_VALUE_FIELDS if field in condition)
+        
+        is_valid, error_message = compile_rule_condition(condition)
+        if is_valid:
+            self.code = compile(condition, '<rule condition>', 'eval')
+        else:
+            self.error = error_message
+
+
+class CompiledRuleCache:
+    """
+    Per-process cache of compiled rule conditions.
+    
+    Entries are keyed by rule ID and version. An entry is also recompiled
+    if the condition text differs, so a rule edited without a version bump
+    is never evaluated with its old condition.
+    """
+    
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._stamp = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+    
+    def get(self, rule) -> CompiledCondition:
+        """
+        Get the compiled condition of a rule, compiling it on first use.
+        
+        Args:
+            rule: The Rule object
+        
+        Returns:
+            The CompiledCondition
+        """
+        self._check_stamp()
+        
+        key = (rule.pk, rule.version)
+        compiled = self._entries.get(key)
+        if compiled is None or compiled.condition != rule.condition:
+            compiled = CompiledCondition(rule.condition)
+            with self._lock:
+                self._entries[key] = compiled
+        return compiled
+    
+    def clear(self):
+        """
+        Drop every compiled condition.
+        """
+        with self._lock:
+            self._entries = {}
+    
+    def _check_stamp(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        
+        try:
+            stamp = cache.get(RULES_VERSION_KEY, 0)
+        except Exception as e:
+            logger.warning(f"Error reading the rules version stamp: {str(e)}")
+            return
+        
+        if stamp != self._stamp:
+            self.clear()
+            self._stamp = stamp
+
+
+_compiled_rule_cache = None
+_compiled_rule_cache_lock = threading.Lock()
+
+
+def get_compiled_rule_cache() -> CompiledRuleCache:
+    """
+    Get the process-wide cache of compiled rule conditions.
+    
+    Returns:
+        The CompiledRuleCache instance
+    """
+    global _compiled_rule_cache
+    
+    if _compiled_rule_cache is None:
+        with _compiled_rule_cache_lock:
+            if _compiled_rule_cache is None:
+                _compiled_rule_cache = CompiledRuleCache(settings.RULE_ENGINE_VERSION_CHECK_INTERVAL)
+    
+    return _compiled_rule_cache
+
+
+def get_compiled_condition(rule) -> CompiledCondition:
+    """
+    Get the compiled condition of a rule from the process-wide cache.
+    
+    Args:
+        rule: The Rule object
+    
+    Returns:
+        The CompiledCondition
+    """
+    return get_compiled_rule_cache().get(rule)
+
+
+def bump_rules_version():
+    """
+    Invalidate the compiled rules of every process.
+    
+    The rules of this process are dropped immediately, other processes drop
+    theirs the next time they check the version stamp.
+    """
+    try:
+        try:
+            cache.incr(RULES_VERSION_KEY)
+        except ValueError:
+            # First bump, or the stamp was evicted
+            cache.add(RULES_VERSION_KEY, 0, None)
+            cache.incr(RULES_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Error bumping the rules version stamp: {str(e)}")
+    
+    if _compiled_rule_cache is not None:
+        _compiled_rule_cache.clear()
+
+
+def is_transaction_value(node) -> bool:
+    """
+    Check whether an expression is read from the transaction data.
+    
+    Args:
+        node: The AST node
+    
+    Returns:
+        True for ``transaction`` and attribute, item and method call chains on it
+    """
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return isinstance(node, ast.Name) and node.id == 'transaction'
+
+
+def get_condition_fields(condition: str) -> Optional[Set[str]]:
+    """
+    Get the transaction dictionary keys a condition reads.
+    
+    Args:
+        condition: The rule condition
+    
+    Returns:
+        The keys, or None if the condition uses the transaction dictionary
+        in other ways than literal ``transaction[...]`` / ``transaction.get(...)``
+        lookups and may read any key
+    """
+    try:
+        tree = ast.parse(condition, mode='eval')
+    except SyntaxError:
+        return None
+    
+    fields = set()
+    lookups = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+            if isinstance(node.slice, ast.Constant):
+                fields.add(node.slice.value)
+                lookups.add(id(node.value))
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'get'
+              and isinstance(node.func.value, ast.Name) and node.args and isinstance(node.args[0], ast.Constant)):
+            fields.add(node.args[0].value)
+            lookups.add(id(node.func.value))
+    
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == 'transaction' and id(node) not in lookups:
+            return None
+    return fields
+
+
 class RuleConditionValidator(ast.NodeVisitor):
     """
     AST visitor to validate rule conditions for safety.
@@ -68,13 +283,16 @@ class RuleConditionValidator(ast.NodeVisitor):
             elif isinstance(node.func.value, ast.Name) and node.func.value.id == 'list':
                 # List methods are generally safe
                 pass
+            elif is_transaction_value(node.func.value):
+                # Read-only methods of transaction values, such as
+                # transaction.get("location_data", {}).get("country"). The
+                # nested values are shared with the other engines, so methods
+                # that could modify them are rejected.
+                if node.func.attr not in READ_ONLY_METHODS:
+                    raise ValueError(f"Method '{node.func.attr}' is not allowed in rule conditions")
+                self.visit(node.func)
             else:
-                # Check if we're accessing transaction attributes
-                if not (isinstance(node.func.value, ast.Name) and node.func.value.id == 'transaction'):
-                    if not (isinstance(node.func.value, ast.Attribute) and 
-                            isinstance(node.func.value.value, ast.Name) and 
-                            node.func.value.value.id == 'transaction'):
-                        raise ValueError(f"Method call '{ast.unparse(node.func)}' is not allowed in rule conditions")
+                raise ValueError(f"Method call '{ast.unparse(node.func)}' is not allowed in rule conditions")
         else:
             raise ValueError(f"Complex function call '{ast.unparse(node)}' is not allowed in rule conditions")
         
@@ -88,6 +306,10 @@ class RuleConditionValidator(ast.NodeVisitor):
         """
         Check attribute access to ensure it's allowed.
         """
+        # Private and special attributes could reach objects outside the transaction
+        if node.attr.startswith('_'):
+            raise ValueError(f"Attribute '{node.attr}' is not allowed in rule conditions")
+        
         # Allow accessing transaction attributes
         if isinstance(node.value, ast.Name) and node.value.id == 'transaction':
             return
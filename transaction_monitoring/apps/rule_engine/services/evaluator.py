@@ -2,23 +2,113 @@
 Rule evaluation service for the Rule Engine.
 
 This service is responsible for evaluating rules against transactions.
+Rule conditions are executed as code objects compiled once per rule
+version by the compiler service. Transactions of merchants and segments
+with an assigned rule set only evaluate the precompiled bundle of that set.
 """
 
 import time
 import logging
-from typing import Dict, Any, List
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional
 from django.utils import timezone
+from apps.core.hit_counts import count_hit
+from apps.core.scoring_context import get_scoring_context
 from ..models import Rule, RuleExecution
+from .compiler import CompiledCondition, get_compiled_condition
+from .execution_store import store_rule_executions
+from .optimizer import ShortCircuit
+from .profiler import handle_guard_event
+from .rule_index import RuleBundle, RuleIndex, get_rule_index
 
 logger = logging.getLogger(__name__)
 
+# Transaction dictionary keys always set by transaction_to_dict
+BASE_FIELDS = ('transaction_id', 'transaction_type', 'channel', 'amount', 'currency', 'user_id', 'timestamp', 'status')
 
-def evaluate_rules(transaction) -> Dict[str, Any]:
+# Transaction dictionary keys only set when the value is not empty
+OPTIONAL_FIELDS = ('merchant_id', 'device_id', 'location_data', 'payment_method_data', 'metadata')
+
+# Channel-specific transaction dictionary keys and their defaults, by channel and table accessor
+CHANNEL_FIELDS = {
+    'pos': ('postransaction', {
+        'terminal_id': None,
+        'entry_mode': None,
+        'terminal_type': None,
+        'attendance': None,
+        'condition': None,
+        'mcc': None,
+        'authorization_code': None,
+        'recurring_payment': False,
+    }),
+    'ecommerce': ('ecommercetransaction', {
+        'website_url': None,
+        'is_3ds_verified': False,
+        'device_fingerprint': None,
+        'shipping_address': {},
+        'billing_address': {},
+        'is_billing_shipping_match': True,
+        'mcc': None,
+        'authorization_code': None,
+        'recurring_payment': False,
+    }),
+    'wallet': ('wallettransaction', {
+        'wallet_id': None,
+        'source_type': None,
+        'destination_type': None,
+        'source_id': None,
+        'destination_id': None,
+        'transaction_purpose': None,
+        'is_internal': False,
+    }),
+}
+
+# Functions available to rule conditions
+CONDITION_FUNCTIONS = {
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'len': len,
+    'str': str,
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'list': list,
+    'dict': dict,
+    'round': round,
+}
+
+
+def evaluate_rules(transaction, rules=None, execution_records=None, context=None,
+                   batch_conditions=None, optimizer=None, full_evaluation=False,
+                   profiler=None) -> Dict[str, Any]:
     """
     Evaluate all applicable rules against a transaction.
     
     Args:
         transaction: The transaction object
+        rules: Optional preloaded active rules, as a list or a RuleIndex.
+            When omitted, the applicable rules are selected from the
+            in-memory index of the active rules, or from the bundle of the
+            rule set assigned to the transaction's merchant or segment.
+        execution_records: Optional list to collect unsaved RuleExecution
+            objects in. When given, executions and hit counts are not written
+            and the caller is responsible for persisting them in bulk.
+        context: Optional ScoringContext shared with the other engines. The
+            transaction dictionary is built once per context and shared
+            read-only between rules.
+        batch_conditions: Optional BatchRuleConditions holding the rule
+            conditions evaluated over the transaction's batch at once.
+        optimizer: Optional RuleOptimizer. Rules are then evaluated in its
+            order and added to its statistics, and evaluation stops once a
+            reject decision is certain. Triggered rules are still listed in
+            priority order.
+        full_evaluation: Whether to evaluate every rule even with an
+            optimizer, e.g. for audit-sampled transactions
+        profiler: Optional RuleProfiler. Rule latencies are then added to
+            its profile, slow and failing rules are reported and rules it
+            quarantined are skipped.
         
     Returns:
         Dictionary with the rule evaluation result
@@ -34,85 +124,97 @@ def evaluate_rules(transaction) -> Dict[str, Any]:
         'rules_triggered': 0,
     }
     
-    # Get active rules applicable to this transaction channel
-    channel = transaction.channel
-    rules = Rule.objects.filter(is_active=True)
+    # Transactions of merchants and segments with an assigned rule set only evaluate its bundle
+    if rules is None:
+        rules = get_rule_index()
+    bundle = get_rule_bundle(transaction, rules)
+    conditions = {}
+    fields = None
+    if bundle is not None:
+        rules, conditions, fields = bundle.index, bundle.conditions, bundle.fields
     
-    if channel == 'pos':
-        rules = rules.filter(applies_to_pos=True)
-    elif channel == 'ecommerce':
-        rules = rules.filter(applies_to_ecommerce=True)
-    elif channel == 'wallet':
-        rules = rules.filter(applies_to_wallet=True)
+    # Convert transaction to a dictionary for rule evaluation, once for all rules
+    transaction_dict = get_transaction_dict(transaction, context, fields)
     
-    # Filter by merchant-specific rules if applicable
-    merchant_id = getattr(transaction, 'merchant_id', None)
-    if merchant_id:
-        # For SQLite compatibility, we need to filter in Python instead of using JSON field lookups
-        # Get all rules first
-        all_rules = list(rules)
-        filtered_rules = []
-        
-        for rule in all_rules:
-            # Skip rules where this merchant is explicitly excluded
-            if merchant_id in rule.excluded_merchants:
-                continue
-            
-            # Include rules that:
-            # 1. Are not merchant-specific (apply to all merchants), OR
-            # 2. Are merchant-specific AND include this merchant, OR
-            # 3. Are merchant-specific with an empty included_merchants list (applies to all)
-            if (not rule.merchant_specific or  # Not merchant-specific
-                (rule.merchant_specific and not rule.included_merchants) or  # Merchant-specific but applies to all
-                (rule.merchant_specific and merchant_id in rule.included_merchants)):  # Merchant-specific and includes this merchant
-                filtered_rules.append(rule)
-        
-        # Replace the queryset with our filtered list
-        rules = filtered_rules
+    # Get active rules applicable to this transaction, in priority order
+    rules = get_applicable_rules(transaction, rules, transaction_dict)
     
-    # Order by priority (higher priority first)
-    if isinstance(rules, list):
-        # If we've filtered in Python, sort the list
-        rules = sorted(rules, key=lambda r: (-r.priority, r.name))
-    else:
-        # Otherwise, use the queryset's order_by method
-        rules = rules.order_by('-priority')
+    # Namespace shared by the conditions of every rule
+    namespace = build_condition_namespace(transaction_dict)
     
     # Track the highest risk score from triggered rules
     max_risk_score = 0.0
     
+    # The optimizer picks the evaluation order and may stop early
+    order = range(len(rules))
+    short_circuit = None
+    if optimizer is not None and not full_evaluation:
+        order = optimizer.order(rules)
+        short_circuit = ShortCircuit(rules)
+    
     # Evaluate each rule
-    for rule in rules:
+    outcomes = {}
+    for position in order:
+        rule = rules[position]
+        if profiler is not None and profiler.is_quarantined(rule):
+            continue
         rule_start_time = time.time()
         
-        # Convert transaction to a dictionary for rule evaluation
-        transaction_dict = transaction_to_dict(transaction)
-        
         # Evaluate the rule condition
         try:
-            triggered, condition_values = evaluate_condition(rule.condition, transaction_dict)
+            outcome = None
+            if batch_conditions is not None:
+                outcome = batch_conditions.evaluate(rule, transaction.transaction_id, transaction_dict, namespace)
+            if outcome is None:
+                compiled = conditions.get(rule.pk) or get_compiled_condition(rule)
+                outcome = execute_condition(compiled, transaction_dict, namespace)
+            triggered, condition_values = outcome
         except Exception as e:
             logger.error(f"Error evaluating rule {rule.name}: {str(e)}", exc_info=True)
             triggered = False
             condition_values = {'error': str(e)}
         
+        # Conditions that raise are reported through their condition values
+        failed = 'error' in condition_values
+        
         # Calculate execution time in milliseconds
         execution_time = (time.time() - rule_start_time) * 1000
+        outcomes[position] = (triggered, condition_values, execution_time)
+        
+        if optimizer is not None:
+            optimizer.record(rule, execution_time, triggered)
+        if profiler is not None:
+            event = profiler.record(rule, execution_time, failed)
+            if event is not None:
+                reason = condition_values['error'] if failed else f"took {execution_time:.2f}ms"
+                handle_guard_event(rule, event, profiler, reason)
+        if short_circuit is not None and short_circuit.add(position, triggered):
+            break
+    
+    # Record the evaluated rules in priority order
+    executed_at = timezone.now()
+    executions = []
+    for position, rule in enumerate(rules):
+        if position not in outcomes:
+            continue
+        triggered, condition_values, execution_time = outcomes[position]
         
         # Record rule execution
-        RuleExecution.objects.create(
+        execution = RuleExecution(
             transaction_id=transaction.transaction_id,
             rule=rule,
             triggered=triggered,
             execution_time=execution_time,
             condition_values=condition_values
         )
+        # Rollups are bucketed by the time the rule ran, not the time the row is written
+        execution.executed_at = executed_at
+        executions.append(execution)
         
         # Update rule metrics
         if triggered:
-            rule.hit_count += 1
-            rule.last_triggered = timezone.now()
-            rule.save(update_fields=['hit_count', 'last_triggered'])
+            if execution_records is None:
+                count_hit(rule)
             
             # Add to triggered rules
             result['triggered_rules'].append({
@@ -134,8 +236,14 @@ def evaluate_rules(transaction) -> Dict[str, Any]:
         # Increment evaluated count
         result['rules_evaluated'] += 1
     
+    if execution_records is not None:
+        execution_records.extend(executions)
+    else:
+        store_rule_executions(executions)
+    
     # Set the risk score to the highest from triggered rules
     result['risk_score'] = max_risk_score
+    result['rules_skipped'] = len(rules) - len(outcomes)
     
     # Calculate total execution time in milliseconds
     result['execution_time'] = (time.time() - start_time) * 1000
@@ -143,75 +251,186 @@ def evaluate_rules(transaction) -> Dict[str, Any]:
     logger.info(
         f"Rule evaluation for transaction {transaction.transaction_id}: "
         f"{result['rules_triggered']} of {result['rules_evaluated']} rules triggered "
-        f"in {result['execution_time']:.2f}ms"
+        f"({result['rules_skipped']} skipped) in {result['execution_time']:.2f}ms"
     )
     
     return result
 
 
-def evaluate_condition(condition: str, transaction_dict: Dict[str, Any]) -> tuple:
+def get_transaction_dict(transaction, context=None, fields=None) -> MappingProxyType:
     """
-    Evaluate a rule condition against a transaction.
+    Get the read-only dictionary rule conditions see as ``transaction``.
     
     Args:
-        condition: The rule condition as a Python expression
-        transaction_dict: The transaction data as a dictionary
+        transaction: The transaction object
+        context: Optional ScoringContext caching the dictionary
+        fields: Optional sorted tuple of the keys to extract, as in
+            transaction_to_dict, for rules only reading those keys
+    
+    Returns:
+        The transaction dictionary, built once per context and set of keys
+    """
+    context = get_scoring_context(transaction, context)
+    if fields is None:
+        return context.derived(
+            'rule_engine.transaction_dict',
+            lambda: MappingProxyType(transaction_to_dict(transaction))
+        )
+    return context.derived(
+        'rule_engine.transaction_dict:' + ','.join(fields),
+        lambda: MappingProxyType(transaction_to_dict(transaction, frozenset(fields)))
+    )
+
+
+def get_rule_bundle(transaction, rules=None) -> Optional[RuleBundle]:
+    """
+    Get the bundle of the rule set assigned to a transaction's merchant or segment.
+    
+    Args:
+        transaction: The transaction object
+        rules: Optional preloaded active rules, as in get_applicable_rules.
+            Only the index of the production rules holds bundles.
+    
+    Returns:
+        The RuleBundle, or None if the transaction is evaluated with all the
+        given rules
+    """
+    if rules is None:
+        rules = get_rule_index()
+    if not isinstance(rules, RuleIndex) or rules.bundles is None:
+        return None
+    return rules.bundles.select(getattr(transaction, 'merchant_id', None), getattr(transaction, 'mcc', None))
+
+
+def get_applicable_rules(transaction, rules=None, transaction_dict=None) -> List[Rule]:
+    """
+    Get the active rules applicable to a transaction, in evaluation order.
+    
+    Args:
+        transaction: The transaction object
+        rules: Optional preloaded active rules to select from, as a list or
+            a RuleIndex, instead of the index of the active rules
+        transaction_dict: Optional transaction data. When given and rules
+            are selected from a RuleIndex, threshold rules whose interval
+            does not hold the transaction are left out.
+    
+    Returns:
+        Ordered list of applicable rules
+    """
+    merchant_id = getattr(transaction, 'merchant_id', None)
+    
+    if rules is None:
+        rules = get_rule_index()
+    if isinstance(rules, RuleIndex):
+        return rules.select(transaction.channel, merchant_id, transaction_dict)
+    
+    channel_flag = {
+        'pos': 'applies_to_pos',
+        'ecommerce': 'applies_to_ecommerce',
+        'wallet': 'applies_to_wallet',
+    }.get(transaction.channel)
+    
+    # Get active rules applicable to this transaction channel
+    rules = [
+        rule for rule in rules
+        if rule.is_active and (not channel_flag or getattr(rule, channel_flag))
+    ]
+    
+    # Filter by merchant-specific rules if applicable
+    if merchant_id:
+        filtered_rules = []
         
+        for rule in rules:
+            # Skip rules where this merchant is explicitly excluded
+            if merchant_id in rule.excluded_merchants:
+                continue
+            
+            # Include rules that:
+            # 1. Are not merchant-specific (apply to all merchants), OR
+            # 2. Are merchant-specific AND include this merchant, OR
+            # 3. Are merchant-specific with an empty included_merchants list (applies to all)
+            if (not rule.merchant_specific or  # Not merchant-specific
+                (rule.merchant_specific and not rule.included_merchants) or  # Merchant-specific but applies to all
+                (rule.merchant_specific and merchant_id in rule.included_merchants)):  # Merchant-specific and includes this merchant
+                filtered_rules.append(rule)
+        
+        rules = filtered_rules
+    
+    # Order by priority (higher priority first)
+    return sorted(rules, key=lambda r: (-r.priority, r.name))
+
+
+def build_condition_namespace(transaction_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the safe namespace rule conditions are executed in.
+    
+    Args:
+        transaction_dict: The transaction data as a dictionary
+    
+    Returns:
+        The namespace, with no builtins besides CONDITION_FUNCTIONS
+    """
+    return {'__builtins__': {}, **CONDITION_FUNCTIONS, 'transaction': transaction_dict}
+
+
+def execute_condition(compiled: CompiledCondition, transaction_dict: Dict[str, Any],
+                      namespace: Optional[Dict[str, Any]] = None) -> tuple:
+    """
+    Execute a compiled rule condition against a transaction.
+    
+    Args:
+        compiled: The CompiledCondition
+        transaction_dict: The transaction data as a dictionary
+        namespace: Optional namespace from build_condition_namespace, shared
+            between the rules evaluated for the same transaction
+    
     Returns:
         Tuple of (triggered, condition_values)
     """
-    # Create a safe namespace for evaluation
-    namespace = {
-        'transaction': transaction_dict,
-        'abs': abs,
-        'min': min,
-        'max': max,
-        'sum': sum,
-        'len': len,
-        'str': str,
-        'int': int,
-        'float': float,
-        'bool': bool,
-        'list': list,
-        'dict': dict,
-        'round': round,
-    }
+    if compiled.error:
+        logger.error(f"Error evaluating condition: {compiled.condition} - {compiled.error}")
+        return False, {'error': compiled.error}
     
-    # Track values used in the condition
-    condition_values = {}
+    if namespace is None:
+        namespace = build_condition_namespace(transaction_dict)
     
-    # Evaluate the condition
     try:
-        result = eval(condition, {"__builtins__": {}}, namespace)
-        
-        # Extract key values used in the condition
-        # This is a simplified approach - in a real system, you'd want to
-        # parse the condition and extract the exact values used
-        if 'amount' in condition:
-            condition_values['amount'] = transaction_dict.get('amount')
-        if 'currency' in condition:
-            condition_values['currency'] = transaction_dict.get('currency')
-        if 'user_id' in condition:
-            condition_values['user_id'] = transaction_dict.get('user_id')
-        if 'merchant_id' in condition:
-            condition_values['merchant_id'] = transaction_dict.get('merchant_id')
-        if 'location_data' in condition:
-            condition_values['location_data'] = transaction_dict.get('location_data')
-        if 'payment_method_data' in condition:
-            condition_values['payment_method_data'] = transaction_dict.get('payment_method_data')
-        
-        return bool(result), condition_values
+        result = eval(compiled.code, namespace)
     except Exception as e:
-        logger.error(f"Error evaluating condition: {condition} - {str(e)}", exc_info=True)
+        logger.error(f"Error evaluating condition: {compiled.condition} - {str(e)}", exc_info=True)
         return False, {'error': str(e)}
+    
+    # Report the values of the transaction fields the condition uses
+    condition_values = {field: transaction_dict.get(field) for field in compiled.value_fields}
+    return bool(result), condition_values
 
 
-def transaction_to_dict(transaction) -> Dict[str, Any]:
+def evaluate_condition(condition: str, transaction_dict: Dict[str, Any]) -> tuple:
+    """
+    Evaluate a rule condition against a transaction.
+    
+    Used for conditions that are not saved rules, such as the rule test
+    page. Saved rules are evaluated from the compiled rule cache.
+    
+    Args:
+        condition: The rule condition as a Python expression
+        transaction_dict: The transaction data as a dictionary
+        
+    Returns:
+        Tuple of (triggered, condition_values)
+    """
+    return execute_condition(CompiledCondition(condition), transaction_dict)
+
+
+def transaction_to_dict(transaction, fields=None) -> Dict[str, Any]:
     """
     Convert a transaction object to a dictionary for rule evaluation.
     
     Args:
         transaction: The transaction object
+        fields: Optional keys to extract. The basic fields are always set;
+            other optional and channel-specific keys are left out. Defaults
+            to every key.
         
     Returns:
         Dictionary representation of the transaction
@@ -229,50 +448,17 @@ def transaction_to_dict(transaction) -> Dict[str, Any]:
     }
     
     # Add optional fields if they exist
-    if hasattr(transaction, 'merchant_id') and transaction.merchant_id:
-        result['merchant_id'] = transaction.merchant_id
-    
-    if hasattr(transaction, 'device_id') and transaction.device_id:
-        result['device_id'] = transaction.device_id
-    
-    if hasattr(transaction, 'location_data') and transaction.location_data:
-        result['location_data'] = transaction.location_data
-    
-    if hasattr(transaction, 'payment_method_data') and transaction.payment_method_data:
-        result['payment_method_data'] = transaction.payment_method_data
-    
-    if hasattr(transaction, 'metadata') and transaction.metadata:
-        result['metadata'] = transaction.metadata
+    for field in OPTIONAL_FIELDS:
+        if fields is None or field in fields:
+            value = getattr(transaction, field, None)
+            if value:
+                result[field] = value
     
     # Add channel-specific fields
-    if transaction.channel == 'pos' and hasattr(transaction, 'terminal_id'):
-        result['terminal_id'] = transaction.terminal_id
-        result['entry_mode'] = getattr(transaction, 'entry_mode', None)
-        result['terminal_type'] = getattr(transaction, 'terminal_type', None)
-        result['attendance'] = getattr(transaction, 'attendance', None)
-        result['condition'] = getattr(transaction, 'condition', None)
-        result['mcc'] = getattr(transaction, 'mcc', None)
-        result['authorization_code'] = getattr(transaction, 'authorization_code', None)
-        result['recurring_payment'] = getattr(transaction, 'recurring_payment', False)
-    
-    elif transaction.channel == 'ecommerce':
-        result['website_url'] = getattr(transaction, 'website_url', None)
-        result['is_3ds_verified'] = getattr(transaction, 'is_3ds_verified', False)
-        result['device_fingerprint'] = getattr(transaction, 'device_fingerprint', None)
-        result['shipping_address'] = getattr(transaction, 'shipping_address', {})
-        result['billing_address'] = getattr(transaction, 'billing_address', {})
-        result['is_billing_shipping_match'] = getattr(transaction, 'is_billing_shipping_match', True)
-        result['mcc'] = getattr(transaction, 'mcc', None)
-        result['authorization_code'] = getattr(transaction, 'authorization_code', None)
-        result['recurring_payment'] = getattr(transaction, 'recurring_payment', False)
-    
-    elif transaction.channel == 'wallet':
-        result['wallet_id'] = getattr(transaction, 'wallet_id', None)
-        result['source_type'] = getattr(transaction, 'source_type', None)
-        result['destination_type'] = getattr(transaction, 'destination_type', None)
-        result['source_id'] = getattr(transaction, 'source_id', None)
-        result['destination_id'] = getattr(transaction, 'destination_id', None)
-        result['transaction_purpose'] = getattr(transaction, 'transaction_purpose', None)
-        result['is_internal'] = getattr(transaction, 'is_internal', False)
+    channel_fields = CHANNEL_FIELDS.get(transaction.channel)
+    if channel_fields is not None and (transaction.channel != 'pos' or hasattr(transaction, 'terminal_id')):
+        for field, default in channel_fields[1].items():
+            if fields is None or field in fields:
+                result[field] = getattr(transaction, field, default)
     
     return result
\ No newline at end of file
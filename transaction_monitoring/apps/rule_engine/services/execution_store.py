@@ -0,0 +1,284 @@
+"""
+Execution store service for the Rule Engine.
+
+This service writes rule executions. Every execution is added to the
+per-minute RuleExecutionRollup of its rule, which holds the evaluation and
+hit counts and a latency histogram. With RULE_ENGINE_EXECUTION_STORAGE set
+to 'sampled', only triggered executions and the executions of a sample of
+RULE_ENGINE_EXECUTION_SAMPLE_RATE transactions are kept as RuleExecution
+rows; the rule statistics shown in the rule views come from the rollups.
+"""
+
+import bisect
+import logging
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from apps.core.utils import is_sampled
+from ..models import RuleExecution, RuleExecutionRollup
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (milliseconds) of the latency histogram buckets; a last bucket holds slower executions
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0)
+
+# Fields of a rollup updated when executions are added
+ROLLUP_FIELDS = ['evaluations', 'hits', 'total_time', 'min_time', 'max_time', 'latency_histogram']
+
+
+def should_store(execution: RuleExecution) -> bool:
+    """
+    Check whether an execution is kept as a RuleExecution row.
+    
+    Args:
+        execution: The unsaved RuleExecution object
+    
+    Returns:
+        True if the row should be written
+    """
+    if settings.RULE_ENGINE_EXECUTION_STORAGE != 'sampled':
+        return True
+    
+    # Sampling by transaction keeps every execution of a sampled transaction
+    return execution.triggered or is_sampled(execution.transaction_id, settings.RULE_ENGINE_EXECUTION_SAMPLE_RATE)
+
+
+def get_latency_bucket(execution_time: float) -> int:
+    """
+    Get the latency histogram bucket of an execution time.
+    
+    Args:
+        execution_time: Execution time in milliseconds
+    
+    Returns:
+        Index of the bucket
+    """
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, execution_time)
+
+
+def merge_histograms(histogram: List[int], other: List[int]) -> List[int]:
+    """
+    Add two latency histograms.
+    
+    Args:
+        histogram: Bucket counts, possibly empty
+        other: Bucket counts, possibly empty
+    
+    Returns:
+        The summed bucket counts
+    """
+    merged = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for counts in (histogram, other):
+        for index, count in enumerate(counts):
+            merged[index] += count
+    return merged
+
+
+def histogram_percentile(histogram: List[int], percentile: float,
+                         min_time: Optional[float] = None, max_time: Optional[float] = None) -> float:
+    """
+    Estimate a latency percentile from a histogram.
+    
+    The value is interpolated linearly within the bucket holding the
+    percentile and clamped to the observed minimum and maximum.
+    
+    Args:
+        histogram: Bucket counts
+        percentile: The percentile, between 0 and 100
+        min_time: Lowest observed execution time in milliseconds
+        max_time: Highest observed execution time in milliseconds
+    
+    Returns:
+        The estimated execution time in milliseconds, 0 for an empty histogram
+    """
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    
+    rank = percentile / 100.0 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0.0
+            upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else (max_time or lower)
+            value = lower + (upper - lower) * (rank - seen) / count
+            break
+        seen += count
+    else:
+        value = max_time or LATENCY_BUCKETS_MS[-1]
+    
+    if min_time is not None:
+        value = max(value, min_time)
+    if max_time is not None:
+        value = min(value, max_time)
+    return value
+
+
+def get_execution_minute(execution: RuleExecution):
+    """
+    Get the minute a rule execution took place in.
+    
+    Args:
+        execution: The RuleExecution object
+    
+    Returns:
+        The execution time set by the evaluator when it built the execution,
+        truncated to the minute. Inserting the row overwrites created_at, so
+        the time is kept in executed_at and survives retried flushes.
+        Executions without either are counted in the current minute.
+    """
+    executed_at = getattr(execution, 'executed_at', None) or execution.created_at or timezone.now()
+    return executed_at.replace(second=0, microsecond=0)
+
+
+def aggregate_executions(executions: List[RuleExecution], minute=None) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Aggregate executions per rule and minute.
+    
+    Args:
+        executions: RuleExecution objects, saved or not
+        minute: The minute to add them all to, defaults to the minute each
+            execution took place in
+    
+    Returns:
+        Dictionary of (rule ID, minute) to the rollup fields to add
+    """
+    if minute is not None:
+        minute = minute.replace(second=0, microsecond=0)
+    
+    aggregates = {}
+    for execution in executions:
+        key = (execution.rule_id, minute or get_execution_minute(execution))
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = {
+                'evaluations': 0,
+                'hits': 0,
+                'total_time': 0.0,
+                'min_time': execution.execution_time,
+                'max_time': execution.execution_time,
+                'latency_histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        aggregate['evaluations'] += 1
+        aggregate['hits'] += 1 if execution.triggered else 0
+        aggregate['total_time'] += execution.execution_time
+        aggregate['min_time'] = min(aggregate['min_time'], execution.execution_time)
+        aggregate['max_time'] = max(aggregate['max_time'], execution.execution_time)
+        aggregate['latency_histogram'][get_latency_bucket(execution.execution_time)] += 1
+    return aggregates
+
+
+def apply_rollups(aggregates: Dict[tuple, Dict[str, Any]]):
+    """
+    Add aggregated executions to the rollups.
+    
+    Missing rollups are created first, then the rollups are locked, merged
+    and written back, so concurrent writers do not lose executions. Rows are
+    created and locked in (rule, minute) order, so writers adding executions
+    of overlapping rules wait for each other instead of deadlocking.
+    
+    Args:
+        aggregates: Aggregates from aggregate_executions
+    """
+    if not aggregates:
+        return
+    
+    keys = sorted(aggregates)
+    with db_transaction.atomic():
+        RuleExecutionRollup.objects.bulk_create(
+            [RuleExecutionRollup(rule_id=rule_id, minute=minute) for rule_id, minute in keys],
+            ignore_conflicts=True
+        )
+        rollups = [
+            rollup for rollup in RuleExecutionRollup.objects.select_for_update()
+            .filter(minute__in={minute for _, minute in keys}, rule_id__in={rule_id for rule_id, _ in keys})
+            .order_by('rule_id', 'minute')
+            if (rollup.rule_id, rollup.minute) in aggregates
+        ]
+        
+        for rollup in rollups:
+            aggregate = aggregates[(rollup.rule_id, rollup.minute)]
+            rollup.evaluations += aggregate['evaluations']
+            rollup.hits += aggregate['hits']
+            rollup.total_time += aggregate['total_time']
+            rollup.min_time = min(t for t in (rollup.min_time, aggregate['min_time']) if t is not None)
+            rollup.max_time = max(t for t in (rollup.max_time, aggregate['max_time']) if t is not None)
+            rollup.latency_histogram = merge_histograms(rollup.latency_histogram, aggregate['latency_histogram'])
+        
+        RuleExecutionRollup.objects.bulk_update(rollups, ROLLUP_FIELDS)
+
+
+def update_rollups(executions: List[RuleExecution], minute=None):
+    """
+    Add executions to the per-minute rollups of their rules.
+    
+    Args:
+        executions: RuleExecution objects, saved or not
+        minute: The minute to add them all to, defaults to the minute each
+            execution took place in
+    """
+    apply_rollups(aggregate_executions(executions, minute))
+
+
+def store_rule_executions(executions: List[RuleExecution]) -> List[RuleExecution]:
+    """
+    Add executions to the rollups and write the rows kept by the storage mode.
+    
+    Args:
+        executions: Unsaved RuleExecution objects
+    
+    Returns:
+        The RuleExecution objects written
+    """
+    stored = [execution for execution in executions if should_store(execution)]
+    
+    # The rollups are updated last to hold their row locks for the shortest time
+    with db_transaction.atomic():
+        RuleExecution.objects.bulk_create(stored)
+        update_rollups(executions)
+    
+    return stored
+
+
+def get_rollup_stats(rollups) -> Dict[str, Any]:
+    """
+    Get execution statistics from rollups.
+    
+    Args:
+        rollups: QuerySet of RuleExecutionRollup objects
+    
+    Returns:
+        Dictionary of execution counts, trigger rate and execution times
+        including latency percentiles
+    """
+    totals = rollups.aggregate(
+        total=Sum('evaluations'),
+        triggered=Sum('hits'),
+        total_time=Sum('total_time'),
+        min_time=Min('min_time'),
+        max_time=Max('max_time'),
+    )
+    histogram = []
+    for rollup_histogram in rollups.order_by().values_list('latency_histogram', flat=True):
+        histogram = merge_histograms(histogram, rollup_histogram)
+    
+    total = totals['total'] or 0
+    triggered = totals['triggered'] or 0
+    min_time = totals['min_time']
+    max_time = totals['max_time']
+    
+    return {
+        'total': total,
+        'triggered': triggered,
+        'not_triggered': total - triggered,
+        'trigger_rate': triggered / total * 100 if total else 0,
+        'not_triggered_rate': (total - triggered) / total * 100 if total else 0,
+        'avg_execution_time': (totals['total_time'] or 0) / total if total else 0,
+        'min_execution_time': min_time or 0,
+        'max_execution_time': max_time or 0,
+        'p50_execution_time': histogram_percentile(histogram, 50, min_time, max_time),
+        'p95_execution_time': histogram_percentile(histogram, 95, min_time, max_time),
+        'p99_execution_time': histogram_percentile(histogram, 99, min_time, max_time),
+    }
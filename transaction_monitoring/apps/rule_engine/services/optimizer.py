@@ -0,0 +1,221 @@
+"""
+Rule optimizer service for the Rule Engine.
+
+This service keeps running statistics of the evaluation cost and hit rate of
+each rule in the process, and uses them to evaluate the rules of a
+transaction in order of expected cost per hit instead of priority order.
+Rules whose action is ``reject`` go first, since only they can end the
+evaluation early.
+
+Evaluation stops once a ``reject`` decision is certain and the rules left
+cannot change it: the first triggered ``reject`` rule in priority order is
+known, and none of the rules left has a higher risk score than the highest
+triggered one. The decision, flag reason and risk score are then the same as
+with a full evaluation.
+"""
+
+import heapq
+import logging
+import threading
+from typing import Dict, List, Sequence
+from ..models import Rule
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest evaluation in the running averages
+STATISTICS_DECAY = 0.05
+
+# Hit rate assumed for rules that were not evaluated yet
+PRIOR_HIT_RATE = 0.5
+
+# Lowest hit rate used for ranking, so rules that never hit keep a finite rank
+MIN_HIT_RATE = 0.001
+
+
+class RuleStatistics:
+    """
+    Running evaluation cost and hit rate of a rule.
+    
+    Both are exponentially weighted averages, so they follow changes in the
+    traffic and in the rule.
+    """
+    
+    __slots__ = ('evaluations', 'cost', 'hit_rate')
+    
+    def __init__(self):
+        self.evaluations = 0
+        self.cost = 0.0
+        self.hit_rate = PRIOR_HIT_RATE
+    
+    def record(self, execution_time: float, triggered: bool):
+        """
+        Add an evaluation to the statistics.
+        
+        Args:
+            execution_time: Evaluation time in milliseconds
+            triggered: Whether the rule triggered
+        """
+        if self.evaluations == 0:
+            self.cost = execution_time
+        else:
+            self.cost += STATISTICS_DECAY * (execution_time - self.cost)
+        self.hit_rate += STATISTICS_DECAY * ((1.0 if triggered else 0.0) - self.hit_rate)
+        self.evaluations += 1
+    
+    def rank(self) -> float:
+        """
+        Get the expected evaluation cost per hit; lower ranks go first.
+        
+        Returns:
+            The rank of the rule
+        """
+        return self.cost / max(self.hit_rate, MIN_HIT_RATE)
+    
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'evaluations': self.evaluations,
+            'cost': round(self.cost, 4),
+            'hit_rate': round(self.hit_rate, 4),
+        }
+
+
+class RuleOptimizer:
+    """
+    Process-wide running statistics of rule evaluations.
+    """
+    
+    def __init__(self):
+        self._statistics = {}
+        self._lock = threading.Lock()
+    
+    def record(self, rule: Rule, execution_time: float, triggered: bool):
+        """
+        Add an evaluation of a rule to its statistics.
+        
+        Args:
+            rule: The Rule object
+            execution_time: Evaluation time in milliseconds
+            triggered: Whether the rule triggered
+        """
+        with self._lock:
+            statistics = self._statistics.get(rule.pk)
+            if statistics is None:
+                statistics = self._statistics[rule.pk] = RuleStatistics()
+            statistics.record(execution_time, triggered)
+    
+    def order(self, rules: Sequence[Rule]) -> List[int]:
+        """
+        Get the order in which to evaluate rules.
+        
+        Args:
+            rules: The rules, in priority order
+        
+        Returns:
+            Positions of the rules in ``rules``, reject rules first, each
+            group by expected cost per hit and then by priority
+        """
+        statistics = self._statistics
+        
+        def key(position):
+            rule = rules[position]
+            rule_statistics = statistics.get(rule.pk)
+            rank = rule_statistics.rank() if rule_statistics is not None else 0.0
+            return (rule.action != 'reject', rank, position)
+        
+        return sorted(range(len(rules)), key=key)
+    
+    def statistics(self) -> Dict[int, Dict[str, float]]:
+        """
+        Get the statistics of every rule evaluated in this process.
+        
+        Returns:
+            Dictionary of rule ID to its evaluations, cost and hit rate
+        """
+        with self._lock:
+            return {rule_id: statistics.to_dict() for rule_id, statistics in self._statistics.items()}
+    
+    def clear(self):
+        """
+        Drop the statistics of every rule.
+        """
+        with self._lock:
+            self._statistics = {}
+
+
+class ShortCircuit:
+    """
+    Tracks whether the rules left can change a reject decision.
+    
+    The highest risk score among the rules left is kept in a heap and the
+    ``reject`` rules in priority order; evaluated rules are dropped from both
+    lazily, so each outcome is recorded in O(log n) for n rules.
+    
+    Args:
+        rules: The rules of the transaction, in priority order
+    """
+    
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = rules
+        self.evaluated = [False] * len(rules)
+        self.first_reject = None
+        self.max_risk_score = 0.0
+        
+        self._risk_scores = [(-float(rule.risk_score), position) for position, rule in enumerate(rules)]
+        heapq.heapify(self._risk_scores)
+        self._rejects = [position for position, rule in enumerate(rules) if rule.action == 'reject']
+        self._next_reject = 0
+    
+    def add(self, position: int, triggered: bool) -> bool:
+        """
+        Record the outcome of a rule.
+        
+        Args:
+            position: Position of the rule in priority order
+            triggered: Whether the rule triggered
+        
+        Returns:
+            True if the rules left cannot change the decision
+        """
+        self.evaluated[position] = True
+        rule = self.rules[position]
+        if triggered:
+            self.max_risk_score = max(self.max_risk_score, float(rule.risk_score))
+            if rule.action == 'reject' and (self.first_reject is None or position < self.first_reject):
+                self.first_reject = position
+        
+        if self.first_reject is None:
+            return False
+        
+        # A rule left with a higher risk score would change the risk score
+        risk_scores = self._risk_scores
+        while risk_scores and self.evaluated[risk_scores[0][1]]:
+            heapq.heappop(risk_scores)
+        if risk_scores and -risk_scores[0][0] > self.max_risk_score:
+            return False
+        
+        # A reject rule left before the first triggered one would change the flag reason
+        rejects = self._rejects
+        while self._next_reject < len(rejects) and self.evaluated[rejects[self._next_reject]]:
+            self._next_reject += 1
+        return self._next_reject == len(rejects) or rejects[self._next_reject] > self.first_reject
+
+
+_rule_optimizer = None
+_rule_optimizer_lock = threading.Lock()
+
+
+def get_rule_optimizer() -> RuleOptimizer:
+    """
+    Get the process-wide rule optimizer.
+    
+    Returns:
+        The RuleOptimizer instance
+    """
+    global _rule_optimizer
+    
+    if _rule_optimizer is None:
+        with _rule_optimizer_lock:
+            if _rule_optimizer is None:
+                _rule_optimizer = RuleOptimizer()
+    
+    return _rule_optimizer
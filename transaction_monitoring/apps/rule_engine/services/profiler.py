@@ -0,0 +1,271 @@
+"""
+Rule profiler service for the Rule Engine.
+
+This service keeps streaming latency histograms of every rule evaluated in
+the process, over the current and the previous RULE_ENGINE_PROFILER_WINDOW
+seconds, and guards the pipeline against badly written conditions:
+
+- a rule whose p99 latency exceeds RULE_ENGINE_SLOW_RULE_P99_MS is flagged
+  and operators are alerted, once until its p99 is back under the threshold,
+- a rule that times out (takes longer than RULE_ENGINE_RULE_TIMEOUT_MS) or
+  raises RULE_ENGINE_QUARANTINE_STRIKES times in a row is quarantined when
+  RULE_ENGINE_QUARANTINE_ENABLED is set: it is skipped by this process at
+  once and moved to shadow mode, which takes it out of the live rule index
+  of every process while shadow scoring keeps measuring it.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from ..metrics import RULE_GUARD_EVENTS
+from ..models import Rule
+from ..tasks import quarantine_rule, send_rule_guard_alert
+from .execution_store import LATENCY_BUCKETS_MS, get_latency_bucket, histogram_percentile
+
+logger = logging.getLogger(__name__)
+
+# Time (seconds) a quarantined rule is skipped by this process, until shadow mode reaches the rule index
+LOCAL_QUARANTINE_SECONDS = 60
+
+# Evaluations between two p99 checks of a rule
+P99_CHECK_INTERVAL = 100
+
+
+class RuleLatency:
+    """
+    Streaming latency histogram and failure streak of a rule.
+    
+    The histogram covers the current and the previous window, so the
+    percentiles always reflect between one and two windows of evaluations.
+    """
+    
+    __slots__ = ('current', 'previous', 'current_max', 'previous_max', 'window_start', 'evaluations',
+                 'strikes', 'flagged')
+    
+    def __init__(self, now: float):
+        self.current = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.previous = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.current_max = 0.0
+        self.previous_max = 0.0
+        self.window_start = now
+        self.evaluations = 0
+        self.strikes = 0
+        self.flagged = False
+    
+    def add(self, execution_time: float):
+        self.current[get_latency_bucket(execution_time)] += 1
+        self.current_max = max(self.current_max, execution_time)
+        self.evaluations += 1
+    
+    def rotate(self, now: float, window: float):
+        """Start a new window if the current one is over."""
+        if now - self.window_start < window:
+            return
+        if now - self.window_start < 2 * window:
+            self.previous, self.previous_max = self.current, self.current_max
+        else:
+            # Nothing was evaluated in the last window
+            self.previous, self.previous_max = [0] * len(self.current), 0.0
+        self.current, self.current_max = [0] * len(self.current), 0.0
+        self.window_start = now
+        self.evaluations = sum(self.previous)
+    
+    def histogram(self) -> List[int]:
+        return [current + previous for current, previous in zip(self.current, self.previous)]
+    
+    def percentile(self, percentile: float) -> float:
+        max_time = max(self.current_max, self.previous_max)
+        return histogram_percentile(self.histogram(), percentile, max_time=max_time or None)
+
+
+class RuleProfiler:
+    """
+    Process-wide latency profile of rule evaluations, with the slow-rule guard.
+    
+    Args:
+        window: Length of a profiling window in seconds
+        p99_threshold_ms: p99 latency above which a rule is flagged as slow
+        min_evaluations: Evaluations needed before a rule can be flagged
+        timeout_ms: Evaluation time counted as a timeout
+        quarantine_strikes: Consecutive timeouts or errors that quarantine a rule
+        quarantine: Whether failing rules are quarantined or only reported
+    """
+    
+    def __init__(self, window: float, p99_threshold_ms: float, min_evaluations: int,
+                 timeout_ms: float, quarantine_strikes: int, quarantine: bool = False):
+        self.window = window
+        self.p99_threshold_ms = p99_threshold_ms
+        self.min_evaluations = min_evaluations
+        self.timeout_ms = timeout_ms
+        self.quarantine_strikes = quarantine_strikes
+        self.quarantine = quarantine
+        self._latencies = {}
+        self._quarantined = {}
+        self._lock = threading.Lock()
+    
+    def record(self, rule: Rule, execution_time: float, failed: bool = False) -> Optional[str]:
+        """
+        Add an evaluation of a rule to its profile and apply the guard.
+        
+        Args:
+            rule: The Rule object
+            execution_time: Evaluation time in milliseconds
+            failed: Whether the condition raised
+        
+        Returns:
+            'slow' if the rule was just flagged as slow, 'quarantined' or
+            'failing' if it just reached the failure streak, depending on
+            whether quarantine is enabled, otherwise None
+        """
+        now = time.monotonic()
+        timed_out = execution_time > self.timeout_ms
+        
+        with self._lock:
+            latency = self._latencies.get(rule.pk)
+            if latency is None:
+                latency = self._latencies[rule.pk] = RuleLatency(now)
+            latency.rotate(now, self.window)
+            latency.add(execution_time)
+            
+            if failed or timed_out:
+                latency.strikes += 1
+                if latency.strikes == self.quarantine_strikes:
+                    latency.strikes = 0
+                    if not self.quarantine:
+                        return 'failing'
+                    self._quarantined[rule.pk] = now
+                    return 'quarantined'
+            else:
+                latency.strikes = 0
+            
+            if latency.evaluations >= self.min_evaluations and latency.evaluations % P99_CHECK_INTERVAL == 0:
+                is_slow = latency.percentile(99) > self.p99_threshold_ms
+                was_flagged, latency.flagged = latency.flagged, is_slow
+                if is_slow and not was_flagged:
+                    return 'slow'
+        return None
+    
+    def is_quarantined(self, rule: Rule) -> bool:
+        """
+        Check whether this process skips a rule it quarantined.
+        
+        Args:
+            rule: The Rule object
+        
+        Returns:
+            True for rules quarantined in the last LOCAL_QUARANTINE_SECONDS
+        """
+        quarantined_at = self._quarantined.get(rule.pk)
+        if quarantined_at is None:
+            return False
+        if time.monotonic() - quarantined_at < LOCAL_QUARANTINE_SECONDS:
+            return True
+        with self._lock:
+            self._quarantined.pop(rule.pk, None)
+        return False
+    
+    def p99(self, rule: Rule) -> float:
+        """
+        Get the p99 latency of a rule over the last one to two windows.
+        
+        Args:
+            rule: The Rule object
+        
+        Returns:
+            The p99 latency in milliseconds, 0 for rules not evaluated
+        """
+        with self._lock:
+            latency = self._latencies.get(rule.pk)
+            return latency.percentile(99) if latency is not None else 0.0
+    
+    def statistics(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Get the latency profile of every rule evaluated in this process.
+        
+        Returns:
+            Dictionary of rule ID to its evaluations, latency percentiles and
+            guard state
+        """
+        with self._lock:
+            return {
+                rule_id: {
+                    'evaluations': sum(latency.histogram()),
+                    'p50': round(latency.percentile(50), 4),
+                    'p95': round(latency.percentile(95), 4),
+                    'p99': round(latency.percentile(99), 4),
+                    'strikes': latency.strikes,
+                    'flagged': latency.flagged,
+                    'quarantined': rule_id in self._quarantined,
+                }
+                for rule_id, latency in self._latencies.items()
+            }
+    
+    def clear(self):
+        """
+        Drop the profile and local quarantine of every rule.
+        """
+        with self._lock:
+            self._latencies = {}
+            self._quarantined = {}
+
+
+def handle_guard_event(rule: Rule, event: str, profiler: RuleProfiler, reason: str):
+    """
+    Report a slow or failing rule, and move quarantined rules to shadow mode.
+    
+    Args:
+        rule: The Rule object
+        event: 'slow', 'failing' or 'quarantined'
+        profiler: The profiler that raised the event
+        reason: Description of the last failure
+    """
+    RULE_GUARD_EVENTS.inc(event=event)
+    if event == 'slow':
+        message = (
+            f"Rule '{rule.name}' (ID: {rule.pk}) has a p99 latency of {profiler.p99(rule):.2f}ms, "
+            f"above the {profiler.p99_threshold_ms}ms threshold"
+        )
+    else:
+        message = (
+            f"Rule '{rule.name}' (ID: {rule.pk}) timed out or failed {profiler.quarantine_strikes} "
+            f"times in a row: {reason}"
+        )
+    logger.warning(message)
+    
+    try:
+        if event == 'quarantined':
+            quarantine_rule.delay(rule.pk, message)
+        else:
+            send_rule_guard_alert.delay(rule.pk, event, message)
+    except Exception as e:
+        logger.error(f"Error dispatching rule guard {event} event for rule {rule.pk}: {str(e)}", exc_info=True)
+
+
+_rule_profiler = None
+_rule_profiler_lock = threading.Lock()
+
+
+def get_rule_profiler() -> RuleProfiler:
+    """
+    Get the process-wide rule profiler.
+    
+    Returns:
+        The RuleProfiler instance
+    """
+    global _rule_profiler
+    
+    if _rule_profiler is None:
+        with _rule_profiler_lock:
+            if _rule_profiler is None:
+                _rule_profiler = RuleProfiler(
+                    window=settings.RULE_ENGINE_PROFILER_WINDOW,
+                    p99_threshold_ms=settings.RULE_ENGINE_SLOW_RULE_P99_MS,
+                    min_evaluations=settings.RULE_ENGINE_SLOW_RULE_MIN_EVALUATIONS,
+                    timeout_ms=settings.RULE_ENGINE_RULE_TIMEOUT_MS,
+                    quarantine_strikes=settings.RULE_ENGINE_QUARANTINE_STRIKES,
+                    quarantine=settings.RULE_ENGINE_QUARANTINE_ENABLED,
+                )
+    
+    return _rule_profiler
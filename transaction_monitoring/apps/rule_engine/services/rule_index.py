@@ -0,0 +1,364 @@
+"""
+Rule index service for the Rule Engine.
+
+This service keeps the active rules in memory, indexed so that the rules
+applicable to a transaction are selected without database queries:
+
+- an ordered list of the rules of each channel that apply to every merchant,
+- hash maps from merchant ID to the merchant-specific rules including the
+  merchant, and to the rules excluding it,
+- a ThresholdIndex of the threshold rules of each channel that apply to
+  every merchant, which only selects those whose interval holds the
+  transaction's value.
+
+Selecting the rules of a transaction then costs O(applicable rules),
+however long the merchant lists of the rules are and however many threshold
+rules the transaction is outside of.
+
+Active rule sets assigned to merchants or merchant category codes are
+compiled into RuleBundles attached to the index of the production rules:
+the rules of the set indexed the same way, their compiled conditions and
+the merged transaction keys they read. Transactions of those merchants and
+segments only evaluate their bundle.
+
+The process-wide index is rebuilt when the rules version stamp bumped by
+rule and rule set saves changes.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from ..models import Rule, RuleSet
+from .compiler import RULES_VERSION_KEY, CompiledCondition, get_compiled_condition, get_condition_fields
+from .threshold_index import ThresholdIndex, is_threshold_rule
+
+logger = logging.getLogger(__name__)
+
+# Channel flag of the rules applying to each channel
+CHANNEL_FLAGS = {
+    'pos': 'applies_to_pos',
+    'ecommerce': 'applies_to_ecommerce',
+    'wallet': 'applies_to_wallet',
+}
+
+
+def rule_order(rule: Rule) -> Tuple:
+    """
+    Get the sort key putting rules in evaluation order.
+    
+    Args:
+        rule: The Rule object
+    
+    Returns:
+        Sort key, higher priority first, then by name
+    """
+    return (-rule.priority, rule.name, rule.pk)
+
+
+class RuleIndex:
+    """
+    Active rules indexed by channel and merchant.
+    
+    The index of the production rules also holds the RuleBundles of the
+    assigned rule sets, in ``bundles``.
+    
+    Args:
+        rules: The rules to index. Inactive rules are left out.
+    """
+    
+    def __init__(self, rules: Iterable[Rule]):
+        rules = sorted((rule for rule in rules if rule.is_active), key=rule_order)
+        self.rules = rules
+        self.rule_count = len(rules)
+        self.bundles = None
+        
+        # Channel None holds the rules of channels without a channel flag
+        channels = list(CHANNEL_FLAGS) + [None]
+        self._all = {channel: [] for channel in channels}
+        self._general = {channel: [] for channel in channels}
+        self._by_merchant = {channel: {} for channel in channels}
+        self._excluded = {}
+        threshold_entries = {channel: [] for channel in channels}
+        
+        for rule in rules:
+            entry = (rule_order(rule), rule)
+            general = not rule.merchant_specific or not rule.included_merchants
+            
+            # Merchant-specific threshold rules are few per merchant and evaluated as any rule
+            if general and is_threshold_rule(rule):
+                for channel in channels:
+                    if channel is None or getattr(rule, CHANNEL_FLAGS[channel]):
+                        threshold_entries[channel].append(entry)
+            else:
+                for channel in channels:
+                    if channel is not None and not getattr(rule, CHANNEL_FLAGS[channel]):
+                        continue
+                    
+                    self._all[channel].append(entry)
+                    if general:
+                        self._general[channel].append(entry)
+                    else:
+                        by_merchant = self._by_merchant[channel]
+                        for merchant_id in set(rule.included_merchants):
+                            by_merchant.setdefault(merchant_id, []).append(entry)
+            
+            for merchant_id in rule.excluded_merchants:
+                self._excluded.setdefault(merchant_id, set()).add(rule.pk)
+        
+        self._thresholds = {channel: ThresholdIndex(entries) for channel, entries in threshold_entries.items()}
+    
+    def select(self, channel: Optional[str], merchant_id: Optional[str] = None,
+               transaction_dict: Optional[Dict[str, Any]] = None) -> List[Rule]:
+        """
+        Get the rules applicable to a transaction, in evaluation order.
+        
+        Applies the same channel and merchant filters as get_applicable_rules.
+        
+        Args:
+            channel: The channel of the transaction
+            merchant_id: The merchant ID of the transaction, if any
+            transaction_dict: Optional transaction data. When given, threshold
+                rules are only selected if the transaction is within their
+                interval; otherwise they are all selected, to be evaluated
+                by condition.
+        
+        Returns:
+            List of applicable rules
+        """
+        if channel not in CHANNEL_FLAGS:
+            channel = None
+        
+        thresholds = self._thresholds[channel]
+        if transaction_dict is None:
+            threshold_entries = thresholds.entries
+        else:
+            threshold_entries = thresholds.match(transaction_dict)
+        
+        # Without a merchant, rules are only filtered by channel
+        if not merchant_id:
+            if not threshold_entries:
+                return [rule for _, rule in self._all[channel]]
+            return [rule for _, rule in heapq.merge(self._all[channel], threshold_entries)]
+        
+        excluded = self._excluded.get(merchant_id, ())
+        merged = heapq.merge(
+            self._general[channel], self._by_merchant[channel].get(merchant_id, ()), threshold_entries
+        )
+        return [rule for _, rule in merged if rule.pk not in excluded]
+
+
+def get_bundle_fields(rules: List[Rule], conditions: Dict[int, CompiledCondition]) -> Optional[Tuple[str, ...]]:
+    """
+    Merge the transaction keys read by the conditions of a set of rules.
+    
+    Args:
+        rules: The Rule objects
+        conditions: Compiled condition of each rule, by rule ID
+    
+    Returns:
+        Sorted tuple of the keys, or None if a condition may read any key
+    """
+    fields = set()
+    for rule in rules:
+        rule_fields = get_condition_fields(rule.condition)
+        if rule_fields is None:
+            return None
+        fields.update(field for field in rule_fields if isinstance(field, str))
+        fields.update(conditions[rule.pk].value_fields)
+    return tuple(sorted(fields))
+
+
+class RuleBundle:
+    """
+    Precompiled evaluation bundle of a rule set.
+    
+    Args:
+        ruleset: The RuleSet object
+        rules: The active production rules of the set
+    """
+    
+    def __init__(self, ruleset: RuleSet, rules: Iterable[Rule]):
+        self.ruleset_id = ruleset.pk
+        self.name = ruleset.name
+        self.index = RuleIndex(rules)
+        self.conditions = {rule.pk: get_compiled_condition(rule) for rule in self.index.rules}
+        self.fields = get_bundle_fields(self.index.rules, self.conditions)
+
+
+class RuleBundles:
+    """
+    Bundles of the active rule sets, by assigned merchant and merchant category code.
+    
+    Args:
+        rulesets: (RuleSet, rules) pairs. A merchant or merchant category code
+            assigned to several rule sets gets the first one.
+    """
+    
+    def __init__(self, rulesets: Iterable[Tuple[RuleSet, List[Rule]]]):
+        self.bundles = []
+        self._by_merchant = {}
+        self._by_mcc = {}
+        
+        for ruleset, rules in rulesets:
+            bundle = RuleBundle(ruleset, rules)
+            self.bundles.append(bundle)
+            for assignments, keys in ((self._by_merchant, ruleset.assigned_merchants),
+                                      (self._by_mcc, ruleset.assigned_mccs)):
+                for key in keys:
+                    if key in assignments:
+                        logger.warning(
+                            f"'{key}' is assigned to rule sets {assignments[key].ruleset_id} and {ruleset.pk}, "
+                            f"using rule set {assignments[key].ruleset_id}"
+                        )
+                        continue
+                    assignments[key] = bundle
+    
+    def select(self, merchant_id: Optional[str], mcc: Optional[str] = None) -> Optional[RuleBundle]:
+        """
+        Get the bundle of a transaction.
+        
+        Args:
+            merchant_id: The merchant ID of the transaction, if any
+            mcc: The merchant category code of the transaction, if any
+        
+        Returns:
+            The bundle of the merchant, else of the merchant category code,
+            or None if neither is assigned to a rule set
+        """
+        bundle = self._by_merchant.get(merchant_id) if merchant_id else None
+        if bundle is None and mcc:
+            bundle = self._by_mcc.get(mcc)
+        return bundle
+
+
+def load_rule_bundles(rules: List[Rule]) -> Optional[RuleBundles]:
+    """
+    Build the bundles of the active assigned rule sets.
+    
+    Args:
+        rules: The active production rules, shared with the bundles
+    
+    Returns:
+        The RuleBundles, or None if no active rule set is assigned
+    """
+    rulesets = [
+        ruleset for ruleset in RuleSet.objects.filter(is_active=True).order_by('pk')
+        if ruleset.assigned_merchants or ruleset.assigned_mccs
+    ]
+    if not rulesets:
+        return None
+    
+    rules_by_id = {rule.pk: rule for rule in rules}
+    members = {}
+    memberships = RuleSet.rules.through.objects.filter(
+        ruleset_id__in=[ruleset.pk for ruleset in rulesets]
+    ).values_list('ruleset_id', 'rule_id')
+    for ruleset_id, rule_id in memberships:
+        # Inactive and shadow rules are not evaluated in bundles either
+        rule = rules_by_id.get(rule_id)
+        if rule is not None:
+            members.setdefault(ruleset_id, []).append(rule)
+    
+    return RuleBundles((ruleset, members.get(ruleset.pk, [])) for ruleset in rulesets)
+
+
+class RuleIndexCache:
+    """
+    Process-wide RuleIndex of the active production rules.
+    
+    The index is built on first use and rebuilt when the rules version stamp
+    changes, which is checked at most every ``check_interval`` seconds.
+    """
+    
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._index = None
+        self._stamp = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+    
+    def get(self) -> RuleIndex:
+        """
+        Get the index, building it if needed.
+        
+        Returns:
+            The RuleIndex
+        """
+        self._check_stamp()
+        
+        index = self._index
+        if index is None:
+            with self._lock:
+                index = self._index
+                if index is None:
+                    index = RuleIndex(Rule.objects.filter(is_active=True, is_shadow=False))
+                    index.bundles = load_rule_bundles(index.rules)
+                    self._index = index
+                    bundle_count = len(index.bundles.bundles) if index.bundles is not None else 0
+                    logger.info(f"Built rule index of {index.rule_count} rules and {bundle_count} rule set bundles")
+        return index
+    
+    def invalidate(self):
+        """
+        Drop the index so it is rebuilt on next use.
+        """
+        self._index = None
+    
+    def _check_stamp(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        
+        try:
+            stamp = cache.get(RULES_VERSION_KEY, 0)
+        except Exception as e:
+            logger.warning(f"Error reading the rules version stamp: {str(e)}")
+            return
+        
+        if stamp != self._stamp:
+            self.invalidate()
+            self._stamp = stamp
+
+
+_rule_index_cache = None
+_rule_index_cache_lock = threading.Lock()
+
+
+def get_rule_index_cache() -> RuleIndexCache:
+    """
+    Get the process-wide rule index cache.
+    
+    Returns:
+        The RuleIndexCache instance
+    """
+    global _rule_index_cache
+    
+    if _rule_index_cache is None:
+        with _rule_index_cache_lock:
+            if _rule_index_cache is None:
+                _rule_index_cache = RuleIndexCache(settings.RULE_ENGINE_VERSION_CHECK_INTERVAL)
+    
+    return _rule_index_cache
+
+
+def get_rule_index() -> RuleIndex:
+    """
+    Get the index of the active production rules.
+    
+    Returns:
+        The RuleIndex
+    """
+    return get_rule_index_cache().get()
+
+
+def invalidate_rule_index():
+    """
+    Drop this process's rule index so it is rebuilt on next use.
+    """
+    if _rule_index_cache is not None:
+        _rule_index_cache.invalidate()
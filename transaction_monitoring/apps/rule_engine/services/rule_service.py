@@ -32,7 +32,7 @@ def apply_rules(transaction) -> Dict[str, Any]:
     
     try:
         # Get active rules
-        active_rules = Rule.objects.filter(is_active=True)
+        active_rules = Rule.objects.filter(is_active=True, is_shadow=False)
         
         if not active_rules.exists():
             logger.warning(f"No active rules found for transaction {transaction.transaction_id}")
@@ -0,0 +1,362 @@
+"""
+Rule simulator service for the Rule Engine.
+
+This service runs a candidate rule condition over the transactions of the
+last days before the rule is saved, and reports its hit count, its hit rate
+by channel and merchant, its overlap with the active rules and sample
+matches.
+
+Transactions are read in chunks with ``values_list`` of only the columns
+the conditions read, so no model instance is built per row. Each chunk is
+turned into the transaction dictionaries rule conditions see, and the
+candidate and active rule conditions are evaluated over the whole chunk by
+the vectorizer. Rows the vectorizer cannot decide, and conditions outside
+its subset, are evaluated per row with the compiled condition.
+"""
+
+import time
+import logging
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from apps.transactions.models import Transaction
+from ..models import Rule
+from .compiler import CompiledCondition, get_compiled_condition, get_condition_fields
+from .evaluator import BASE_FIELDS, CHANNEL_FIELDS, OPTIONAL_FIELDS, build_condition_namespace
+from .vectorizer import ConditionVectorizer, UnsupportedCondition
+
+logger = logging.getLogger(__name__)
+
+# Keys read for the report whatever the conditions read
+REPORT_FIELDS = {'transaction_id', 'channel', 'merchant_id', 'amount'}
+
+# Rule flags of the channels, as used by get_applicable_rules
+CHANNEL_FLAGS = {
+    'pos': 'applies_to_pos',
+    'ecommerce': 'applies_to_ecommerce',
+    'wallet': 'applies_to_wallet',
+}
+
+# Number of merchants listed in the report
+TOP_MERCHANTS = 20
+
+
+class TransactionColumns:
+    """
+    The columns to load for a set of transaction dictionary keys.
+    
+    Args:
+        fields: The keys to load, or None for every key
+    """
+    
+    def __init__(self, fields: Optional[Set[str]]):
+        self.base = [field for field in BASE_FIELDS if fields is None or field in fields]
+        self.optional = [field for field in OPTIONAL_FIELDS if fields is None or field in fields]
+        self.channels = {}
+        for channel, (accessor, defaults) in CHANNEL_FIELDS.items():
+            keys = {key: default for key, default in defaults.items() if fields is None or key in fields}
+            if keys:
+                self.channels[channel] = (accessor, keys)
+        
+        self.lookups = ['pk'] + self.base + self.optional
+        for channel, (accessor, keys) in self.channels.items():
+            if channel == 'pos':
+                # POS keys are only set for POS transactions, which always have a terminal ID
+                keys = {'terminal_id': None, **keys}
+                self.channels[channel] = (accessor, keys)
+            self.lookups.extend(f'{accessor}__{key}' for key in keys)
+        if 'channel' not in self.base:
+            self.lookups.append('channel')
+    
+    def to_dicts(self, values: List[Tuple]) -> List[Dict[str, Any]]:
+        """
+        Build the transaction dictionaries of loaded rows, as transaction_to_dict does.
+        
+        Args:
+            values: Rows of ``values_list(*self.lookups)``
+        
+        Returns:
+            The transaction dictionaries
+        """
+        positions = {lookup: position for position, lookup in enumerate(self.lookups)}
+        base = [(field, positions[field]) for field in self.base]
+        optional = [(field, positions[field]) for field in self.optional]
+        channels = {
+            channel: (accessor, [(key, positions[f'{accessor}__{key}'], default) for key, default in keys.items()])
+            for channel, (accessor, keys) in self.channels.items()
+        }
+        channel_position = positions['channel']
+        amount_position = positions.get('amount')
+        
+        rows = []
+        for row in values:
+            transaction_dict = {field: row[position] for field, position in base}
+            if amount_position is not None:
+                transaction_dict['amount'] = float(row[amount_position])
+            for field, position in optional:
+                if row[position]:
+                    transaction_dict[field] = row[position]
+            
+            channel_fields = channels.get(row[channel_position])
+            if channel_fields is not None:
+                accessor, keys = channel_fields
+                if accessor != 'postransaction' or row[keys[0][1]] is not None:
+                    for key, position, default in keys:
+                        value = row[position]
+                        transaction_dict[key] = default if value is None else value
+            rows.append(transaction_dict)
+        return rows
+
+
+def evaluate_chunk(compiled: CompiledCondition, rows: Sequence[Dict[str, Any]],
+                   vectorizer: ConditionVectorizer) -> Tuple[np.ndarray, int, int]:
+    """
+    Evaluate a condition over a chunk of transaction dictionaries.
+    
+    Args:
+        compiled: The compiled condition
+        rows: The transaction dictionaries
+        vectorizer: The ConditionVectorizer of the rows
+    
+    Returns:
+        Tuple of (triggered array, rows evaluated per row, rows that raised)
+    """
+    try:
+        triggered, unsure = vectorizer.evaluate(compiled.condition)
+        triggered = triggered.copy()
+    except UnsupportedCondition:
+        triggered = np.zeros(len(rows), dtype=bool)
+        unsure = np.ones(len(rows), dtype=bool)
+    
+    per_row = np.flatnonzero(unsure)
+    errors = 0
+    for row in per_row:
+        try:
+            triggered[row] = bool(eval(compiled.code, build_condition_namespace(rows[row])))
+        except Exception:
+            # Rules that raise are not triggered, as in evaluate_rules
+            triggered[row] = False
+            errors += 1
+    return triggered, len(per_row), errors
+
+
+def get_applicable_mask(rule: Rule, channels: np.ndarray, merchants: np.ndarray) -> np.ndarray:
+    """
+    Get the rows of a chunk a rule applies to, as get_applicable_rules selects them.
+    
+    Args:
+        rule: The Rule object
+        channels: Channel of each row
+        merchants: Merchant ID of each row, '' for none
+    
+    Returns:
+        Boolean array of the rows the rule is evaluated for
+    """
+    excluded_channels = [channel for channel, flag in CHANNEL_FLAGS.items() if not getattr(rule, flag)]
+    mask = ~np.isin(channels, excluded_channels)
+    
+    has_merchant = merchants != ''
+    if rule.excluded_merchants:
+        mask &= ~(has_merchant & np.isin(merchants, rule.excluded_merchants))
+    if rule.merchant_specific and rule.included_merchants:
+        mask &= ~has_merchant | np.isin(merchants, rule.included_merchants)
+    return mask
+
+
+def count_by(keys: np.ndarray, triggered: np.ndarray, transactions: Counter, hits: Counter):
+    """
+    Add the transactions and hits of a chunk to per-key counters.
+    
+    Args:
+        keys: Key of each row
+        triggered: Boolean array of the rows that triggered
+        transactions: Counter of transactions per key
+        hits: Counter of hits per key
+    """
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, minlength=len(unique))
+    triggered_totals = np.bincount(inverse, weights=triggered, minlength=len(unique))
+    for key, total, key_hits in zip(unique.tolist(), totals.tolist(), triggered_totals.tolist()):
+        transactions[key] += total
+        hits[key] += int(key_hits)
+
+
+def breakdown(transactions: Counter, hits: Counter, key_name: str, limit: Optional[int] = None) -> List[Dict]:
+    """
+    List per-key counters as report rows, most hits first.
+    
+    Args:
+        transactions: Counter of transactions per key
+        hits: Counter of hits per key
+        key_name: Name of the key in the rows
+        limit: Optional maximum number of rows
+    
+    Returns:
+        The report rows with transactions, hits and hit rate
+    """
+    rows = [
+        {
+            key_name: key or None,
+            'transactions': total,
+            'hits': hits[key],
+            'hit_rate': hits[key] / total * 100 if total else 0,
+        }
+        for key, total in transactions.items()
+    ]
+    rows.sort(key=lambda row: (-row['hits'], -row['transactions']))
+    return rows[:limit] if limit else rows
+
+
+def simulate_condition(
+    condition: str,
+    days: int = 7,
+    channels: Optional[Sequence[str]] = None,
+    exclude_rule_id: Optional[int] = None,
+    sample_size: int = 20,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Run a candidate rule condition over the transactions of the last days.
+    
+    Args:
+        condition: The candidate rule condition
+        days: Number of days of transactions to run it over
+        channels: Optional channels to restrict the transactions to
+        exclude_rule_id: Optional ID of the rule being edited, left out of
+            the overlap with the active rules
+        sample_size: Number of matching transactions to return
+        chunk_size: Number of transactions loaded and evaluated at once
+    
+    Returns:
+        Dictionary with the simulation report
+    
+    Raises:
+        ValueError: If the condition is invalid or the number of days is
+            out of range
+    """
+    compiled = CompiledCondition(condition)
+    if compiled.error:
+        raise ValueError(f"Invalid rule condition: {compiled.error}")
+    if not 1 <= days <= settings.RULE_ENGINE_SIMULATION_MAX_DAYS:
+        raise ValueError(f"Days must be between 1 and {settings.RULE_ENGINE_SIMULATION_MAX_DAYS}")
+    
+    chunk_size = chunk_size or settings.RULE_ENGINE_SIMULATION_CHUNK_SIZE
+    start_time = time.time()
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    
+    # Active rules to compare with, with their compiled conditions
+    rules = Rule.objects.filter(is_active=True, is_shadow=False)
+    if exclude_rule_id:
+        rules = rules.exclude(pk=exclude_rule_id)
+    rules = [(rule, get_compiled_condition(rule)) for rule in rules]
+    rules = [(rule, compiled_rule) for rule, compiled_rule in rules if not compiled_rule.error]
+    
+    fields = get_condition_fields(condition)
+    for rule, compiled_rule in rules:
+        rule_fields = get_condition_fields(rule.condition)
+        fields = None if fields is None or rule_fields is None else fields | rule_fields
+    columns = TransactionColumns(None if fields is None else fields | REPORT_FIELDS)
+    
+    queryset = Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if channels:
+        queryset = queryset.filter(channel__in=list(channels))
+    
+    total = 0
+    hits = 0
+    per_row = 0
+    errors = 0
+    new_hits = 0
+    channel_transactions, channel_hits = Counter(), Counter()
+    merchant_transactions, merchant_hits = Counter(), Counter()
+    rule_hits, overlap = Counter(), Counter()
+    samples = []
+    
+    last_pk = 0
+    while True:
+        # Keyset pagination keeps every chunk query an index range scan
+        values = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(*columns.lookups)[:chunk_size])
+        if not values:
+            break
+        last_pk = values[-1][0]
+        
+        rows = columns.to_dicts(values)
+        vectorizer = ConditionVectorizer(rows)
+        triggered, chunk_per_row, chunk_errors = evaluate_chunk(compiled, rows, vectorizer)
+        total += len(rows)
+        hits += int(triggered.sum())
+        per_row += chunk_per_row
+        errors += chunk_errors
+        
+        chunk_channels = np.array([row['channel'] or '' for row in rows], dtype=str)
+        chunk_merchants = np.array([row.get('merchant_id') or '' for row in rows], dtype=str)
+        count_by(chunk_channels, triggered, channel_transactions, channel_hits)
+        count_by(chunk_merchants, triggered, merchant_transactions, merchant_hits)
+        
+        caught = np.zeros(len(rows), dtype=bool)
+        for rule, compiled_rule in rules:
+            rule_triggered, _, _ = evaluate_chunk(compiled_rule, rows, vectorizer)
+            rule_triggered &= get_applicable_mask(rule, chunk_channels, chunk_merchants)
+            rule_hits[rule.pk] += int(rule_triggered.sum())
+            overlap[rule.pk] += int((rule_triggered & triggered).sum())
+            caught |= rule_triggered
+        new_hits += int((triggered & ~caught).sum())
+        
+        for row in np.flatnonzero(triggered)[:sample_size - len(samples)]:
+            transaction_dict = rows[row]
+            samples.append({
+                'transaction_id': transaction_dict['transaction_id'],
+                'channel': transaction_dict['channel'],
+                'merchant_id': transaction_dict.get('merchant_id'),
+                'amount': transaction_dict['amount'],
+                'condition_values': {field: transaction_dict.get(field) for field in compiled.value_fields},
+            })
+    
+    # Timestamps are only read for the samples
+    timestamps = dict(
+        Transaction.objects.filter(transaction_id__in=[sample['transaction_id'] for sample in samples])
+        .values_list('transaction_id', 'timestamp')
+    )
+    for sample in samples:
+        sample['timestamp'] = timestamps[sample['transaction_id']].isoformat()
+    
+    overlapping_rules = [
+        {
+            'rule_id': rule.pk,
+            'name': rule.name,
+            'action': rule.action,
+            'hits': rule_hits[rule.pk],
+            'overlap': overlap[rule.pk],
+            'overlap_rate': overlap[rule.pk] / hits * 100 if hits else 0,
+        }
+        for rule, compiled_rule in rules
+        if overlap[rule.pk]
+    ]
+    overlapping_rules.sort(key=lambda row: -row['overlap'])
+    
+    execution_time = (time.time() - start_time) * 1000
+    logger.info(
+        f"Simulated condition over {total} transactions of the last {days} days: "
+        f"{hits} hits, {per_row} rows evaluated per row, in {execution_time:.2f}ms"
+    )
+    
+    return {
+        'condition': condition,
+        'days': days,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'transactions': total,
+        'hits': hits,
+        'hit_rate': hits / total * 100 if total else 0,
+        'new_hits': new_hits,
+        'by_channel': breakdown(channel_transactions, channel_hits, 'channel'),
+        'by_merchant': breakdown(merchant_transactions, merchant_hits, 'merchant_id', TOP_MERCHANTS),
+        'overlap': overlapping_rules,
+        'samples': samples,
+        'rows_evaluated_per_row': per_row,
+        'errors': errors,
+        'execution_time': execution_time,
+    }
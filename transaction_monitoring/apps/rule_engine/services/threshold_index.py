@@ -0,0 +1,271 @@
+"""
+Threshold index service for the Rule Engine.
+
+Threshold rules are stored as data rather than as an expression: a
+transaction field, an interval [threshold_min, threshold_max) and the channel
+flags of the rule. Their condition is generated from the interval, so the
+compiler, the vectorizer, the simulator and shadow scoring evaluate them as
+any other rule, while the rule index matches them through an interval tree
+per field: the threshold rules matching a transaction are found in
+O(log n + k) for n rules and k matches, instead of evaluating n conditions.
+"""
+
+import bisect
+import math
+from typing import Any, Dict, List, Optional, Tuple
+from ..models import Rule
+
+# Expression reading each threshold field in a rule condition
+THRESHOLD_FIELDS = {
+    'amount': 'transaction["amount"]',
+    'hour': 'transaction["timestamp"].hour',
+}
+
+INFINITY = float('inf')
+
+
+def format_bound(value: float) -> str:
+    """
+    Format an interval bound for a generated condition.
+    
+    Args:
+        value: The bound
+    
+    Returns:
+        The bound as a Python literal, without a fraction for whole numbers
+    """
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def validate_threshold(field: Optional[str], threshold_min: Optional[float],
+                       threshold_max: Optional[float]) -> Tuple[bool, str]:
+    """
+    Validate the field and interval of a threshold rule.
+    
+    Args:
+        field: The threshold field
+        threshold_min: Lowest matching value, inclusive, or None
+        threshold_max: Upper bound of the matching values, exclusive, or None
+    
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    if field not in THRESHOLD_FIELDS:
+        return False, f"Unknown threshold field '{field}'"
+    if threshold_min is None and threshold_max is None:
+        return False, "A threshold rule needs a minimum, a maximum or both"
+    if any(bound is not None and not math.isfinite(bound) for bound in (threshold_min, threshold_max)):
+        return False, "The threshold bounds must be finite numbers"
+    if threshold_min is not None and threshold_min == threshold_max:
+        return False, "The threshold minimum and maximum cannot be equal"
+    return True, ""
+
+
+def parse_threshold(field: Optional[str], threshold_min: Optional[str],
+                    threshold_max: Optional[str]) -> Tuple[Optional[str], Optional[float], Optional[float]]:
+    """
+    Parse the threshold of a rule from form data.
+    
+    Args:
+        field: The threshold field, empty for rules with a plain condition
+        threshold_min: The minimum as entered, possibly empty
+        threshold_max: The maximum as entered, possibly empty
+    
+    Returns:
+        Tuple of (field, threshold_min, threshold_max), all None for rules
+        with a plain condition
+    
+    Raises:
+        ValueError: If the threshold is invalid
+    """
+    if not field:
+        return None, None, None
+    
+    try:
+        bounds = [float(bound) if bound not in (None, '') else None for bound in (threshold_min, threshold_max)]
+    except ValueError:
+        raise ValueError("The threshold bounds must be numbers")
+    
+    is_valid, error_message = validate_threshold(field, *bounds)
+    if not is_valid:
+        raise ValueError(error_message)
+    return field, bounds[0], bounds[1]
+
+
+def build_threshold_condition(field: str, threshold_min: Optional[float], threshold_max: Optional[float]) -> str:
+    """
+    Build the condition equivalent to a threshold interval.
+    
+    Args:
+        field: The threshold field
+        threshold_min: Lowest matching value, inclusive, or None
+        threshold_max: Upper bound of the matching values, exclusive, or None
+    
+    Returns:
+        The rule condition
+    """
+    value = THRESHOLD_FIELDS[field]
+    checks = []
+    if threshold_min is not None:
+        checks.append(f"{value} >= {format_bound(threshold_min)}")
+    if threshold_max is not None:
+        checks.append(f"{value} < {format_bound(threshold_max)}")
+    
+    # A maximum below the minimum wraps around, e.g. hours from 22 to 6
+    wraps = threshold_min is not None and threshold_max is not None and threshold_max < threshold_min
+    return (' or ' if wraps else ' and ').join(checks)
+
+
+def is_threshold_rule(rule: Rule) -> bool:
+    """
+    Check whether a rule is matched through the threshold index.
+    
+    Args:
+        rule: The Rule object
+    
+    Returns:
+        True for rules with a valid threshold field and interval
+    """
+    return validate_threshold(rule.threshold_field, rule.threshold_min, rule.threshold_max)[0]
+
+
+def get_threshold_intervals(rule: Rule) -> List[Tuple[float, float]]:
+    """
+    Get the half-open intervals matched by a threshold rule.
+    
+    Args:
+        rule: The Rule object
+    
+    Returns:
+        List of (lower, upper) intervals, two for a wrapping interval
+    """
+    lower = rule.threshold_min if rule.threshold_min is not None else -INFINITY
+    upper = rule.threshold_max if rule.threshold_max is not None else INFINITY
+    if upper < lower:
+        return [(lower, INFINITY), (-INFINITY, upper)]
+    return [(lower, upper)]
+
+
+def get_threshold_value(field: str, transaction_dict: Dict[str, Any]) -> Optional[float]:
+    """
+    Get the value of a threshold field from the transaction data.
+    
+    Args:
+        field: The threshold field
+        transaction_dict: The transaction data as a dictionary
+    
+    Returns:
+        The value, or None if the transaction has none
+    """
+    if field == 'hour':
+        timestamp = transaction_dict.get('timestamp')
+        return timestamp.hour if timestamp is not None else None
+    return transaction_dict.get(field)
+
+
+class IntervalTree:
+    """
+    Centered interval tree of half-open intervals [lower, upper).
+    
+    Each node keeps the intervals containing its center, sorted by lower and
+    by upper bound; the intervals entirely below or above the center are in
+    its left or right subtree. The center is the median lower bound, so the
+    tree is balanced. Empty intervals are left out.
+    
+    Args:
+        intervals: Non-empty list of (lower, upper, item) tuples
+    """
+    
+    __slots__ = ('center', 'lowers', 'by_lower', 'uppers', 'by_upper', 'left', 'right')
+    
+    def __init__(self, intervals: List[Tuple[float, float, Any]]):
+        lowers = sorted(lower for lower, _, _ in intervals)
+        center = self.center = lowers[len(lowers) // 2]
+        
+        here, below, above = [], [], []
+        for interval in intervals:
+            lower, upper, _ = interval
+            if upper <= lower:
+                continue
+            if upper <= center:
+                below.append(interval)
+            elif lower > center:
+                above.append(interval)
+            else:
+                here.append(interval)
+        
+        here.sort(key=lambda interval: interval[0])
+        self.lowers = [lower for lower, _, _ in here]
+        self.by_lower = [item for _, _, item in here]
+        
+        # Upper bounds are negated to search them in ascending order
+        here.sort(key=lambda interval: -interval[1])
+        self.uppers = [-upper for _, upper, _ in here]
+        self.by_upper = [item for _, _, item in here]
+        
+        self.left = IntervalTree(below) if below else None
+        self.right = IntervalTree(above) if above else None
+    
+    def query(self, value: float) -> List[Any]:
+        """
+        Get the items of the intervals containing a value.
+        
+        Args:
+            value: The value
+        
+        Returns:
+            List of items, in no particular order
+        """
+        matches = []
+        node = self
+        while node is not None:
+            if value < node.center:
+                # Every interval of the node ends after the value
+                matches.extend(node.by_lower[:bisect.bisect_right(node.lowers, value)])
+                node = node.left
+            else:
+                # Every interval of the node starts at or before the value
+                matches.extend(node.by_upper[:bisect.bisect_left(node.uppers, -value)])
+                node = node.right
+        return matches
+
+
+class ThresholdIndex:
+    """
+    Threshold rules indexed by field and interval.
+    
+    Args:
+        entries: (sort key, rule) entries of threshold rules, in evaluation
+            order
+    """
+    
+    def __init__(self, entries: List[Tuple[Tuple, Rule]]):
+        self.entries = entries
+        
+        intervals = {}
+        for entry in entries:
+            rule = entry[1]
+            for lower, upper in get_threshold_intervals(rule):
+                intervals.setdefault(rule.threshold_field, []).append((lower, upper, entry))
+        self._trees = {field: IntervalTree(field_intervals) for field, field_intervals in intervals.items()}
+    
+    def match(self, transaction_dict: Dict[str, Any]) -> List[Tuple[Tuple, Rule]]:
+        """
+        Get the entries of the threshold rules matching a transaction.
+        
+        Args:
+            transaction_dict: The transaction data as a dictionary
+        
+        Returns:
+            List of matching entries, in evaluation order
+        """
+        matches = []
+        for field, tree in self._trees.items():
+            value = get_threshold_value(field, transaction_dict)
+            # Missing values and NaN match no interval
+            if value is None or value != value:
+                continue
+            matches.extend(tree.query(value))
+        
+        matches.sort(key=lambda entry: entry[0])
+        return matches
@@ -0,0 +1,520 @@
+"""
+Vectorised rule evaluation service for the Rule Engine.
+
+This service evaluates rule conditions over a whole batch of transactions at
+once, for backtests and batch scoring. A condition is translated into column
+expressions over NumPy arrays, one array per transaction field it reads.
+Numeric columns use NumPy operations, other columns are evaluated element by
+element in one pass.
+
+The supported subset is comparisons (including ``in`` with literal lists and
+``is None``), ``and``/``or``/``not``, arithmetic, and ``transaction["field"]``
+/ ``.get(...)`` lookups on the transaction and its JSON fields. Conditions
+outside the subset fall back to the compiled per-row evaluation, and are
+reported with the reason.
+
+Rows where the vectorised evaluation cannot be sure to match Python, such as
+a missing key, a division by zero or an ordering comparison between
+different types, are marked and evaluated per row when they are read, so
+the results always match evaluate_condition.
+"""
+
+import ast
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from django.conf import settings
+from .compiler import get_compiled_condition
+from .evaluator import execute_condition, get_transaction_dict
+
+logger = logging.getLogger(__name__)
+
+# Integers beyond this magnitude can't be represented exactly as float64
+MAX_EXACT_INTEGER = 2 ** 53
+
+# Operators of ast.Compare nodes, as NumPy-compatible functions
+COMPARE_OPERATORS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+# Operators of ast.BinOp nodes
+BINARY_OPERATORS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+}
+
+# Binary operators that raise ZeroDivisionError for a zero right operand
+DIVISION_OPERATORS = (ast.Div, ast.FloorDiv, ast.Mod)
+
+
+class UnsupportedCondition(Exception):
+    """Raised for conditions outside the vectorised subset."""
+
+
+def is_number(value) -> bool:
+    """Check whether a value behaves the same as a Python number and as a float64."""
+    if isinstance(value, float):
+        return True
+    return isinstance(value, int) and not isinstance(value, bool) and abs(value) < MAX_EXACT_INTEGER
+
+
+class Column:
+    """
+    Values of an expression for every row of the batch.
+    
+    Args:
+        values: Array of the values, float64 for numeric columns and object
+            otherwise
+        unsure: Boolean array of the rows that must be evaluated per row
+        truth_only: Whether only the truth of the values is meaningful, as
+            for the result of ``and`` / ``or``
+    """
+    
+    def __init__(self, values: np.ndarray, unsure: np.ndarray, truth_only: bool = False):
+        self.values = values
+        self.unsure = unsure
+        self.truth_only = truth_only
+    
+    @property
+    def numeric(self) -> bool:
+        return self.values.dtype == np.float64
+    
+    @classmethod
+    def from_values(cls, values: List[Any], unsure: np.ndarray) -> 'Column':
+        """
+        Build a column, as float64 if every sure value is a number.
+        
+        Args:
+            values: The values, one per row
+            unsure: Boolean array of the rows that must be evaluated per row
+        
+        Returns:
+            The Column
+        """
+        if all(is_number(value) for value, skip in zip(values, unsure) if not skip):
+            numbers = np.array([0.0 if skip else value for value, skip in zip(values, unsure)], dtype=np.float64)
+            return cls(numbers, unsure)
+        
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return cls(array, unsure)
+    
+    def truth(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the truth value of every row.
+        
+        Returns:
+            Tuple of (truth array, unsure array)
+        """
+        if self.values.dtype == bool:
+            return self.values, self.unsure
+        if self.numeric:
+            return self.values != 0, self.unsure
+        
+        unsure = self.unsure.copy()
+        truth = np.zeros(len(self.values), dtype=bool)
+        for row, value in enumerate(self.values):
+            try:
+                truth[row] = bool(value)
+            except Exception:
+                unsure[row] = True
+        return truth, unsure
+
+
+class Constant:
+    """A literal value of a condition."""
+    
+    def __init__(self, value):
+        self.value = value
+
+
+class ConditionVectorizer:
+    """
+    Translates a condition into a Column over a batch of transactions.
+    
+    The columns of the transaction fields are kept, so conditions evaluated
+    with the same vectorizer read each field once.
+    
+    Args:
+        rows: The transaction dictionaries, one per row
+    """
+    
+    def __init__(self, rows: Sequence[Mapping[str, Any]]):
+        self.rows = rows
+        self.size = len(rows)
+        self._fields = {}
+    
+    def evaluate(self, condition: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate a condition for every row.
+        
+        Args:
+            condition: The rule condition
+        
+        Returns:
+            Tuple of (triggered array, unsure array)
+        
+        Raises:
+            UnsupportedCondition: If the condition is outside the vectorised subset
+        """
+        tree = ast.parse(condition, mode='eval')
+        result = self.visit(tree.body)
+        if isinstance(result, Constant):
+            raise UnsupportedCondition("Literal conditions are not vectorised")
+        return result.truth()
+    
+    def visit(self, node):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            raise UnsupportedCondition(f"'{type(node).__name__}' expressions are not vectorised")
+        return method(node)
+    
+    def operand(self, node):
+        """Translate a node whose value, not only its truth, is used."""
+        result = self.visit(node)
+        if isinstance(result, Column) and result.truth_only:
+            raise UnsupportedCondition("The value of 'and' / 'or' is only vectorised as a condition")
+        return result
+    
+    # Literals and transaction fields
+    
+    def visit_Constant(self, node):
+        return Constant(node.value)
+    
+    def _literal(self, node):
+        try:
+            return Constant(ast.literal_eval(node))
+        except ValueError:
+            raise UnsupportedCondition(f"'{ast.unparse(node)}' is not a literal")
+    
+    visit_List = _literal
+    visit_Tuple = _literal
+    visit_Set = _literal
+    visit_Dict = _literal
+    
+    def visit_Subscript(self, node):
+        key = self.visit(node.slice)
+        if not isinstance(key, Constant):
+            raise UnsupportedCondition("Only literal keys are vectorised")
+        return self.field(('item', key.value), node.value, lambda value, row: value[key.value])
+    
+    def visit_Call(self, node):
+        func = node.func
+        if not (isinstance(func, ast.Attribute) and func.attr == 'get' and not node.keywords
+                and 1 <= len(node.args) <= 2):
+            raise UnsupportedCondition(f"Call '{ast.unparse(func)}' is not vectorised")
+        
+        key = self.visit(node.args[0])
+        if not isinstance(key, Constant):
+            raise UnsupportedCondition("Only literal .get() keys are vectorised")
+        
+        # The default is evaluated for every row, like the Python call does
+        default = self.operand(node.args[1]) if len(node.args) == 2 else Constant(None)
+        if isinstance(default, Constant):
+            return self.field(
+                ('get', key.value, repr(default.value)), func.value,
+                lambda value, row: value.get(key.value, default.value)
+            )
+        return self.lookup(
+            func.value, lambda value, row: value.get(key.value, default.values[row]), default.unsure
+        )
+    
+    def field(self, cache_key, node, read):
+        """Read a key, reusing the column if it was read from the transaction before."""
+        if not (isinstance(node, ast.Name) and node.id == 'transaction'):
+            return self.lookup(node, read)
+        column = self._fields.get(cache_key)
+        if column is None:
+            column = self._fields[cache_key] = self.lookup(node, read)
+        return column
+    
+    def lookup(self, node, read, unsure_rows=None):
+        """
+        Read a key from the transaction or from the values of a column.
+        
+        Args:
+            node: The node the key is read from
+            read: Function reading the key from one value and its row index
+            unsure_rows: Optional boolean array of further rows to leave unsure
+        
+        Returns:
+            The Column of the read values
+        """
+        if isinstance(node, ast.Name):
+            if node.id != 'transaction':
+                raise UnsupportedCondition(f"Variable '{node.id}' is not vectorised")
+            source = self.rows
+            unsure = np.zeros(self.size, dtype=bool)
+        else:
+            column = self.operand(node)
+            if isinstance(column, Constant):
+                raise UnsupportedCondition("Lookups on literals are not vectorised")
+            source = column.values
+            unsure = column.unsure.copy()
+        if unsure_rows is not None:
+            unsure |= unsure_rows
+        
+        values = [None] * self.size
+        for row, value in enumerate(source):
+            if unsure[row]:
+                continue
+            try:
+                values[row] = read(value, row)
+            except Exception:
+                unsure[row] = True
+        return Column.from_values(values, unsure)
+    
+    # Operators
+    
+    def visit_BoolOp(self, node):
+        truth, unsure = self.condition(node.values[0])
+        for value in node.values[1:]:
+            value_truth, value_unsure = self.condition(value)
+            if isinstance(node.op, ast.And):
+                # The right operand only runs, and can only fail, where the left one is true
+                unsure = unsure | (truth & value_unsure)
+                truth = truth & value_truth
+            else:
+                unsure = unsure | (~truth & value_unsure)
+                truth = truth | value_truth
+        return Column(truth, unsure, truth_only=True)
+    
+    def condition(self, node) -> Tuple[np.ndarray, np.ndarray]:
+        """Translate a node used as a condition into (truth, unsure) arrays."""
+        result = self.visit(node)
+        if isinstance(result, Constant):
+            raise UnsupportedCondition("Literal conditions are not vectorised")
+        return result.truth()
+    
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            truth, unsure = self.condition(node.operand)
+            return Column(~truth, unsure)
+        
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.operand(node.operand)
+            sign = -1 if isinstance(node.op, ast.USub) else 1
+            if isinstance(operand, Constant):
+                return self._literal(node)
+            if operand.numeric:
+                return Column(operand.values * sign, operand.unsure)
+            return self.elementwise(lambda value: -value if sign < 0 else +value, operand)
+        
+        raise UnsupportedCondition(f"Operator '{type(node.op).__name__}' is not vectorised")
+    
+    def visit_BinOp(self, node):
+        operator = BINARY_OPERATORS.get(type(node.op))
+        if operator is None:
+            raise UnsupportedCondition(f"Operator '{type(node.op).__name__}' is not vectorised")
+        
+        left, right = self.operand(node.left), self.operand(node.right)
+        if isinstance(left, Constant) and isinstance(right, Constant):
+            return self._literal(node)
+        
+        if self.numeric(left) and self.numeric(right):
+            left_values, right_values = self.numbers(left), self.numbers(right)
+            unsure = self.unsure(left) | self.unsure(right)
+            if isinstance(node.op, DIVISION_OPERATORS):
+                # Python raises ZeroDivisionError instead of returning inf or nan
+                unsure = unsure | (np.broadcast_to(right_values, (self.size,)) == 0)
+            with np.errstate(all='ignore'):
+                values = np.broadcast_to(operator(left_values, right_values), (self.size,)).astype(np.float64)
+            # Integer results this large are exact in Python but not in float64
+            unsure = unsure | ~(np.abs(values) < MAX_EXACT_INTEGER) & np.isfinite(values)
+            return Column(values, unsure)
+        
+        return self.elementwise(operator, left, right)
+    
+    def visit_Compare(self, node):
+        truth = np.ones(self.size, dtype=bool)
+        unsure = np.zeros(self.size, dtype=bool)
+        left = self.operand(node.left)
+        
+        # a < b < c is a < b and b < c, with b evaluated once
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.operand(comparator)
+            result = self.compare(op, left, right)
+            result_truth, result_unsure = result.truth()
+            unsure = unsure | (truth & result_unsure)
+            truth = truth & result_truth
+            left = right
+        return Column(truth, unsure)
+    
+    def compare(self, op, left, right) -> Column:
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            return self.compare_none(op, left, right)
+        
+        operator = COMPARE_OPERATORS.get(type(op))
+        if operator is None:
+            raise UnsupportedCondition(f"Comparison '{type(op).__name__}' is not vectorised")
+        if isinstance(left, Constant) and isinstance(right, Constant):
+            raise UnsupportedCondition("Comparisons of two literals are not vectorised")
+        
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if (isinstance(right, Constant) and self.numeric(left) and isinstance(right.value, (list, tuple, set))
+                    and all(is_number(value) for value in right.value)):
+                found = np.isin(left.values, np.array(list(right.value), dtype=np.float64))
+                return Column(found if isinstance(op, ast.In) else ~found, left.unsure)
+            return self.elementwise(operator, left, right)
+        
+        if self.numeric(left) and self.numeric(right):
+            values = np.broadcast_to(operator(self.numbers(left), self.numbers(right)), (self.size,))
+            return Column(np.asarray(values, dtype=bool), self.unsure(left) | self.unsure(right))
+        
+        return self.elementwise(lambda a, b: bool(operator(a, b)), left, right)
+    
+    def compare_none(self, op, left, right) -> Column:
+        # Float64 columns don't keep the identity of values, so only None checks are vectorised
+        if isinstance(right, Constant) and right.value is None and not isinstance(left, Constant):
+            column = left
+        elif isinstance(left, Constant) and left.value is None and not isinstance(right, Constant):
+            column = right
+        else:
+            raise UnsupportedCondition("Only 'is None' / 'is not None' checks are vectorised")
+        
+        if column.numeric:
+            found = np.zeros(self.size, dtype=bool)
+        else:
+            found = np.array([value is None for value in column.values.tolist()], dtype=bool)
+        return Column(found if isinstance(op, ast.Is) else ~found, column.unsure)
+    
+    # Helpers
+    
+    def numeric(self, operand) -> bool:
+        if isinstance(operand, Constant):
+            return is_number(operand.value)
+        return operand.numeric
+    
+    def numbers(self, operand):
+        return float(operand.value) if isinstance(operand, Constant) else operand.values
+    
+    def unsure(self, operand) -> np.ndarray:
+        return np.zeros(self.size, dtype=bool) if isinstance(operand, Constant) else operand.unsure
+    
+    def elementwise(self, function, *operands) -> Column:
+        """
+        Apply a function to the values of every row, one row at a time.
+        
+        Args:
+            function: The function of one value per operand
+            *operands: Columns or Constants
+        
+        Returns:
+            The Column of the results, unsure where the function raised
+        """
+        unsure = np.zeros(self.size, dtype=bool)
+        sources = []
+        for operand in operands:
+            if isinstance(operand, Constant):
+                sources.append([operand.value] * self.size)
+            else:
+                unsure = unsure | operand.unsure
+                sources.append(operand.values.tolist())
+        
+        values = [None] * self.size
+        for row, arguments in enumerate(zip(*sources)):
+            if unsure[row]:
+                continue
+            try:
+                values[row] = function(*arguments)
+            except Exception:
+                unsure[row] = True
+        
+        if all(isinstance(value, bool) for value, skip in zip(values, unsure) if not skip):
+            return Column(np.array([bool(value) for value in values], dtype=bool), unsure)
+        return Column.from_values(values, unsure)
+
+
+class BatchRuleConditions:
+    """
+    The conditions of a set of rules evaluated over a batch of transactions.
+    
+    Args:
+        rules: The rules to evaluate
+        transaction_dicts: Mapping of transaction ID to the transaction
+            dictionary built by transaction_to_dict
+    """
+    
+    def __init__(self, rules: Sequence, transaction_dicts: Mapping[str, Mapping[str, Any]]):
+        self.rows = {transaction_id: row for row, transaction_id in enumerate(transaction_dicts)}
+        self.results = {}
+        self.fallbacks = {}
+        
+        vectorizer = ConditionVectorizer(list(transaction_dicts.values()))
+        for rule in rules:
+            compiled = get_compiled_condition(rule)
+            if compiled.error:
+                self.fallbacks[rule.pk] = compiled.error
+                continue
+            try:
+                self.results[rule.pk] = (compiled,) + vectorizer.evaluate(rule.condition)
+            except UnsupportedCondition as e:
+                self.fallbacks[rule.pk] = str(e)
+        
+        if self.fallbacks:
+            logger.info(
+                f"Evaluating {len(self.fallbacks)} of {len(rules)} rules per row: "
+                + '; '.join(f"rule {rule_id}: {reason}" for rule_id, reason in self.fallbacks.items())
+            )
+    
+    def evaluate(self, rule, transaction_id: str, transaction_dict: Mapping[str, Any],
+                 namespace: Optional[Dict[str, Any]] = None) -> Optional[Tuple[bool, Dict[str, Any]]]:
+        """
+        Get the result of a rule's condition for a transaction of the batch.
+        
+        Args:
+            rule: The Rule object
+            transaction_id: The transaction ID
+            transaction_dict: The transaction dictionary, for rows evaluated per row
+            namespace: Optional condition namespace of the transaction
+        
+        Returns:
+            Tuple of (triggered, condition_values) as returned by
+            evaluate_condition, or None if the rule or the transaction was
+            not vectorised
+        """
+        row = self.rows.get(transaction_id)
+        result = self.results.get(rule.pk)
+        if row is None or result is None:
+            return None
+        
+        compiled, triggered, unsure = result
+        if unsure[row]:
+            return execute_condition(compiled, transaction_dict, namespace)
+        return bool(triggered[row]), {field: transaction_dict.get(field) for field in compiled.value_fields}
+
+
+def evaluate_batch_conditions(rules: Sequence, transactions: Sequence,
+                              contexts: Optional[Sequence] = None) -> Optional[BatchRuleConditions]:
+    """
+    Evaluate the conditions of rules over a batch of transactions.
+    
+    Args:
+        rules: The rules to evaluate
+        transactions: The transaction objects
+        contexts: Optional ScoringContext of each transaction
+    
+    Returns:
+        The BatchRuleConditions, or None for batches smaller than
+        RULE_ENGINE_VECTORIZE_MIN_BATCH, which are cheaper to evaluate per row
+    """
+    if not rules or len(transactions) < settings.RULE_ENGINE_VECTORIZE_MIN_BATCH:
+        return None
+    
+    contexts = contexts or [None] * len(transactions)
+    transaction_dicts = {
+        transaction.transaction_id: get_transaction_dict(transaction, context)
+        for transaction, context in zip(transactions, contexts)
+    }
+    return BatchRuleConditions(rules, transaction_dicts)
@@ -2,6 +2,91 @@
 Signal handlers for the rule engine app.
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Rule, RuleSet
\ No newline at end of file
+from .models import Rule, RuleSet
+from .services.compiler import bump_rules_version
+from .services.rule_index import invalidate_rule_index
+from .services.threshold_index import build_threshold_condition, is_threshold_rule
+
+# Rule fields updated by rule evaluation, which don't change how a rule is compiled
+RULE_STATISTICS_FIELDS = {'hit_count', 'false_positive_count', 'last_triggered'}
+
+
+@receiver(pre_save, sender=Rule)
+def rule_pre_save(sender, instance, **kwargs):
+    """
+    Signal handler for rule pre-save.
+    
+    This will generate the condition of threshold rules from their interval,
+    so the condition always matches what the threshold index selects.
+    """
+    if is_threshold_rule(instance):
+        instance.condition = build_threshold_condition(
+            instance.threshold_field, instance.threshold_min, instance.threshold_max
+        )
+
+
+@receiver(post_save, sender=Rule)
+def rule_post_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Signal handler for rule post-save.
+    
+    This will invalidate the compiled rules and rule index of every process,
+    unless only the hit statistics of the rule were saved.
+    """
+    if update_fields and set(update_fields) <= RULE_STATISTICS_FIELDS:
+        return
+    
+    bump_rules_version()
+    invalidate_rule_index()
+
+
+@receiver(post_delete, sender=Rule)
+def rule_post_delete(sender, instance, **kwargs):
+    """
+    Signal handler for rule post-delete.
+    
+    This will invalidate the compiled rules and rule index of every process.
+    """
+    bump_rules_version()
+    invalidate_rule_index()
+
+
+@receiver(post_save, sender=RuleSet)
+def ruleset_post_save(sender, instance, **kwargs):
+    """
+    Signal handler for rule set post-save.
+    
+    This will rebuild the rule set bundles of every process with their rule
+    index.
+    """
+    bump_rules_version()
+    invalidate_rule_index()
+
+
+@receiver(post_delete, sender=RuleSet)
+def ruleset_post_delete(sender, instance, **kwargs):
+    """
+    Signal handler for rule set post-delete.
+    
+    This will rebuild the rule set bundles of every process with their rule
+    index.
+    """
+    bump_rules_version()
+    invalidate_rule_index()
+
+
+@receiver(m2m_changed, sender=RuleSet.rules.through)
+def ruleset_rules_changed(sender, instance, action, **kwargs):
+    """
+    Signal handler for rules added to or removed from a rule set.
+    
+    This will rebuild the rule set bundles of every process with their rule
+    index.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    
+    bump_rules_version()
+    invalidate_rule_index()
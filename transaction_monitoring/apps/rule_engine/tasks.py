@@ -0,0 +1,81 @@
+"""
+Celery tasks for the Rule Engine app.
+"""
+
+import logging
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from transaction_monitoring.celery_app import app
+from apps.notifications.models import Notification
+from .models import Rule
+
+logger = logging.getLogger(__name__)
+
+
+def alert_operators(rule_id: int, event: str, message: str) -> int:
+    """
+    Notify the active staff users and system administrators about a rule.
+    
+    Args:
+        rule_id: ID of the rule
+        event: Rule guard event, 'slow', 'failing' or 'quarantined'
+        message: Notification message
+    
+    Returns:
+        Number of notifications created
+    """
+    operators = get_user_model().objects.filter(Q(is_staff=True) | Q(role='system_admin'), is_active=True)
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            user=user,
+            notification_type='system',
+            title=f"Rule {event.replace('_', ' ')}",
+            message=message,
+            priority='critical' if event == 'quarantined' else 'high',
+            related_object_type='rule',
+            related_object_id=str(rule_id),
+            extra_data={'event': event},
+        )
+        for user in operators
+    ])
+    return len(notifications)
+
+
+@app.task(ignore_result=True)
+def quarantine_rule(rule_id: int, reason: str):
+    """
+    Move a failing rule to shadow mode and notify the operators.
+    
+    Shadow rules are not in the live rule index, so saving the rule takes it
+    out of evaluation in every process once the index is reloaded.
+    
+    Args:
+        rule_id: ID of the rule
+        reason: Description of the failures
+    """
+    try:
+        rule = Rule.objects.get(pk=rule_id)
+    except Rule.DoesNotExist:
+        logger.warning(f"Rule {rule_id} to quarantine does not exist")
+        return
+    
+    if not rule.is_shadow:
+        rule.is_shadow = True
+        rule.last_modified_by = 'rule_profiler'
+        rule.save(update_fields=['is_shadow', 'last_modified_by'])
+        logger.warning(f"Rule '{rule.name}' (ID: {rule.pk}) quarantined to shadow mode")
+    
+    alert_operators(rule_id, 'quarantined', f"{reason}. The rule was moved to shadow mode.")
+
+
+@app.task(ignore_result=True)
+def send_rule_guard_alert(rule_id: int, event: str, message: str):
+    """
+    Notify the operators about a slow or failing rule.
+    
+    Args:
+        rule_id: ID of the rule
+        event: Rule guard event, 'slow' or 'failing'
+        message: Notification message
+    """
+    alert_operators(rule_id, event, message)
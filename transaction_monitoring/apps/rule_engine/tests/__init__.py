@@ -0,0 +1,3 @@
+"""
+Tests for the Rule Engine app.
+"""
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Tests for the rule engine compiler service.
+"""
+
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.compiler import (
+    CompiledRuleCache,
+    compile_rule_condition,
+    get_compiled_condition
+)
+from apps.rule_engine.services.evaluator import evaluate_condition, evaluate_rules
+from apps.transactions.models import POSTransaction
+
+
+class CompiledRuleCacheTests(TestCase):
+    """Tests for compiling rule conditions once per rule version."""
+    
+    def setUp(self):
+        """Set up a rule and a transaction."""
+        cache.clear()
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+        with post_save_scoring_suppressed():
+            self.transaction = POSTransaction.objects.create(
+                transaction_id='tx_compiled_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+                location_data={'country': 'US'},
+            )
+    
+    def test_compiles_each_rule_once(self):
+        """Test that a rule's condition is compiled on first use only."""
+        with patch('apps.rule_engine.services.compiler.compile', wraps=compile, create=True) as mock_compile:
+            for _ in range(3):
+                result = evaluate_rules(self.transaction, rules=[self.rule], execution_records=[])
+        
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertEqual(result['rules_triggered'], 1)
+        self.assertEqual(result['triggered_rules'][0]['condition_values'], {'amount': 1000.0})
+    
+    def test_saving_a_rule_invalidates_every_process(self):
+        """Test that saving a rule bumps the version stamp other processes check."""
+        other_process = CompiledRuleCache(check_interval=0)
+        compiled = other_process.get(self.rule)
+        self.assertIs(other_process.get(self.rule), compiled)
+        
+        self.rule.risk_score = 70
+        self.rule.save()
+        
+        self.assertIsNot(other_process.get(self.rule), compiled)
+    
+    def test_hit_counts_do_not_invalidate(self):
+        """Test that saving a rule's hit statistics keeps the compiled rules."""
+        compiled = get_compiled_condition(self.rule)
+        
+        self.rule.hit_count += 1
+        self.rule.save(update_fields=['hit_count', 'last_triggered'])
+        
+        self.assertIs(get_compiled_condition(self.rule), compiled)
+    
+    def test_edited_condition_is_recompiled(self):
+        """Test that a changed condition is never evaluated from its old code."""
+        get_compiled_condition(self.rule)
+        
+        self.rule.condition = 'transaction["amount"] > 5000'
+        
+        self.assertEqual(get_compiled_condition(self.rule).condition, 'transaction["amount"] > 5000')
+    
+    def test_invalid_conditions_are_not_evaluated(self):
+        """Test that conditions rejected by the validator never run."""
+        triggered, condition_values = evaluate_condition('__import__("os").getcwd()', {})
+        
+        self.assertFalse(triggered)
+        self.assertIn('error', condition_values)
+        self.assertFalse(compile_rule_condition('transaction.get("amount").__class__')[0])
+    
+    def test_allows_lookups_into_transaction_values(self):
+        """Test that method calls on values read from the transaction are allowed."""
+        condition = 'transaction.get("location_data", {}).get("country") == "US"'
+        
+        self.assertEqual(compile_rule_condition(condition), (True, ''))
+        self.assertEqual(
+            evaluate_condition(condition, {'location_data': {'country': 'US'}}),
+            (True, {'location_data': {'country': 'US'}})
+        )
+    
+    def test_rejects_methods_that_modify_transaction_values(self):
+        """Test that only read-only methods can be called on values read from the transaction."""
+        for condition in (
+            'transaction["location_data"].clear() or True',
+            'transaction.get("payment_method_data", {}).update({"type": "card"}) is None',
+            'transaction.get("metadata", {}).setdefault("seen", True)',
+        ):
+            self.assertFalse(compile_rule_condition(condition)[0], condition)
+        
+        self.assertTrue(compile_rule_condition('transaction["merchant_id"].lower().startswith("test")')[0])
@@ -0,0 +1,121 @@
+"""
+Tests for the rule engine execution store service.
+"""
+
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule, RuleExecution, RuleExecutionRollup
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.execution_store import (
+    get_rollup_stats,
+    histogram_percentile,
+    store_rule_executions,
+    update_rollups
+)
+from apps.transactions.models import POSTransaction
+
+
+class ExecutionStoreTests(TestCase):
+    """Tests for sampled rule execution storage and per-minute rollups."""
+    
+    def setUp(self):
+        """Set up a rule."""
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+    
+    def make_executions(self, count, triggered_every=10):
+        return [
+            RuleExecution(
+                transaction_id=f'tx_store_{index}',
+                rule=self.rule,
+                triggered=index % triggered_every == 0,
+                execution_time=0.2 + index / 100,
+            )
+            for index in range(count)
+        ]
+    
+    @override_settings(RULE_ENGINE_EXECUTION_STORAGE='sampled', RULE_ENGINE_EXECUTION_SAMPLE_RATE=0.1)
+    def test_sampled_storage_keeps_triggered_executions(self):
+        """Test that sampled storage keeps every triggered row but rolls up every execution."""
+        executions = self.make_executions(200)
+        
+        stored = store_rule_executions(executions)
+        
+        self.assertLess(len(stored), len(executions))
+        self.assertEqual(RuleExecution.objects.count(), len(stored))
+        self.assertEqual(RuleExecution.objects.filter(triggered=True).count(), 20)
+        stats = get_rollup_stats(RuleExecutionRollup.objects.all())
+        self.assertEqual(stats['total'], 200)
+        self.assertEqual(stats['triggered'], 20)
+        self.assertEqual(stats['not_triggered'], 180)
+    
+    def test_full_storage_keeps_every_execution(self):
+        """Test that full storage writes every row."""
+        store_rule_executions(self.make_executions(20))
+        
+        self.assertEqual(RuleExecution.objects.count(), 20)
+    
+    def test_rollups_are_merged_incrementally(self):
+        """Test that executions stored in the same minute update a single rollup."""
+        minute = timezone.now()
+        executions = self.make_executions(30)
+        
+        update_rollups(executions[:10], minute=minute)
+        update_rollups(executions[10:], minute=minute)
+        
+        rollup = RuleExecutionRollup.objects.get(rule=self.rule)
+        self.assertEqual(rollup.evaluations, 30)
+        self.assertEqual(rollup.hits, 3)
+        self.assertAlmostEqual(rollup.min_time, 0.2)
+        self.assertAlmostEqual(rollup.max_time, 0.49)
+        self.assertEqual(sum(rollup.latency_histogram), 30)
+    
+    def test_rollups_are_bucketed_by_execution_minute(self):
+        """Test that executions are added to the minute they ran in, however late they are stored."""
+        executions = self.make_executions(4)
+        ran_at = timezone.now() - timedelta(minutes=5)
+        for execution in executions[:3]:
+            execution.executed_at = ran_at
+        
+        store_rule_executions(executions)
+        
+        minutes = dict(RuleExecutionRollup.objects.values_list('minute', 'evaluations'))
+        self.assertEqual(minutes[ran_at.replace(second=0, microsecond=0)], 3)
+        self.assertEqual(sum(minutes.values()), 4)
+    
+    def test_percentiles_are_estimated_from_the_histogram(self):
+        """Test that percentiles fall in the right bucket and within the observed range."""
+        histogram = [0, 0, 0, 90, 9, 0, 0, 0, 0, 0, 0, 0, 1]
+        
+        self.assertTrue(0.25 <= histogram_percentile(histogram, 50) <= 0.5)
+        self.assertTrue(0.5 <= histogram_percentile(histogram, 95) <= 1.0)
+        self.assertEqual(histogram_percentile(histogram, 100, 0.3, 400.0), 400.0)
+        self.assertEqual(histogram_percentile([], 50), 0.0)
+    
+    def test_evaluation_updates_rollups(self):
+        """Test that evaluating rules outside the pipeline adds to the rollups."""
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_store_eval',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        
+        evaluate_rules(transaction, rules=[self.rule])
+        
+        self.assertEqual(RuleExecution.objects.filter(transaction_id='tx_store_eval').count(), 1)
+        rollup = RuleExecutionRollup.objects.get(rule=self.rule)
+        self.assertEqual((rollup.evaluations, rollup.hits), (1, 1))
@@ -0,0 +1,100 @@
+"""
+Tests for the rule engine optimizer service.
+"""
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.fraud_engine.services.decision_service import make_fraud_decision
+from apps.fraud_engine.services.pipeline_service import run_detection_pipeline
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.optimizer import RuleOptimizer, ShortCircuit, get_rule_optimizer
+from apps.transactions.models import POSTransaction
+
+
+class RuleOptimizerTests(TestCase):
+    """Tests for cost- and hit-rate-based rule ordering with early stopping."""
+    
+    def setUp(self):
+        """Set up rules with different actions and risk scores and a transaction."""
+        rule_specs = [
+            ('Review large amount', 'transaction["amount"] > 100', 'review', 92, 90),
+            ('Reject huge amount', 'transaction["amount"] > 10000', 'reject', 95, 80),
+            ('Reject large POS amount', 'transaction["channel"] == "pos" and transaction["amount"] > 500',
+             'reject', 90, 70),
+            ('Review manual entry', 'transaction.get("entry_mode") == "manual"', 'review', 50, 60),
+            ('Notify any amount', 'transaction["amount"] > 0', 'notify', 10, 50),
+        ]
+        self.rules = [
+            Rule.objects.create(
+                name=name,
+                description=name,
+                rule_type='amount',
+                condition=condition,
+                action=action,
+                risk_score=risk_score,
+                priority=priority,
+            )
+            for name, condition, action, risk_score, priority in rule_specs
+        ]
+        with post_save_scoring_suppressed():
+            self.transaction = POSTransaction.objects.create(
+                transaction_id='tx_optimizer_1',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+                entry_mode='manual',
+            )
+    
+    def test_stops_early_without_changing_the_decision(self):
+        """Test that the optimizer skips rules but reaches the full-evaluation decision."""
+        full = evaluate_rules(self.transaction, rules=self.rules, execution_records=[])
+        records = []
+        optimized = evaluate_rules(
+            self.transaction, rules=self.rules, execution_records=records, optimizer=RuleOptimizer()
+        )
+        
+        self.assertEqual(full['rules_skipped'], 0)
+        self.assertGreater(optimized['rules_skipped'], 0)
+        self.assertEqual(len(records), optimized['rules_evaluated'])
+        self.assertEqual(optimized['risk_score'], full['risk_score'])
+        self.assertEqual(
+            make_fraud_decision(self.transaction, {**optimized, 'rule_engine': optimized}),
+            make_fraud_decision(self.transaction, {**full, 'rule_engine': full})
+        )
+    
+    def test_waits_for_higher_priority_reject_rules(self):
+        """Test that a reject is only certain once every earlier reject rule and riskier rule is known."""
+        short_circuit = ShortCircuit(self.rules)
+        
+        self.assertFalse(short_circuit.add(2, True))
+        self.assertFalse(short_circuit.add(1, False))
+        self.assertTrue(short_circuit.add(0, True))
+    
+    def test_orders_reject_rules_by_cost_per_hit(self):
+        """Test that cheap, frequently hit reject rules are evaluated first."""
+        optimizer = RuleOptimizer()
+        for _ in range(20):
+            optimizer.record(self.rules[1], 1.0, False)
+            optimizer.record(self.rules[2], 1.0, True)
+            optimizer.record(self.rules[3], 0.1, True)
+            optimizer.record(self.rules[4], 0.5, True)
+        
+        self.assertEqual(optimizer.order(self.rules), [2, 1, 0, 3, 4])
+        self.assertEqual(optimizer.statistics()[self.rules[2].pk]['evaluations'], 20)
+    
+    @override_settings(RULE_ENGINE_OPTIMIZER=True, RULE_ENGINE_FULL_EVALUATION_SAMPLE_RATE=1.0)
+    def test_audit_sampled_transactions_are_fully_evaluated(self):
+        """Test that the pipeline evaluates every rule of audit-sampled transactions."""
+        get_rule_optimizer().clear()
+        
+        results, decision = run_detection_pipeline(self.transaction, rules=self.rules, audit_records=[])
+        
+        self.assertEqual(results['rule_engine']['rules_skipped'], 0)
+        self.assertEqual(decision['decision'], 'reject')
+        self.assertEqual(len(get_rule_optimizer().statistics()), len(self.rules))
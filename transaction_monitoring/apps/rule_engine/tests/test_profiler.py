@@ -0,0 +1,128 @@
+"""
+Tests for the rule engine profiler service.
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.notifications.models import Notification
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_rules
+from apps.rule_engine.services.profiler import RuleProfiler
+from apps.transactions.models import POSTransaction
+
+
+class RuleProfilerTests(TestCase):
+    """Tests for rule latency profiling and the slow-rule guard."""
+    
+    def setUp(self):
+        """Set up a rule and a staff user."""
+        self.rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 500',
+            rule_type='amount',
+            condition='transaction["amount"] > 500',
+            action='review',
+            risk_score=60,
+        )
+        self.operator = get_user_model().objects.create_user(
+            username='operator', password='password', is_staff=True
+        )
+    
+    def make_profiler(self, quarantine=False):
+        return RuleProfiler(
+            window=300, p99_threshold_ms=10.0, min_evaluations=100,
+            timeout_ms=50.0, quarantine_strikes=5, quarantine=quarantine
+        )
+    
+    def test_slow_rule_is_flagged_once(self):
+        """Test that a rule whose p99 exceeds the threshold is flagged once while it stays slow."""
+        profiler = self.make_profiler()
+        
+        events = [profiler.record(self.rule, 0.2) for _ in range(95)]
+        events += [profiler.record(self.rule, 30.0) for _ in range(105)]
+        
+        self.assertEqual(events.count('slow'), 1)
+        self.assertEqual(events.index('slow'), 99)
+        self.assertGreater(profiler.p99(self.rule), 10.0)
+        self.assertTrue(profiler.statistics()[self.rule.pk]['flagged'])
+    
+    def test_failing_rule_is_reported_without_quarantine(self):
+        """Test that consecutive timeouts are only reported when quarantine is disabled."""
+        profiler = self.make_profiler()
+        
+        events = [profiler.record(self.rule, 80.0) for _ in range(4)]
+        events += [profiler.record(self.rule, 0.2), profiler.record(self.rule, 80.0, failed=True)]
+        events += [profiler.record(self.rule, 0.2, failed=True) for _ in range(4)]
+        
+        self.assertEqual(events.count('failing'), 1)
+        self.assertEqual(events[-1], 'failing')
+        self.assertFalse(profiler.is_quarantined(self.rule))
+    
+    def test_quarantine_moves_rule_to_shadow_mode(self):
+        """Test that a rule whose condition keeps raising is quarantined, moved to shadow mode and reported."""
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_profiler_failing',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        failing_rule = Rule.objects.create(
+            name='Missing field',
+            description='Reads a field transactions do not have',
+            rule_type='custom',
+            condition='transaction["no_such_key"] > 1',
+            action='review',
+            risk_score=40,
+        )
+        profiler = self.make_profiler(quarantine=True)
+        
+        for _ in range(4):
+            result = evaluate_rules(transaction, rules=[failing_rule], execution_records=[], profiler=profiler)
+            self.assertEqual(result['rules_evaluated'], 1)
+        self.assertEqual(profiler.statistics()[failing_rule.pk]['strikes'], 4)
+        self.assertFalse(profiler.is_quarantined(failing_rule))
+        
+        evaluate_rules(transaction, rules=[failing_rule], execution_records=[], profiler=profiler)
+        
+        self.assertTrue(profiler.is_quarantined(failing_rule))
+        failing_rule.refresh_from_db()
+        self.assertTrue(failing_rule.is_shadow)
+        self.assertEqual(failing_rule.last_modified_by, 'rule_profiler')
+        notification = Notification.objects.get(user=self.operator)
+        self.assertEqual(notification.related_object_id, str(failing_rule.pk))
+        self.assertEqual(notification.extra_data, {'event': 'quarantined'})
+        
+        result = evaluate_rules(transaction, rules=[failing_rule], execution_records=[], profiler=profiler)
+        self.assertEqual(result['rules_skipped'], 1)
+    
+    def test_evaluation_skips_quarantined_rules(self):
+        """Test that the evaluator skips rules quarantined by its profiler and profiles the others."""
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_profiler',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        profiler = self.make_profiler(quarantine=True)
+        
+        result = evaluate_rules(transaction, rules=[self.rule], execution_records=[], profiler=profiler)
+        self.assertEqual(result['rules_triggered'], 1)
+        self.assertEqual(profiler.statistics()[self.rule.pk]['evaluations'], 1)
+        
+        for _ in range(5):
+            profiler.record(self.rule, 0.2, failed=True)
+        result = evaluate_rules(transaction, rules=[self.rule], execution_records=[], profiler=profiler)
+        self.assertEqual(result['rules_evaluated'], 0)
+        self.assertEqual(result['rules_skipped'], 1)
@@ -0,0 +1,103 @@
+"""
+Tests for the rule engine rule set bundles.
+"""
+
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule, RuleSet
+from apps.rule_engine.services.evaluator import evaluate_rules, get_rule_bundle, transaction_to_dict
+from apps.rule_engine.services.rule_index import get_rule_index
+from apps.transactions.models import POSTransaction
+
+
+class RuleBundleTests(TestCase):
+    """Tests for evaluating transactions with the bundle of their rule set."""
+    
+    def setUp(self):
+        """Set up global rules and a rule set assigned to a merchant."""
+        def create_rule(name, condition, priority=0):
+            return Rule.objects.create(
+                name=name,
+                description=name,
+                rule_type='custom',
+                condition=condition,
+                action='review',
+                risk_score=50,
+                priority=priority,
+            )
+        
+        self.global_rule = create_rule('Global', 'transaction["amount"] > 500', priority=10)
+        self.manual = create_rule('Manual entry', 'transaction.get("entry_mode") == "manual"', priority=5)
+        self.large = create_rule('Large', 'transaction["amount"] > 900', priority=7)
+        
+        self.ruleset = RuleSet.objects.create(
+            name='Merchant A pack',
+            description='Rules of merchant A',
+            assigned_merchants=['merchant_a'],
+            assigned_mccs=['5732'],
+        )
+        self.ruleset.rules.add(self.manual, self.large)
+    
+    def create_transaction(self, transaction_id, merchant_id, mcc=None):
+        with post_save_scoring_suppressed():
+            return POSTransaction.objects.create(
+                transaction_id=transaction_id,
+                transaction_type='acquiring',
+                channel='pos',
+                amount=1000,
+                currency='USD',
+                user_id='user_1',
+                merchant_id=merchant_id,
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+                entry_mode='manual',
+                mcc=mcc,
+            )
+    
+    def test_assigned_merchant_evaluates_only_its_bundle(self):
+        """Test that transactions of an assigned merchant or MCC only evaluate the rules of the set, in order."""
+        for transaction in (self.create_transaction('tx_bundle_a', 'merchant_a'),
+                            self.create_transaction('tx_bundle_mcc', 'merchant_c', mcc='5732')):
+            result = evaluate_rules(transaction, execution_records=[])
+            
+            self.assertEqual(result['rules_evaluated'], 2)
+            self.assertEqual([rule['id'] for rule in result['triggered_rules']], [self.large.id, self.manual.id])
+        
+        result = evaluate_rules(self.create_transaction('tx_bundle_b', 'merchant_b'), execution_records=[])
+        self.assertEqual(result['rules_evaluated'], 3)
+    
+    def test_bundle_merges_referenced_fields(self):
+        """Test that a bundle extracts only the keys its conditions read."""
+        transaction = self.create_transaction('tx_bundle_fields', 'merchant_a', mcc='5732')
+        bundle = get_rule_bundle(transaction)
+        
+        self.assertEqual(bundle.fields, ('amount', 'entry_mode'))
+        self.assertEqual(set(bundle.conditions), {self.manual.id, self.large.id})
+        
+        full = transaction_to_dict(transaction)
+        extracted = transaction_to_dict(transaction, frozenset(bundle.fields))
+        self.assertNotIn('merchant_id', extracted)
+        self.assertEqual({key: extracted[key] for key in bundle.fields}, {key: full[key] for key in bundle.fields})
+        
+        self.ruleset.rules.add(
+            Rule.objects.create(name='Any', description='Any', rule_type='custom', condition='len(transaction) > 3',
+                                action='review', risk_score=10)
+        )
+        self.assertIsNone(get_rule_bundle(transaction).fields)
+    
+    def test_rebuilt_when_rule_sets_change(self):
+        """Test that assigning, deactivating and editing rule sets rebuilds the bundles."""
+        transaction = self.create_transaction('tx_bundle_change', 'merchant_b')
+        self.assertIsNone(get_rule_bundle(transaction))
+        
+        self.ruleset.assigned_merchants = ['merchant_a', 'merchant_b']
+        self.ruleset.save()
+        self.assertEqual(get_rule_bundle(transaction).ruleset_id, self.ruleset.id)
+        
+        self.ruleset.rules.remove(self.large)
+        self.assertEqual(list(get_rule_bundle(transaction).conditions), [self.manual.id])
+        
+        self.ruleset.is_active = False
+        self.ruleset.save()
+        self.assertIsNone(get_rule_index().bundles)
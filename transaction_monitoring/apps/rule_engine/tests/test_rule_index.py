@@ -0,0 +1,83 @@
+"""
+Tests for the rule engine rule index.
+"""
+
+from types import SimpleNamespace
+from django.test import TestCase
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import get_applicable_rules
+from apps.rule_engine.services.rule_index import RuleIndex, get_rule_index
+
+
+class RuleIndexTests(TestCase):
+    """Tests for selecting rules from the in-memory index."""
+    
+    def setUp(self):
+        """Set up rules with channel and merchant restrictions."""
+        def create_rule(name, priority=0, **kwargs):
+            return Rule.objects.create(
+                name=name,
+                description=name,
+                rule_type='amount',
+                condition='transaction["amount"] > 500',
+                action='review',
+                risk_score=50,
+                priority=priority,
+                **kwargs
+            )
+        
+        self.general = create_rule('General', priority=5)
+        self.pos_only = create_rule('POS only', priority=10, applies_to_ecommerce=False, applies_to_wallet=False)
+        self.merchant_a = create_rule(
+            'Merchant A', priority=7, merchant_specific=True,
+            included_merchants=['merchant_a'] + [f'merchant_{index}' for index in range(5000)]
+        )
+        self.all_merchants = create_rule('All merchants', priority=1, merchant_specific=True)
+        self.excludes_b = create_rule('Excludes B', priority=3, excluded_merchants=['merchant_b'])
+        create_rule('Inactive', priority=20, is_active=False)
+        create_rule('Shadow', priority=20, is_shadow=True)
+    
+    def transaction(self, channel, merchant_id=''):
+        return SimpleNamespace(channel=channel, merchant_id=merchant_id)
+    
+    def test_selects_like_the_list_filter(self):
+        """Test that the index selects the same rules, in the same order, as filtering the rule list."""
+        rules = list(Rule.objects.filter(is_shadow=False))
+        index = RuleIndex(rules)
+        
+        for channel in ('pos', 'ecommerce', 'wallet', 'unknown'):
+            for merchant_id in ('', 'merchant_a', 'merchant_b', 'merchant_c', 'merchant_42'):
+                transaction = self.transaction(channel, merchant_id)
+                self.assertEqual(
+                    index.select(channel, merchant_id),
+                    get_applicable_rules(transaction, rules),
+                    f"{channel} / {merchant_id}"
+                )
+    
+    def test_selects_merchant_rules(self):
+        """Test that merchant-specific and excluding rules apply to the right merchants."""
+        index = get_rule_index()
+        
+        self.assertEqual(
+            index.select('pos', 'merchant_a'),
+            [self.pos_only, self.merchant_a, self.general, self.excludes_b, self.all_merchants]
+        )
+        self.assertEqual(index.select('wallet', 'merchant_b'), [self.general, self.all_merchants])
+    
+    def test_selection_runs_no_queries(self):
+        """Test that rules are selected from memory once the index is built."""
+        get_rule_index()
+        
+        with self.assertNumQueries(0):
+            rules = get_applicable_rules(self.transaction('ecommerce', 'merchant_a'))
+        
+        self.assertEqual(rules, [self.merchant_a, self.general, self.excludes_b, self.all_merchants])
+    
+    def test_rebuilt_when_rules_change(self):
+        """Test that saving a rule rebuilds the index."""
+        self.assertIn(self.general, get_rule_index().select('wallet'))
+        
+        self.general.is_active = False
+        self.general.save()
+        
+        self.assertNotIn(self.general, get_rule_index().select('wallet'))
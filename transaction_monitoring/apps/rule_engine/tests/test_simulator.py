@@ -0,0 +1,138 @@
+"""
+Tests for the rule engine simulator service.
+"""
+
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_condition, transaction_to_dict
+from apps.rule_engine.services.simulator import TransactionColumns, get_condition_fields, simulate_condition
+from apps.transactions.models import EcommerceTransaction, POSTransaction, Transaction, WalletTransaction
+
+
+class RuleSimulatorTests(TestCase):
+    """Tests for running candidate rule conditions over historical transactions."""
+    
+    def setUp(self):
+        """Set up transactions of every channel and an active rule."""
+        now = timezone.now()
+        with post_save_scoring_suppressed():
+            for index in range(6):
+                POSTransaction.objects.create(
+                    transaction_id=f'tx_sim_pos_{index}',
+                    transaction_type='acquiring',
+                    channel='pos',
+                    amount=200 * index,
+                    currency='USD',
+                    user_id='user_1',
+                    merchant_id='merchant_a' if index % 2 else 'merchant_b',
+                    timestamp=now - timedelta(hours=index),
+                    terminal_id='term_1',
+                    entry_mode='manual' if index > 3 else 'chip',
+                )
+            EcommerceTransaction.objects.create(
+                transaction_id='tx_sim_ecommerce',
+                transaction_type='acquiring',
+                channel='ecommerce',
+                amount=900,
+                currency='USD',
+                user_id='user_2',
+                timestamp=now - timedelta(hours=1),
+                is_3ds_verified=False,
+                location_data={'country': 'US'},
+            )
+            WalletTransaction.objects.create(
+                transaction_id='tx_sim_wallet',
+                transaction_type='wallet',
+                channel='wallet',
+                amount=5000,
+                currency='USD',
+                user_id='user_3',
+                timestamp=now - timedelta(hours=2),
+                wallet_id='wallet_1',
+                source_type='wallet',
+                destination_type='external',
+                source_id='wallet_1',
+                destination_id='bank_1',
+                transaction_purpose='withdrawal',
+            )
+            POSTransaction.objects.create(
+                transaction_id='tx_sim_old',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=10000,
+                currency='USD',
+                user_id='user_1',
+                timestamp=now - timedelta(days=30),
+                terminal_id='term_1',
+            )
+        
+        self.rule = Rule.objects.create(
+            name='Manual entry',
+            description='Manually entered card',
+            rule_type='card',
+            condition='transaction.get("entry_mode") == "manual"',
+            action='review',
+            risk_score=50,
+        )
+    
+    def test_columnar_rows_match_transaction_dicts(self):
+        """Test that the dictionaries built from loaded columns match transaction_to_dict."""
+        columns = TransactionColumns(None)
+        values = Transaction.objects.order_by('pk').values_list(*columns.lookups)
+        rows = {row['transaction_id']: row for row in columns.to_dicts(list(values))}
+        
+        for model in (POSTransaction, EcommerceTransaction, WalletTransaction):
+            for transaction in model.objects.all():
+                self.assertEqual(rows[transaction.transaction_id], transaction_to_dict(transaction))
+    
+    def test_reports_hits_by_channel_and_merchant(self):
+        """Test that hits, hit rates and samples match per-row evaluation over the window."""
+        condition = 'transaction["amount"] >= 800'
+        
+        report = simulate_condition(condition, days=7, chunk_size=3)
+        
+        expected = [
+            transaction.transaction_id
+            for model in (POSTransaction, EcommerceTransaction, WalletTransaction)
+            for transaction in model.objects.filter(timestamp__gte=timezone.now() - timedelta(days=7))
+            if evaluate_condition(condition, transaction_to_dict(transaction))[0]
+        ]
+        self.assertEqual(report['transactions'], 8)
+        self.assertEqual(report['hits'], len(expected))
+        self.assertEqual(sorted(sample['transaction_id'] for sample in report['samples']), sorted(expected))
+        by_channel = {row['channel']: row for row in report['by_channel']}
+        self.assertEqual((by_channel['pos']['transactions'], by_channel['pos']['hits']), (6, 2))
+        self.assertEqual(by_channel['wallet']['hit_rate'], 100)
+        by_merchant = {row['merchant_id']: row['hits'] for row in report['by_merchant']}
+        self.assertEqual(by_merchant, {'merchant_a': 1, 'merchant_b': 1, None: 2})
+    
+    def test_reports_overlap_with_active_rules(self):
+        """Test that hits shared with active rules and new hits are counted."""
+        report = simulate_condition('transaction["amount"] >= 600', days=7)
+        
+        self.assertEqual(report['hits'], 5)
+        self.assertEqual(report['overlap'][0]['rule_id'], self.rule.id)
+        self.assertEqual(report['overlap'][0]['overlap'], 2)
+        self.assertEqual(report['new_hits'], 3)
+        
+        report = simulate_condition('transaction["amount"] >= 600', days=7, exclude_rule_id=self.rule.id)
+        self.assertEqual(report['overlap'], [])
+        self.assertEqual(report['new_hits'], 5)
+    
+    def test_loads_only_the_fields_read(self):
+        """Test that only the fields read by the conditions are loaded."""
+        self.assertEqual(get_condition_fields('transaction.get("metadata", {}).get("age", 0) > 3'), {'metadata'})
+        self.assertIsNone(get_condition_fields('len(transaction) > 3'))
+        
+        columns = TransactionColumns({'amount', 'channel', 'is_3ds_verified'})
+        self.assertEqual(columns.lookups, ['pk', 'channel', 'amount', 'ecommercetransaction__is_3ds_verified'])
+    
+    def test_rejects_invalid_conditions(self):
+        """Test that invalid conditions and windows raise ValueError."""
+        with self.assertRaises(ValueError):
+            simulate_condition('import os', days=7)
+        with self.assertRaises(ValueError):
+            simulate_condition('transaction["amount"] > 1', days=0)
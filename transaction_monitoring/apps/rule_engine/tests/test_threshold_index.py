@@ -0,0 +1,115 @@
+"""
+Tests for the rule engine threshold index.
+"""
+
+import random
+from datetime import datetime, timezone as dt_timezone
+from django.test import TestCase
+from django.utils import timezone
+from apps.fraud_engine.services.scoring_service import post_save_scoring_suppressed
+from apps.rule_engine.models import Rule
+from apps.rule_engine.services.evaluator import evaluate_condition, evaluate_rules
+from apps.rule_engine.services.rule_index import RuleIndex
+from apps.rule_engine.services.threshold_index import IntervalTree, parse_threshold
+from apps.transactions.models import POSTransaction
+
+
+class ThresholdIndexTests(TestCase):
+    """Tests for matching threshold rules through interval trees."""
+    
+    def create_rule(self, name, priority=0, condition='transaction["amount"] > 500', **kwargs):
+        return Rule.objects.create(
+            name=name,
+            description=name,
+            rule_type='amount',
+            condition=condition,
+            action='review',
+            risk_score=50,
+            priority=priority,
+            **kwargs
+        )
+    
+    def test_interval_tree_matches_brute_force(self):
+        """Test that interval tree queries return exactly the intervals holding the value."""
+        generator = random.Random(7)
+        intervals = []
+        for index in range(300):
+            lower = generator.choice([float('-inf'), generator.randint(0, 100)])
+            upper = generator.choice([float('inf'), max(lower, 0) + generator.randint(1, 30)])
+            intervals.append((lower, upper, index))
+        intervals.append((5, 5, 'empty'))
+        tree = IntervalTree(intervals)
+        
+        for value in [-5, 0, 0.5, 17, 50, 99.99, 100, 131, 500]:
+            expected = sorted(index for lower, upper, index in intervals if lower <= value < upper)
+            self.assertEqual(sorted(tree.query(value)), expected, value)
+    
+    def test_condition_is_generated_from_the_interval(self):
+        """Test that threshold rules get the condition equivalent to their interval."""
+        rule = self.create_rule('Structuring', threshold_field='amount', threshold_min=9000, threshold_max=10000)
+        night = self.create_rule('Night', threshold_field='hour', threshold_min=22, threshold_max=6)
+        
+        self.assertEqual(rule.condition, 'transaction["amount"] >= 9000 and transaction["amount"] < 10000')
+        self.assertEqual(night.condition, 'transaction["timestamp"].hour >= 22 or transaction["timestamp"].hour < 6')
+        self.assertEqual(parse_threshold('amount', '', '2.5'), ('amount', None, 2.5))
+        self.assertEqual(parse_threshold('', '1', '2'), (None, None, None))
+        for bounds in (('', ''), ('5', '5'), ('x', '')):
+            with self.assertRaises(ValueError):
+                parse_threshold('amount', *bounds)
+    
+    def test_selects_threshold_rules_holding_the_transaction(self):
+        """Test that the index selects the same rules, in order, as evaluating the threshold conditions."""
+        plain = self.create_rule('Plain', priority=50)
+        thresholds = [
+            self.create_rule(f'Band {index}', priority=index % 7, threshold_field='amount',
+                             threshold_min=index * 100 if index % 5 else None,
+                             threshold_max=index * 100 + 250 if index % 3 or not index % 5 else None)
+            for index in range(40)
+        ]
+        self.create_rule('Night', priority=3, threshold_field='hour', threshold_min=22, threshold_max=6)
+        self.create_rule('Excludes B', priority=2, threshold_field='amount', threshold_min=0,
+                         excluded_merchants=['merchant_b'])
+        self.create_rule('Wallet only', priority=1, threshold_field='amount', threshold_min=0,
+                         applies_to_pos=False, applies_to_ecommerce=False)
+        index = RuleIndex(Rule.objects.all())
+        
+        for amount in (0, 99.5, 100, 1234, 3999, 10000):
+            for hour in (3, 12, 22):
+                transaction_dict = {
+                    'amount': float(amount),
+                    'timestamp': datetime(2026, 10, 17, hour, tzinfo=dt_timezone.utc),
+                }
+                for channel, merchant_id in (('pos', ''), ('pos', 'merchant_b'), ('wallet', 'merchant_a')):
+                    expected = [
+                        rule for rule in index.select(channel, merchant_id)
+                        if not rule.threshold_field or evaluate_condition(rule.condition, transaction_dict)[0]
+                    ]
+                    self.assertEqual(
+                        index.select(channel, merchant_id, transaction_dict), expected,
+                        f"{amount} / {hour} / {channel} / {merchant_id}"
+                    )
+        
+        self.assertIn(plain, index.select('pos', '', {'amount': 0.0, 'timestamp': None}))
+        self.assertEqual(len(index.select('pos', '')), len(thresholds) + 3)
+    
+    def test_evaluation_only_evaluates_matching_threshold_rules(self):
+        """Test that threshold rules outside their interval are not evaluated."""
+        structuring = self.create_rule('Structuring', priority=10, threshold_field='amount',
+                                       threshold_min=9000, threshold_max=10000)
+        self.create_rule('Small', threshold_field='amount', threshold_max=100)
+        with post_save_scoring_suppressed():
+            transaction = POSTransaction.objects.create(
+                transaction_id='tx_threshold',
+                transaction_type='acquiring',
+                channel='pos',
+                amount=9500,
+                currency='USD',
+                user_id='user_1',
+                timestamp=timezone.now(),
+                terminal_id='term_1',
+            )
+        
+        result = evaluate_rules(transaction, rules=RuleIndex(Rule.objects.all()), execution_records=[])
+        
+        self.assertEqual(result['rules_evaluated'], 1)
+        self.assertEqual([rule['id'] for rule in result['triggered_rules']], [structuring.id])
@@ -0,0 +1,115 @@
+"""
+Tests for the rule engine vectorizer service.
+"""
+
+from django.test import TestCase
+from apps.rule_engine.models import Rule
+from apps.rule_engine.rules.aml_rules import AML_RULES
+from apps.rule_engine.rules.amount_rules import AMOUNT_RULES
+from apps.rule_engine.rules.card_rules import CARD_RULES
+from apps.rule_engine.rules.geographic_rules import GEOGRAPHIC_RULES
+from apps.rule_engine.services.evaluator import evaluate_condition
+from apps.rule_engine.services.vectorizer import BatchRuleConditions, ConditionVectorizer
+
+# Transaction dictionaries covering missing keys, None values, mixed types and edge amounts
+ROWS = [
+    {'amount': 0, 'channel': 'pos', 'entry_mode': 'manual'},
+    {'amount': 1000, 'channel': 'wallet', 'transaction_purpose': 'transfer', 'metadata': {'account_age_days': 3}},
+    {'amount': 9500.5, 'channel': 'wallet', 'transaction_purpose': 'withdrawal', 'destination_type': 'external'},
+    {'amount': 5000, 'channel': 'ecommerce', 'is_3ds_verified': False, 'is_billing_shipping_match': False},
+    {'amount': 12000, 'channel': 'pos', 'condition': 'card_not_present',
+     'location_data': {'country': 'NG', 'ip_country': 'US'}, 'merchant_location': {'country': 'NG'}},
+    {'amount': None, 'channel': None, 'metadata': {}},
+    {'amount': '700', 'channel': 'ecommerce', 'location_data': None},
+    {'channel': 'wallet', 'transaction_purpose': 'transfer'},
+    {'amount': True, 'channel': 'pos',
+     'payment_method_data': {'card_details': {'is_new': True}}, 'location_data': {'country': 'KP'}},
+    {'amount': 2 ** 60, 'channel': 'wallet', 'transaction_purpose': 'transfer', 'metadata': {'account_age_days': '5'}},
+    {'amount': -3000.0, 'channel': 'wallet', 'payment_method_data': {'card_details': {}}},
+]
+
+# Conditions exercising the edge cases of the vectorised subset
+EDGE_CONDITIONS = [
+    'transaction["amount"] / transaction.get("divisor", 0) > 1',
+    'transaction.get("amount", 0) // 7 == 142 or transaction.get("amount", 0) % 3 == 1',
+    'transaction.get("amount") is None or transaction.get("amount") > 100',
+    'transaction.get("amount") > 100 and transaction.get("amount") is not None',
+    '100 < transaction.get("amount", 0) <= 10000',
+    '-transaction.get("amount", 0) > 100',
+    'transaction.get("channel") not in ("pos", "wallet")',
+    'transaction.get("amount", 0) * 2 >= 1048576',
+    'transaction.get("metadata", {}).get("account_age_days", 30) < 7',
+]
+
+
+class ConditionVectorizerTests(TestCase):
+    """Tests for evaluating rule conditions over a batch of transactions."""
+    
+    def assertMatchesRows(self, condition):
+        """Assert that the vectorised results of a condition match per-row evaluation."""
+        truth, unsure = ConditionVectorizer(ROWS).evaluate(condition)
+        for index, row in enumerate(ROWS):
+            if not unsure[index]:
+                self.assertEqual(bool(truth[index]), evaluate_condition(condition, row)[0],
+                                 f"{condition} on row {index}")
+    
+    def test_shipped_rules_match_per_row_evaluation(self):
+        """Test that the shipped rule conditions give the same results as per-row evaluation."""
+        for rule in AML_RULES + AMOUNT_RULES + CARD_RULES + GEOGRAPHIC_RULES:
+            self.assertMatchesRows(rule['condition'])
+    
+    def test_edge_cases_match_per_row_evaluation(self):
+        """Test that division by zero, None, mixed types and large integers match per-row evaluation."""
+        for condition in EDGE_CONDITIONS:
+            self.assertMatchesRows(condition)
+    
+    def test_numeric_rows_are_vectorised(self):
+        """Test that rows with numeric amounts are decided without per-row evaluation."""
+        truth, unsure = ConditionVectorizer(ROWS).evaluate('transaction["amount"] > 5000')
+        
+        self.assertEqual(list(truth[:5]), [False, False, True, False, True])
+        self.assertFalse(unsure[:5].any())
+        self.assertTrue(unsure[7])
+
+
+class BatchRuleConditionsTests(TestCase):
+    """Tests for the per-rule results of a batch."""
+    
+    def setUp(self):
+        """Set up a vectorisable rule and one outside the vectorised subset."""
+        self.amount_rule = Rule.objects.create(
+            name='Large amount',
+            description='Amount above 5000',
+            rule_type='amount',
+            condition='transaction["amount"] > 5000',
+            action='review',
+            risk_score=60,
+        )
+        self.channel_rule = Rule.objects.create(
+            name='Upper-case channel',
+            description='Channel spelled in upper case',
+            rule_type='custom',
+            condition='transaction.get("channel", "").upper() == "POS"',
+            action='review',
+            risk_score=40,
+        )
+        self.rows = {f'tx_{index}': row for index, row in enumerate(ROWS[:5])}
+    
+    def test_unsupported_conditions_fall_back(self):
+        """Test that unsupported conditions are reported and left to per-row evaluation."""
+        batch = BatchRuleConditions([self.amount_rule, self.channel_rule], self.rows)
+        
+        self.assertIn(self.channel_rule.pk, batch.fallbacks)
+        self.assertNotIn(self.amount_rule.pk, batch.fallbacks)
+        self.assertIsNone(batch.evaluate(self.channel_rule, 'tx_0', self.rows['tx_0']))
+        self.assertIsNone(batch.evaluate(self.amount_rule, 'tx_unknown', {}))
+    
+    def test_results_include_condition_values(self):
+        """Test that batch results match evaluate_condition including condition values."""
+        batch = BatchRuleConditions([self.amount_rule], self.rows)
+        
+        for transaction_id, row in self.rows.items():
+            self.assertEqual(
+                batch.evaluate(self.amount_rule, transaction_id, row),
+                evaluate_condition(self.amount_rule.condition, row)
+            )
@@ -9,14 +9,19 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Avg, Max, Min
+from django.db.models import Q, Count, Avg, Max, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.urls import reverse
 
-from .models import Rule, RuleSet, RuleExecution
+from apps.core.hit_counts import apply_pending_hits
+from .models import Rule, RuleSet, RuleExecution, RuleExecutionRollup
 from .services.compiler import compile_rule_condition
 from .services.evaluator import evaluate_condition
+from .services.execution_store import get_rollup_stats
+from .services.simulator import simulate_condition
+from .services.threshold_index import build_threshold_condition, parse_threshold
 from .rules.amount_rules import AMOUNT_RULES
 from .rules.geographic_rules import GEOGRAPHIC_RULES
 from .rules.card_rules import CARD_RULES
@@ -84,6 +89,9 @@ def rule_list(request):
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
     
+    # Show hit counts including the hits not yet written to the rule rows
+    page_obj.object_list = apply_pending_hits(page_obj.object_list)
+    
     # Prepare context
     context = {
         'page_obj': page_obj,
@@ -104,25 +112,13 @@ def rule_detail(request, rule_id):
     Display details of a specific rule.
     """
     rule = get_object_or_404(Rule, id=rule_id)
+    apply_pending_hits([rule])
     
     # Get recent executions
     recent_executions = RuleExecution.objects.filter(rule=rule).order_by('-created_at')[:50]
     
-    # Calculate execution statistics
-    execution_stats = {
-        'total': RuleExecution.objects.filter(rule=rule).count(),
-        'triggered': RuleExecution.objects.filter(rule=rule, triggered=True).count(),
-        'not_triggered': RuleExecution.objects.filter(rule=rule, triggered=False).count(),
-        'avg_execution_time': RuleExecution.objects.filter(rule=rule).aggregate(avg=Avg('execution_time'))['avg'] or 0,
-        'max_execution_time': RuleExecution.objects.filter(rule=rule).aggregate(max=Max('execution_time'))['max'] or 0,
-        'min_execution_time': RuleExecution.objects.filter(rule=rule).aggregate(min=Min('execution_time'))['min'] or 0,
-    }
-    
-    # Calculate trigger rate
-    if execution_stats['total'] > 0:
-        execution_stats['trigger_rate'] = (execution_stats['triggered'] / execution_stats['total']) * 100
-    else:
-        execution_stats['trigger_rate'] = 0
+    # Calculate execution statistics from the rollups, which count every evaluation
+    execution_stats = get_rollup_stats(rule.execution_rollups.all())
     
     # Get rule sets this rule belongs to
     rule_sets = rule.rule_sets.all()
@@ -156,8 +152,21 @@ def rule_create(request):
         applies_to_ecommerce = request.POST.get('applies_to_ecommerce') == 'on'
         applies_to_wallet = request.POST.get('applies_to_wallet') == 'on'
         
-        # Validate the condition
-        is_valid, error_message = compile_rule_condition(condition)
+        # Threshold rules get their condition from the threshold interval
+        try:
+            threshold_field, threshold_min, threshold_max = parse_threshold(
+                request.POST.get('threshold_field'),
+                request.POST.get('threshold_min'),
+                request.POST.get('threshold_max')
+            )
+        except ValueError as e:
+            is_valid, error_message = False, str(e)
+        else:
+            if threshold_field:
+                condition = build_threshold_condition(threshold_field, threshold_min, threshold_max)
+            
+            # Validate the condition
+            is_valid, error_message = compile_rule_condition(condition)
         
         if not is_valid:
             messages.error(request, f"Invalid rule condition: {error_message}")
@@ -165,6 +174,7 @@ def rule_create(request):
             context = {
                 'rule_types': Rule.RULE_TYPE_CHOICES,
                 'action_choices': Rule.ACTION_CHOICES,
+                'threshold_fields': Rule.THRESHOLD_FIELD_CHOICES,
                 'form_data': request.POST,
             }
             return render(request, 'rule_engine/create.html', context)
@@ -194,6 +204,9 @@ def rule_create(request):
             merchant_specific=merchant_specific,
             included_merchants=included_merchants_list,
             excluded_merchants=excluded_merchants_list,
+            threshold_field=threshold_field,
+            threshold_min=threshold_min,
+            threshold_max=threshold_max,
             created_by=request.user.username,
         )
         
@@ -204,6 +217,7 @@ def rule_create(request):
     context = {
         'rule_types': Rule.RULE_TYPE_CHOICES,
         'action_choices': Rule.ACTION_CHOICES,
+        'threshold_fields': Rule.THRESHOLD_FIELD_CHOICES,
     }
     return render(request, 'rule_engine/create.html', context)
 
@@ -229,8 +243,21 @@ def rule_edit(request, rule_id):
         applies_to_ecommerce = request.POST.get('applies_to_ecommerce') == 'on'
         applies_to_wallet = request.POST.get('applies_to_wallet') == 'on'
         
-        # Validate the condition
-        is_valid, error_message = compile_rule_condition(condition)
+        # Threshold rules get their condition from the threshold interval
+        try:
+            threshold_field, threshold_min, threshold_max = parse_threshold(
+                request.POST.get('threshold_field'),
+                request.POST.get('threshold_min'),
+                request.POST.get('threshold_max')
+            )
+        except ValueError as e:
+            is_valid, error_message = False, str(e)
+        else:
+            if threshold_field:
+                condition = build_threshold_condition(threshold_field, threshold_min, threshold_max)
+            
+            # Validate the condition
+            is_valid, error_message = compile_rule_condition(condition)
         
         if not is_valid:
             messages.error(request, f"Invalid rule condition: {error_message}")
@@ -239,6 +266,7 @@ def rule_edit(request, rule_id):
                 'rule': rule,
                 'rule_types': Rule.RULE_TYPE_CHOICES,
                 'action_choices': Rule.ACTION_CHOICES,
+                'threshold_fields': Rule.THRESHOLD_FIELD_CHOICES,
                 'form_data': request.POST,
             }
             return render(request, 'rule_engine/edit.html', context)
@@ -267,6 +295,9 @@ def rule_edit(request, rule_id):
         rule.merchant_specific = merchant_specific
         rule.included_merchants = included_merchants_list
         rule.excluded_merchants = excluded_merchants_list
+        rule.threshold_field = threshold_field
+        rule.threshold_min = threshold_min
+        rule.threshold_max = threshold_max
         rule.last_modified_by = request.user.username
         rule.version += 1
         rule.save()
@@ -279,6 +310,7 @@ def rule_edit(request, rule_id):
         'rule': rule,
         'rule_types': Rule.RULE_TYPE_CHOICES,
         'action_choices': Rule.ACTION_CHOICES,
+        'threshold_fields': Rule.THRESHOLD_FIELD_CHOICES,
     }
     return render(request, 'rule_engine/edit.html', context)
 
@@ -314,6 +346,33 @@ def rule_test(request, rule_id=None):
         # Get the rule condition and test data
         condition = request.POST.get('condition')
         test_data_json = request.POST.get('test_data')
+        simulate_days = request.POST.get('simulate_days')
+        
+        if simulate_days:
+            # Run the condition over historical transactions instead of the sample data
+            try:
+                simulation = simulate_condition(
+                    condition,
+                    days=int(simulate_days),
+                    channels=request.POST.getlist('channels') or None,
+                    exclude_rule_id=rule.id if rule else None
+                )
+            except ValueError as e:
+                return JsonResponse({
+                    'success': False,
+                    'message': str(e)
+                })
+            except Exception as e:
+                logger.error(f"Error simulating rule condition: {str(e)}", exc_info=True)
+                return JsonResponse({
+                    'success': False,
+                    'message': f"Error simulating condition: {str(e)}"
+                })
+            
+            return JsonResponse({
+                'success': True,
+                'simulation': simulation
+            })
         
         try:
             # Parse the test data
@@ -538,11 +597,19 @@ def ruleset_create(request):
         is_active = request.POST.get('is_active') == 'on'
         rule_ids = request.POST.getlist('rules')
         
+        # Parse merchant and MCC assignments (comma-separated values)
+        assigned_merchants = request.POST.get('assigned_merchants', '')
+        assigned_mccs = request.POST.get('assigned_mccs', '')
+        assigned_merchants_list = [m.strip() for m in assigned_merchants.split(',') if m.strip()]
+        assigned_mccs_list = [m.strip() for m in assigned_mccs.split(',') if m.strip()]
+        
         # Create the rule set
         ruleset = RuleSet.objects.create(
             name=name,
             description=description,
             is_active=is_active,
+            assigned_merchants=assigned_merchants_list,
+            assigned_mccs=assigned_mccs_list,
             created_by=request.user.username,
         )
         
@@ -579,10 +646,18 @@ def ruleset_edit(request, ruleset_id):
         is_active = request.POST.get('is_active') == 'on'
         rule_ids = request.POST.getlist('rules')
         
+        # Parse merchant and MCC assignments (comma-separated values)
+        assigned_merchants = request.POST.get('assigned_merchants', '')
+        assigned_mccs = request.POST.get('assigned_mccs', '')
+        assigned_merchants_list = [m.strip() for m in assigned_merchants.split(',') if m.strip()]
+        assigned_mccs_list = [m.strip() for m in assigned_mccs.split(',') if m.strip()]
+        
         # Update the rule set
         ruleset.name = name
         ruleset.description = description
         ruleset.is_active = is_active
+        ruleset.assigned_merchants = assigned_merchants_list
+        ruleset.assigned_mccs = assigned_mccs_list
         ruleset.last_modified_by = request.user.username
         ruleset.save()
         
@@ -663,12 +738,31 @@ def execution_list(request):
     executions = executions.order_by('-created_at')
     
     # Get execution statistics
-    execution_stats = {
-        'total': executions.count(),
-        'triggered': executions.filter(triggered=True).count(),
-        'not_triggered': executions.filter(triggered=False).count(),
-        'avg_execution_time': executions.aggregate(avg=Avg('execution_time'))['avg'] or 0,
-    }
+    if transaction_id:
+        # Rollups are not kept per transaction, so count the stored rows
+        execution_stats = {
+            'total': executions.count(),
+            'triggered': executions.filter(triggered=True).count(),
+            'not_triggered': executions.filter(triggered=False).count(),
+            'avg_execution_time': executions.aggregate(avg=Avg('execution_time'))['avg'] or 0,
+        }
+    else:
+        rollups = RuleExecutionRollup.objects.all()
+        if rule_id:
+            rollups = rollups.filter(rule_id=rule_id)
+        if start_date:
+            rollups = rollups.filter(minute__gte=start_date)
+        if end_date:
+            rollups = rollups.filter(minute__lte=end_date)
+        execution_stats = get_rollup_stats(rollups)
+        
+        # Rollups count triggered executions but time all executions together
+        if triggered:
+            if triggered.lower() == 'true':
+                execution_stats['not_triggered'] = 0
+            else:
+                execution_stats['triggered'] = 0
+            execution_stats['total'] = execution_stats['triggered'] + execution_stats['not_triggered']
     
     # Calculate trigger rates
     if execution_stats['total'] > 0:
@@ -731,51 +825,51 @@ def dashboard(request):
     
     # Get rule statistics
     rules = Rule.objects.all()
+    
+    # Hit counts include the hits not yet written to the rule rows
+    top_triggered = sorted(
+        apply_pending_hits(rules.only('id', 'name', 'hit_count', 'last_triggered', 'rule_type')),
+        key=lambda rule: -rule.hit_count
+    )[:10]
+    
     rule_stats = {
         'total': rules.count(),
         'active': rules.filter(is_active=True).count(),
         'inactive': rules.filter(is_active=False).count(),
         'by_type': list(rules.values('rule_type').annotate(count=Count('id')).order_by('rule_type')),
         'by_action': list(rules.values('action').annotate(count=Count('id')).order_by('action')),
-        'top_triggered': list(rules.order_by('-hit_count')[:10].values('id', 'name', 'hit_count', 'rule_type')),
+        'top_triggered': [
+            {'id': rule.id, 'name': rule.name, 'hit_count': rule.hit_count, 'rule_type': rule.rule_type}
+            for rule in top_triggered
+        ],
     }
     
-    # Get execution statistics
-    executions = RuleExecution.objects.filter(created_at__gte=start_date)
-    execution_stats = {
-        'total': executions.count(),
-        'triggered': executions.filter(triggered=True).count(),
-        'not_triggered': executions.filter(triggered=False).count(),
-        'avg_execution_time': executions.aggregate(avg=Avg('execution_time'))['avg'] or 0,
-    }
+    # Get execution statistics from the rollups
+    rollups = RuleExecutionRollup.objects.filter(minute__gte=start_date)
+    execution_stats = get_rollup_stats(rollups)
     
-    # Calculate trigger rate
-    if execution_stats['total'] > 0:
-        execution_stats['trigger_rate'] = (execution_stats['triggered'] / execution_stats['total']) * 100
-    else:
-        execution_stats['trigger_rate'] = 0
-    
-    # Get daily execution counts for chart
+    # Get daily execution counts for chart, grouped in one query
+    daily_totals = {
+        row['day']: row
+        for row in rollups.annotate(day=TruncDate('minute')).values('day').annotate(
+            count=Sum('evaluations'), triggered=Sum('hits')
+        ).order_by()
+    }
     daily_executions = []
     daily_triggers = []
     
     for i in range(days):
-        day = timezone.now() - timezone.timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        day_executions = executions.filter(created_at__gte=day_start, created_at__lte=day_end)
-        day_count = day_executions.count()
-        day_triggered = day_executions.filter(triggered=True).count()
+        day = timezone.localtime(timezone.now() - timezone.timedelta(days=i)).date()
+        day_totals = daily_totals.get(day, {})
         
         daily_executions.append({
-            'date': day_start.strftime('%Y-%m-%d'),
-            'count': day_count
+            'date': day.strftime('%Y-%m-%d'),
+            'count': day_totals.get('count') or 0
         })
         
         daily_triggers.append({
-            'date': day_start.strftime('%Y-%m-%d'),
-            'count': day_triggered
+            'date': day.strftime('%Y-%m-%d'),
+            'count': day_totals.get('triggered') or 0
         })
     
     # Reverse the lists to show oldest to newest
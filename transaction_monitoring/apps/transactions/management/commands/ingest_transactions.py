@@ -0,0 +1,186 @@
+"""
+Management command to stream a large transaction file into the database.
+"""
+
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.fraud_engine.services.routing_service import get_scoring_queues
+from apps.transactions.services.ingestion_service import ROW_STATUS_CREATED, ingest_transactions, parse_ndjson
+
+# CSV columns holding JSON documents
+JSON_COLUMNS = (
+    'location_data',
+    'payment_method_data',
+    'metadata',
+    'shipping_address',
+    'billing_address',
+    'browser_info',
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON transaction file into the database in constant memory'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file to ingest')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rows inserted per chunk (default: 1000)')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file to resume from (default: <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore any existing checkpoint and start from the beginning')
+        parser.add_argument('--no-score', action='store_true',
+                            help='Insert the transactions without queueing them for fraud detection')
+        parser.add_argument('--queue', nargs='+', dest='queues',
+                            help='Celery queues watched for backpressure (default: every scoring queue)')
+        parser.add_argument('--max-queue-depth', type=int, default=settings.TRANSACTION_INGEST_MAX_QUEUE_DEPTH,
+                            help='Pause reading while the queues hold more messages than this in total')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"File not found: {path}")
+        
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        chunk_size = options['chunk_size']
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        score = not options['no_score']
+        # Ingested transactions go to whichever scoring queue their route picks
+        queues = options['queues'] or get_scoring_queues()
+        
+        checkpoint = {'offset': 0, 'rows': 0, 'created': 0, 'failed': 0}
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint_file:
+                checkpoint.update(json.load(checkpoint_file))
+            self.stdout.write(f"Resuming {path} from byte {checkpoint['offset']} ({checkpoint['rows']} rows done)")
+        
+        file_size = os.path.getsize(path)
+        broker = redis.from_url(settings.CELERY_BROKER_URL) if score else None
+        start_time = time.time()
+        rows_this_run = 0
+        
+        with open(path, 'rb') as stream:
+            rows = self.read_rows(stream, file_format, checkpoint['offset'])
+            
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                
+                if broker is not None:
+                    self.wait_for_queues(broker, queues, options['max_queue_depth'])
+                
+                statuses = ingest_transactions([row for row, offset in chunk], score=score)
+                created = sum(1 for status in statuses if status['status'] == ROW_STATUS_CREATED)
+                
+                # Only move the checkpoint once the chunk is committed. Rows of a
+                # chunk that is replayed after a crash are reported as duplicates.
+                checkpoint['offset'] = chunk[-1][1]
+                checkpoint['rows'] += len(chunk)
+                checkpoint['created'] += created
+                checkpoint['failed'] += len(chunk) - created
+                self.write_checkpoint(checkpoint_path, checkpoint)
+                
+                rows_this_run += len(chunk)
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f"{checkpoint['rows']} rows ({checkpoint['created']} created, {checkpoint['failed']} failed), "
+                    f"{checkpoint['offset'] / max(file_size, 1) * 100:.1f}% of file, "
+                    f"{rows_this_run / max(elapsed, 0.001):.0f} rows/s"
+                )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {path}: {checkpoint['created']} created, {checkpoint['failed']} failed "
+            f"in {time.time() - start_time:.1f}s"
+        ))
+    
+    def read_rows(self, stream, file_format, offset):
+        """
+        Read rows from the file one line at a time, starting at a byte offset.
+        
+        Yields:
+            (row, offset) tuples, where offset is the byte offset after the row
+        """
+        header = None
+        if file_format == 'csv':
+            header = next(csv.reader([stream.readline().decode('utf-8-sig')]), None)
+            if not header:
+                return
+        if offset > stream.tell():
+            stream.seek(offset)
+        
+        for line, end_offset in self.read_lines(stream):
+            if file_format == 'csv':
+                row = self.parse_csv_line(header, line)
+            else:
+                row = next(parse_ndjson([line]), None)
+            if row is not None:
+                yield row, end_offset
+    
+    def read_lines(self, stream):
+        """Yield (line, offset after the line) for each line of the file."""
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            yield line, stream.tell()
+    
+    def parse_csv_line(self, header, line):
+        """Parse a CSV line into a transaction dict, or None for blank lines."""
+        try:
+            values = next(csv.reader([line.decode('utf-8')]), None)
+        except (ValueError, csv.Error) as e:
+            return e
+        if not values:
+            return None
+        
+        row = {}
+        for column, value in zip(header, values):
+            # Leave empty columns out so model defaults apply
+            if value == '':
+                continue
+            if column in JSON_COLUMNS:
+                try:
+                    value = json.loads(value)
+                except ValueError as e:
+                    return e
+            row[column] = value
+        return row
+    
+    def wait_for_queues(self, broker, queues, max_depth):
+        """Pause while the Celery queues hold more than max_depth messages in total."""
+        names = ', '.join(queues)
+        paused = False
+        while True:
+            try:
+                depth = sum(broker.llen(queue) for queue in queues)
+            except redis.RedisError as e:
+                self.stderr.write(f"Could not read depth of queues {names}, not applying backpressure: {str(e)}")
+                return
+            
+            if depth <= max_depth:
+                if paused:
+                    self.stdout.write(f"Queues {names} are down to {depth} messages, resuming")
+                return
+            
+            if not paused:
+                self.stdout.write(f"Queues {names} hold {depth} messages, pausing")
+                paused = True
+            time.sleep(1)
+    
+    def write_checkpoint(self, checkpoint_path, checkpoint):
+        """Write the checkpoint atomically so a crash never leaves it half written."""
+        temp_path = f"{checkpoint_path}.tmp"
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temp_path, checkpoint_path)
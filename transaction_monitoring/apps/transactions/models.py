@@ -223,6 +223,15 @@ class Transaction(BaseTransaction):
         """
         Override save method to process sensitive data before saving and set additional flags.
         """
+        self.prepare_for_save()
+        super().save(*args, **kwargs)
+    
+    def prepare_for_save(self):
+        """
+        Hash sensitive payment data and set the derived risk flags.
+        
+        Called by save(), and by bulk inserts which bypass save().
+        """
         # Process payment method data to hash sensitive information
         if self.payment_method_data and isinstance(self.payment_method_data, dict):
             payment_method = self.payment_method_data.get('type')
@@ -269,8 +278,6 @@ class Transaction(BaseTransaction):
                 (user_country in high_risk_countries) or 
                 (merchant_country in high_risk_countries)
             )
-        
-        super().save(*args, **kwargs)
     
     def get_transaction_details(self):
         """
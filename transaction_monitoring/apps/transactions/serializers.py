@@ -150,4 +150,37 @@ class WalletTransactionSerializer(serializers.ModelSerializer):
             'risk_score',
             'is_flagged',
             'flag_reason',
-        ]
\ No newline at end of file
+        ]
+
+
+class BulkPOSTransactionSerializer(POSTransactionSerializer):
+    """Serializer for POS transactions in bulk ingestion."""
+    
+    class Meta(POSTransactionSerializer.Meta):
+        # Uniqueness is checked once per batch instead of once per row
+        extra_kwargs = {
+            **getattr(POSTransactionSerializer.Meta, 'extra_kwargs', {}),
+            'transaction_id': {'validators': []},
+        }
+
+
+class BulkEcommerceTransactionSerializer(EcommerceTransactionSerializer):
+    """Serializer for E-commerce transactions in bulk ingestion."""
+    
+    class Meta(EcommerceTransactionSerializer.Meta):
+        # Uniqueness is checked once per batch instead of once per row
+        extra_kwargs = {
+            **getattr(EcommerceTransactionSerializer.Meta, 'extra_kwargs', {}),
+            'transaction_id': {'validators': []},
+        }
+
+
+class BulkWalletTransactionSerializer(WalletTransactionSerializer):
+    """Serializer for Wallet transactions in bulk ingestion."""
+    
+    class Meta(WalletTransactionSerializer.Meta):
+        # Uniqueness is checked once per batch instead of once per row
+        extra_kwargs = {
+            **getattr(WalletTransactionSerializer.Meta, 'extra_kwargs', {}),
+            'transaction_id': {'validators': []},
+        }
@@ -0,0 +1,295 @@
+"""
+Duplicate transaction detection service.
+
+Upstream processors retry submissions, so the same transaction ID can arrive
+several times. This service recognises duplicates before any serializer or
+ORM work is done, and keeps the decision made for each transaction in an
+idempotency cache so a duplicate can be answered with the stored decision
+instead of being scored again.
+
+Duplicates are checked in three tiers:
+
+1. An in-process Bloom filter of the IDs this process has accepted.
+2. The shared idempotency cache, holding recent IDs across all processes.
+3. The database, for IDs the cache no longer holds.
+
+The unique constraint on ``transaction_id`` remains the final guard.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from ..models import Transaction
+
+logger = logging.getLogger(__name__)
+
+
+# Marker stored for accepted transactions that have not been scored yet
+PENDING_DECISION = {'status': 'pending'}
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+    
+    ``might_contain`` never returns False for an added item. It returns True
+    for an item that was not added with a probability of about
+    ``error_rate`` once ``capacity`` items have been added.
+    """
+    
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item: str):
+        # Double hashing derives all positions from one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.size
+    
+    def add(self, item: str):
+        """
+        Add an item to the filter.
+        
+        Args:
+            item: The item to add
+        """
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def might_contain(self, item: str) -> bool:
+        """
+        Check whether an item may have been added.
+        
+        Args:
+            item: The item to check
+        
+        Returns:
+            False if the item was definitely not added
+        """
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class DuplicateFilter:
+    """
+    Tiered duplicate check for transaction IDs.
+    
+    The Bloom filter is rebuilt empty once it holds ``capacity`` IDs, so its
+    false positive rate stays bounded. IDs it forgets are still found in the
+    idempotency cache or the database.
+    """
+    
+    def __init__(self, capacity: int, error_rate: float, ttl: int):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ttl = ttl
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+    
+    def remember(self, decisions: Dict[str, Optional[Dict[str, Any]]]):
+        """
+        Record accepted transaction IDs, with their decision if already made.
+        
+        Args:
+            decisions: Dictionary of transaction ID to its stored decision,
+                or None if scoring is pending
+        """
+        with self._lock:
+            for transaction_id in decisions:
+                if self._bloom.count >= self.capacity:
+                    self._bloom = BloomFilter(self.capacity, self.error_rate)
+                self._bloom.add(transaction_id)
+        
+        try:
+            # Don't overwrite a decision stored by another process with the pending marker
+            for transaction_id, decision in decisions.items():
+                if decision is None:
+                    cache.add(idempotency_key(transaction_id), PENDING_DECISION, self.ttl)
+            cache.set_many(
+                {
+                    idempotency_key(transaction_id): decision
+                    for transaction_id, decision in decisions.items()
+                    if decision is not None
+                },
+                self.ttl
+            )
+        except Exception as e:
+            logger.warning(f"Error writing idempotency cache: {str(e)}")
+    
+    def find_duplicates(self, transaction_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Find the transaction IDs that were already accepted.
+        
+        Args:
+            transaction_ids: The transaction IDs to check
+        
+        Returns:
+            Dictionary of duplicate transaction ID to its stored decision
+        """
+        transaction_ids = [transaction_id for transaction_id in transaction_ids if transaction_id]
+        if not transaction_ids:
+            return {}
+        
+        with self._lock:
+            seen_locally = {
+                transaction_id for transaction_id in transaction_ids
+                if self._bloom.might_contain(transaction_id)
+            }
+        
+        # Shared tier, one round trip for all IDs
+        try:
+            cached = cache.get_many([idempotency_key(transaction_id) for transaction_id in transaction_ids])
+        except Exception as e:
+            logger.warning(f"Error reading idempotency cache: {str(e)}")
+            cached = {}
+        
+        duplicates = {}
+        unresolved = set()
+        for transaction_id in transaction_ids:
+            decision = cached.get(idempotency_key(transaction_id))
+            if decision is not None:
+                duplicates[transaction_id] = decision
+            elif transaction_id in seen_locally:
+                unresolved.add(transaction_id)
+        
+        # IDs the Bloom filter has seen but the cache has lost are confirmed
+        # against the database, which also provides their decision
+        if unresolved:
+            duplicates.update(load_stored_decisions(unresolved))
+        
+        return duplicates
+
+
+def idempotency_key(transaction_id: str) -> str:
+    """
+    Get the cache key holding the decision for a transaction.
+    
+    Args:
+        transaction_id: The transaction ID
+    
+    Returns:
+        The cache key
+    """
+    return f"idempotency:{transaction_id}"
+
+
+def decision_summary(transaction, decision: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the stored decision for a transaction.
+    
+    Args:
+        transaction: The scored transaction
+        decision: The fraud decision, if known
+    
+    Returns:
+        Dictionary with the decision and the resulting transaction status
+    """
+    return {
+        'status': transaction.status,
+        'decision': decision,
+        'risk_score': float(transaction.risk_score) if transaction.risk_score is not None else None,
+        'is_flagged': transaction.is_flagged,
+        'flag_reason': transaction.flag_reason,
+    }
+
+
+def load_stored_decisions(transaction_ids: Set[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the stored decisions of existing transactions from the database.
+    
+    Args:
+        transaction_ids: The transaction IDs to look up
+    
+    Returns:
+        Dictionary of existing transaction ID to its stored decision
+    """
+    # Import here to avoid circular imports
+    from apps.fraud_engine.models import FraudDetectionResult
+    
+    transactions = Transaction.objects.filter(transaction_id__in=transaction_ids).only(
+        'transaction_id', 'status', 'risk_score', 'is_flagged', 'flag_reason'
+    )
+    decisions = dict(
+        FraudDetectionResult.objects.filter(transaction_id__in=transaction_ids)
+        .order_by('created_at')
+        .values_list('transaction_id', 'decision')
+    )
+    return {
+        transaction.transaction_id: decision_summary(transaction, decisions.get(transaction.transaction_id))
+        for transaction in transactions
+    }
+
+
+_duplicate_filter = None
+_duplicate_filter_lock = threading.Lock()
+
+
+def get_duplicate_filter() -> DuplicateFilter:
+    """
+    Get the process-wide duplicate filter.
+    
+    Returns:
+        The DuplicateFilter instance
+    """
+    global _duplicate_filter
+    
+    if _duplicate_filter is None:
+        with _duplicate_filter_lock:
+            if _duplicate_filter is None:
+                _duplicate_filter = DuplicateFilter(
+                    capacity=settings.TRANSACTION_DEDUP_BLOOM_CAPACITY,
+                    error_rate=settings.TRANSACTION_DEDUP_BLOOM_ERROR_RATE,
+                    ttl=settings.TRANSACTION_IDEMPOTENCY_TTL,
+                )
+    
+    return _duplicate_filter
+
+
+def find_duplicate(transaction_id: Optional[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Check whether a transaction ID was already accepted.
+    
+    Args:
+        transaction_id: The submitted transaction ID, if any
+    
+    Returns:
+        The stored decision of the earlier submission, or None if it is new
+    """
+    if transaction_id is None or transaction_id == '':
+        return None
+    transaction_id = str(transaction_id)
+    return get_duplicate_filter().find_duplicates([transaction_id]).get(transaction_id)
+
+
+def remember_transactions(transaction_ids: Iterable[str]):
+    """
+    Record newly accepted transaction IDs before they are scored.
+    
+    Args:
+        transaction_ids: The accepted transaction IDs
+    """
+    get_duplicate_filter().remember({transaction_id: None for transaction_id in transaction_ids})
+
+
+def remember_decisions(scored: Iterable[Tuple[Any, Optional[str]]]):
+    """
+    Store the decisions of scored transactions in the idempotency cache.
+    
+    Args:
+        scored: Iterable of (transaction, fraud decision) pairs
+    """
+    get_duplicate_filter().remember({
+        transaction.transaction_id: decision_summary(transaction, decision)
+        for transaction, decision in scored
+    })
@@ -0,0 +1,235 @@
+"""
+Bulk ingestion service for transactions.
+
+This service validates batches of transaction rows, inserts them with
+multi-row INSERTs and queues them for batched fraud detection. It is used for
+settlement files and replays, where creating transactions one by one would
+pay the serializer, signal and scoring costs per row.
+"""
+
+import json
+import logging
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+from django.db import connections, router, transaction as db_transaction
+from django.utils import timezone
+from apps.core.utils import generate_transaction_id
+from ..models import Transaction, POSTransaction, EcommerceTransaction, WalletTransaction
+from .dedup_service import get_duplicate_filter, remember_transactions
+from ..serializers import (
+    BulkPOSTransactionSerializer,
+    BulkEcommerceTransactionSerializer,
+    BulkWalletTransactionSerializer
+)
+
+logger = logging.getLogger(__name__)
+
+
+CHANNEL_SERIALIZERS = {
+    'pos': BulkPOSTransactionSerializer,
+    'ecommerce': BulkEcommerceTransactionSerializer,
+    'wallet': BulkWalletTransactionSerializer,
+}
+
+# Per-row ingestion statuses
+ROW_STATUS_CREATED = 'created'
+ROW_STATUS_INVALID = 'invalid'
+ROW_STATUS_DUPLICATE = 'duplicate'
+
+
+def ingest_transactions(rows: List[Any], score: bool = True) -> List[Dict[str, Any]]:
+    """
+    Validate, insert and queue a batch of transaction rows.
+    
+    Args:
+        rows: List of transaction dicts. Rows may also be exceptions raised
+            while parsing them, which are reported as invalid.
+        score: Whether to queue the created transactions for fraud detection
+    
+    Returns:
+        List with one status dict per row, in input order
+    """
+    transactions, statuses = validate_transaction_rows(rows)
+    
+    if transactions:
+        bulk_insert_transactions(transactions)
+        
+        # Remember the IDs once the rows are committed, so a rolled back ingest can be resubmitted
+        transaction_ids = [transaction.transaction_id for transaction in transactions]
+        db_transaction.on_commit(lambda: remember_transactions(transaction_ids))
+        
+        if score:
+            # Import here to avoid circular imports
+            from apps.fraud_engine.services.scoring_service import enqueue_scoring_on_commit
+            
+            # Queue once the rows are committed, so workers can load them
+            enqueue_scoring_on_commit(transactions)
+    
+    return statuses
+
+
+def parse_ndjson(lines: Iterable) -> Iterator[Any]:
+    """
+    Parse newline-delimited JSON, one row per non-empty line.
+    
+    Args:
+        lines: Iterable of str or bytes lines
+    
+    Yields:
+        The parsed row, or the ValueError for a line that is not valid JSON
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Includes undecodable bytes
+            yield e
+
+
+def validate_transaction_rows(rows: List[Any]) -> Tuple[List[Transaction], List[Dict[str, Any]]]:
+    """
+    Validate transaction rows and build unsaved transaction objects.
+    
+    Resubmitted transaction IDs are recognised by the duplicate filter before
+    their rows are validated, and are reported with their stored decision.
+    The remaining IDs are checked for uniqueness with one query for the whole
+    batch, and against the other rows of the batch.
+    
+    Args:
+        rows: List of transaction dicts or parse exceptions
+    
+    Returns:
+        Tuple of (unsaved transactions, per-row status dicts)
+    """
+    statuses = []
+    candidates = []
+    
+    for index, row in enumerate(rows):
+        status = {'index': index, 'transaction_id': None, 'status': ROW_STATUS_INVALID}
+        statuses.append(status)
+        
+        if isinstance(row, Exception):
+            status['errors'] = {'non_field_errors': [f'Invalid row: {str(row)}']}
+            continue
+        if not isinstance(row, dict):
+            status['errors'] = {'non_field_errors': ['Row must be a JSON object']}
+            continue
+        
+        row = dict(row)
+        row.setdefault('transaction_id', generate_transaction_id())
+        row.setdefault('timestamp', timezone.now().isoformat())
+        status['transaction_id'] = row['transaction_id']
+        candidates.append((status, row))
+    
+    # Skip validation of known resubmissions
+    duplicates = get_duplicate_filter().find_duplicates(
+        row['transaction_id'] for status, row in candidates
+        if isinstance(row['transaction_id'], str)
+    )
+    
+    valid = []
+    for status, row in candidates:
+        if row['transaction_id'] in duplicates:
+            mark_duplicate(status, duplicates[row['transaction_id']])
+            continue
+        
+        serializer_class = CHANNEL_SERIALIZERS.get(row.get('channel'))
+        if serializer_class is None:
+            status['errors'] = {
+                'channel': [f"Invalid channel: {row.get('channel')}. Must be one of: pos, ecommerce, wallet"]
+            }
+            continue
+        
+        serializer = serializer_class(data=row)
+        if not serializer.is_valid():
+            status['errors'] = serializer.errors
+            continue
+        
+        valid.append((status, serializer.Meta.model(**serializer.validated_data)))
+    
+    # Check uniqueness for the whole batch at once
+    transaction_ids = [transaction.transaction_id for status, transaction in valid]
+    existing_ids = set(
+        Transaction.objects.filter(transaction_id__in=transaction_ids).values_list('transaction_id', flat=True)
+    )
+    
+    transactions = []
+    seen_ids = set()
+    for status, transaction in valid:
+        if transaction.transaction_id in existing_ids or transaction.transaction_id in seen_ids:
+            mark_duplicate(status)
+            continue
+        
+        seen_ids.add(transaction.transaction_id)
+        status['status'] = ROW_STATUS_CREATED
+        transactions.append(transaction)
+    
+    return transactions, statuses
+
+
+def mark_duplicate(status: Dict[str, Any], stored_decision: Optional[Dict[str, Any]] = None):
+    """
+    Mark a row status as a duplicate submission.
+    
+    Args:
+        status: The row status dict
+        stored_decision: The decision stored for the earlier submission, if known
+    """
+    status['status'] = ROW_STATUS_DUPLICATE
+    status['errors'] = {'transaction_id': ['Transaction with this Transaction ID already exists.']}
+    if stored_decision is not None:
+        status['stored_decision'] = stored_decision
+
+
+def bulk_insert_transactions(transactions: List[Transaction]):
+    """
+    Insert channel transactions with multi-row INSERTs.
+    
+    Django's bulk_create does not support multi-table inheritance, so the
+    parent Transaction rows are bulk created first and the child rows of each
+    channel model are then inserted with the parent keys. post_save is not
+    sent for the inserted transactions.
+    
+    Args:
+        transactions: Unsaved POSTransaction, EcommerceTransaction and
+            WalletTransaction objects
+    """
+    for transaction in transactions:
+        transaction.prepare_for_save()
+    
+    using = router.db_for_write(Transaction)
+    with db_transaction.atomic(using=using):
+        # Parent rows for all channels in one go
+        Transaction.objects.using(using).bulk_create(transactions)
+        
+        # Backends that can't return keys from bulk inserts need a lookup
+        missing = [transaction for transaction in transactions if transaction.id is None]
+        if missing:
+            ids = dict(
+                Transaction.objects.using(using).filter(
+                    transaction_id__in=[transaction.transaction_id for transaction in missing]
+                ).values_list('transaction_id', 'id')
+            )
+            for transaction in missing:
+                transaction.id = ids[transaction.transaction_id]
+        
+        # Child rows per channel model
+        for model in (POSTransaction, EcommerceTransaction, WalletTransaction):
+            children = [transaction for transaction in transactions if type(transaction) is model]
+            if not children:
+                continue
+            
+            for child in children:
+                child.transaction_ptr_id = child.id
+                child._state.adding = False
+                child._state.db = using
+            
+            fields = model._meta.local_concrete_fields
+            batch_size = max(connections[using].ops.bulk_batch_size(fields, children), 1)
+            for start in range(0, len(children), batch_size):
+                model._base_manager.using(using)._insert(
+                    children[start:start + batch_size], fields=fields, using=using
+                )
+    
+    logger.info(f"Bulk inserted {len(transactions)} transactions")
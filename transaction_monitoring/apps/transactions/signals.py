@@ -16,21 +16,25 @@ def transaction_post_save(sender, instance, created, **kwargs):
     """
     Signal handler for transaction post-save.
     
-    This will trigger fraud detection processes when a transaction is created.
+    This will queue fraud detection for a new transaction once the database
+    transaction creating it commits, unless the code creating it scores the
+    transaction itself.
     """
     if created:
         # Import here to avoid circular imports
-        from apps.fraud_engine.tasks import process_transaction
+        from apps.fraud_engine.services.scoring_service import (
+            enqueue_scoring_on_commit,
+            is_post_save_scoring_suppressed
+        )
+        
+        if is_post_save_scoring_suppressed():
+            return
         
         # Queue the transaction for fraud detection processing using Celery
         try:
-            process_transaction.delay(
-                transaction_id=instance.transaction_id,
-                transaction_type=instance.transaction_type,
-                channel=instance.channel
-            )
+            enqueue_scoring_on_commit([instance])
         except Exception as e:
             # Log the error but don't raise it to avoid breaking the transaction creation
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Error queuing transaction {instance.transaction_id} for processing: {str(e)}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Error queuing transaction {instance.transaction_id} for processing: {str(e)}", exc_info=True)
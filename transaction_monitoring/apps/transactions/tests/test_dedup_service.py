@@ -0,0 +1,98 @@
+"""
+Tests for the duplicate transaction detection service.
+"""
+
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from apps.transactions.models import Transaction
+from apps.transactions.services.dedup_service import (
+    BloomFilter,
+    DuplicateFilter,
+    PENDING_DECISION,
+    decision_summary,
+    idempotency_key
+)
+
+
+class BloomFilterTests(TestCase):
+    """Tests for the BloomFilter class."""
+    
+    def test_has_no_false_negatives(self):
+        """Test that every added item is reported as possibly present."""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f'tx_{index}' for index in range(1000)]
+        for item in items:
+            bloom.add(item)
+        
+        self.assertTrue(all(bloom.might_contain(item) for item in items))
+    
+    def test_false_positive_rate_is_bounded(self):
+        """Test that unseen items are rarely reported at capacity."""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for index in range(1000):
+            bloom.add(f'tx_{index}')
+        
+        false_positives = sum(1 for index in range(10000) if bloom.might_contain(f'other_{index}'))
+        
+        self.assertLess(false_positives, 300)
+
+
+class DuplicateFilterTests(TestCase):
+    """Tests for the DuplicateFilter class."""
+    
+    def setUp(self):
+        """Set up an empty cache and filter."""
+        cache.clear()
+        self.duplicate_filter = DuplicateFilter(capacity=100, error_rate=0.01, ttl=60)
+    
+    def create_transaction(self, transaction_id):
+        return Transaction.objects.create(
+            transaction_id=transaction_id,
+            transaction_type='purchase',
+            channel='pos',
+            amount=Decimal('10.00'),
+            currency='USD',
+            user_id='user_1',
+            timestamp=timezone.now(),
+            status='approved',
+            risk_score=Decimal('12.50'),
+        )
+    
+    def test_new_ids_are_not_duplicates(self):
+        """Test that unseen IDs are not reported, without a database query."""
+        with self.assertNumQueries(0):
+            duplicates = self.duplicate_filter.find_duplicates(['tx_new_1', 'tx_new_2'])
+        
+        self.assertEqual(duplicates, {})
+    
+    def test_finds_remembered_decision_in_cache(self):
+        """Test that a remembered decision is returned for a resubmission."""
+        decision = {'status': 'approved', 'decision': 'approve'}
+        self.duplicate_filter.remember({'tx_seen': decision})
+        
+        with self.assertNumQueries(0):
+            duplicates = self.duplicate_filter.find_duplicates(['tx_seen', 'tx_unseen'])
+        
+        self.assertEqual(duplicates, {'tx_seen': decision})
+    
+    def test_pending_marker_does_not_overwrite_decision(self):
+        """Test that remembering an accepted ID keeps an existing decision."""
+        decision = {'status': 'rejected', 'decision': 'reject'}
+        self.duplicate_filter.remember({'tx_decided': decision})
+        self.duplicate_filter.remember({'tx_decided': None, 'tx_pending': None})
+        
+        self.assertEqual(cache.get(idempotency_key('tx_decided')), decision)
+        self.assertEqual(cache.get(idempotency_key('tx_pending')), PENDING_DECISION)
+    
+    def test_falls_back_to_database_when_cache_is_lost(self):
+        """Test that IDs evicted from the cache are confirmed in the database."""
+        transaction = self.create_transaction('tx_stored')
+        self.duplicate_filter.remember({'tx_stored': None, 'tx_rolled_back': None})
+        cache.clear()
+        
+        duplicates = self.duplicate_filter.find_duplicates(['tx_stored', 'tx_rolled_back'])
+        
+        transaction.refresh_from_db()
+        self.assertEqual(duplicates, {'tx_stored': decision_summary(transaction)})
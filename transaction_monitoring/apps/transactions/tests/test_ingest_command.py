@@ -0,0 +1,105 @@
+"""
+Tests for the ingest_transactions management command.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from unittest.mock import MagicMock, patch
+from apps.transactions.models import Transaction, POSTransaction
+from apps.transactions.management.commands.ingest_transactions import Command
+
+
+def pos_row(transaction_id):
+    return {
+        'transaction_id': transaction_id,
+        'transaction_type': 'purchase',
+        'channel': 'pos',
+        'amount': '100.00',
+        'currency': 'USD',
+        'user_id': 'user_1',
+        'timestamp': '2026-10-01T12:00:00Z',
+        'terminal_id': 'term_1',
+        'entry_mode': 'chip',
+        'terminal_type': 'traditional',
+        'attendance': 'attended',
+        'condition': 'card_present',
+    }
+
+
+class IngestTransactionsCommandTests(TestCase):
+    """Tests for the ingest_transactions command."""
+    
+    def setUp(self):
+        """Set up a temporary directory for the files."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def write_file(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as output:
+            output.write('\n'.join(lines) + '\n')
+        return path
+    
+    def ingest(self, path, *args):
+        output = StringIO()
+        call_command('ingest_transactions', path, '--no-score', '--chunk-size', '2', *args, stdout=output)
+        return output.getvalue()
+    
+    def test_ingests_ndjson_in_chunks(self):
+        """Test that an NDJSON file is inserted chunk by chunk with progress."""
+        path = self.write_file('transactions.ndjson', [
+            json.dumps(pos_row(f'tx_file_{index}')) for index in range(5)
+        ] + ['not json'])
+        
+        output = self.ingest(path)
+        
+        self.assertEqual(POSTransaction.objects.count(), 5)
+        self.assertIn('rows/s', output)
+        with open(f'{path}.checkpoint') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(checkpoint['created'], 5)
+        self.assertEqual(checkpoint['failed'], 1)
+        self.assertEqual(checkpoint['offset'], os.path.getsize(path))
+    
+    def test_ingests_csv_with_json_columns(self):
+        """Test that CSV rows are parsed with their JSON columns."""
+        row = pos_row('tx_csv_1')
+        columns = list(row) + ['location_data']
+        values = [row[column] for column in row] + ['"{""country"": ""US""}"']
+        path = self.write_file('transactions.csv', [','.join(columns), ','.join(values)])
+        
+        self.ingest(path)
+        
+        transaction = Transaction.objects.get(transaction_id='tx_csv_1')
+        self.assertEqual(transaction.location_data, {'country': 'US'})
+    
+    def test_resumes_from_checkpoint(self):
+        """Test that a rerun starts after the rows recorded in the checkpoint."""
+        lines = [json.dumps(pos_row(f'tx_resume_{index}')) for index in range(4)]
+        path = self.write_file('transactions.ndjson', lines)
+        with open(f'{path}.checkpoint', 'w') as checkpoint_file:
+            json.dump({'offset': len(lines[0]) + 1, 'rows': 1, 'created': 1, 'failed': 0}, checkpoint_file)
+        
+        output = self.ingest(path)
+        
+        self.assertIn('Resuming', output)
+        self.assertFalse(Transaction.objects.filter(transaction_id='tx_resume_0').exists())
+        self.assertEqual(Transaction.objects.count(), 3)
+    
+    @patch('apps.transactions.management.commands.ingest_transactions.time.sleep')
+    def test_pauses_while_queues_are_deep(self, mock_sleep):
+        """Test that reading pauses until the scoring queues drain below the limit in total."""
+        broker = MagicMock()
+        depths = {'scoring_priority': [50, 8, 4], 'scoring': [0, 6, 5]}
+        broker.llen.side_effect = lambda queue: depths[queue].pop(0)
+        command = Command(stdout=StringIO())
+        
+        command.wait_for_queues(broker, ['scoring_priority', 'scoring'], 10)
+        
+        self.assertEqual(broker.llen.call_count, 6)
+        self.assertEqual(mock_sleep.call_count, 2)
@@ -0,0 +1,144 @@
+"""
+Tests for the bulk transaction ingestion service.
+"""
+
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from apps.core.utils import hash_sensitive_data
+from apps.transactions.models import Transaction, POSTransaction, EcommerceTransaction
+from apps.transactions.services.dedup_service import PENDING_DECISION
+from apps.transactions.services.ingestion_service import ingest_transactions, parse_ndjson
+
+
+@patch('apps.fraud_engine.tasks.process_transaction.apply_async')
+@patch('apps.fraud_engine.tasks.process_transaction_batch.apply_async')
+class IngestTransactionsTests(TestCase):
+    """Tests for ingest_transactions function."""
+    
+    def setUp(self):
+        """Set up an empty idempotency cache."""
+        cache.clear()
+    
+    def pos_row(self, transaction_id, **kwargs):
+        row = {
+            'transaction_id': transaction_id,
+            'transaction_type': 'purchase',
+            'channel': 'pos',
+            'amount': '100.00',
+            'currency': 'USD',
+            'user_id': 'user_1',
+            'merchant_id': 'merchant_1',
+            'timestamp': timezone.now().isoformat(),
+            'terminal_id': 'term_1',
+            'entry_mode': 'chip',
+            'terminal_type': 'traditional',
+            'attendance': 'attended',
+            'condition': 'card_present',
+        }
+        row.update(kwargs)
+        return row
+    
+    def ecommerce_row(self, transaction_id):
+        return {
+            'transaction_id': transaction_id,
+            'transaction_type': 'purchase',
+            'channel': 'ecommerce',
+            'amount': '250.00',
+            'currency': 'USD',
+            'user_id': 'user_2',
+            'timestamp': timezone.now().isoformat(),
+            'payment_method_data': {
+                'type': 'credit_card',
+                'card_details': {'card_number': '4111111111111111'},
+            },
+        }
+    
+    def test_inserts_channel_transactions(self, mock_batch_delay, mock_delay):
+        """Test that rows of every channel are inserted with their subtype fields."""
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ingest_transactions([
+                self.pos_row('tx_bulk_1'),
+                self.ecommerce_row('tx_bulk_2'),
+                self.pos_row('tx_bulk_3', terminal_id='term_3'),
+            ])
+        
+        self.assertEqual([result['status'] for result in results], ['created'] * 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(POSTransaction.objects.get(transaction_id='tx_bulk_3').terminal_id, 'term_3')
+        
+        ecommerce = EcommerceTransaction.objects.get(transaction_id='tx_bulk_2')
+        card_details = ecommerce.payment_method_data['card_details']
+        self.assertEqual(card_details['card_number'], hash_sensitive_data('4111111111111111'))
+        
+        # Scoring is queued in batches, not per transaction, one per scoring queue
+        mock_delay.assert_not_called()
+        batches = {
+            call.kwargs['queue']: [item['transaction_id'] for item in call.kwargs['args'][0]]
+            for call in mock_batch_delay.call_args_list
+        }
+        self.assertEqual(batches, {
+            'scoring_priority': ['tx_bulk_1', 'tx_bulk_3'],
+            'scoring': ['tx_bulk_2'],
+        })
+    
+    def test_reports_invalid_and_duplicate_rows(self, mock_batch_delay, mock_delay):
+        """Test that bad rows are reported per row without blocking the others."""
+        ingest_transactions([self.pos_row('tx_bulk_existing')])
+        
+        results = ingest_transactions([
+            self.pos_row('tx_bulk_existing'),
+            self.pos_row('tx_bulk_new'),
+            self.pos_row('tx_bulk_new'),
+            self.pos_row('tx_bulk_bad', amount='lots'),
+            {'transaction_id': 'tx_bulk_channel', 'channel': 'fax'},
+            ValueError('Expecting value'),
+        ])
+        
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['duplicate', 'created', 'duplicate', 'invalid', 'invalid', 'invalid']
+        )
+        self.assertIn('amount', results[3]['errors'])
+        self.assertIn('channel', results[4]['errors'])
+        self.assertEqual(Transaction.objects.count(), 2)
+    
+    def test_resubmission_reports_stored_decision(self, mock_batch_delay, mock_delay):
+        """Test that a resubmitted row is answered from the idempotency cache."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_transactions([self.pos_row('tx_bulk_retry')])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ingest_transactions([self.pos_row('tx_bulk_retry')])
+        
+        self.assertEqual(results[0]['status'], 'duplicate')
+        self.assertEqual(results[0]['stored_decision'], PENDING_DECISION)
+        # The single created transaction is queued once, through the shared scoring hook
+        self.assertEqual(mock_delay.call_count, 1)
+        mock_batch_delay.assert_not_called()
+    
+    def test_rolled_back_ingest_is_not_remembered(self, mock_batch_delay, mock_delay):
+        """Test that IDs of a rolled back ingest are not reported as duplicates later."""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with db_transaction.atomic():
+                    ingest_transactions([self.pos_row('tx_bulk_rollback')])
+                    raise RuntimeError('ingest aborted')
+            except RuntimeError:
+                pass
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ingest_transactions([self.pos_row('tx_bulk_rollback')])
+        
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertTrue(Transaction.objects.filter(transaction_id='tx_bulk_rollback').exists())
+    
+    def test_parse_ndjson(self, mock_batch_delay, mock_delay):
+        """Test that NDJSON lines are parsed one row per line."""
+        rows = list(parse_ndjson([b'{"transaction_id": "tx_1"}', b'', b'not json']))
+        
+        self.assertEqual(rows[0], {'transaction_id': 'tx_1'})
+        self.assertIsInstance(rows[1], ValueError)
+        self.assertEqual(len(rows), 2)
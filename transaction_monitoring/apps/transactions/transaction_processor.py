@@ -1,49 +1,103 @@
 """
-Transaction processor module for handling transaction creation without Celery.
+Transaction processor module for handling transaction creation from forms.
 """
 
 from django.utils import timezone
 from apps.core.utils import generate_transaction_id
 from apps.transactions.models import POSTransaction, EcommerceTransaction, WalletTransaction
-from apps.fraud_engine.tasks import process_transaction
+
+
+def build_location_data(form_data):
+    """
+    Build the location data of a transaction from form data.
+    
+    Args:
+        form_data: Cleaned form data from TransactionCreateForm
+    
+    Returns:
+        The location data dict
+    """
+    location_data = {}
+    if form_data.get('location_city'):
+        location_data['city'] = form_data.get('location_city')
+    if form_data.get('location_country'):
+        location_data['country'] = form_data.get('location_country')
+    if form_data.get('location_postal_code'):
+        location_data['postal_code'] = form_data.get('location_postal_code')
+    if form_data.get('location_latitude') and form_data.get('location_longitude'):
+        location_data['latitude'] = float(form_data.get('location_latitude'))
+        location_data['longitude'] = float(form_data.get('location_longitude'))
+    return location_data
+
+
+def build_payment_method_data(form_data, include_card_details=True):
+    """
+    Build the payment method data of a transaction from form data.
+    
+    Args:
+        form_data: Cleaned form data from TransactionCreateForm
+        include_card_details: Whether to add the card details of card payments
+    
+    Returns:
+        The payment method data dict
+    """
+    payment_method_data = {
+        'type': form_data.get('payment_method_type', '')
+    }
+    
+    if include_card_details and form_data.get('payment_method_type') in ['credit_card', 'debit_card']:
+        payment_method_data['card_details'] = {
+            'card_number': form_data.get('card_number', ''),
+            'expiry_date': form_data.get('card_expiry', ''),
+            'cvv': form_data.get('card_cvv', ''),
+            'cardholder_name': form_data.get('cardholder_name', '')
+        }
+    return payment_method_data
 
 
 def create_transaction(form_data):
     """
     Create a transaction based on form data.
     
+    The transaction is inserted with all of its fields in a single write.
+    Fraud detection is queued by the transaction post_save signal once the
+    write commits.
+    
     Args:
         form_data: Cleaned form data from TransactionCreateForm
         
     Returns:
         The created transaction object
     """
-    # Get form data
-    transaction_type = form_data.get('transaction_type')
     channel = form_data.get('channel')
-    amount = form_data.get('amount')
-    currency = form_data.get('currency')
-    user_id = form_data.get('user_id')
-    merchant_id = form_data.get('merchant_id', '')
-    device_id = form_data.get('device_id', '')
     
-    # Generate transaction ID
-    transaction_id = generate_transaction_id()
+    # Create metadata
+    metadata = {}
+    if form_data.get('metadata_notes'):
+        metadata['notes'] = form_data.get('metadata_notes')
+    
+    # Fields shared by every channel
+    common_fields = {
+        'transaction_id': generate_transaction_id(),
+        'transaction_type': form_data.get('transaction_type'),
+        'channel': channel,
+        'amount': form_data.get('amount'),
+        'currency': form_data.get('currency'),
+        'user_id': form_data.get('user_id'),
+        'timestamp': timezone.now(),
+        'merchant_id': form_data.get('merchant_id', ''),
+        'device_id': form_data.get('device_id', ''),
+        'status': 'pending',
+        'location_data': build_location_data(form_data),
+        'metadata': metadata,
+    }
     
     # Create transaction based on channel
     if channel == 'pos':
         # Create POS Transaction
         transaction = POSTransaction.objects.create(
-            transaction_id=transaction_id,
-            transaction_type=transaction_type,
-            channel=channel,
-            amount=amount,
-            currency=currency,
-            user_id=user_id,
-            timestamp=timezone.now(),
-            merchant_id=merchant_id,
-            device_id=device_id,
-            status='pending',
+            **common_fields,
+            payment_method_data=build_payment_method_data(form_data),
             terminal_id=form_data.get('terminal_id', ''),
             entry_mode=form_data.get('entry_mode', ''),
             terminal_type=form_data.get('terminal_type', ''),
@@ -51,88 +105,7 @@ def create_transaction(form_data):
             condition=form_data.get('condition', ''),
         )
         
-        # Create location data
-        location_data = {}
-        if form_data.get('location_city'):
-            location_data['city'] = form_data.get('location_city')
-        if form_data.get('location_country'):
-            location_data['country'] = form_data.get('location_country')
-        if form_data.get('location_postal_code'):
-            location_data['postal_code'] = form_data.get('location_postal_code')
-        if form_data.get('location_latitude') and form_data.get('location_longitude'):
-            location_data['latitude'] = float(form_data.get('location_latitude'))
-            location_data['longitude'] = float(form_data.get('location_longitude'))
-        
-        # Create payment method data
-        payment_method_data = {
-            'type': form_data.get('payment_method_type', '')
-        }
-        
-        if form_data.get('payment_method_type') in ['credit_card', 'debit_card']:
-            payment_method_data['card_details'] = {
-                'card_number': form_data.get('card_number', ''),
-                'expiry_date': form_data.get('card_expiry', ''),
-                'cvv': form_data.get('card_cvv', ''),
-                'cardholder_name': form_data.get('cardholder_name', '')
-            }
-        
-        # Create metadata
-        metadata = {}
-        if form_data.get('metadata_notes'):
-            metadata['notes'] = form_data.get('metadata_notes')
-        
-        # Set JSON fields
-        transaction.location_data = location_data
-        transaction.payment_method_data = payment_method_data
-        transaction.metadata = metadata
-        
-        # Save transaction
-        transaction.save()
-        
     elif channel == 'ecommerce':
-        # Create E-commerce Transaction
-        transaction = EcommerceTransaction.objects.create(
-            transaction_id=transaction_id,
-            transaction_type=transaction_type,
-            channel=channel,
-            amount=amount,
-            currency=currency,
-            user_id=user_id,
-            timestamp=timezone.now(),
-            merchant_id=merchant_id,
-            device_id=device_id,
-            status='pending',
-            website_url=form_data.get('website_url', ''),
-            is_3ds_verified=form_data.get('is_3ds_verified', False),
-            device_fingerprint=form_data.get('device_fingerprint', ''),
-            is_billing_shipping_match=form_data.get('billing_same_as_shipping', True),
-        )
-        
-        # Create location data
-        location_data = {}
-        if form_data.get('location_city'):
-            location_data['city'] = form_data.get('location_city')
-        if form_data.get('location_country'):
-            location_data['country'] = form_data.get('location_country')
-        if form_data.get('location_postal_code'):
-            location_data['postal_code'] = form_data.get('location_postal_code')
-        if form_data.get('location_latitude') and form_data.get('location_longitude'):
-            location_data['latitude'] = float(form_data.get('location_latitude'))
-            location_data['longitude'] = float(form_data.get('location_longitude'))
-        
-        # Create payment method data
-        payment_method_data = {
-            'type': form_data.get('payment_method_type', '')
-        }
-        
-        if form_data.get('payment_method_type') in ['credit_card', 'debit_card']:
-            payment_method_data['card_details'] = {
-                'card_number': form_data.get('card_number', ''),
-                'expiry_date': form_data.get('card_expiry', ''),
-                'cvv': form_data.get('card_cvv', ''),
-                'cardholder_name': form_data.get('cardholder_name', '')
-            }
-        
         # Create shipping address
         shipping_address = {
             'street': form_data.get('shipping_street', ''),
@@ -154,34 +127,23 @@ def create_transaction(form_data):
                 'country': form_data.get('billing_country', '')
             }
         
-        # Create metadata
-        metadata = {}
-        if form_data.get('metadata_notes'):
-            metadata['notes'] = form_data.get('metadata_notes')
-        
-        # Set JSON fields
-        transaction.location_data = location_data
-        transaction.payment_method_data = payment_method_data
-        transaction.shipping_address = shipping_address
-        transaction.billing_address = billing_address
-        transaction.metadata = metadata
-        
-        # Save transaction
-        transaction.save()
+        # Create E-commerce Transaction
+        transaction = EcommerceTransaction.objects.create(
+            **common_fields,
+            payment_method_data=build_payment_method_data(form_data),
+            website_url=form_data.get('website_url', ''),
+            is_3ds_verified=form_data.get('is_3ds_verified', False),
+            device_fingerprint=form_data.get('device_fingerprint', ''),
+            is_billing_shipping_match=form_data.get('billing_same_as_shipping', True),
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+        )
         
     elif channel == 'wallet':
         # Create Wallet Transaction
         transaction = WalletTransaction.objects.create(
-            transaction_id=transaction_id,
-            transaction_type=transaction_type,
-            channel=channel,
-            amount=amount,
-            currency=currency,
-            user_id=user_id,
-            timestamp=timezone.now(),
-            merchant_id=merchant_id,
-            device_id=device_id,
-            status='pending',
+            **common_fields,
+            payment_method_data=build_payment_method_data(form_data, include_card_details=False),
             wallet_id=form_data.get('wallet_id', ''),
             source_type=form_data.get('source_type', ''),
             destination_type=form_data.get('destination_type', ''),
@@ -191,60 +153,7 @@ def create_transaction(form_data):
             is_internal=form_data.get('is_internal', False),
         )
         
-        # Create location data
-        location_data = {}
-        if form_data.get('location_city'):
-            location_data['city'] = form_data.get('location_city')
-        if form_data.get('location_country'):
-            location_data['country'] = form_data.get('location_country')
-        if form_data.get('location_postal_code'):
-            location_data['postal_code'] = form_data.get('location_postal_code')
-        if form_data.get('location_latitude') and form_data.get('location_longitude'):
-            location_data['latitude'] = float(form_data.get('location_latitude'))
-            location_data['longitude'] = float(form_data.get('location_longitude'))
-        
-        # Create payment method data
-        payment_method_data = {
-            'type': form_data.get('payment_method_type', '')
-        }
-        
-        # Create metadata
-        metadata = {}
-        if form_data.get('metadata_notes'):
-            metadata['notes'] = form_data.get('metadata_notes')
-        
-        # Set JSON fields
-        transaction.location_data = location_data
-        transaction.payment_method_data = payment_method_data
-        transaction.metadata = metadata
-        
-        # Save transaction
-        transaction.save()
-        
     else:
         raise ValueError(f"Invalid channel: {channel}")
     
-    # Process the transaction directly (no Celery)
-    try:
-        # Simulate fraud detection processing
-        import random
-        
-        # Generate a random risk score between 1 and 100
-        risk_score = random.randint(1, 100)
-        
-        # Update transaction with results
-        transaction.risk_score = risk_score
-        transaction.is_flagged = risk_score > 80  # Flag if risk score is high
-        transaction.save()
-        
-        # Log the processing
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"Transaction {transaction.transaction_id} processed with risk score: {risk_score}")
-    except Exception as e:
-        # Log the error but don't raise it to avoid breaking the transaction creation
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Error processing transaction {transaction.transaction_id}: {str(e)}", exc_info=True)
-    
-    return transaction
\ No newline at end of file
+    return transaction
@@ -148,12 +148,16 @@ def transaction_detail(request, transaction_id):
             pass
     
     # Get fraud detection result
-    from apps.fraud_engine.models import FraudDetectionResult
+    from apps.fraud_engine.models import FraudDetectionResult, TransactionTrace
+    from apps.fraud_engine.services.trace_service import build_waterfall
     try:
         fraud_result = FraudDetectionResult.objects.get(transaction_id=transaction_id)
     except FraudDetectionResult.DoesNotExist:
         fraud_result = None
     
+    # Get the latest stored scoring trace, if the transaction was traced
+    trace = TransactionTrace.objects.filter(transaction_id=transaction_id).first()
+    
     # Handle review form submission
     if request.method == 'POST':
         form = TransactionReviewForm(request.POST)
@@ -184,6 +188,8 @@ def transaction_detail(request, transaction_id):
         'transaction': transaction,
         'form': form,
         'fraud_result': fraud_result,
+        'trace': trace,
+        'trace_spans': build_waterfall(trace) if trace else [],
     }
     
     return render(request, 'transactions/detail.html', context)
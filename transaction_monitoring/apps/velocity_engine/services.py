@@ -9,7 +9,9 @@ from django.utils import timezone
 from django.db import transaction, models
 from django.db.models import F
 from .models import VelocityRule, VelocityCounter, VelocityAlert
+from apps.core.hit_counts import count_hit
 from apps.core.utils import hash_sensitive_data
+from apps.core.scoring_context import get_scoring_context
 from apps.core.constants import (
     TIME_WINDOW_5_MIN,
     TIME_WINDOW_15_MIN,
@@ -23,12 +25,18 @@ from apps.core.constants import (
 logger = logging.getLogger(__name__)
 
 
-def check_velocity(transaction_obj) -> Dict[str, Any]:
+def check_velocity(transaction_obj, rules=None, alert_records=None, context=None) -> Dict[str, Any]:
     """
     Check transaction velocity against rules.
     
     Args:
         transaction_obj: The transaction object
+        rules: Optional list of preloaded active velocity rules. When omitted,
+            the applicable rules are queried from the database.
+        alert_records: Optional list to collect unsaved VelocityAlert objects
+            in. When given, alerts and hit counts are not written and the
+            caller is responsible for persisting them in bulk.
+        context: Optional ScoringContext holding the hashed entity keys
         
     Returns:
         Dictionary with the velocity check result
@@ -44,23 +52,11 @@ def check_velocity(transaction_obj) -> Dict[str, Any]:
         'rules_triggered': 0,
     }
     
-    # Get active velocity rules applicable to this transaction channel
-    channel = transaction_obj.channel
-    rules = VelocityRule.objects.filter(is_active=True)
+    # Get active velocity rules applicable to this transaction
+    rules = get_applicable_velocity_rules(transaction_obj, rules)
     
-    if channel == 'pos':
-        rules = rules.filter(applies_to_pos=True)
-    elif channel == 'ecommerce':
-        rules = rules.filter(applies_to_ecommerce=True)
-    elif channel == 'wallet':
-        rules = rules.filter(applies_to_wallet=True)
-    
-    # Apply amount filters if applicable
-    amount = float(transaction_obj.amount)
-    rules = rules.filter(
-        (models.Q(min_amount__isnull=True) | models.Q(min_amount__lte=amount)) &
-        (models.Q(max_amount__isnull=True) | models.Q(max_amount__gte=amount))
-    )
+    # Entity keys (including the hashed card number) are computed once
+    context = get_scoring_context(transaction_obj, context)
     
     # Track the highest risk score from triggered rules
     max_risk_score = 0.0
@@ -70,7 +66,7 @@ def check_velocity(transaction_obj) -> Dict[str, Any]:
         rule_start_time = time.time()
         
         # Get entity value based on entity type
-        entity_value = get_entity_value(transaction_obj, rule.entity_type)
+        entity_value = context.entity_keys.get(rule.entity_type)
         
         if entity_value:
             # Increment velocity counter
@@ -82,7 +78,7 @@ def check_velocity(transaction_obj) -> Dict[str, Any]:
             # Check if threshold is exceeded
             if count > rule.threshold:
                 # Create alert
-                alert = VelocityAlert.objects.create(
+                alert = VelocityAlert(
                     transaction_id=transaction_obj.transaction_id,
                     rule=rule,
                     entity_type=rule.entity_type,
@@ -91,11 +87,13 @@ def check_velocity(transaction_obj) -> Dict[str, Any]:
                     threshold=rule.threshold,
                     time_window=rule.time_window
                 )
-                
-                # Update rule metrics
-                rule.hit_count += 1
-                rule.last_triggered = timezone.now()
-                rule.save(update_fields=['hit_count', 'last_triggered'])
+                if alert_records is not None:
+                    alert_records.append(alert)
+                else:
+                    alert.save()
+                    
+                    # Update rule metrics
+                    count_hit(rule)
                 
                 # Add to triggered rules
                 result['triggered_rules'].append({
@@ -135,6 +133,47 @@ def check_velocity(transaction_obj) -> Dict[str, Any]:
     return result
 
 
+def get_applicable_velocity_rules(transaction_obj, rules=None):
+    """
+    Get the active velocity rules applicable to a transaction.
+    
+    Args:
+        transaction_obj: The transaction object
+        rules: Optional list of preloaded active velocity rules to filter
+            instead of querying the database
+    
+    Returns:
+        List (or queryset) of applicable velocity rules
+    """
+    channel = transaction_obj.channel
+    channel_flag = {
+        'pos': 'applies_to_pos',
+        'ecommerce': 'applies_to_ecommerce',
+        'wallet': 'applies_to_wallet',
+    }.get(channel)
+    amount = float(transaction_obj.amount)
+    
+    if rules is not None:
+        # Apply the same channel and amount filters to the preloaded rules
+        return [
+            rule for rule in rules
+            if rule.is_active
+            and (not channel_flag or getattr(rule, channel_flag))
+            and (rule.min_amount is None or rule.min_amount <= amount)
+            and (rule.max_amount is None or rule.max_amount >= amount)
+        ]
+    
+    rules = VelocityRule.objects.filter(is_active=True)
+    if channel_flag:
+        rules = rules.filter(**{channel_flag: True})
+    
+    # Apply amount filters if applicable
+    return rules.filter(
+        (models.Q(min_amount__isnull=True) | models.Q(min_amount__lte=amount)) &
+        (models.Q(max_amount__isnull=True) | models.Q(max_amount__gte=amount))
+    )
+
+
 def get_entity_value(transaction_obj, entity_type: str) -> str:
     """
     Get the entity value from a transaction based on entity type.
@@ -61,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.fraud_engine.middleware.ScoringEnqueueMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -236,6 +237,147 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Deep-analysis tasks run on the bulk queue so they never hold up scoring
+CELERY_TASK_ROUTES = {
+    'apps.fraud_engine.tasks.create_fraud_case': {'queue': 'bulk'},
+    'apps.aml.tasks.*': {'queue': 'bulk'},
+}
+# Reserve one message per worker process by default, so queued scoring work
+# is not held by a busy process; bulk workers raise it with --prefetch-multiplier
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Fraud engine settings
+# Queue new transactions for micro-batched scoring instead of one task each
+FRAUD_ENGINE_BATCH_SCORING = False
+# Maximum number of transactions per scoring batch
+FRAUD_ENGINE_BATCH_SIZE = 50
+# Maximum time (ms) a transaction waits for its batch to fill up
+FRAUD_ENGINE_BATCH_MAX_WAIT_MS = 200
+# Run the rule, velocity, ML and AML engines concurrently
+FRAUD_ENGINE_PARALLEL_STAGES = True
+# Size of the thread pool shared by concurrently running engine stages
+FRAUD_ENGINE_STAGE_WORKERS = 8
+# Time budget (ms) for each engine stage when running concurrently
+FRAUD_ENGINE_STAGE_TIMEOUTS_MS = {
+    'rule_engine': 200,
+    'velocity_engine': 200,
+    'ml_engine': 500,
+    'aml_engine': 1000,
+}
+# Default latency budget (ms) for synchronous API scoring, None for unbounded
+FRAUD_ENGINE_LATENCY_BUDGET_MS = None
+# Per-merchant latency budgets (ms), e.g. {'merchant_123': 150}
+FRAUD_ENGINE_MERCHANT_LATENCY_BUDGETS_MS = {}
+# Budget time (ms) that must be left to start SHAP explanations and AML pattern scans
+FRAUD_ENGINE_OPTIONAL_WORK_RESERVE_MS = 20
+# Number of buffered audit rows that triggers a write-behind flush
+FRAUD_ENGINE_AUDIT_BUFFER_SIZE = 500
+# Maximum time (ms) audit rows stay buffered before they are written
+FRAUD_ENGINE_AUDIT_FLUSH_INTERVAL_MS = 1000
+# Maximum number of audit rows kept for retry after failed flushes
+FRAUD_ENGINE_AUDIT_MAX_PENDING = 50000
+# Write audit rows as soon as they are produced instead of in the background
+FRAUD_ENGINE_AUDIT_SYNC_FLUSH = False
+# Default scoring mode of the process-transaction API: 'inline', 'async' or 'inline_fast'
+FRAUD_ENGINE_API_SCORING_MODE = 'inline'
+# Engine stages run for the provisional decision in 'inline_fast' mode
+FRAUD_ENGINE_FAST_STAGES = ('rule_engine', 'velocity_engine')
+# Number of worker processes used by backtests
+FRAUD_ENGINE_BACKTEST_WORKERS = 4
+# Number of transactions loaded and scored per backtest batch
+FRAUD_ENGINE_BACKTEST_BATCH_SIZE = 2000
+# Number of changed decisions listed in a backtest report
+FRAUD_ENGINE_BACKTEST_SAMPLE_SIZE = 100
+# Fraction of live transactions scored by shadow rules and models
+FRAUD_ENGINE_SHADOW_SAMPLE_RATE = 0.1
+# Celery queue for shadow scoring, served by low-priority workers
+FRAUD_ENGINE_SHADOW_QUEUE = 'shadow'
+# Time (seconds) the list of shadow rules and models is cached per process
+FRAUD_ENGINE_SHADOW_CONFIG_TTL = 60
+# Celery queue for scoring transactions that match none of the scoring routes
+FRAUD_ENGINE_DEFAULT_SCORING_QUEUE = 'scoring'
+# Scoring routes, tried in order. A route matches transactions whose channel is
+# in 'channels', whose merchant tier is in 'merchant_tiers' and whose amount is
+# in [min_amount, max_amount); criteria left out match everything
+FRAUD_ENGINE_SCORING_ROUTES = [
+    {'queue': 'scoring_priority', 'channels': ['pos']},
+    {'queue': 'scoring_priority', 'merchant_tiers': ['premium']},
+    {'queue': 'scoring_priority', 'min_amount': 5000},
+    {'queue': 'scoring_low', 'channels': ['wallet'], 'max_amount': 100},
+]
+# Tier of each merchant used by the scoring routes, e.g. {'merchant_123': 'premium'}
+FRAUD_ENGINE_MERCHANT_TIERS = {}
+# Tier of merchants missing from FRAUD_ENGINE_MERCHANT_TIERS
+FRAUD_ENGINE_DEFAULT_MERCHANT_TIER = 'standard'
+# Time (seconds) covered by the queue lag metrics
+FRAUD_ENGINE_QUEUE_LAG_WINDOW = 300
+# Record a span timeline of every scored transaction
+FRAUD_ENGINE_TRACING = True
+# Fraction of transactions whose trace is stored
+FRAUD_ENGINE_TRACE_SAMPLE_RATE = 0.01
+# Time (ms) above which the trace of a transaction is always stored
+FRAUD_ENGINE_TRACE_SLOW_MS = 500
+
+# Time (ms) between pushes of each process's metrics to the shared cache
+METRICS_FLUSH_INTERVAL_MS = 5000
+# Push metrics as soon as they are observed instead of in the background
+METRICS_SYNC_FLUSH = False
+
+# Time (ms) between pushes of each process's rule hit counts to the shared cache
+HIT_COUNT_PUSH_INTERVAL_MS = 1000
+# Push rule hit counts as soon as they are counted instead of in the background
+HIT_COUNT_SYNC_PUSH = False
+# Time (seconds) between writes of the shared rule hit counts to the rule rows
+HIT_COUNT_FLUSH_INTERVAL = 30
+# Periodic tasks run by Celery beat
+CELERY_BEAT_SCHEDULE = {
+    'flush-rule-hit-counts': {
+        'task': 'apps.core.tasks.flush_rule_hit_counts',
+        'schedule': HIT_COUNT_FLUSH_INTERVAL,
+    },
+}
+
+# Maximum number of transactions accepted per bulk ingestion request
+TRANSACTION_BULK_MAX_ROWS = 10000
+# Celery queue depth above which the ingest_transactions command pauses reading
+TRANSACTION_INGEST_MAX_QUEUE_DEPTH = 1000
+# Number of recent transaction IDs held by each process's duplicate Bloom filter
+TRANSACTION_DEDUP_BLOOM_CAPACITY = 1000000
+# False positive rate of the duplicate Bloom filter at capacity
+TRANSACTION_DEDUP_BLOOM_ERROR_RATE = 0.001
+# Time (seconds) the decision for a transaction is kept for resubmissions
+TRANSACTION_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Time (seconds) between checks of the version stamp invalidating compiled rules
+RULE_ENGINE_VERSION_CHECK_INTERVAL = 1
+# Smallest batch whose rule conditions are evaluated as column expressions
+RULE_ENGINE_VECTORIZE_MIN_BATCH = 32
+# Evaluate rules by running cost and hit rate, stopping once a reject decision is certain
+RULE_ENGINE_OPTIMIZER = False
+# Fraction of transactions whose rules are all evaluated with the optimizer on, for the audit trail
+RULE_ENGINE_FULL_EVALUATION_SAMPLE_RATE = 0.05
+# Rule execution rows to keep: 'full' keeps every row, 'sampled' keeps triggered executions and a sample
+RULE_ENGINE_EXECUTION_STORAGE = 'full'
+# Fraction of transactions whose non-triggered rule executions are kept in 'sampled' storage
+RULE_ENGINE_EXECUTION_SAMPLE_RATE = 0.01
+# Number of transactions loaded and evaluated at once by the rule simulator
+RULE_ENGINE_SIMULATION_CHUNK_SIZE = 50000
+# Longest history (days) a candidate rule condition can be simulated over
+RULE_ENGINE_SIMULATION_MAX_DAYS = 90
+# Profile rule latency per process and guard against slow and failing rules
+RULE_ENGINE_PROFILER = True
+# Length (seconds) of a rule profiling window; percentiles cover the current and the previous window
+RULE_ENGINE_PROFILER_WINDOW = 300
+# p99 rule latency (milliseconds) above which a rule is flagged as slow and operators are alerted
+RULE_ENGINE_SLOW_RULE_P99_MS = 10.0
+# Evaluations of a rule needed before it can be flagged as slow
+RULE_ENGINE_SLOW_RULE_MIN_EVALUATIONS = 100
+# Rule evaluation time (milliseconds) counted as a timeout
+RULE_ENGINE_RULE_TIMEOUT_MS = 50.0
+# Move rules that keep timing out or failing to shadow mode instead of only alerting
+RULE_ENGINE_QUARANTINE_ENABLED = False
+# Consecutive timeouts or errors that quarantine a rule
+RULE_ENGINE_QUARANTINE_STRIKES = 20
 
 # Logging configuration
 LOGGING = {
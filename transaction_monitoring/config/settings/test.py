@@ -37,5 +37,17 @@ MIGRATION_MODULES = DisableMigrations()
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Run the fraud engine stages sequentially in tests
+FRAUD_ENGINE_PARALLEL_STAGES = False
+
+# Write audit rows synchronously in tests
+FRAUD_ENGINE_AUDIT_SYNC_FLUSH = True
+
+# Push metrics synchronously in tests
+METRICS_SYNC_FLUSH = True
+
+# Push rule hit counts synchronously in tests
+HIT_COUNT_SYNC_PUSH = True
+
 # Disable throttling for tests
 REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []  # noqa
\ No newline at end of file
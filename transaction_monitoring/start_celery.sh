@@ -1,4 +1,4 @@
 #!/bin/bash
 
-# Start Celery worker
-celery -A transaction_monitoring worker --loglevel=info
\ No newline at end of file
+# Start Celery worker, reading the scoring, bulk and shadow queues as well as the default queue
+celery -A transaction_monitoring worker --loglevel=info -Q scoring_priority,scoring,scoring_low,bulk,shadow,celery